@@ -0,0 +1,302 @@
+"""
+Anonymized analytics export for MentWel
+
+Copies TherapySession, Payment and SentimentAnalysis rows into partitioned,
+compressed columnar files that analysts can query without touching the
+production database:
+
+    <ANALYTICS_EXPORT_DIR>/<dataset>/month=YYYY-MM/part-<run>-<n>.parquet
+
+Only allowlisted columns are exported. User, session and payment ids are
+replaced by keyed HMAC-SHA256 pseudonyms (ANALYTICS_HASH_KEY), so datasets
+still join on the same person without revealing who it is; payment
+references, emails and free text never leave the database.
+
+Rows are read with a server-side cursor in fixed-size chunks and buffered
+per month into row groups, so memory stays bounded by a couple of chunks
+whatever the table size. Each dataset keeps an id watermark in `_watermarks.json`;
+a run exports only rows above it and advances it after its files are in
+place. Rows updated after they were exported (e.g. a session changing status)
+are not re-exported.
+
+Needs pyarrow (`pip install pyarrow`).
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, select
+
+# Column -> how it is exported: 'keep' or 'hash:<namespace>'. Anything else is dropped.
+DATASETS = {
+    'therapy_sessions': {
+        'id': 'hash:session',
+        'patient_id': 'hash:user',
+        'therapist_id': 'hash:user',
+        'session_type': 'keep',
+        'status': 'keep',
+        'scheduled_at': 'keep',
+        'started_at': 'keep',
+        'ended_at': 'keep',
+        'duration_minutes': 'keep',
+        'created_at': 'keep',
+    },
+    'payments': {
+        'id': 'hash:payment',
+        'user_id': 'hash:user',
+        'package_id': 'keep',
+        'amount': 'keep',
+        'status': 'keep',
+        'paid_at': 'keep',
+        'created_at': 'keep',
+    },
+    'sentiment_analysis': {
+        'user_id': 'hash:user',
+        'session_id': 'hash:session',
+        'sentiment_label': 'keep',
+        'sentiment_score': 'keep',
+        'created_at': 'keep',
+    },
+}
+
+WATERMARK_FILE = '_watermarks.json'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise RuntimeError('Analytics export needs `pip install pyarrow`')
+    return pyarrow
+
+
+class Pseudonymizer:
+    """Keyed, stable pseudonyms for ids (same id and namespace -> same token)"""
+
+    def __init__(self, key):
+        if not key:
+            raise ValueError('ANALYTICS_HASH_KEY (or SECRET_KEY) is required for analytics export')
+        self.key = key.encode('utf-8') if isinstance(key, str) else key
+
+    def __call__(self, namespace, value):
+        if value is None:
+            return None
+        digest = hmac.new(self.key, f'{namespace}:{value}'.encode('utf-8'), hashlib.sha256)
+        return digest.hexdigest()[:20]
+
+
+def _arrow_type(pa, column, rule):
+    if rule.startswith('hash:'):
+        return pa.string()
+    kind = column.type
+    if isinstance(kind, Boolean):
+        return pa.bool_()
+    if isinstance(kind, Integer):
+        return pa.int64()
+    if isinstance(kind, (Float, Numeric)):
+        return pa.float64()
+    if isinstance(kind, DateTime):
+        return pa.timestamp('us')
+    if isinstance(kind, Date):
+        return pa.date32()
+    return pa.string()
+
+
+class PartitionWriters:
+    """Buffered writer per month partition
+
+    Rows are buffered per partition and written as row groups of
+    `row_group_size`; when more than `max_buffered` rows are held in total the
+    largest buffer is flushed early. Past `max_open` partitions the least
+    recently used file is closed and a later write starts a new part file.
+    """
+
+    def __init__(self, root, schema, file_format='parquet', compression='zstd', max_open=32,
+                 row_group_size=50000, max_buffered=100000):
+        self.pa = _pyarrow()
+        self.root = root
+        self.schema = schema
+        self.file_format = file_format
+        self.compression = compression
+        self.max_open = max_open
+        self.row_group_size = row_group_size
+        self.max_buffered = max_buffered
+        self.run = time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+        self._open = OrderedDict()
+        self._parts = {}
+        self._buffers = {}
+        self._buffered = 0
+        self.files = []
+
+    def _writer(self, partition):
+        entry = self._open.get(partition)
+        if entry is not None:
+            self._open.move_to_end(partition)
+            return entry[0]
+        while len(self._open) >= self.max_open:
+            self._close(next(iter(self._open)))
+
+        directory = os.path.join(self.root, f'month={partition}')
+        os.makedirs(directory, exist_ok=True)
+        part = self._parts[partition] = self._parts.get(partition, -1) + 1
+        suffix = 'parquet' if self.file_format == 'parquet' else 'arrow'
+        final = os.path.join(directory, f'part-{self.run}-{part:04d}.{suffix}')
+        # Written under a temporary name so readers never see a half-written file
+        temporary = final + '.tmp'
+        if self.file_format == 'parquet':
+            writer = self.pa.parquet.ParquetWriter(temporary, self.schema, compression=self.compression)
+        else:
+            options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+            writer = self.pa.ipc.new_file(temporary, self.schema, options=options)
+        self._open[partition] = (writer, temporary, final)
+        return writer
+
+    def write(self, partition, batch):
+        """Buffer a RecordBatch for `partition`"""
+        buffer = self._buffers.setdefault(partition, [])
+        buffer.append(batch)
+        self._buffered += batch.num_rows
+        if sum(b.num_rows for b in buffer) >= self.row_group_size:
+            self._flush(partition)
+        while self._buffered > self.max_buffered:
+            self._flush(max(self._buffers, key=lambda p: sum(b.num_rows for b in self._buffers[p])))
+
+    def _flush(self, partition):
+        batches = self._buffers.pop(partition, None)
+        if not batches:
+            return
+        self._buffered -= sum(b.num_rows for b in batches)
+        self._writer(partition).write_table(self.pa.Table.from_batches(batches, schema=self.schema))
+
+    def _close(self, partition):
+        self._flush(partition)
+        writer, temporary, final = self._open.pop(partition)
+        writer.close()
+        os.replace(temporary, final)
+        self.files.append(final)
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for partition in list(self._open):
+            self._close(partition)
+
+    def abort(self):
+        for writer, temporary, _ in self._open.values():
+            writer.close()
+            os.remove(temporary)
+        self._open.clear()
+        self._buffers.clear()
+
+
+def load_watermarks(root):
+    try:
+        with open(os.path.join(root, WATERMARK_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_watermarks(root, watermarks):
+    path = os.path.join(root, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def export_table(engine, table, rules, root, pseudonymize, watermark=0, chunk_size=50000,
+                 file_format='parquet', compression='zstd'):
+    """Export rows of `table` with id > watermark; returns (rows, new_watermark, files)"""
+    pa = _pyarrow()
+    columns = [(name, rule) for name, rule in rules.items() if name in table.c]
+    schema = pa.schema([(name, _arrow_type(pa, table.c[name], rule)) for name, rule in columns])
+    writers = PartitionWriters(os.path.join(root, table.name), schema, file_format, compression,
+                               row_group_size=chunk_size, max_buffered=2 * chunk_size)
+
+    query = (
+        select(table.c.id, *[table.c[name] for name, _ in columns if name != 'id'])
+        .where(table.c.id > watermark)
+        .order_by(table.c.id)
+    )
+    rows_written, high = 0, watermark
+    try:
+        with engine.connect() as conn:
+            # Server-side cursor: the driver holds one chunk at a time
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+            for chunk in result.partitions():
+                by_month = {}
+                for row in chunk:
+                    created = row.created_at
+                    month = created.strftime('%Y-%m') if created is not None else 'unknown'
+                    by_month.setdefault(month, []).append(row)
+                for month, month_rows in by_month.items():
+                    data = []
+                    for name, rule in columns:
+                        values = [getattr(r, name) for r in month_rows]
+                        if rule.startswith('hash:'):
+                            namespace = rule[len('hash:'):]
+                            values = [pseudonymize(namespace, v) for v in values]
+                        elif isinstance(table.c[name].type, Numeric) and not isinstance(table.c[name].type, Float):
+                            values = [float(v) if v is not None else None for v in values]
+                        data.append(values)
+                    writers.write(month, pa.RecordBatch.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(data, schema)],
+                        schema=schema,
+                    ))
+                rows_written += len(chunk)
+                high = chunk[-1].id
+        writers.close()
+    except BaseException:
+        writers.abort()
+        raise
+    return rows_written, high, writers.files
+
+
+def export_all(engine, tables, root, key, datasets=None, chunk_size=50000, file_format='parquet',
+               compression='zstd', logger=None):
+    """Export every dataset incrementally; returns {dataset: (rows, seconds, files)}"""
+    pseudonymize = Pseudonymizer(key)
+    os.makedirs(root, exist_ok=True)
+    watermarks = load_watermarks(root)
+    report = {}
+    for name in datasets or DATASETS:
+        start = time.perf_counter()
+        rows, high, files = export_table(
+            engine, tables[name], DATASETS[name], root, pseudonymize,
+            watermark=watermarks.get(name, 0), chunk_size=chunk_size,
+            file_format=file_format, compression=compression,
+        )
+        if rows:
+            watermarks[name] = high
+            save_watermarks(root, watermarks)
+        report[name] = (rows, time.perf_counter() - start, files)
+        if logger:
+            logger.info('analytics export %s: %d rows, watermark %d', name, rows, high)
+    return report
+
+
+def export_from_config(app, datasets=None):
+    """Run the export with the app's ANALYTICS_EXPORT_* settings"""
+    from app import db
+    from app.read_replicas import read_engine
+    with app.app_context():
+        return export_all(
+            read_engine(app),
+            db.metadata.tables,
+            app.config.get('ANALYTICS_EXPORT_DIR') or 'instance/analytics',
+            app.config.get('ANALYTICS_HASH_KEY') or app.config.get('SECRET_KEY'),
+            datasets=datasets,
+            chunk_size=app.config.get('ANALYTICS_EXPORT_CHUNK_SIZE', 50000),
+            file_format=app.config.get('ANALYTICS_EXPORT_FORMAT', 'parquet'),
+            compression=app.config.get('ANALYTICS_EXPORT_COMPRESSION', 'zstd'),
+            logger=app.logger,
+        )
@@ -0,0 +1,48 @@
+"""
+Public session package catalog for MentWel
+
+The packages seeded by `flask seed-data` change only when an admin edits
+them, so the listing is served from the response cache and rebuilt after a
+commit touches session_packages (tag 'packages').
+"""
+
+from flask import Blueprint, jsonify
+from sqlalchemy import select
+
+from app.response_cache import cached
+
+catalog_bp = Blueprint('catalog', __name__)
+
+
+def package_rows(conn, packages):
+    """Active packages, cheapest first"""
+    return conn.execute(
+        select(packages.c.id, packages.c.package_name, packages.c.package_description,
+               packages.c.session_count, packages.c.package_duration_days, packages.c.package_price)
+        .where(packages.c.is_active.is_(True))
+        .order_by(packages.c.package_price, packages.c.id)
+    ).all()
+
+
+@catalog_bp.route('/api/packages')
+@cached(tags=('packages',))
+def list_packages():
+    """Session packages available for purchase"""
+    from app import db
+    from app.models import SessionPackage
+
+    with db.engine.connect() as conn:
+        rows = package_rows(conn, SessionPackage.__table__)
+    return jsonify({'packages': [{
+        'id': row.id,
+        'name': row.package_name,
+        'description': row.package_description,
+        'session_count': row.session_count,
+        'duration_days': row.package_duration_days,
+        'price': float(row.package_price) if row.package_price is not None else None,
+    } for row in rows]})
+
+
+def init_app(app):
+    """Register the catalog endpoint"""
+    app.register_blueprint(catalog_bp)
@@ -0,0 +1,246 @@
+"""
+Streaming AI chat replies for MentWel
+
+POST /api/chat/stream relays generated tokens to the browser as they arrive,
+as Server-Sent Events (default) or as a plain chunked response
+(`?format=text`). The generator backend is chosen by CHAT_STREAM_BACKEND:
+
+    huggingface  streaming Inference API at HUGGINGFACE_TEXT_GEN_URL
+    local        deterministic stand-in generator for tests and demos
+
+If the first token does not arrive within CHAT_TTFT_BUDGET_MS the client
+gets an error event instead of an open connection that never speaks. On that
+timeout, or when the client disconnects, generation is cancelled and the
+upstream response closed, so an abandoned chat does not keep a thread and an
+outbound connection busy.
+Time-to-first-token and tokens/sec are logged and kept for every request.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import login_required
+
+from app.startup import LazyClient
+
+chat_stream_bp = Blueprint('chat_stream', __name__)
+
+_DONE = object()
+
+
+class HuggingFaceStreamBackend:
+    """Token stream from the Hugging Face text-generation Inference API"""
+
+    def __init__(self, api_url, api_key=None, max_new_tokens=256, timeout=30, http=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_new_tokens = max_new_tokens
+        self.timeout = timeout
+        # Shared pooled client (app.http_client) when running inside the app
+        self.http = http
+        self._session = LazyClient(self._make_session)
+
+    def _make_session(self):
+        import requests
+        session = requests.Session()
+        if self.api_key:
+            session.headers['Authorization'] = f'Bearer {self.api_key}'
+        return session
+
+    def generate(self, prompt):
+        payload = {
+            'inputs': prompt,
+            'parameters': {'max_new_tokens': self.max_new_tokens, 'return_full_text': False},
+            'stream': True,
+        }
+        if self.http is not None:
+            response = self.http.request('huggingface', 'POST', self.api_url, json=payload,
+                                         stream=True, retry=True)
+        else:
+            response = self._session.post(self.api_url, json=payload, stream=True, timeout=self.timeout)
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                event = json.loads(line[len('data:'):])
+                token = event.get('token') or {}
+                if token.get('text') and not token.get('special'):
+                    yield token['text']
+
+
+class LocalStandInBackend:
+    """Deterministic token generator with configurable pacing"""
+
+    REPLY = (
+        "Thank you for sharing that with me. It sounds like you are carrying a lot right now. "
+        "Would you like to talk about what has been on your mind most this week?"
+    )
+
+    def __init__(self, first_token_delay=0.0, token_delay=0.0):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    def generate(self, prompt):
+        time.sleep(self.first_token_delay)
+        for i, word in enumerate(self.REPLY.split(' ')):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else ' ' + word
+
+
+def backend_from_config(config, http=None):
+    """Build the generator selected by CHAT_STREAM_BACKEND"""
+    name = (config.get('CHAT_STREAM_BACKEND') or 'huggingface').lower()
+    if name == 'local':
+        return LocalStandInBackend()
+    if name == 'huggingface':
+        return HuggingFaceStreamBackend(
+            config.get('HUGGINGFACE_TEXT_GEN_URL'),
+            config.get('HUGGINGFACE_API_KEY'),
+            max_new_tokens=config.get('CHAT_MAX_NEW_TOKENS', 256),
+            http=http,
+        )
+    raise ValueError(f'Unknown CHAT_STREAM_BACKEND: {name}')
+
+
+class StreamMetrics:
+    """Recent per-request time-to-first-token and throughput"""
+
+    def __init__(self, size=1000):
+        self._recent = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, ttft_ms, tokens, duration):
+        entry = {
+            'ttft_ms': ttft_ms,
+            'tokens': tokens,
+            'tokens_per_sec': tokens / duration if duration > 0 else 0.0,
+        }
+        with self._lock:
+            self._recent.append(entry)
+        return entry
+
+    def summary(self):
+        with self._lock:
+            recent = list(self._recent)
+        if not recent:
+            return {'requests': 0}
+        ttfts = sorted(e['ttft_ms'] for e in recent if e['ttft_ms'] is not None)
+        rates = sorted(e['tokens_per_sec'] for e in recent)
+        return {
+            'requests': len(recent),
+            'ttft_p50_ms': ttfts[len(ttfts) // 2] if ttfts else None,
+            'ttft_p95_ms': ttfts[int(len(ttfts) * 0.95)] if ttfts else None,
+            'tokens_per_sec_p50': rates[len(rates) // 2],
+        }
+
+
+def stream_tokens(backend, prompt, ttft_budget):
+    """Yield ('token', text) then ('done', metrics) or ('error', message)
+
+    The backend runs on its own thread so the first-token budget can be
+    enforced even while the backend is blocked on the network. When this
+    generator stops early (timeout, or closed because the client went away)
+    the producer stops at the next token and closes the backend's generator,
+    which releases the upstream response.
+    """
+    tokens = queue.Queue()
+    cancel = threading.Event()
+
+    def produce():
+        generated = backend.generate(prompt)
+        try:
+            for token in generated:
+                if cancel.is_set():
+                    break
+                tokens.put(token)
+        except Exception as e:
+            tokens.put(e)
+        finally:
+            generated.close()
+            tokens.put(_DONE)
+
+    start = time.perf_counter()
+    threading.Thread(target=produce, name='chat-stream', daemon=True).start()
+
+    ttft_ms = None
+    count = 0
+    try:
+        while True:
+            try:
+                item = tokens.get(timeout=ttft_budget if ttft_ms is None else None)
+            except queue.Empty:
+                yield 'error', 'The assistant is taking too long to respond. Please try again.'
+                return
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                yield 'error', 'The assistant is unavailable right now. Please try again later.'
+                return
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+            count += 1
+            yield 'token', item
+    finally:
+        cancel.set()
+
+    yield 'done', {'ttft_ms': ttft_ms, 'tokens': count, 'duration': time.perf_counter() - start}
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+@chat_stream_bp.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Stream an AI chat reply token by token"""
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    if len(message) > current_app.config.get('MAX_MESSAGE_LENGTH', 1000):
+        return jsonify({'error': 'Message is too long'}), 400
+
+    backend = current_app.extensions['chat_stream_backend']
+    metrics = current_app.extensions['chat_stream_metrics']
+    budget = current_app.config.get('CHAT_TTFT_BUDGET_MS', 5000) / 1000
+    logger = current_app.logger
+    as_text = request.args.get('format') == 'text'
+
+    def generate():
+        for kind, value in stream_tokens(backend, message, budget):
+            if kind == 'done':
+                entry = metrics.record(value['ttft_ms'], value['tokens'], value['duration'])
+                logger.info('chat stream ttft=%.0fms tokens=%d tokens/sec=%.1f',
+                            entry['ttft_ms'] or 0, entry['tokens'], entry['tokens_per_sec'])
+                if not as_text:
+                    yield _sse('done', entry)
+            elif kind == 'error':
+                metrics.record(None, 0, 0)
+                yield value if as_text else _sse('error', {'error': value})
+            else:
+                yield value if as_text else _sse('token', {'text': value})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/plain' if as_text else 'text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop Nginx from buffering the stream (see DEPLOYMENT.md)
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def init_app(app):
+    """Register the streaming chat endpoint and its backend"""
+    app.extensions['chat_stream_backend'] = backend_from_config(
+        app.config, http=app.extensions.get('http_client')
+    )
+    app.extensions['chat_stream_metrics'] = StreamMetrics()
+    app.register_blueprint(chat_stream_bp)
@@ -0,0 +1,223 @@
+"""
+Connection pool telemetry for MentWel
+
+InstrumentedQueuePool records checkouts, waits, overflow usage and checkout
+latency for the process it runs in. When DB_POOL_STATS_DIR is set each worker
+also writes its snapshot there so `flask pool-stats` can report all workers.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
+
+# Upper bounds (milliseconds) of the checkout latency histogram buckets
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolStats:
+    """Thread-safe counters for one process"""
+
+    DUMP_INTERVAL = 10  # seconds between snapshot writes
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats_dir = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.waits = 0
+            self.timeouts = 0
+            self.overflow_checkouts = 0
+            self.peak_overflow = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.disconnect_errors = 0
+            self.latency_total_ms = 0.0
+            self.latency_max_ms = 0.0
+            self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            self._last_dump = 0.0
+
+    def record_checkout(self, elapsed, waited, overflowed, overflow_in_use):
+        ms = elapsed * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.waits += waited
+            self.overflow_checkouts += overflowed
+            self.peak_overflow = max(self.peak_overflow, overflow_in_use)
+            self.latency_total_ms += ms
+            self.latency_max_ms = max(self.latency_max_ms, ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if ms <= bound:
+                    self.histogram[i] += 1
+                    break
+            else:
+                self.histogram[-1] += 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'overflow_checkouts': self.overflow_checkouts,
+                'peak_overflow': self.peak_overflow,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'disconnect_errors': self.disconnect_errors,
+                'latency_total_ms': self.latency_total_ms,
+                'latency_max_ms': self.latency_max_ms,
+                'histogram': list(self.histogram),
+            }
+
+    def maybe_dump(self):
+        """Write this worker's snapshot to stats_dir at most every DUMP_INTERVAL seconds"""
+        if not self.stats_dir:
+            return
+        now = time.monotonic()
+        if now - self._last_dump < self.DUMP_INTERVAL:
+            return
+        self._last_dump = now
+        path = os.path.join(self.stats_dir, f'{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+
+pool_stats = PoolStats()
+
+
+# What happened during the current thread's checkout, filled in by the pool below
+_checkout = threading.local()
+
+
+class _WaitTrackingQueue(sqla_queue.Queue):
+    """Pool queue that notes when a checkout had to block for a connection"""
+
+    def get(self, block=True, timeout=None):
+        if block:
+            try:
+                return super().get(False)
+            except sqla_queue.Empty:
+                _checkout.waited = True
+        return super().get(block, timeout)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkout behaviour to `pool_stats`"""
+
+    _queue_class = _WaitTrackingQueue
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        event.listen(self, 'connect', lambda *a: pool_stats.incr('connects'))
+        event.listen(self, 'invalidate', lambda *a: pool_stats.incr('invalidations'))
+
+    def _inc_overflow(self):
+        if not super()._inc_overflow():
+            return False
+        # Counted per checkout rather than guessed from pool state read around it
+        _checkout.overflow = self._overflow
+        return True
+
+    def _do_get(self):
+        # QueuePool retries by calling _do_get again; only the outer call records
+        if getattr(_checkout, 'active', False):
+            return super()._do_get()
+        _checkout.active, _checkout.waited, _checkout.overflow = True, False, None
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.incr('timeouts')
+            raise
+        finally:
+            _checkout.active = False
+        overflow = _checkout.overflow
+        pool_stats.record_checkout(
+            time.perf_counter() - start, _checkout.waited, overflow is not None and overflow > 0,
+            max(0, overflow or 0)
+        )
+        return record
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        pool_stats.maybe_dump()
+
+
+def _count_disconnects(context):
+    # No pre-ping: a dead connection surfaces as an error on first use, and
+    # SQLAlchemy then invalidates every connection opened before it.
+    if context.is_disconnect:
+        pool_stats.incr('disconnect_errors')
+
+
+def load_snapshots(stats_dir):
+    """Read every worker snapshot written to stats_dir"""
+    snapshots = []
+    for path in glob.glob(os.path.join(stats_dir, '*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    """Sum per-worker snapshots into one report"""
+    total = {
+        'workers': len(snapshots),
+        'checkouts': 0,
+        'waits': 0,
+        'timeouts': 0,
+        'overflow_checkouts': 0,
+        'peak_overflow': 0,
+        'connects': 0,
+        'invalidations': 0,
+        'disconnect_errors': 0,
+        'latency_total_ms': 0.0,
+        'latency_max_ms': 0.0,
+        'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+    }
+    for snap in snapshots:
+        for key in ('peak_overflow', 'latency_max_ms'):
+            total[key] = max(total[key], snap.get(key, 0))
+        for key in ('checkouts', 'waits', 'timeouts', 'overflow_checkouts', 'connects',
+                    'invalidations', 'disconnect_errors', 'latency_total_ms'):
+            total[key] += snap.get(key, 0)
+        for i, count in enumerate(snap.get('histogram', [])):
+            total['histogram'][i] += count
+    return total
+
+
+def init_app(app):
+    """Install the instrumented pool into SQLALCHEMY_ENGINE_OPTIONS"""
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    # SQLite profiles carry no pool sizing; Flask-SQLAlchemy picks their pool
+    if 'pool_size' in options and 'poolclass' not in options:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, poolclass=InstrumentedQueuePool)
+
+    stats_dir = app.config.get('DB_POOL_STATS_DIR')
+    if stats_dir:
+        os.makedirs(stats_dir, exist_ok=True)
+        pool_stats.stats_dir = stats_dir
+
+    if not event.contains(Engine, 'handle_error', _count_disconnects):
+        event.listen(Engine, 'handle_error', _count_disconnects)
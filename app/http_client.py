@@ -0,0 +1,267 @@
+"""
+Shared outbound HTTP client for MentWel integrations (Paystack, Hugging Face)
+
+One requests.Session per worker process keeps a keep-alive pool per host, so
+repeat calls skip the TCP and TLS handshakes. Each integration has its own
+timeouts, retry policy and circuit breaker:
+
+    http = get_http_client()
+    response = http.request('paystack', 'GET', f'/transaction/verify/{reference}')
+
+Retries use full-jitter exponential backoff and only apply to idempotent
+methods unless the caller passes retry=True. After HTTP_BREAKER_THRESHOLD
+consecutive failures the breaker opens and calls fail fast with
+CircuitOpenError for HTTP_BREAKER_RESET seconds, then one trial call is let
+through. Per-host latency percentiles are available from `stats()`.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from flask import current_app
+
+from app.instrumentation import record_outbound
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an integration whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial"""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class LatencyTracker:
+    """Recent request latencies per host"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds):
+        with self._lock:
+            samples = self._samples.get(host)
+            if samples is None:
+                samples = self._samples[host] = deque(maxlen=self.size)
+            samples.append(seconds * 1000)
+
+    def percentiles(self):
+        with self._lock:
+            snapshot = {host: sorted(samples) for host, samples in self._samples.items()}
+        report = {}
+        for host, samples in snapshot.items():
+            if not samples:
+                continue
+            pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+            report[host] = {
+                'count': len(samples),
+                'p50_ms': pick(0.50),
+                'p95_ms': pick(0.95),
+                'p99_ms': pick(0.99),
+            }
+        return report
+
+
+class Integration:
+    """Connection settings for one external service"""
+
+    def __init__(self, name, base_url, timeout=(3.05, 15), headers=None, retries=2,
+                 backoff_base=0.2, backoff_max=2.0, breaker=None):
+        self.name = name
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+
+class OutboundClient:
+    """Pooled, retrying HTTP client shared by all integrations in a process"""
+
+    def __init__(self, integrations=(), pool_maxsize=10, verify=True):
+        self.integrations = {i.name: i for i in integrations}
+        self.pool_maxsize = pool_maxsize
+        self.verify = verify
+        self.latency = LatencyTracker()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add(self, integration):
+        self.integrations[integration.name] = integration
+
+    @property
+    def session(self):
+        # Sockets must not be shared with the Gunicorn master, so rebuild after fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.verify = self.verify
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _backoff(self, integration, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), integration.backoff_max)
+        # Full jitter keeps retries from many workers from arriving in lockstep
+        return random.uniform(0, min(integration.backoff_max, integration.backoff_base * 2 ** attempt))
+
+    def request(self, name, method, url, retry=None, timeout=None, **kwargs):
+        """Send a request through integration `name`; `url` may be a path or absolute"""
+        import requests
+
+        integration = self.integrations[name]
+        method = method.upper()
+        if not url.startswith(('http://', 'https://')):
+            url = integration.base_url + '/' + url.lstrip('/')
+        headers = dict(integration.headers, **(kwargs.pop('headers', None) or {}))
+        # Passed per call: requests lets REQUESTS_CA_BUNDLE override session.verify
+        kwargs.setdefault('verify', self.verify)
+        retries = integration.retries if (retry or (retry is None and method in IDEMPOTENT_METHODS)) else 0
+        host = urlsplit(url).netloc
+
+        attempt = 0
+        while True:
+            if not integration.breaker.allow():
+                raise CircuitOpenError(f'{name} is unavailable (circuit open)')
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url, headers=headers, timeout=timeout or integration.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                integration.breaker.failure()
+                if attempt >= retries:
+                    raise
+                time.sleep(self._backoff(integration, attempt))
+                attempt += 1
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                self.latency.record(host, elapsed)
+                record_outbound(name, elapsed)
+
+            if response.status_code >= 500 or response.status_code == 429:
+                integration.breaker.failure()
+            else:
+                integration.breaker.success()
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                response.close()
+                time.sleep(self._backoff(integration, attempt, response))
+                attempt += 1
+                continue
+            return response
+
+    def stats(self):
+        return {
+            'hosts': self.latency.percentiles(),
+            'breakers': {
+                name: {'state': i.breaker.state, 'failures': i.breaker.failures}
+                for name, i in self.integrations.items()
+            },
+        }
+
+
+def _origin(url):
+    parts = urlsplit(url or '')
+    return f'{parts.scheme}://{parts.netloc}' if parts.netloc else ''
+
+
+def client_from_config(config):
+    """Build the shared client with the Paystack and Hugging Face integrations"""
+    breaker = lambda: CircuitBreaker(
+        config.get('HTTP_BREAKER_THRESHOLD', 5), config.get('HTTP_BREAKER_RESET', 30)
+    )
+    common = {
+        'retries': config.get('HTTP_RETRIES', 2),
+        'backoff_base': config.get('HTTP_BACKOFF_BASE', 0.2),
+        'backoff_max': config.get('HTTP_BACKOFF_MAX', 2.0),
+    }
+
+    paystack_headers = {}
+    if config.get('PAYSTACK_SECRET_KEY'):
+        paystack_headers['Authorization'] = f"Bearer {config['PAYSTACK_SECRET_KEY']}"
+    hf_headers = {}
+    if config.get('HUGGINGFACE_API_KEY'):
+        hf_headers['Authorization'] = f"Bearer {config['HUGGINGFACE_API_KEY']}"
+
+    return OutboundClient(
+        [
+            Integration('paystack', config.get('PAYSTACK_BASE_URL'),
+                        timeout=config.get('PAYSTACK_TIMEOUT', (3.05, 15)),
+                        headers=paystack_headers, breaker=breaker(), **common),
+            Integration('huggingface', _origin(config.get('HUGGINGFACE_API_URL')),
+                        timeout=config.get('HUGGINGFACE_TIMEOUT', (3.05, 30)),
+                        headers=hf_headers, breaker=breaker(), **common),
+        ],
+        pool_maxsize=config.get('HTTP_POOL_MAXSIZE', 10),
+    )
+
+
+def get_http_client():
+    """The app's shared outbound client"""
+    return current_app.extensions['http_client']
+
+
+def init_app(app):
+    """Attach the shared outbound HTTP client to the app"""
+    client = client_from_config(app.config)
+    app.extensions['http_client'] = client
+    return client
@@ -0,0 +1,281 @@
+"""
+Inference result cache for MentWel
+
+Sentiment results are cached under HMAC-SHA256(model URL + normalized text),
+keyed with INFERENCE_CACHE_KEY (or SECRET_KEY). Message text itself is never
+stored, and without the key a short message cannot be recovered from its
+cache key by hashing candidate texts, which keeps the ANONYMOUS_ANALYTICS
+guarantee.
+
+Two layers:
+    local   per-process LRU with TTL, bounded by entry count and bytes
+    shared  optional SQLite file shared by every worker (INFERENCE_CACHE_URL)
+
+Hit/miss counters are kept per process and, with a shared layer, summed in
+the shared file so `flask inference-cache-stats` reports all workers.
+"""
+
+import hashlib
+import hmac
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from app.startup import SQLiteFile
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Fold case, Unicode forms, whitespace and edge punctuation"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _WHITESPACE.sub(' ', text).strip(' .,!?;:\'"')
+
+
+def cache_key(secret, model_url, text):
+    message = f'{model_url}\0{normalize(text)}'.encode('utf-8')
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry TTL and entry/byte limits"""
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires < now:
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, ttl=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, now + (ttl or self.ttl))
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+class SQLiteStore(SQLiteFile):
+    """Shared cache layer in a WAL-mode SQLite file"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS inference_cache ('
+        'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS inference_cache_stats ('
+        'name TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID',
+    )
+
+    def get(self, key, now):
+        row = self.connect().execute(
+            'SELECT value FROM inference_cache WHERE key = ? AND expires >= ?', (key, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, payload, expires):
+        self.connect().execute(
+            'INSERT OR REPLACE INTO inference_cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, payload, expires),
+        )
+
+    def purge(self, now):
+        self.connect().execute('DELETE FROM inference_cache WHERE expires < ?', (now,))
+
+    def add_counts(self, counts):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO inference_cache_stats (name, count) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET count = count + excluded.count',
+                list(counts.items()),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def totals(self):
+        conn = self.connect()
+        counts = dict(conn.execute('SELECT name, count FROM inference_cache_stats').fetchall())
+        entries, size = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM inference_cache'
+        ).fetchone()
+        return counts, entries, size
+
+
+class InferenceCache:
+    """Two-layer cache of model results keyed by HMAC of the input"""
+
+    COUNTERS = ('local_hits', 'shared_hits', 'misses', 'sets')
+    FLUSH_EVERY = 100  # operations between pushing counters to the shared layer
+
+    def __init__(self, local, secret, shared=None):
+        if not secret:
+            raise ValueError('INFERENCE_CACHE_KEY (or SECRET_KEY) is required for the inference cache')
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.local = local
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self._pending = dict.fromkeys(self.COUNTERS, 0)
+        self._ops = 0
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+            self._pending[name] += 1
+            self._ops += 1
+            if self.shared is None or self._ops % self.FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, dict.fromkeys(self.COUNTERS, 0)
+        try:
+            self.shared.add_counts(pending)
+            self.shared.purge(time.time())
+        except sqlite3.Error:
+            pass
+
+    def key(self, model_url, text):
+        return cache_key(self.secret, model_url, text)
+
+    def get(self, model_url, text):
+        key = self.key(model_url, text)
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        if self.shared is not None:
+            try:
+                payload = self.shared.get(key, time.time())
+            except sqlite3.Error:
+                payload = None
+            if payload is not None:
+                value = json.loads(payload)
+                self.local.set(key, value, len(payload))
+                self._count('shared_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, model_url, text, value):
+        key = self.key(model_url, text)
+        payload = json.dumps(value)
+        self.local.set(key, value, len(payload))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, payload, time.time() + self.local.ttl)
+            except sqlite3.Error:
+                pass
+        self._count('sets')
+
+    def get_or_compute(self, model_url, text, compute):
+        """Return the cached result for `text`, calling compute(text) on a miss"""
+        value = self.get(model_url, text)
+        if value is None:
+            value = compute(text)
+            self.set(model_url, text, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        lookups = counts['local_hits'] + counts['shared_hits'] + counts['misses']
+        hits = counts['local_hits'] + counts['shared_hits']
+        counts.update(
+            hit_rate=hits / lookups if lookups else 0.0,
+            local_entries=len(self.local),
+            local_bytes=self.local.size_bytes,
+            evictions=self.local.evictions,
+        )
+        return counts
+
+
+class CachedBackend:
+    """Wrap a sentiment backend so only cache misses reach the model"""
+
+    def __init__(self, backend, cache, model_url):
+        self.backend = backend
+        self.cache = cache
+        self.model_url = model_url
+
+    def analyze(self, texts):
+        results = [self.cache.get(self.model_url, text) for text in texts]
+        # Near-identical messages within one batch share a single model input
+        pending = {}
+        for i, result in enumerate(results):
+            if result is None:
+                pending.setdefault(self.cache.key(self.model_url, texts[i]), []).append(i)
+        if pending:
+            groups = list(pending.values())
+            fresh = self.backend.analyze([texts[group[0]] for group in groups])
+            for group, (label, score) in zip(groups, fresh):
+                self.cache.set(self.model_url, texts[group[0]], [label, score])
+                for i in group:
+                    results[i] = [label, score]
+        return [(label, score) for label, score in results]
+
+
+def cache_from_config(config):
+    """Build the inference cache described by INFERENCE_CACHE_* settings"""
+    local = LRUCache(
+        max_entries=config.get('INFERENCE_CACHE_MAX_ENTRIES', 10000),
+        max_bytes=config.get('INFERENCE_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+        ttl=config.get('INFERENCE_CACHE_TTL', 86400),
+    )
+    url = config.get('INFERENCE_CACHE_URL')
+    shared = None
+    if url:
+        if not url.startswith('sqlite:///'):
+            raise ValueError(f'Unsupported INFERENCE_CACHE_URL: {url}')
+        shared = SQLiteStore(url[len('sqlite:///'):])
+    secret = config.get('INFERENCE_CACHE_KEY') or config.get('SECRET_KEY')
+    return InferenceCache(local, secret, shared)
+
+
+def init_app(app):
+    """Attach the inference cache to the app"""
+    if not app.config.get('INFERENCE_CACHE_ENABLED', True):
+        return None
+    cache = cache_from_config(app.config)
+    app.extensions['inference_cache'] = cache
+    return cache
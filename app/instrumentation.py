@@ -0,0 +1,456 @@
+"""
+Request instrumentation for MentWel
+
+Every request is timed into a per-endpoint latency histogram. A sample of
+requests (INSTRUMENT_SAMPLE_RATE) is also profiled:
+
+    SQL         query count and time, via SQLAlchemy cursor events
+    outbound    time spent calling Paystack and Hugging Face (app/http_client.py)
+    N+1         the same statement run INSTRUMENT_N_PLUS_ONE_THRESHOLD or more
+                times in one request is counted and logged once per endpoint
+
+Requests slower than INSTRUMENT_SLOW_REQUEST_MS are logged, with their
+heaviest queries when the request was sampled.
+
+Metrics are kept per process. With INSTRUMENT_STATS_DIR set each worker also
+writes its snapshot there, so INSTRUMENT_METRICS_PATH (Prometheus text format)
+and `flask perf-report` cover all workers.
+"""
+
+import contextvars
+import glob
+import json
+import os
+import random
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram upper bounds, Prometheus style (the +Inf bucket is implicit)
+BUCKETS = {
+    'mentwel_http_request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'mentwel_db_queries_per_request': (1, 2, 5, 10, 20, 50, 100, 250),
+    'mentwel_db_query_seconds_per_request': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+    'mentwel_outbound_request_duration_seconds': (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+}
+
+HELP = {
+    'mentwel_http_request_duration_seconds': 'Request latency by endpoint',
+    'mentwel_db_queries_per_request': 'SQL statements per sampled request',
+    'mentwel_db_query_seconds_per_request': 'SQL time per sampled request',
+    'mentwel_outbound_request_duration_seconds': 'Outbound HTTP call latency by integration',
+    'mentwel_sampled_requests_total': 'Requests profiled for SQL and outbound time',
+    'mentwel_request_outbound_seconds_total': 'Outbound HTTP time spent inside sampled requests',
+    'mentwel_n_plus_one_total': 'Sampled requests that repeated one statement past the N+1 threshold',
+    'mentwel_slow_requests_total': 'Requests slower than INSTRUMENT_SLOW_REQUEST_MS',
+}
+
+_state = contextvars.ContextVar('mentwel_request_state', default=None)
+
+
+class Metrics:
+    """Thread-safe histograms and counters for one process"""
+
+    DUMP_INTERVAL = 10  # seconds between snapshot writes
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats_dir = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (name, labels) -> [bucket counts..., +Inf count, sum]
+            self.histograms = {}
+            # (name, labels) -> value
+            self.counters = {}
+            self._last_dump = 0.0
+
+    def observe(self, name, labels, value):
+        bounds = BUCKETS[name]
+        with self._lock:
+            series = self.histograms.get((name, labels))
+            if series is None:
+                series = self.histograms[(name, labels)] = [0] * (len(bounds) + 1) + [0.0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(bounds)] += 1
+            series[-1] += value
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def maybe_dump(self):
+        """Write this worker's snapshot to stats_dir at most every DUMP_INTERVAL seconds"""
+        if not self.stats_dir:
+            return
+        now = time.monotonic()
+        if now - self._last_dump < self.DUMP_INTERVAL:
+            return
+        self._last_dump = now
+        path = os.path.join(self.stats_dir, f'{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+
+metrics = Metrics()
+
+
+class RequestProfile:
+    """SQL and outbound time collected for one sampled request"""
+
+    __slots__ = ('queries', 'query_seconds', 'statements', 'outbound_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # statement -> [count, seconds]; statements carry placeholders, so an
+        # N+1 loop shows up as one entry with a high count
+        self.statements = {}
+        self.outbound_seconds = 0.0
+
+    def record_query(self, statement, seconds):
+        self.queries += 1
+        self.query_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def repeated(self, threshold):
+        return [(statement, count, seconds) for statement, (count, seconds) in self.statements.items()
+                if count >= threshold]
+
+    def heaviest(self, limit=10):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(statement, count, seconds) for statement, (count, seconds) in ranked[:limit]]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _state.get()
+    if state is not None and state.profile is not None and context is not None:
+        # Kept on the statement's own context, which is dropped when it fails,
+        # rather than on the pooled connection, which would keep the stale start
+        context._mentwel_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _state.get()
+    if state is None or state.profile is None:
+        return
+    start = getattr(context, '_mentwel_start', None)
+    if start is not None:
+        state.profile.record_query(statement, time.perf_counter() - start)
+
+
+def record_outbound(integration, seconds):
+    """Called by the outbound HTTP client after every attempt"""
+    metrics.observe('mentwel_outbound_request_duration_seconds', (('integration', integration),), seconds)
+    state = _state.get()
+    if state is not None and state.profile is not None:
+        state.profile.outbound_seconds += seconds
+
+
+def _shorten(statement, limit=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+class RequestState:
+    """Timing for the request in progress, held in a ContextVar rather than
+    `g`, whose proxy lookups would cost more than the measurement itself"""
+
+    __slots__ = ('start', 'request', 'profile', 'status', 'token')
+
+    def __init__(self, start, request, profile):
+        self.start = start
+        self.request = request
+        self.profile = profile
+        self.status = None
+        self.token = None
+
+
+class Instrumentation:
+    """Flask hooks that time requests and profile a sample of them"""
+
+    def __init__(self, sample_rate=1.0, slow_ms=500, n_plus_one=10, logger=None):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+        self.n_plus_one = n_plus_one
+        self.logger = logger
+        self.skip = set()
+        self._reported = set()
+
+    def before_request(self):
+        req = request._get_current_object()
+        if req.endpoint in self.skip:
+            return
+        profile = None
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            profile = RequestProfile()
+        state = RequestState(time.perf_counter(), req, profile)
+        state.token = _state.set(state)
+
+    def after_request(self, response):
+        state = _state.get()
+        if state is not None:
+            state.status = response.status_code
+        return response
+
+    def teardown_request(self, exc=None):
+        state = _state.get()
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state.start
+        _state.reset(state.token)
+        req, profile = state.request, state.profile
+
+        status = state.status or (500 if exc is not None else 200)
+        endpoint = req.endpoint or '<unmatched>'
+        metrics.observe('mentwel_http_request_duration_seconds',
+                        (('endpoint', endpoint), ('method', req.method), ('status', f'{status // 100}xx')),
+                        elapsed)
+        labels = (('endpoint', endpoint),)
+        if profile is not None:
+            metrics.inc('mentwel_sampled_requests_total', labels)
+            metrics.observe('mentwel_db_queries_per_request', labels, profile.queries)
+            metrics.observe('mentwel_db_query_seconds_per_request', labels, profile.query_seconds)
+            if profile.outbound_seconds:
+                metrics.inc('mentwel_request_outbound_seconds_total', labels, profile.outbound_seconds)
+            repeated = profile.repeated(self.n_plus_one)
+            if repeated:
+                metrics.inc('mentwel_n_plus_one_total', labels)
+                self._report_n_plus_one(endpoint, repeated)
+        if elapsed >= self.slow_seconds:
+            metrics.inc('mentwel_slow_requests_total', labels)
+            self._report_slow(req, endpoint, elapsed, status, profile)
+        metrics.maybe_dump()
+
+    def _report_n_plus_one(self, endpoint, repeated):
+        if self.logger is None:
+            return
+        for statement, count, seconds in repeated:
+            key = (endpoint, statement)
+            if key in self._reported:
+                continue
+            self._reported.add(key)
+            self.logger.warning('Possible N+1 in %s: %d x %.1fms %s',
+                                endpoint, count, seconds * 1000, _shorten(statement))
+
+    def _report_slow(self, req, endpoint, elapsed, status, profile):
+        if self.logger is None:
+            return
+        line = f'Slow request {req.method} {req.path} ({endpoint}) {status} {elapsed * 1000:.0f}ms'
+        if profile is None:
+            self.logger.warning('%s (not sampled)', line)
+            return
+        lines = [f'{line}: {profile.queries} queries {profile.query_seconds * 1000:.1f}ms, '
+                 f'outbound {profile.outbound_seconds * 1000:.1f}ms']
+        for statement, count, seconds in profile.heaviest():
+            lines.append(f'  {count:>4} x {seconds * 1000:8.1f}ms  {_shorten(statement)}')
+        self.logger.warning('\n'.join(lines))
+
+
+# -- reporting -------------------------------------------------------------
+
+def load_snapshots(stats_dir):
+    """Read every worker snapshot written to stats_dir"""
+    snapshots = []
+    for path in glob.glob(os.path.join(stats_dir, '*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def collect(stats_dir=None):
+    """This process's metrics plus other workers' snapshots from stats_dir"""
+    snapshots = [metrics.snapshot()]
+    if stats_dir:
+        snapshots += [s for s in load_snapshots(stats_dir) if s.get('pid') != os.getpid()]
+    return merge_snapshots(snapshots)
+
+
+def merge_snapshots(snapshots):
+    """Sum per-worker snapshots into {'histograms': {...}, 'counters': {...}, 'workers': n}"""
+    histograms = {}
+    counters = {}
+    for snap in snapshots:
+        for name, labels, series in snap.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(series)
+            else:
+                for i, value in enumerate(series):
+                    total[i] += value
+        for name, labels, value in snap.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+    return {'workers': len(snapshots), 'histograms': histograms, 'counters': counters}
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus(merged):
+    """Prometheus text exposition format (0.0.4)"""
+    lines = []
+    by_name = {}
+    for (name, labels), series in merged['histograms'].items():
+        by_name.setdefault(name, []).append((labels, series))
+    for name in sorted(by_name):
+        lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+        bounds = BUCKETS[name]
+        for labels, series in sorted(by_name[name]):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", f"{bound:g}")])} {cumulative}')
+            cumulative += series[len(bounds)]
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {series[-1]:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+
+    by_name = {}
+    for (name, labels), value in merged['counters'].items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+        for labels, value in sorted(by_name[name]):
+            lines.append(f'{name}{_labels(labels)} {value:g}' if isinstance(value, int)
+                         else f'{name}{_labels(labels)} {value:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+def histogram_quantile(bounds, series, q):
+    """Upper bound of the bucket holding quantile q (the last bound for +Inf)"""
+    total = sum(series[:len(bounds) + 1])
+    if not total:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for bound, count in zip(bounds, series):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return bounds[-1]
+
+
+def endpoint_report(merged):
+    """Per-endpoint rows for `flask perf-report`, slowest total time first"""
+    rows = {}
+    name = 'mentwel_http_request_duration_seconds'
+    bounds = BUCKETS[name]
+    for (metric, labels), series in merged['histograms'].items():
+        if metric != name:
+            continue
+        endpoint = dict(labels)['endpoint']
+        row = rows.setdefault(endpoint, {'endpoint': endpoint, 'series': [0] * (len(bounds) + 2)})
+        for i, value in enumerate(series):
+            row['series'][i] += value
+
+    def endpoint_series(metric, endpoint):
+        return merged['histograms'].get((metric, (('endpoint', endpoint),)))
+
+    def counter(metric, endpoint):
+        return merged['counters'].get((metric, (('endpoint', endpoint),)), 0)
+
+    report = []
+    for endpoint, row in rows.items():
+        series = row['series']
+        count = sum(series[:-1])
+        sampled = counter('mentwel_sampled_requests_total', endpoint)
+        queries = endpoint_series('mentwel_db_queries_per_request', endpoint)
+        sql = endpoint_series('mentwel_db_query_seconds_per_request', endpoint)
+        report.append({
+            'endpoint': endpoint,
+            'requests': count,
+            'total_s': series[-1],
+            'mean_ms': series[-1] / count * 1000 if count else 0.0,
+            'p50_ms': histogram_quantile(bounds, series, 0.5) * 1000,
+            'p95_ms': histogram_quantile(bounds, series, 0.95) * 1000,
+            'p99_ms': histogram_quantile(bounds, series, 0.99) * 1000,
+            'sampled': sampled,
+            'queries_per_request': queries[-1] / sampled if queries and sampled else 0.0,
+            'sql_ms_per_request': sql[-1] / sampled * 1000 if sql and sampled else 0.0,
+            'outbound_ms_per_request': counter('mentwel_request_outbound_seconds_total', endpoint) / sampled * 1000
+            if sampled else 0.0,
+            'n_plus_one': counter('mentwel_n_plus_one_total', endpoint),
+            'slow': counter('mentwel_slow_requests_total', endpoint),
+        })
+    return sorted(report, key=lambda r: r['total_s'], reverse=True)
+
+
+def metrics_view():
+    """Prometheus scrape endpoint; bearer token or localhost only"""
+    from flask import Response, abort
+    token = current_app.config.get('INSTRUMENT_METRICS_TOKEN')
+    if token:
+        import hmac
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            abort(401)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(404)
+    body = render_prometheus(collect(current_app.config.get('INSTRUMENT_STATS_DIR')))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Time every request, profile a sample and expose INSTRUMENT_METRICS_PATH"""
+    if not app.config.get('INSTRUMENT_ENABLED', True):
+        return None
+    stats_dir = app.config.get('INSTRUMENT_STATS_DIR')
+    if stats_dir:
+        os.makedirs(stats_dir, exist_ok=True)
+        metrics.stats_dir = stats_dir
+
+    instrumentation = Instrumentation(
+        sample_rate=app.config.get('INSTRUMENT_SAMPLE_RATE', 1.0),
+        slow_ms=app.config.get('INSTRUMENT_SLOW_REQUEST_MS', 500),
+        n_plus_one=app.config.get('INSTRUMENT_N_PLUS_ONE_THRESHOLD', 10),
+        logger=app.logger,
+    )
+    instrumentation.skip.update({'static', 'mentwel_metrics'})
+    app.extensions['instrumentation'] = instrumentation
+    app.before_request(instrumentation.before_request)
+    app.after_request(instrumentation.after_request)
+    app.teardown_request(instrumentation.teardown_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    path = app.config.get('INSTRUMENT_METRICS_PATH')
+    if path:
+        app.add_url_rule(path, 'mentwel_metrics', metrics_view)
+    return instrumentation
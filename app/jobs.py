@@ -0,0 +1,490 @@
+"""
+Background jobs for MentWel
+
+Slow side effects (SMTP, notifications, deferred work) are stored as rows in
+`jobs` and run by `flask worker` processes, so a request only pays for one
+INSERT:
+
+    from app.jobs import enqueue, send_email
+    send_email(user.email, 'Reset your MentWel password', body)
+    enqueue('session_event', {'session_id': 7, 'event_type': 'reminder'}, delay=3600)
+
+Job types are functions taking the JSON payload, registered with
+@job(name, max_attempts=..., concurrency=...). They run inside an app
+context, so they can use db.session and current_app.
+
+A worker claims due jobs (status 'queued', run_at <= now) in batches: it
+tags them 'running' with a claim token in one UPDATE and reads back the rows
+carrying its token, so concurrent workers never run the same job (Postgres
+also skips rows other workers have locked). Each worker runs up to
+JOB_WORKER_THREADS jobs at once and at most `concurrency` of one type, so a
+slow SMTP server cannot occupy every thread.
+
+A job that raises is retried after an exponential backoff with jitter
+(JOB_BACKOFF_BASE doubling up to JOB_BACKOFF_MAX seconds) until it has run
+max_attempts times; PermanentJobError fails it at once. Failed jobs stay in
+the table with their last error for `flask jobs-retry`. Workers renew the
+lease on their running jobs every minute; jobs left 'running' by a killed
+worker are queued again after JOB_LEASE_SECONDS, so handlers should be safe
+to run twice. Finished jobs are deleted after JOB_RETENTION_DAYS.
+"""
+
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text, delete, func, select, update
+
+from app.instrumentation import HELP, metrics
+
+HELP['mentwel_jobs_total'] = 'Background job attempts by job type and outcome'
+
+MAINTENANCE_INTERVAL = 60  # seconds between lease and retention sweeps
+
+metadata = MetaData()
+
+jobs = Table(
+    'jobs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String(50), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('status', String(20), nullable=False, default='queued'),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('max_attempts', Integer, nullable=False),
+    Column('run_at', DateTime, nullable=False),
+    Column('locked_by', String(100)),
+    Column('locked_at', DateTime),
+    Column('last_error', String(255)),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
+    Column('finished_at', DateTime),
+    Index('ix_jobs_status_run_at', 'status', 'run_at'),
+)
+
+
+class PermanentJobError(Exception):
+    """Raised by a job that must not be retried (e.g. the mail server refused the recipient)"""
+
+
+class JobType:
+    """A registered handler with its retry and concurrency limits"""
+
+    def __init__(self, name, handler, max_attempts=None, concurrency=None):
+        self.name = name
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+
+
+JOB_TYPES = {}
+
+
+def job(name, max_attempts=None, concurrency=None):
+    """Register a job handler under `name`"""
+    def register(handler):
+        JOB_TYPES[name] = JobType(name, handler, max_attempts, concurrency)
+        return handler
+    return register
+
+
+class JobQueue:
+    """The jobs table: enqueue, claim and record outcomes"""
+
+    def __init__(self, engine, max_attempts=5, backoff_base=30, backoff_max=3600, lease_seconds=600,
+                 retention_days=7, logger=None):
+        self.engine = engine
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.retention_days = retention_days
+        self.logger = logger
+        if engine.dialect.name == 'sqlite':
+            # The claim reads then writes; take SQLite's writer lock first so workers queue, not deadlock
+            from app.sqlite_mode import writer_lock
+            self._claim_lock = writer_lock(engine.url.database)
+        else:
+            self._claim_lock = nullcontext()
+
+    def create_tables(self):
+        metadata.create_all(self.engine, checkfirst=True)
+
+    def enqueue(self, kind, payload=None, delay=0, run_at=None, max_attempts=None, conn=None):
+        """Queue a job; pass conn to commit it together with the caller's own writes. Returns the id"""
+        job_type = JOB_TYPES.get(kind)
+        if job_type is None:
+            raise ValueError(f'Unknown job type: {kind}')
+        now = datetime.utcnow()
+        values = {
+            'kind': kind,
+            'payload': json.dumps(payload or {}),
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts or job_type.max_attempts or self.max_attempts,
+            'run_at': run_at or now + timedelta(seconds=delay),
+            'created_at': now,
+        }
+        if conn is not None:
+            return conn.execute(jobs.insert(), values).inserted_primary_key[0]
+        with self.engine.begin() as conn:
+            return conn.execute(jobs.insert(), values).inserted_primary_key[0]
+
+    def claim(self, token, capacity, limit, done=()):
+        """Mark up to `limit` due jobs running under `token`, at most capacity[kind] per type.
+
+        Ids in `done` are marked finished in the same transaction, so a busy
+        worker commits once per job rather than twice.
+        """
+        kinds = [kind for kind, free in capacity.items() if free > 0]
+        if not kinds or limit <= 0:
+            if done:
+                self.complete(done)
+            return []
+        now = datetime.utcnow()
+        query = (
+            select(jobs.c.id, jobs.c.kind)
+            .where(jobs.c.status == 'queued', jobs.c.run_at <= now, jobs.c.kind.in_(kinds))
+            .order_by(jobs.c.run_at, jobs.c.id)
+            .limit(limit * 4)
+        )
+        if self.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+
+        with self._claim_lock, self.engine.begin() as conn:
+            if done:
+                self._complete(conn, done)
+            free = dict(capacity)
+            ids = []
+            for row in conn.execute(query).all():
+                if free.get(row.kind, 0) > 0:
+                    free[row.kind] -= 1
+                    ids.append(row.id)
+                    if len(ids) == limit:
+                        break
+            if not ids:
+                return []
+            conn.execute(
+                update(jobs)
+                .where(jobs.c.id.in_(ids), jobs.c.status == 'queued')
+                .values(status='running', locked_by=token, locked_at=now, attempts=jobs.c.attempts + 1)
+            )
+            # Rows another worker claimed first are not tagged with our token
+            return conn.execute(
+                select(jobs).where(jobs.c.id.in_(ids), jobs.c.locked_by == token)
+                .order_by(jobs.c.run_at, jobs.c.id)
+            ).all()
+
+    def complete(self, ids):
+        """Mark jobs finished"""
+        with self.engine.begin() as conn:
+            self._complete(conn, ids)
+
+    def _complete(self, conn, ids):
+        conn.execute(
+            update(jobs).where(jobs.c.id.in_(list(ids)))
+            .values(status='done', locked_by=None, last_error=None, finished_at=datetime.utcnow())
+        )
+
+    def backoff(self, attempt):
+        """Seconds before retry number `attempt`: half fixed, half random"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def fail(self, row, error, permanent=False):
+        """Schedule a retry, or mark the job failed; returns the new status"""
+        now = datetime.utcnow()
+        if permanent or row.attempts >= row.max_attempts:
+            values = {'status': 'failed', 'finished_at': now}
+        else:
+            values = {'status': 'queued', 'run_at': now + timedelta(seconds=self.backoff(row.attempts))}
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(jobs).where(jobs.c.id == row.id)
+                .values(locked_by=None, last_error=f'{error.__class__.__name__}: {error}'[:255], **values)
+            )
+        return values['status']
+
+    def execute(self, row, app):
+        """Run one claimed job in an app context; failures are recorded, success is left to the caller.
+        Returns 'done', 'retry' or 'failed'"""
+        job_type = JOB_TYPES.get(row.kind)
+        try:
+            if job_type is None:
+                raise PermanentJobError(f'No handler registered for {row.kind}')
+            with app.app_context():
+                job_type.handler(json.loads(row.payload))
+        except Exception as e:
+            outcome = 'failed' if self.fail(row, e, isinstance(e, PermanentJobError)) == 'failed' else 'retry'
+            if self.logger:
+                self.logger.warning('Job %s (%s) attempt %d/%d: %s', row.id, row.kind, row.attempts,
+                                    row.max_attempts, e)
+        else:
+            outcome = 'done'
+        metrics.inc('mentwel_jobs_total', (('kind', row.kind), ('outcome', outcome)))
+        return outcome
+
+    def run_pending(self, app, limit=None):
+        """Run due jobs one by one in this thread (tests, cron); returns how many ran"""
+        token = f'inline:{os.getpid()}:{time.monotonic_ns()}'
+        ran = 0
+        while limit is None or ran < limit:
+            claimed = self.claim(token, dict.fromkeys(JOB_TYPES, 1), 1)
+            if not claimed:
+                return ran
+            if self.execute(claimed[0], app) == 'done':
+                self.complete([claimed[0].id])
+            ran += 1
+        return ran
+
+    def renew(self, worker_name):
+        """Extend the lease of every job a worker is still running"""
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(jobs).where(jobs.c.status == 'running', jobs.c.locked_by.like(f'{worker_name}:%'))
+                .values(locked_at=datetime.utcnow())
+            )
+
+    def requeue_expired(self):
+        """Queue jobs again whose worker stopped renewing them; returns how many"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        with self.engine.begin() as conn:
+            return conn.execute(
+                update(jobs).where(jobs.c.status == 'running', jobs.c.locked_at < cutoff)
+                .values(status='queued', locked_by=None, last_error='Lease expired (worker stopped)')
+            ).rowcount
+
+    def purge(self):
+        """Delete finished jobs older than the retention period; returns how many"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        with self.engine.begin() as conn:
+            return conn.execute(delete(jobs).where(jobs.c.status == 'done', jobs.c.finished_at < cutoff)).rowcount
+
+    def retry_failed(self, kind=None):
+        """Queue failed jobs again with fresh attempts; returns how many"""
+        query = (
+            update(jobs).where(jobs.c.status == 'failed')
+            .values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+        )
+        if kind:
+            query = query.where(jobs.c.kind == kind)
+        with self.engine.begin() as conn:
+            return conn.execute(query).rowcount
+
+    def counts(self):
+        """{(kind, status): count}"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(jobs.c.kind, jobs.c.status, func.count()).group_by(jobs.c.kind, jobs.c.status))
+            return {(kind, status): count for kind, status, count in rows}
+
+
+class Worker:
+    """Claims due jobs and runs them on a thread pool until stopped"""
+
+    def __init__(self, queue, app, threads=4, poll_interval=1.0, concurrency=None):
+        self.queue = queue
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        # Per-type limits: JOB_CONCURRENCY overrides, then the @job default, never above the thread count
+        overrides = concurrency or {}
+        self.limits = {
+            name: min(threads, overrides.get(name) or job_type.concurrency or threads)
+            for name, job_type in JOB_TYPES.items()
+        }
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._claims = itertools.count()
+        self._running = dict.fromkeys(self.limits, 0)
+        self._done = []
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self.processed = 0
+
+    def stop(self, *args):
+        """Stop claiming; jobs already running are finished"""
+        self._stop.set()
+        self._changed.set()
+
+    def _capacity(self):
+        with self._lock:
+            busy = sum(self._running.values())
+            return {kind: limit - self._running.get(kind, 0) for kind, limit in self.limits.items()}, \
+                self.threads - busy
+
+    def _execute(self, row):
+        outcome = None
+        try:
+            outcome = self.queue.execute(row, self.app)
+        finally:
+            with self._lock:
+                self._running[row.kind] -= 1
+                self.processed += 1
+                if outcome == 'done':
+                    self._done.append(row.id)
+            self._changed.set()
+
+    def _take_done(self):
+        with self._lock:
+            done, self._done = self._done, []
+        return done
+
+    def run(self, burst=False):
+        """Process jobs until stop(), or with burst=True until nothing is due; returns jobs processed"""
+        last_maintenance = 0.0
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='job') as executor:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now - last_maintenance >= MAINTENANCE_INTERVAL:
+                    self._maintain()
+                    last_maintenance = now
+
+                capacity, free = self._capacity()
+                done = self._take_done()
+                claimed = []
+                try:
+                    claimed = self.queue.claim(f'{self.name}:{next(self._claims)}', capacity, free, done)
+                except Exception as e:
+                    self.app.logger.warning('Job claim failed: %s', e)
+                    self._requeue_done(done)
+                for row in claimed:
+                    with self._lock:
+                        self._running[row.kind] = self._running.get(row.kind, 0) + 1
+                    executor.submit(self._execute, row)
+                metrics.maybe_dump()
+
+                if claimed and len(claimed) == free:
+                    # Every thread is busy: wait for one to finish
+                    self._changed.wait(self.poll_interval)
+                elif not claimed:
+                    with self._lock:
+                        idle = not any(self._running.values())
+                    if burst and idle:
+                        break
+                    self._changed.wait(self.poll_interval)
+                self._changed.clear()
+        # Record jobs that finished while the pool shut down
+        done = self._take_done()
+        if done:
+            self.queue.complete(done)
+        return self.processed
+
+    def _requeue_done(self, done):
+        # Keep finished ids for the next claim, so they are not run again after the lease expires
+        with self._lock:
+            self._done[:0] = done
+
+    def _maintain(self):
+        try:
+            self.queue.renew(self.name)
+            requeued = self.queue.requeue_expired()
+            purged = self.queue.purge()
+        except Exception as e:
+            self.app.logger.warning('Job maintenance failed: %s', e)
+            return
+        if requeued:
+            self.app.logger.warning('Requeued %d jobs whose lease expired', requeued)
+        if purged:
+            self.app.logger.info('Purged %d finished jobs', purged)
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINT finish the running jobs, then exit"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+
+def parse_concurrency(value):
+    """'email=4,session_event=8' -> {'email': 4, 'session_event': 8}"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, limit = item.split('=', 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+def queue_from_config(app, engine):
+    config = app.config
+    return JobQueue(
+        engine,
+        max_attempts=config.get('JOB_MAX_ATTEMPTS', 5),
+        backoff_base=config.get('JOB_BACKOFF_BASE', 30),
+        backoff_max=config.get('JOB_BACKOFF_MAX', 3600),
+        lease_seconds=config.get('JOB_LEASE_SECONDS', 600),
+        retention_days=config.get('JOB_RETENTION_DAYS', 7),
+        logger=app.logger,
+    )
+
+
+def worker_from_config(app, threads=None):
+    config = app.config
+    return Worker(
+        app.extensions['jobs'].get(),
+        app,
+        threads=threads or config.get('JOB_WORKER_THREADS', 4),
+        poll_interval=config.get('JOB_POLL_INTERVAL', 1.0),
+        concurrency=parse_concurrency(config.get('JOB_CONCURRENCY')),
+    )
+
+
+def enqueue(kind, payload=None, delay=0, run_at=None, conn=None):
+    """Queue a job from request code; returns its id"""
+    return current_app.extensions['jobs'].get().enqueue(kind, payload, delay=delay, run_at=run_at, conn=conn)
+
+
+def send_email(to, subject, body, html=None, delay=0, conn=None):
+    """Queue an email from MAIL_DEFAULT_SENDER; the request does not wait for SMTP"""
+    return enqueue('email', {'to': to, 'subject': subject, 'body': body, 'html': html}, delay=delay, conn=conn)
+
+
+# -- job types -------------------------------------------------------------
+
+@job('email', max_attempts=6, concurrency=4)
+def deliver_email(payload):
+    """Send one queued email through the pooled SMTP connections"""
+    import smtplib
+    from app.mailer import build_message
+
+    config = current_app.config
+    message = build_message(
+        payload.get('sender') or config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME'),
+        payload['to'], payload['subject'], payload['body'], html=payload.get('html'),
+    )
+    try:
+        current_app.extensions['mailer'].get().send(message)
+    except smtplib.SMTPRecipientsRefused as e:
+        raise PermanentJobError(f'Recipients refused: {", ".join(e.recipients)}')
+    except smtplib.SMTPResponseException as e:
+        if 500 <= e.smtp_code < 600:
+            raise PermanentJobError(f'{e.smtp_code} {e.smtp_error!r}')
+        raise
+
+
+@job('session_event', max_attempts=3)
+def deliver_session_event(payload):
+    """Publish a deferred therapy session event (reminders, follow-ups) to the push channel"""
+    from app.realtime import publish_session_event
+
+    data = payload.get('data') or {}
+    publish_session_event(payload['session_id'], payload['event_type'], **data)
+
+
+def init_app(app):
+    """Register the job queue; the table is created on first use"""
+    from app import db
+    from app.startup import lazy_app_client, register_tables
+
+    def build():
+        queue = queue_from_config(app, db.engine)
+        queue.create_tables()
+        return queue
+
+    app.extensions['jobs'] = lazy_app_client(app, build)
+    register_tables(metadata)
@@ -0,0 +1,306 @@
+"""
+Non-blocking JSON logging for MentWel
+
+Request threads only put records on a bounded queue (QueueHandler); a
+QueueListener thread per worker formats them as JSON lines and writes them
+to stderr and, optionally, LOG_FILE. A full queue drops records instead of
+blocking the request, and the next record written reports how many were
+dropped.
+
+Each line carries the request id (X-Request-ID, generated when absent) and,
+for the access line written at the end of a request, its duration. Access
+lines for fast successful requests are sampled (LOG_ACCESS_SAMPLE_RATE);
+errors and slow requests are always logged. Repeats of one message template
+beyond LOG_RATE_LIMIT per LOG_RATE_WINDOW seconds are suppressed and
+counted, so a hot path that logs cannot flood the pipe.
+
+PII never leaves the process: fields named in REDACT_FIELDS are masked in
+`extra` data, and email addresses and phone numbers are masked in message
+text before serialization.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+from flask import request
+
+REDACT_FIELDS = frozenset({
+    'email', 'phone_number', 'password', 'password_hash', 'token', 'authorization', 'cookie',
+})
+REDACTED = '[redacted]'
+STOP_TIMEOUT = 5  # seconds to wait at exit for room in a full queue
+
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+# Nigerian numbers (+234 / 0 prefix) and other international numbers
+_PHONE = re.compile(r'(?<![\w+])(?:\+?234|0)[789][01]\d{8}\b|(?<![\w+])\+\d{10,14}\b')
+_REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came from `extra`
+_STANDARD = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_request_id = contextvars.ContextVar('mentwel_request_id', default=None)
+
+
+def redact_text(text):
+    return _PHONE.sub('[phone]', _EMAIL.sub('[email]', text))
+
+
+def redact(value):
+    """Copy of `value` with PII fields masked, recursing into dicts and lists"""
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in REDACT_FIELDS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, redacted before serialization"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact_text(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD and not key.startswith('_'):
+                entry[key] = REDACTED if key.lower() in REDACT_FIELDS else redact(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = redact_text(record.exc_text)
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id (runs in the calling thread)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            request_id = _request_id.get()
+            if request_id is not None:
+                record.request_id = request_id
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most `limit` records per message template per `window` seconds
+
+    ERROR and above always pass, as do access lines, which are sampled
+    already. The first record after a window reports how many of its
+    template were suppressed.
+    """
+
+    def __init__(self, limit=20, window=10.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or not self.limit or hasattr(record, 'sample_rate'):
+            return True
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else repr(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry is not None else 0
+                self._counts[key] = [now, 1, 0]
+                if len(self._counts) > 10000:
+                    self._prune(now)
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if entry[1] < self.limit:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            return False
+
+    def _prune(self, now):
+        for key in [k for k, v in self._counts.items() if now - v[0] >= self.window and not v[2]]:
+            del self._counts[key]
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback now: args may change after this
+        # returns, and exc_info holds frames that must not cross threads
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        dropped = self.dropped
+        if dropped:
+            record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if dropped:
+            # Subtract rather than reset: other threads may have dropped more meanwhile
+            self.dropped -= dropped
+
+
+class _Listener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # The queue may be full: wait for the writer to make room, but not forever
+        self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+
+
+class LogPipeline:
+    """Bounded queue plus one writer thread per process (restarted after fork)"""
+
+    def __init__(self, handlers, queue_size=10000):
+        self.handlers = handlers
+        self.queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.listener is None:
+                self.listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+                self.listener.start()
+        return self
+
+    def stop(self):
+        """Flush queued records and stop the writer"""
+        with self._lock:
+            if self.listener is not None:
+                try:
+                    self.listener.stop()
+                except queue.Full:
+                    pass  # writer is stuck on a blocked stream; its thread is a daemon
+                self.listener = None
+
+    def _after_fork(self):
+        # The writer thread does not survive fork; records queued before it are the parent's
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.handler.queue = self.queue
+        self.handler.dropped = 0
+        self._lock = threading.Lock()
+        self.listener = None
+        self.start()
+
+
+def build_pipeline(config, stream=None):
+    """Pipeline writing JSON lines to `stream` (stderr) and LOG_FILE when set"""
+    level = logging.getLevelName(str(config.get('LOG_LEVEL') or 'INFO').upper())
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if config.get('LOG_FILE'):
+        os.makedirs(os.path.dirname(os.path.abspath(config['LOG_FILE'])), exist_ok=True)
+        # Reopens the file after logrotate moves it; safe with several workers
+        handlers.append(WatchedFileHandler(config['LOG_FILE']))
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+
+    pipeline = LogPipeline(handlers, queue_size=config.get('LOG_QUEUE_SIZE', 10000))
+    pipeline.handler.setLevel(level)
+    pipeline.handler.addFilter(RateLimitFilter(config.get('LOG_RATE_LIMIT', 20), config.get('LOG_RATE_WINDOW', 10)))
+    pipeline.handler.addFilter(RequestContextFilter())
+    return pipeline
+
+
+# -- request ids and access lines ------------------------------------------
+
+class AccessLog:
+    """Request id per request and a sampled JSON access line when it ends"""
+
+    def __init__(self, logger, sample_rate=1.0, slow_ms=500):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+
+    def before_request(self):
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex[:16]
+        request.environ['mentwel.request'] = (_request_id.set(request_id), request_id, time.perf_counter())
+
+    def after_request(self, response):
+        started = request.environ.get('mentwel.request')
+        if started is None:
+            return response
+        token, request_id, start = started
+        response.headers['X-Request-ID'] = request_id
+        elapsed = time.perf_counter() - start
+        status = response.status_code
+        if status >= 400 or elapsed >= self.slow_seconds or self.sample_rate >= 1 \
+                or random.random() < self.sample_rate:
+            level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+            self.logger.log(level, 'request', extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': status,
+                'duration_ms': round(elapsed * 1000, 2),
+                'sample_rate': 1.0 if status >= 400 or elapsed >= self.slow_seconds else self.sample_rate,
+            })
+        return response
+
+    def teardown_request(self, exc=None):
+        started = request.environ.pop('mentwel.request', None)
+        if started is not None:
+            _request_id.reset(started[0])
+
+
+def init_app(app):
+    """Send app.logger through the JSON queue pipeline and log requests"""
+    from flask.logging import default_handler
+
+    pipeline = build_pipeline(app.config).start()
+    app.extensions['log_pipeline'] = pipeline
+    atexit.register(pipeline.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=pipeline._after_fork)
+
+    logger = app.logger
+    logger.removeHandler(default_handler)
+    logger.addHandler(pipeline.handler)
+    logger.setLevel(pipeline.handler.level)
+    # Gunicorn's root handlers would print every record a second time
+    logger.propagate = False
+
+    access = AccessLog(logger, app.config.get('LOG_ACCESS_SAMPLE_RATE', 1.0),
+                       app.config.get('INSTRUMENT_SLOW_REQUEST_MS', 500))
+    app.before_request(access.before_request)
+    app.after_request(access.after_request)
+    app.teardown_request(access.teardown_request)
+    return pipeline
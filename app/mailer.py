@@ -0,0 +1,316 @@
+"""
+Outgoing email for MentWel
+
+SMTPPool keeps up to MAIL_POOL_SIZE authenticated SMTP connections open and
+reuses them across messages, so the TCP, TLS and AUTH handshake (often the
+bulk of a send) is paid once per connection instead of once per email.
+Connections idle for longer than MAIL_IDLE_TIMEOUT seconds are closed rather
+than reused, and each one is recycled after MAIL_MAX_MESSAGES_PER_CONNECTION
+messages, a limit most providers enforce. A connection the server dropped
+in between is replaced and the message sent once more.
+
+Emails are sent from background jobs (see app/jobs.py `send_email`), not
+inside requests. With MAIL_SUPPRESS_SEND (the default under TESTING) messages
+are appended to an in-memory outbox instead.
+
+SMTPSink is a small SMTP server that accepts everything and keeps the
+messages in memory, optionally with a simulated handshake and per-message
+delay. Tests and benchmarks start it on a free port; `flask smtp-sink` runs
+it for local development (MAIL_SERVER=localhost, MAIL_PORT=1025,
+MAIL_USE_TLS=false). Recipients at the `invalid` domain are refused with
+550, to exercise permanent failures.
+"""
+
+import socketserver
+import ssl
+import threading
+import time
+from email.message import EmailMessage
+
+from app.instrumentation import HELP, metrics
+from app.startup import lazy_module
+
+smtplib = lazy_module('smtplib')
+
+HELP['mentwel_smtp_connections_total'] = 'SMTP connections opened by the mail pool'
+
+
+def build_message(sender, to, subject, body, html=None, reply_to=None):
+    """A text email with an optional HTML alternative"""
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = to if isinstance(to, str) else ', '.join(to)
+    message['Subject'] = subject
+    if reply_to:
+        message['Reply-To'] = reply_to
+    message.set_content(body)
+    if html:
+        message.add_alternative(html, subtype='html')
+    return message
+
+
+class _Connection:
+    __slots__ = ('smtp', 'sent', 'last_used')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Thread-safe pool of reusable SMTP connections"""
+
+    def __init__(self, host, port, use_tls=False, use_ssl=False, username=None, password=None, size=4,
+                 timeout=10, max_messages=100, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+        self.sent = 0
+
+    def _connect(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+        try:
+            if self.username:
+                smtp.login(self.username, self.password or '')
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connects += 1
+        metrics.inc('mentwel_smtp_connections_total', ())
+        return _Connection(smtp)
+
+    def _checkout(self):
+        """(connection, reused) with the most recently used idle connection first"""
+        stale = []
+        try:
+            with self._lock:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if time.monotonic() - conn.last_used < self.idle_timeout:
+                        return conn, True
+                    stale.append(conn)
+        finally:
+            for conn in stale:
+                self._discard(conn)
+        return self._connect(), False
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_messages:
+            self._discard(conn, quit=True)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def _discard(self, conn, quit=False):
+        try:
+            if quit:
+                conn.smtp.quit()
+            else:
+                conn.smtp.close()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def send(self, message):
+        """Send an EmailMessage; SMTP errors propagate to the caller (the job retries)"""
+        with self._slots:
+            conn, reused = self._checkout()
+            try:
+                try:
+                    conn.smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    if not reused:
+                        raise
+                    # The server closed the connection while it sat idle
+                    self._discard(conn)
+                    conn = self._connect()
+                    conn.smtp.send_message(message)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server answered and smtplib reset the transaction; the connection is still good
+                self._release(conn)
+                raise
+            except BaseException:
+                self._discard(conn)
+                raise
+            conn.sent += 1
+            self._release(conn)
+        with self._lock:
+            self.sent += 1
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn, quit=True)
+
+
+class OutboxMailer:
+    """Keeps messages in memory instead of sending them (MAIL_SUPPRESS_SEND)"""
+
+    def __init__(self):
+        self.outbox = []
+        self.sent = 0
+
+    def send(self, message):
+        self.outbox.append(message)
+        self.sent += 1
+
+    def close(self):
+        pass
+
+
+def mailer_from_config(app):
+    """SMTPPool for the MAIL_* settings, or an OutboxMailer when sending is suppressed"""
+    config = app.config
+    if config.get('MAIL_SUPPRESS_SEND', config.get('TESTING', False)):
+        return OutboxMailer()
+    return SMTPPool(
+        config.get('MAIL_SERVER') or 'localhost',
+        config.get('MAIL_PORT', 25),
+        use_tls=config.get('MAIL_USE_TLS', False),
+        use_ssl=config.get('MAIL_USE_SSL', False),
+        username=config.get('MAIL_USERNAME'),
+        password=config.get('MAIL_PASSWORD'),
+        size=config.get('MAIL_POOL_SIZE', 4),
+        timeout=config.get('MAIL_TIMEOUT', 10),
+        max_messages=config.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100),
+        idle_timeout=config.get('MAIL_IDLE_TIMEOUT', 60),
+    )
+
+
+# -- local SMTP sink -------------------------------------------------------
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        if sink.connect_delay:
+            time.sleep(sink.connect_delay)
+        self.reply('220 mentwel-sink ESMTP')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-mentwel-sink\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif verb == 'HELO':
+                self.reply('250 mentwel-sink')
+            elif verb == 'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip().split(' ')[0].strip('<>'), []
+                self.reply('250 2.1.0 OK')
+            elif verb == 'RCPT':
+                address = command[8:].strip().split(' ')[0].strip('<>')
+                if address.lower().endswith('@invalid'):
+                    self.reply('550 5.1.1 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 2.1.5 OK')
+            elif verb == 'DATA':
+                if not recipients:
+                    self.reply('554 5.5.1 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                if sink.message_delay:
+                    time.sleep(sink.message_delay)
+                sink.received(sender, recipients, b''.join(lines))
+                self.reply('250 2.0.0 OK queued')
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 2.0.0 OK')
+            elif verb == 'NOOP':
+                self.reply('250 2.0.0 OK')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            elif verb == 'STAR':
+                self.reply('454 4.7.0 TLS not available')
+            else:
+                self.reply('502 5.5.2 Command not recognized')
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """In-memory SMTP server for tests, benchmarks and local development"""
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0, message_delay=0.0, keep=True,
+                 on_message=None):
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.keep = keep
+        self.on_message = on_message
+        self.messages = []
+        self.count = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = _SinkServer((host, port), _SinkHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def received(self, sender, recipients, data):
+        with self.lock:
+            self.count += 1
+            if self.keep:
+                self.messages.append((sender, recipients, data))
+        if self.on_message:
+            self.on_message(sender, recipients, data)
+
+    def start(self):
+        """Serve on a daemon thread; returns self"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def init_app(app):
+    """Register the mail pool; connections are opened on first send"""
+    from app.startup import LazyClient
+
+    app.extensions['mailer'] = LazyClient(lambda: mailer_from_config(app))
@@ -0,0 +1,592 @@
+"""
+Media uploads for MentWel: voice notes and images
+
+Uploads are streamed to disk in MEDIA_CHUNK_SIZE pieces, from a raw request
+body or the `file` part of a multipart form, without ever holding the whole
+body in worker memory. The type is taken from the magic bytes of the first
+chunk, not from the filename, and must be in ALLOWED_EXTENSIONS; voice notes
+are capped at MAX_VOICE_NOTE_SIZE while they stream.
+
+Files are stored by SHA-256 of their content, so a file uploaded twice is
+stored once. MEDIA_ROOT (default <instance>/media) must not be under static/,
+where anyone with the URL could fetch it:
+
+    <MEDIA_ROOT>/originals/ab/<sha256>.<ext>
+    <MEDIA_ROOT>/derived/ab/<sha256>/display.jpg, thumb.jpg   (images)
+    <MEDIA_ROOT>/derived/ab/<sha256>/voice.m4a                (voice notes)
+
+Each upload records who may see it in media_owners: the uploader, and the
+participants of the TherapySession given as ?session_id=. Content is only
+described or served to those users; everyone else gets 404, as if it did
+not exist.
+
+Normalization runs on a per-worker thread pool (MEDIA_WORKERS) after the
+response is sent: images are EXIF-rotated, stripped of metadata (including
+GPS) and resized with Pillow; voice notes are transcoded to mono AAC with
+ffmpeg when it is installed, otherwise the original is served.
+
+`/media/<id>[/<variant>]` serves files to their owners with Range,
+ETag/If-None-Match and sendfile via wsgi.file_wrapper, or hands the transfer
+to Nginx with X-Accel-Redirect when MEDIA_ACCEL_REDIRECT is set.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, jsonify, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, or_, select
+
+from app.startup import lazy_module
+
+# Pillow loads on the first upload that needs resizing
+Image = lazy_module('PIL.Image')
+ImageOps = lazy_module('PIL.ImageOps')
+
+IMAGE, AUDIO = 'image', 'audio'
+
+media_bp = Blueprint('media', __name__)
+
+metadata = MetaData()
+
+# Who may read stored content: the uploader, plus a session's participants
+media_owners = Table(
+    'media_owners', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('digest', String(64), nullable=False, index=True),
+    Column('user_id', Integer, nullable=False),
+    Column('session_id', Integer, index=True),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def _mp3(head):
+    # ID3 tag, or a bare MPEG audio frame sync
+    return head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+
+
+def _ftyp(brands):
+    return lambda head: head[4:8] == b'ftyp' and head[8:12] in brands
+
+
+# (extension, kind, test on the first bytes); checked in order
+SIGNATURES = [
+    ('png', IMAGE, lambda head: head.startswith(b'\x89PNG\r\n\x1a\n')),
+    ('jpg', IMAGE, lambda head: head.startswith(b'\xff\xd8\xff')),
+    ('gif', IMAGE, lambda head: head[:6] in (b'GIF87a', b'GIF89a')),
+    ('webp', IMAGE, lambda head: head[:4] == b'RIFF' and head[8:12] == b'WEBP'),
+    ('wav', AUDIO, lambda head: head[:4] == b'RIFF' and head[8:12] == b'WAVE'),
+    ('m4a', AUDIO, _ftyp((b'M4A ', b'M4B ', b'mp42', b'isom', b'iso2', b'dash'))),
+    ('ogg', AUDIO, lambda head: head.startswith(b'OggS')),
+    ('webm', AUDIO, lambda head: head.startswith(b'\x1a\x45\xdf\xa3')),
+    ('mp3', AUDIO, _mp3),
+]
+
+# Bytes needed to tell every signature apart
+SNIFF_BYTES = 16
+
+# Extensions that name the same format
+ALIASES = {'jpeg': 'jpg'}
+
+
+class UploadError(Exception):
+    """Rejected upload, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sniff(head, allowed=None):
+    """(extension, kind) from the first bytes of a file, or (None, None)"""
+    allowed = {ALIASES.get(ext, ext) for ext in allowed} if allowed is not None else None
+    for ext, kind, test in SIGNATURES:
+        if test(head):
+            if allowed is not None and ext not in allowed:
+                return None, None
+            return ext, kind
+    return None, None
+
+
+def raw_chunks(stream, chunk_size):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def multipart_chunks(stream, boundary, field='file', chunk_size=65536):
+    """Yield the body of the `field` file part as it arrives; other parts are skipped"""
+    from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=512 * 1024)
+    in_file = found = eof = False
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            if eof:
+                break
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            decoder.receive_data(chunk or None)
+        elif isinstance(event, File):
+            in_file = event.name == field
+            found = found or in_file
+        elif isinstance(event, Data):
+            if in_file:
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    # The rest of the body is not needed
+                    return
+        elif isinstance(event, Epilogue):
+            break
+    if not found:
+        raise UploadError(f'Upload has no {field!r} part')
+
+
+def request_chunks(req, chunk_size=65536, field='file'):
+    """Stream an upload from a Flask request without parsing it into request.files"""
+    if req.mimetype == 'multipart/form-data':
+        boundary = req.mimetype_params.get('boundary')
+        if not boundary:
+            raise UploadError('Missing multipart boundary')
+        return multipart_chunks(req.stream, boundary, field, chunk_size)
+    return raw_chunks(req.stream, chunk_size)
+
+
+class StoredFile:
+    """Result of an upload: content id, detected type and whether it was already stored"""
+
+    def __init__(self, digest, ext, kind, size, path, duplicate):
+        self.digest = digest
+        self.ext = ext
+        self.kind = kind
+        self.size = size
+        self.path = path
+        self.duplicate = duplicate
+
+
+class MediaStore:
+    """Content-addressed file store with background normalization"""
+
+    def __init__(self, root, allowed, max_sizes, workers=2, image_size=1600, thumb_size=256,
+                 ffmpeg=None, audio_bitrate='64k', logger=None):
+        self.root = root
+        self.allowed = set(allowed)
+        self.max_sizes = max_sizes
+        self.workers = workers
+        self.image_size = image_size
+        self.thumb_size = thumb_size
+        self.ffmpeg = ffmpeg
+        self.audio_bitrate = audio_bitrate
+        self.logger = logger
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def executor(self):
+        # Pool threads do not survive a Gunicorn fork, so build one per worker
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='media')
+                    self._pid = os.getpid()
+                    self._pending = {}
+        return self._executor
+
+    # -- layout ----------------------------------------------------------
+
+    def original_path(self, digest, ext):
+        return os.path.join(self.root, 'originals', digest[:2], f'{digest}.{ext}')
+
+    def derived_dir(self, digest):
+        return os.path.join(self.root, 'derived', digest[:2], digest)
+
+    def derived_names(self, kind):
+        if kind == IMAGE:
+            return ['display.jpg', 'thumb.jpg']
+        return ['voice.m4a'] if self.ffmpeg else []
+
+    def find(self, digest):
+        """(path, ext, kind) of a stored original, or None"""
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        for ext, kind, _ in SIGNATURES:
+            path = self.original_path(digest, ext)
+            if os.path.exists(path):
+                return path, ext, kind
+        return None
+
+    # -- upload ----------------------------------------------------------
+
+    def save_stream(self, chunks):
+        """Write an upload from an iterable of byte chunks; returns a StoredFile"""
+        incoming = os.path.join(self.root, 'incoming')
+        os.makedirs(incoming, exist_ok=True)
+        temporary = os.path.join(incoming, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        head = b''
+        ext = kind = limit = None
+        size = 0
+        try:
+            with open(temporary, 'wb') as f:
+                for chunk in chunks:
+                    if ext is None:
+                        # Hold back only until the signature can be read
+                        head += chunk
+                        if len(head) < SNIFF_BYTES:
+                            continue
+                        ext, kind, limit = self._check_type(head)
+                        chunk, head = head, b''
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadError(f'{kind.capitalize()} exceeds {limit // (1024 * 1024)}MB', 413)
+                    digest.update(chunk)
+                    f.write(chunk)
+                if ext is None:
+                    if not head:
+                        raise UploadError('Empty upload')
+                    ext, kind, limit = self._check_type(head)
+                    size = len(head)
+                    if size > limit:
+                        raise UploadError(f'{kind.capitalize()} exceeds {limit // (1024 * 1024)}MB', 413)
+                    digest.update(head)
+                    f.write(head)
+            digest = digest.hexdigest()
+            final = self.original_path(digest, ext)
+            duplicate = os.path.exists(final)
+            if duplicate:
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(temporary, final)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return StoredFile(digest, ext, kind, size, final, duplicate)
+
+    def _check_type(self, head):
+        ext, kind = sniff(head, self.allowed)
+        if ext is None:
+            raise UploadError('Unsupported file type', 415)
+        return ext, kind, self.max_sizes.get(kind) or self.max_sizes.get(None)
+
+    # -- normalization ---------------------------------------------------
+
+    def status(self, digest):
+        """'ready', 'processing', 'failed' or None for unknown content"""
+        found = self.find(digest)
+        if found is None:
+            return None
+        directory = self.derived_dir(digest)
+        if os.path.exists(os.path.join(directory, 'failed')):
+            return 'failed'
+        names = self.derived_names(found[2])
+        if all(os.path.exists(os.path.join(directory, name)) for name in names):
+            return 'ready'
+        return 'processing'
+
+    def normalize_async(self, stored):
+        """Queue normalization of a stored file; returns a Future (or None when nothing is due)"""
+        if self.status(stored.digest) != 'processing':
+            return None
+        executor = self.executor
+        with self._lock:
+            future = self._pending.get(stored.digest)
+            if future is None:
+                future = self._pending[stored.digest] = executor.submit(self._normalize, stored)
+                future.add_done_callback(lambda _: self._pending.pop(stored.digest, None))
+        return future
+
+    def _normalize(self, stored):
+        directory = self.derived_dir(stored.digest)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            if stored.kind == IMAGE:
+                self._resize_image(stored.path, directory)
+            elif self.ffmpeg:
+                self._transcode_audio(stored.path, directory)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('media normalization failed for %s: %s', stored.digest, e)
+            with open(os.path.join(directory, 'failed'), 'w') as f:
+                f.write(str(e))
+            return False
+        return True
+
+    def _resize_image(self, source, directory):
+        with Image.open(source) as image:
+            # JPEG decoders can downscale while decoding, which keeps memory low for huge photos
+            image.draft('RGB', (self.image_size, self.image_size))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            for name, size in (('display.jpg', self.image_size), ('thumb.jpg', self.thumb_size)):
+                resized = image.copy()
+                resized.thumbnail((size, size))
+                temporary = os.path.join(directory, f'.{name}.tmp')
+                # Saved without exif=..., so camera and GPS metadata are dropped
+                resized.save(temporary, 'JPEG', quality=85, optimize=True)
+                os.replace(temporary, os.path.join(directory, name))
+
+    def _transcode_audio(self, source, directory):
+        temporary = os.path.join(directory, '.voice.m4a.tmp')
+        subprocess.run(
+            [
+                self.ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', '-i', source,
+                '-vn', '-ac', '1', '-c:a', 'aac', '-b:a', self.audio_bitrate, '-map_metadata', '-1',
+                '-f', 'mp4', temporary,
+            ],
+            check=True, capture_output=True, timeout=300,
+        )
+        os.replace(temporary, os.path.join(directory, 'voice.m4a'))
+
+
+def store_from_config(app):
+    root = app.config.get('MEDIA_ROOT') or 'media'
+    if not os.path.isabs(root):
+        root = os.path.join(app.instance_path, root)
+    static = app.static_folder and os.path.realpath(app.static_folder)
+    if static and os.path.realpath(root).startswith(static + os.sep):
+        app.logger.warning('MEDIA_ROOT %s is under the static folder; uploads are public there', root)
+    ffmpeg = app.config.get('MEDIA_FFMPEG') or shutil.which('ffmpeg')
+    return MediaStore(
+        root,
+        app.config.get('ALLOWED_EXTENSIONS') or (),
+        {
+            AUDIO: app.config.get('MAX_VOICE_NOTE_SIZE'),
+            None: app.config.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024,
+        },
+        workers=app.config.get('MEDIA_WORKERS', 2),
+        image_size=app.config.get('MEDIA_IMAGE_SIZE', 1600),
+        thumb_size=app.config.get('MEDIA_THUMB_SIZE', 256),
+        ffmpeg=ffmpeg,
+        audio_bitrate=app.config.get('MEDIA_AUDIO_BITRATE', '64k'),
+        logger=app.logger,
+    )
+
+
+MIMETYPES = {
+    'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp',
+    'wav': 'audio/wav', 'm4a': 'audio/mp4', 'ogg': 'audio/ogg', 'webm': 'audio/webm', 'mp3': 'audio/mpeg',
+}
+
+
+def record_owner(conn, digest, user_id, session_id=None):
+    """Let `user_id` (and the participants of `session_id`) read `digest`"""
+    exists = conn.execute(select(media_owners.c.id).where(
+        media_owners.c.digest == digest,
+        media_owners.c.user_id == user_id,
+        media_owners.c.session_id.is_(None) if session_id is None else media_owners.c.session_id == session_id,
+    ).limit(1)).first()
+    if exists is None:
+        conn.execute(media_owners.insert().values(digest=digest, user_id=user_id, session_id=session_id))
+
+
+def may_read(conn, sessions, digest, user_id):
+    """Whether `user_id` uploaded `digest` or takes part in a session it was shared with"""
+    participating = select(sessions.c.id).where(
+        or_(sessions.c.patient_id == user_id, sessions.c.therapist_id == user_id))
+    return conn.execute(select(media_owners.c.id).where(and_(
+        media_owners.c.digest == digest,
+        or_(media_owners.c.user_id == user_id, media_owners.c.session_id.in_(participating)),
+    )).limit(1)).first() is not None
+
+
+def _readable(store, digest):
+    """(path, ext, kind) of content the signed-in user may read, or None"""
+    from app import db
+    from app.models import TherapySession
+    found = store.find(digest)
+    # Content someone else owns answers exactly like content that does not exist
+    if found is None or not may_read(db.session.connection(), TherapySession.__table__, digest, current_user.id):
+        return None
+    return found
+
+
+def describe(store, digest):
+    """JSON-ready description of stored content"""
+    path, ext, kind = store.find(digest)
+    directory = store.derived_dir(digest)
+    derived = {
+        name.split('.')[0]: url_for('media.serve_media', digest=digest, variant=name.split('.')[0])
+        for name in store.derived_names(kind)
+        if os.path.exists(os.path.join(directory, name))
+    }
+    return {
+        'id': digest,
+        'kind': kind,
+        'type': ext,
+        'size': os.path.getsize(path),
+        'status': store.status(digest),
+        'url': url_for('media.serve_media', digest=digest),
+        'derived': derived,
+    }
+
+
+class FileSlice:
+    """File object limited to `length` bytes from its current position
+
+    Exposes fileno(), so Gunicorn's wsgi.file_wrapper can hand the range to
+    os.sendfile (offset from the descriptor, byte count from Content-Length)
+    while other servers read it through the bounded read().
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def send_media(path, mimetype, etag, max_age=31536000, accel_path=None, buffer_size=65536):
+    """Conditional, range-aware response for `path`
+
+    Answers If-None-Match with 304 and a single Range with 206 (If-Range
+    honoured). With `accel_path` the body is left to Nginx via
+    X-Accel-Redirect, which applies the Range itself.
+    """
+    from werkzeug.datastructures import ContentRange
+    from werkzeug.wsgi import wrap_file
+
+    stat = os.stat(path)
+    size = stat.st_size
+    response = current_app.response_class(mimetype=mimetype, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    # Content addressed, so a URL's bytes never change; private because access is checked
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    response.accept_ranges = 'bytes'
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+    if accel_path:
+        response.headers['X-Accel-Redirect'] = accel_path
+        return response
+
+    start, stop = 0, size
+    # Multi-range requests get the whole file; players only ask for one range
+    byte_range, if_range = request.range, request.if_range
+    if byte_range is not None and len(byte_range.ranges) == 1 \
+            and (if_range.etag == etag or (if_range.etag is None and if_range.date is None)):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, stop = bounds
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, size)
+
+    f = open(path, 'rb')
+    f.seek(start)
+    response.response = wrap_file(request.environ, FileSlice(f, stop - start), buffer_size)
+    response.content_length = stop - start
+    return response
+
+
+@media_bp.route('/api/media', methods=['POST'])
+@login_required
+def upload_media():
+    """Stream a voice note or image to the content-addressed store
+
+    With ?session_id= the upload is shared with that session's participants.
+    """
+    from app import db
+    from app.models import TherapySession
+    session_id = request.args.get('session_id', type=int)
+    if session_id is not None:
+        session = db.session.get(TherapySession, session_id)
+        if session is None:
+            return jsonify({'error': 'Session not found'}), 404
+        if current_user.id not in (session.patient_id, session.therapist_id):
+            return jsonify({'error': 'Not a participant in this session'}), 403
+
+    store = current_app.extensions['media_store'].get()
+    chunk_size = current_app.config.get('MEDIA_CHUNK_SIZE', 65536)
+    try:
+        stored = store.save_stream(request_chunks(request, chunk_size))
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    record_owner(db.session.connection(), stored.digest, current_user.id, session_id)
+    db.session.commit()
+    store.normalize_async(stored)
+    # Whether the content was already stored is not reported: it would tell one
+    # user that someone else uploaded the same file
+    return jsonify(describe(store, stored.digest)), 201
+
+
+@media_bp.route('/api/media/<digest>')
+@login_required
+def media_status(digest):
+    """Type, size and normalization status of uploaded content"""
+    store = current_app.extensions['media_store'].get()
+    if _readable(store, digest) is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(describe(store, digest))
+
+
+@media_bp.route('/media/<digest>')
+@media_bp.route('/media/<digest>/<variant>')
+@login_required
+def serve_media(digest, variant=None):
+    """Original or normalized upload, with Range and ETag support"""
+    store = current_app.extensions['media_store'].get()
+    found = _readable(store, digest)
+    if found is None:
+        abort(404)
+    path, ext, kind = found
+    if variant is not None:
+        names = {name.split('.')[0]: name for name in store.derived_names(kind)}
+        if variant not in names:
+            abort(404)
+        path = os.path.join(store.derived_dir(digest), names[variant])
+        ext = names[variant].rsplit('.', 1)[1]
+        if not os.path.exists(path):
+            abort(404)
+    etag = digest if variant is None else f'{digest}-{variant}-{int(os.path.getmtime(path))}'
+
+    accel_path = None
+    prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT')
+    if prefix:
+        accel_path = prefix.rstrip('/') + '/' + os.path.relpath(path, store.root).replace(os.sep, '/')
+    return send_media(
+        path, MIMETYPES.get(ext, 'application/octet-stream'), etag,
+        max_age=current_app.config.get('MEDIA_CACHE_MAX_AGE', 31536000),
+        accel_path=accel_path,
+        buffer_size=current_app.config.get('MEDIA_CHUNK_SIZE', 65536),
+    )
+
+
+def init_app(app):
+    """Register the upload endpoints; the store and its pool are built on first use"""
+    from app.startup import LazyClient, register_tables
+    app.extensions['media_store'] = LazyClient(lambda: store_from_config(app))
+    register_tables(metadata)
+    app.register_blueprint(media_bp)
@@ -0,0 +1,248 @@
+"""
+Daily and weekly mood aggregates for MentWel progress charts
+
+`mood_daily` and `mood_weekly` hold, per user and UTC day / ISO week
+(starting Monday), the message count, the label counts and the sum of a
+signed mood score (+score for positive, -score for negative, 0 for neutral).
+Charts read O(days) rollup rows instead of scanning every SentimentAnalysis
+row a user has produced.
+
+Rollups are maintained incrementally in the same transaction as the
+sentiment rows they summarize:
+
+- the sentiment pipeline's bulk sink calls `record_rows()`
+- SentimentAnalysis objects added through the ORM are picked up on flush
+
+The tables are registered with the app's metadata, so `flask init-db`
+creates them; `flask mood-rollups-backfill` rebuilds them from existing
+rows and should be run once when deploying this feature.
+"""
+
+from datetime import date, datetime, timedelta
+from importlib import import_module
+
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import (
+    Column, Date, Float, Integer, MetaData, Table, and_, case, delete, event, func, select,
+)
+from sqlalchemy.orm import Session
+
+metadata = MetaData()
+
+
+def _rollup_table(name, period_column):
+    return Table(
+        name, metadata,
+        Column('user_id', Integer, primary_key=True),
+        Column(period_column, Date, primary_key=True),
+        Column('messages', Integer, nullable=False, default=0),
+        Column('positive', Integer, nullable=False, default=0),
+        Column('neutral', Integer, nullable=False, default=0),
+        Column('negative', Integer, nullable=False, default=0),
+        Column('mood_sum', Float, nullable=False, default=0.0),
+    )
+
+
+mood_daily = _rollup_table('mood_daily', 'day')
+mood_weekly = _rollup_table('mood_weekly', 'week_start')
+
+COUNTERS = ('messages', 'positive', 'neutral', 'negative', 'mood_sum')
+
+mood_progress_bp = Blueprint('mood_progress', __name__)
+
+
+def mood_value(label, score):
+    """Signed mood in [-1, 1] for one sentiment result"""
+    label = (label or '').lower()
+    if label == 'positive':
+        return float(score or 0)
+    if label == 'negative':
+        return -float(score or 0)
+    return 0.0
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def aggregate(rows):
+    """Fold sentiment rows into {(user_id, day): counters} and {(user_id, week): counters}"""
+    daily, weekly = {}, {}
+    for row in rows:
+        if row.get('user_id') is None:
+            continue
+        day = _to_date(row.get('created_at') or datetime.utcnow())
+        label = (row.get('sentiment_label') or 'neutral').lower()
+        for buckets, key in ((daily, (row['user_id'], day)), (weekly, (row['user_id'], week_start(day)))):
+            counts = buckets.get(key)
+            if counts is None:
+                counts = buckets[key] = dict.fromkeys(COUNTERS, 0)
+                counts['mood_sum'] = 0.0
+            counts['messages'] += 1
+            if label in ('positive', 'neutral', 'negative'):
+                counts[label] += 1
+            counts['mood_sum'] += mood_value(label, row.get('sentiment_score'))
+    return daily, weekly
+
+
+def _increment_statement(table, dialect_name):
+    """INSERT .. ON CONFLICT that adds to the existing counters"""
+    if dialect_name in ('sqlite', 'postgresql'):
+        stmt = import_module(f'sqlalchemy.dialects.{dialect_name}').insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key],
+            set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+        )
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in COUNTERS})
+    raise ValueError(f'Mood rollups are not supported on {dialect_name}')
+
+
+def _write(conn, table, period_column, buckets):
+    if not buckets:
+        return
+    stmt = _increment_statement(table, conn.dialect.name)
+    # Sorted keys keep lock order stable across concurrent writers
+    conn.execute(stmt, [
+        dict(counts, user_id=user_id, **{period_column: period})
+        for (user_id, period), counts in sorted(buckets.items())
+    ])
+
+
+def record_rows(conn, rows):
+    """Add freshly inserted sentiment rows (dicts) to the rollups on `conn`"""
+    daily, weekly = aggregate(rows)
+    _write(conn, mood_daily, 'day', daily)
+    _write(conn, mood_weekly, 'week_start', weekly)
+
+
+def _record_flushed(session, flush_context):
+    rows = [
+        {
+            'user_id': obj.user_id,
+            'sentiment_label': obj.sentiment_label,
+            'sentiment_score': obj.sentiment_score,
+            'created_at': obj.created_at,
+        }
+        for obj in session.new
+        if getattr(obj, '__tablename__', None) == 'sentiment_analysis'
+    ]
+    if rows:
+        record_rows(session.connection(), rows)
+
+
+def backfill(engine, sentiment, user_id=None, since=None, chunk_size=5000):
+    """Rebuild rollups from `sentiment` rows; returns (daily_rows, weekly_rows)
+
+    Runs in one transaction. Rows inserted by other processes while it runs
+    may be counted twice, so run it before enabling rollups or when quiet.
+    """
+    label = func.lower(sentiment.c.sentiment_label)
+    day = func.date(sentiment.c.created_at)
+    query = (
+        select(
+            sentiment.c.user_id,
+            day.label('day'),
+            func.count().label('messages'),
+            func.sum(case((label == 'positive', 1), else_=0)).label('positive'),
+            func.sum(case((label == 'neutral', 1), else_=0)).label('neutral'),
+            func.sum(case((label == 'negative', 1), else_=0)).label('negative'),
+            func.sum(case(
+                (label == 'positive', sentiment.c.sentiment_score),
+                (label == 'negative', -sentiment.c.sentiment_score),
+                else_=0.0,
+            )).label('mood_sum'),
+        )
+        .where(sentiment.c.user_id.isnot(None))
+        .group_by(sentiment.c.user_id, day)
+        .order_by(sentiment.c.user_id, day)
+    )
+    scope_daily, scope_weekly = [], []
+    if user_id is not None:
+        query = query.where(sentiment.c.user_id == user_id)
+        scope_daily.append(mood_daily.c.user_id == user_id)
+        scope_weekly.append(mood_weekly.c.user_id == user_id)
+    if since is not None:
+        # Whole weeks, so weekly rows are rebuilt from complete data
+        since = week_start(_to_date(since))
+        query = query.where(sentiment.c.created_at >= datetime.combine(since, datetime.min.time()))
+        scope_daily.append(mood_daily.c.day >= since)
+        scope_weekly.append(mood_weekly.c.week_start >= since)
+
+    metadata.create_all(engine, checkfirst=True)
+    daily_count, weekly = 0, {}
+    with engine.begin() as conn:
+        conn.execute(delete(mood_daily).where(and_(True, *scope_daily)))
+        conn.execute(delete(mood_weekly).where(and_(True, *scope_weekly)))
+        # Already grouped to one row per user-day, so fetching it all stays small
+        grouped = conn.execute(query).all()
+        for i in range(0, len(grouped), chunk_size):
+            daily = []
+            for row in grouped[i:i + chunk_size]:
+                counts = {name: getattr(row, name) or 0 for name in COUNTERS}
+                counts['mood_sum'] = float(counts['mood_sum'])
+                day_value = _to_date(row.day)
+                daily.append(dict(counts, user_id=row.user_id, day=day_value))
+                week = weekly.setdefault((row.user_id, week_start(day_value)), dict.fromkeys(COUNTERS, 0))
+                for name in COUNTERS:
+                    week[name] += counts[name]
+            conn.execute(mood_daily.insert(), daily)
+            daily_count += len(daily)
+        if weekly:
+            conn.execute(mood_weekly.insert(), [
+                dict(counts, user_id=uid, week_start=period) for (uid, period), counts in sorted(weekly.items())
+            ])
+    return daily_count, len(weekly)
+
+
+def mood_chart(conn, user_id, period='daily', since=None):
+    """Chart points for one user: one per day or week with average mood and label counts"""
+    table, column = (mood_weekly, 'week_start') if period == 'weekly' else (mood_daily, 'day')
+    query = select(table).where(table.c.user_id == user_id).order_by(table.c[column])
+    if since is not None:
+        query = query.where(table.c[column] >= since)
+    return [
+        {
+            'date': row._mapping[column].isoformat(),
+            'messages': row.messages,
+            'average_mood': round(row.mood_sum / row.messages, 4) if row.messages else 0.0,
+            'positive': row.positive,
+            'neutral': row.neutral,
+            'negative': row.negative,
+        }
+        for row in conn.execute(query)
+    ]
+
+
+@mood_progress_bp.route('/api/progress/mood')
+@login_required
+def mood_progress():
+    """Mood chart data for the signed-in user"""
+    from app.read_replicas import read_connection
+    period = 'weekly' if request.args.get('period') == 'weekly' else 'daily'
+    days = min(request.args.get('days', 90, type=int), 3650)
+    since = datetime.utcnow().date() - timedelta(days=days)
+    points = mood_chart(read_connection(), current_user.id, period, since)
+    return jsonify({'period': period, 'points': points})
+
+
+def init_app(app):
+    """Keep rollups current on ORM flushes and register the chart endpoint"""
+    if not app.config.get('MOOD_ROLLUPS_ENABLED', True):
+        return
+    from app.startup import register_tables
+    register_tables(metadata)
+    if not event.contains(Session, 'after_flush', _record_flushed):
+        event.listen(Session, 'after_flush', _record_flushed)
+    app.register_blueprint(mood_progress_bp)
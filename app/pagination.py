@@ -0,0 +1,233 @@
+"""
+Keyset (cursor) pagination for MentWel list endpoints
+
+Histories are listed newest first and paged on (created_at, id) instead of
+LIMIT/OFFSET. The next page starts strictly after the last row returned:
+
+    WHERE owner = :user AND created_at <= :c AND (created_at < :c OR id < :i)
+    ORDER BY created_at DESC, id DESC LIMIT :n + 1
+
+so page 1000 costs the same index range read as page 1, where OFFSET has to
+walk and discard every earlier row. The predicate is spelled out rather than
+as a row-value comparison because MySQL only uses the index for the leading
+`created_at <=` bound. One extra row is fetched to tell whether there is a
+next page. Rows with a NULL created_at are not listed.
+
+Cursors are opaque to clients: the (created_at, id) pair signed with
+SECRET_KEY and salted per listing, so a payments cursor is rejected by the
+sessions endpoint and a tampered one gets a 400.
+
+Clients may ask for only the columns they need with `?fields=id,status`.
+Each listing whitelists its columns; the defaults are carried in the
+listing's index after (owner, created_at, id), so a page of default or fewer
+fields is answered from the index alone. The indexes are created by
+`db.create_all()` (flask init-db); `flask pagination-indexes` adds them to an
+existing database.
+"""
+
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user, login_required
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import Index, and_, event, or_, select
+
+pagination_bp = Blueprint('pagination', __name__)
+
+
+class CursorError(ValueError):
+    """A cursor that was not issued by this listing"""
+
+
+class Listing:
+    """One paged history: owner column, selectable fields and the covered defaults"""
+
+    def __init__(self, name, table_name, owner, fields, defaults):
+        self.name = name
+        self.table_name = table_name
+        self.owner = owner
+        self.fields = fields
+        self.defaults = defaults
+
+    @property
+    def index_name(self):
+        return f'ix_{self.table_name}_{self.owner}_page'
+
+    @property
+    def index_columns(self):
+        keys = [self.owner, 'created_at', 'id']
+        return keys + [name for name in self.defaults if name not in keys]
+
+    def columns(self, requested=None):
+        """Whitelisted column names for a `fields` parameter; ValueError on unknown names"""
+        if not requested:
+            return list(self.defaults)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        # id and created_at are always returned; the next cursor is built from them
+        return ['id', 'created_at'] + [name for name in dict.fromkeys(names) if name not in ('id', 'created_at')]
+
+
+LISTINGS = {
+    'payments': Listing(
+        'payments', 'payments', 'user_id',
+        fields=['id', 'created_at', 'package_id', 'amount', 'status', 'paystack_reference', 'paid_at'],
+        defaults=['id', 'created_at', 'package_id', 'amount', 'status'],
+    ),
+    'sessions': Listing(
+        'sessions', 'therapy_sessions', 'patient_id',
+        fields=['id', 'created_at', 'therapist_id', 'session_type', 'status', 'scheduled_at', 'started_at',
+                'ended_at', 'duration_minutes'],
+        defaults=['id', 'created_at', 'therapist_id', 'session_type', 'status', 'scheduled_at'],
+    ),
+    'therapist_sessions': Listing(
+        'therapist_sessions', 'therapy_sessions', 'therapist_id',
+        fields=['id', 'created_at', 'patient_id', 'session_type', 'status', 'scheduled_at', 'started_at',
+                'ended_at', 'duration_minutes'],
+        defaults=['id', 'created_at', 'patient_id', 'session_type', 'status', 'scheduled_at'],
+    ),
+    'messages': Listing(
+        'messages', 'sentiment_analysis', 'user_id',
+        fields=['id', 'created_at', 'session_id', 'sentiment_label', 'sentiment_score'],
+        defaults=['id', 'created_at', 'session_id', 'sentiment_label', 'sentiment_score'],
+    ),
+}
+
+
+def page_indexes(tables):
+    """Index objects for the listings whose tables are in `tables` (attached on first call)"""
+    indexes = []
+    for listing in LISTINGS.values():
+        table = tables.get(listing.table_name)
+        columns = listing.index_columns
+        if table is None or any(column not in table.c for column in columns):
+            continue
+        existing = {index.name: index for index in table.indexes}
+        indexes.append(existing.get(listing.index_name) or
+                       Index(listing.index_name, *[table.c[column] for column in columns]))
+    return indexes
+
+
+def create_indexes(bind, tables):
+    """Create missing pagination indexes; returns their names"""
+    indexes = page_indexes(tables)
+    for index in indexes:
+        index.create(bind, checkfirst=True)
+    return [index.name for index in indexes]
+
+
+# -- cursors ---------------------------------------------------------------
+
+def cursor_serializer(secret_key, name):
+    return URLSafeSerializer(secret_key, salt=f'mentwel.cursor.{name}')
+
+
+def encode_cursor(serializer, created_at, row_id):
+    return serializer.dumps([created_at.isoformat(), row_id])
+
+
+def decode_cursor(serializer, cursor):
+    """(created_at, id) from a cursor; CursorError when it is forged or malformed"""
+    try:
+        created_at, row_id = serializer.loads(cursor)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (BadSignature, TypeError, ValueError):
+        raise CursorError('Invalid cursor')
+
+
+# -- queries ---------------------------------------------------------------
+
+def keyset_page(conn, table, owner_column, owner_id, columns, after=None, limit=20):
+    """Up to `limit` rows newest first, strictly after the (created_at, id) pair `after`;
+    returns (rows, more)"""
+    created_at, row_id = table.c.created_at, table.c.id
+    query = (
+        select(*[table.c[name] for name in columns])
+        .where(table.c[owner_column] == owner_id, created_at.is_not(None))
+        .order_by(created_at.desc(), row_id.desc())
+        .limit(limit + 1)
+    )
+    if after is not None:
+        last_created, last_id = after
+        query = query.where(and_(created_at <= last_created,
+                                 or_(created_at < last_created, row_id < last_id)))
+    rows = conn.execute(query).all()
+    return rows[:limit], len(rows) > limit
+
+
+def _json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is not None and not isinstance(value, (int, float, str, bool)):
+        return float(value)  # Numeric amounts
+    return value
+
+
+def paginate(name, table, owner_id, key=None):
+    """JSON page of listing `name` for owner_id from the request's cursor, limit and fields"""
+    from app.read_replicas import read_connection
+
+    listing = LISTINGS[name]
+    config = current_app.config
+    default_limit = config.get('PAGINATION_DEFAULT_LIMIT', 20)
+    limit = max(1, min(request.args.get('limit', default_limit, type=int), config.get('PAGINATION_MAX_LIMIT', 100)))
+    serializer = cursor_serializer(config['SECRET_KEY'], name)
+    try:
+        columns = listing.columns(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(serializer, cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows, more = keyset_page(read_connection(), table, listing.owner, owner_id, columns, after, limit)
+    next_cursor = None
+    if more:
+        last = rows[-1]
+        next_cursor = encode_cursor(serializer, last.created_at, last.id)
+    return jsonify({
+        key or name: [{column: _json(value) for column, value in zip(columns, row)} for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+# -- endpoints -------------------------------------------------------------
+
+@pagination_bp.route('/api/payments')
+@login_required
+def list_payments():
+    """Payment history for the signed-in user"""
+    from app.models import Payment
+    return paginate('payments', Payment.__table__, current_user.id)
+
+
+@pagination_bp.route('/api/sessions')
+@login_required
+def list_sessions():
+    """Therapy sessions booked by the signed-in patient, or assigned to the signed-in therapist"""
+    from app.models import TherapySession
+    name = 'therapist_sessions' if current_user.is_therapist else 'sessions'
+    return paginate(name, TherapySession.__table__, current_user.id, key='sessions')
+
+
+@pagination_bp.route('/api/messages')
+@login_required
+def list_messages():
+    """Analyzed chat messages (one sentiment_analysis row each); message text is not stored"""
+    from app.models import SentimentAnalysis
+    return paginate('messages', SentimentAnalysis.__table__, current_user.id)
+
+
+def _create_page_indexes(target, connection, **kw):
+    create_indexes(connection, target.tables)
+
+
+def init_app(app):
+    """Register the paged history endpoints and their indexes"""
+    from app import db
+
+    # db.create_all() (init-db) also creates the covering indexes
+    if not event.contains(db.metadata, 'after_create', _create_page_indexes):
+        event.listen(db.metadata, 'after_create', _create_page_indexes)
+    app.register_blueprint(pagination_bp)
@@ -0,0 +1,100 @@
+"""
+Password hashing service for MentWel
+
+bcrypt runs inline on the request thread with the cost factor from
+BCRYPT_ROUNDS, set per environment in config.py. The login waits for its
+hash either way; what keeps a worker responsive is that bcrypt releases the
+GIL, so with threaded Gunicorn workers (gthread) the worker's other threads
+keep serving requests while a hash is computed.
+
+    password_hash = hash_password(password)
+    if check_user_password(user, password):   # upgrades user.password_hash
+        db.session.commit()                   # when BCRYPT_ROUNDS was raised
+
+Hashes made with a lower cost than BCRYPT_ROUNDS are rehashed on the next
+successful login.
+"""
+
+import re
+
+from flask import current_app, has_app_context
+
+_COST = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PasswordHasher:
+    """bcrypt with a configurable cost factor"""
+
+    def __init__(self, rounds=12):
+        self.rounds = rounds
+
+    def hash(self, password):
+        import bcrypt
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        import bcrypt
+        if not password_hash:
+            return False
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError:
+            # Malformed stored hash
+            return False
+
+    def needs_rehash(self, password_hash):
+        """True when `password_hash` was made with fewer rounds than configured"""
+        match = _COST.match(password_hash or '')
+        return match is not None and int(match.group(1)) < self.rounds
+
+    def verify_and_update(self, password, password_hash):
+        """Return (matches, new_hash); new_hash is None unless an upgrade is due"""
+        if not self.verify(password, password_hash):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, self.hash(password)
+        return True, None
+
+
+def hasher_from_config(config):
+    return PasswordHasher(rounds=config.get('BCRYPT_ROUNDS', 12))
+
+
+_default = None
+
+
+def get_hasher():
+    """The app's hasher, or a default one outside an application context"""
+    global _default
+    if has_app_context() and 'password_hasher' in current_app.extensions:
+        return current_app.extensions['password_hasher']
+    if _default is None:
+        _default = PasswordHasher()
+    return _default
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def check_password(password, password_hash):
+    return get_hasher().verify(password, password_hash)
+
+
+def check_user_password(user, password):
+    """Verify a login and upgrade user.password_hash if its cost is outdated
+
+    The caller commits; the upgraded hash rides along with the login's
+    own writes (e.g. last-login bookkeeping).
+    """
+    matches, new_hash = get_hasher().verify_and_update(password, user.password_hash)
+    if new_hash is not None:
+        user.password_hash = new_hash
+    return matches
+
+
+def init_app(app):
+    """Attach the password hasher configured for this environment"""
+    hasher = hasher_from_config(app.config)
+    app.extensions['password_hasher'] = hasher
+    return hasher
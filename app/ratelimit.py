@@ -0,0 +1,344 @@
+"""
+Shared token-bucket rate limiting for MentWel
+
+Counters live in a pluggable storage backend selected by RATELIMIT_STORAGE_URL:
+
+    memory://                       per-process (development/testing only)
+    sqlite:///instance/ratelimit.db shared by every worker on a single host
+    redis://host:6379/0             shared by every host (needs the redis package)
+    fakeredis://                    in-process stand-in for the Redis backend (needs lupa)
+
+Every backend debits all buckets for a request in one atomic step, so a
+request is either charged against every limit or against none of them.
+A bucket of `count` tokens refilled at count/period per second behaves
+like a sliding window without keeping a timestamp per request, so every
+backend stores two numbers per key.
+"""
+
+import math
+import threading
+import time
+
+from flask import jsonify, request
+
+from app.startup import SQLiteFile
+
+_PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'month': 2592000,
+    'year': 31536000,
+}
+
+
+def parse_limits(value):
+    """Parse "200 per day;50 per hour" (or a list of such strings) into (count, seconds) pairs"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+
+    limits = []
+    for item in value:
+        item = item.strip().lower()
+        if not item:
+            continue
+        count, _, period = item.replace('/', ' per ').partition(' per ')
+        parts = period.split()
+        multiplier = int(parts[0]) if len(parts) > 1 else 1
+        unit = parts[-1].rstrip('s')
+        if unit not in _PERIODS:
+            raise ValueError(f'Unknown rate limit period: {item!r}')
+        limits.append((int(count), multiplier * _PERIODS[unit]))
+    return limits
+
+
+def _take(states, buckets, now, cost):
+    """Refill and debit token buckets; `states` maps key -> (tokens, timestamp)"""
+    allowed = True
+    retry_after = 0.0
+    refilled = []
+    for key, capacity, rate in buckets:
+        tokens, stamp = states.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - stamp) * rate)
+        if tokens < cost:
+            allowed = False
+            retry_after = max(retry_after, (cost - tokens) / rate)
+        refilled.append((key, capacity, rate, tokens))
+
+    remaining = None
+    updates = []
+    for key, capacity, rate, tokens in refilled:
+        if allowed:
+            tokens -= cost
+        # Time at which the bucket is full again; after that the row is disposable
+        expires = now + (capacity - tokens) / rate
+        updates.append((key, tokens, now, expires))
+        remaining = tokens if remaining is None else min(remaining, tokens)
+    return allowed, int(remaining or 0), retry_after, updates
+
+
+class MemoryBackend:
+    """Token buckets held in this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def consume(self, buckets, cost=1, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            allowed, remaining, retry_after, updates = _take(self._states, buckets, now, cost)
+            for key, tokens, stamp, expires in updates:
+                self._states[key] = (tokens, stamp)
+        return allowed, remaining, retry_after
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+
+
+class SQLiteBackend(SQLiteFile):
+    """Token buckets in a WAL-mode SQLite file shared by all workers on a host"""
+
+    PURGE_EVERY = 1000
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS rate_buckets ('
+        'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+        'stamp REAL NOT NULL, expires REAL NOT NULL) WITHOUT ROWID',
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._calls = 0
+
+    def consume(self, buckets, cost=1, now=None):
+        now = time.time() if now is None else now
+        conn = self.connect()
+        keys = [key for key, _, _ in buckets]
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT key, tokens, stamp FROM rate_buckets WHERE key IN (%s)'
+                % ','.join('?' * len(keys)),
+                keys,
+            ).fetchall()
+            states = {key: (tokens, stamp) for key, tokens, stamp in rows}
+            allowed, remaining, retry_after, updates = _take(states, buckets, now, cost)
+            conn.executemany(
+                'INSERT OR REPLACE INTO rate_buckets (key, tokens, stamp, expires) '
+                'VALUES (?, ?, ?, ?)',
+                updates,
+            )
+            self._calls += 1
+            if self._calls % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM rate_buckets WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, remaining, retry_after
+
+    def reset(self):
+        self.connect().execute('DELETE FROM rate_buckets')
+
+
+# KEYS are bucket keys; ARGV holds (capacity, rate) pairs followed by cost.
+# The server clock is used so that hosts with skewed clocks agree.
+_REDIS_SCRIPT = """
+local n = #KEYS
+local cost = tonumber(ARGV[2 * n + 1])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local allowed = 1
+local retry = 0
+local tokens = {}
+for i = 1, n do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'stamp')
+    local level = tonumber(state[1]) or capacity
+    local stamp = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - stamp) * rate)
+    if level < cost then
+        allowed = 0
+        retry = math.max(retry, (cost - level) / rate)
+    end
+    tokens[i] = level
+end
+local remaining = -1
+for i = 1, n do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    if allowed == 1 then
+        tokens[i] = tokens[i] - cost
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i], 'stamp', now)
+    redis.call('EXPIRE', KEYS[i], math.ceil((capacity - tokens[i]) / rate) + 1)
+    if remaining < 0 or tokens[i] < remaining then
+        remaining = tokens[i]
+    end
+end
+return {allowed, math.floor(remaining), tostring(retry)}
+"""
+
+
+class RedisBackend:
+    """Token buckets in Redis, updated atomically by a server-side Lua script"""
+
+    def __init__(self, client, prefix='mentwel:rl:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_SCRIPT)
+
+    def consume(self, buckets, cost=1, now=None):
+        keys = [self.prefix + key for key, _, _ in buckets]
+        args = []
+        for _, capacity, rate in buckets:
+            args.extend((capacity, rate))
+        args.append(cost)
+        allowed, remaining, retry_after = self._script(keys=keys, args=args)
+        return bool(int(allowed)), int(remaining), float(retry_after)
+
+    def reset(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class FakeRedis:
+    """In-process stand-in for the subset of redis-py that RedisBackend uses
+
+    Scripts run in an embedded Lua interpreter (the `lupa` package) against
+    an in-memory keyspace, so tests exercise the same Lua as a real server.
+    """
+
+    def __init__(self, clock=time.time):
+        try:
+            import lupa
+        except ImportError:
+            raise RuntimeError('fakeredis:// runs the Lua script locally; run `pip install lupa`')
+        self.clock = clock
+        self._lua = lupa.LuaRuntime()
+        self._lua.globals()['redis'] = self._lua.table(call=self._call)
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._expires = {}
+
+    def _live(self, key, now):
+        if key in self._expires and self._expires[key] <= now:
+            del self._expires[key]
+            self._hashes.pop(key, None)
+        return self._hashes.get(key)
+
+    def _call(self, command, *args):
+        command = command.upper()
+        now = self.clock()
+        if command == 'TIME':
+            return self._lua.table_from([str(int(now)), str(int(now % 1 * 1000000))])
+        key = args[0]
+        fields = self._live(key, now)
+        if command == 'HMGET':
+            # Redis hands missing fields to Lua as false
+            return self._lua.table_from([(fields or {}).get(field, False) for field in args[1:]])
+        if command == 'HSET':
+            fields = self._hashes.setdefault(key, {})
+            pairs = args[1:]
+            for field, value in zip(pairs[::2], pairs[1::2]):
+                fields[field] = str(value)
+            return len(pairs) // 2
+        if command == 'EXPIRE':
+            if fields is None:
+                return 0
+            self._expires[key] = now + int(args[1])
+            return 1
+        raise ValueError(f'FakeRedis does not support {command}')
+
+    def register_script(self, script):
+        # Redis runs scripts as a function body with KEYS and ARGV in scope
+        function = self._lua.eval(f'function(KEYS, ARGV)\n{script}\nend')
+
+        def run(keys=(), args=()):
+            with self._lock:
+                result = function(self._lua.table_from(list(keys)),
+                                  self._lua.table_from([str(arg) for arg in args]))
+            # Lua numbers come back as integers and strings as bulk replies
+            return [value.encode() if isinstance(value, str) else int(value) for value in result.values()]
+        return run
+
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip('*')
+        now = self.clock()
+        with self._lock:
+            return [key for key in list(self._hashes) if key.startswith(prefix) and self._live(key, now)]
+
+    def delete(self, key):
+        with self._lock:
+            self._hashes.pop(key, None)
+            self._expires.pop(key, None)
+
+
+def backend_from_url(url):
+    """Build a storage backend from a RATELIMIT_STORAGE_URL"""
+    url = url or 'memory://'
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith('fakeredis://'):
+        return RedisBackend(FakeRedis())
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL uses Redis; run `pip install redis`')
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL: {url}')
+
+
+class TokenBucketLimiter:
+    """Applies a set of (count, seconds) limits per client key"""
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits
+        self.exempt = set()  # endpoint names that are never limited
+
+    def hit(self, key, cost=1):
+        """Charge one request to `key`; returns (allowed, remaining, retry_after)"""
+        buckets = [
+            (f'{key}:{count}/{seconds}', count, count / seconds)
+            for count, seconds in self.limits
+        ]
+        return self.backend.consume(buckets, cost=cost)
+
+
+def init_app(app):
+    """Enforce RATELIMIT_DEFAULT for every request through the shared backend"""
+    limits = parse_limits(app.config.get('RATELIMIT_DEFAULT'))
+    if not limits or not app.config.get('RATELIMIT_ENABLED', True):
+        return None
+
+    limiter = TokenBucketLimiter(
+        backend_from_url(app.config.get('RATELIMIT_STORAGE_URL')), limits
+    )
+    app.extensions['mentwel_ratelimit'] = limiter
+    # Default limits are enforced here; Flask-Limiter keeps per-route decorators only
+    app.config['RATELIMIT_DEFAULT'] = []
+
+    @app.before_request
+    def check_rate_limit():
+        if request.endpoint == 'static' or request.endpoint in limiter.exempt:
+            return None
+        allowed, remaining, retry_after = limiter.hit(request.remote_addr or '127.0.0.1')
+        if not allowed:
+            response = jsonify({'error': 'Rate limit exceeded. Please try again later.'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+            response.headers['X-RateLimit-Remaining'] = '0'
+            return response
+        return None
+
+    return limiter
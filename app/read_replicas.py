@@ -0,0 +1,224 @@
+"""
+Read replica routing for MentWel
+
+With SQLALCHEMY_REPLICA_URIS set (comma separated URLs), db.session becomes a
+RoutingSession that chooses the engine per statement:
+
+- Plain SELECTs go to a replica, one per session, picked round robin.
+- The primary serves flushes and INSERT/UPDATE/DELETE, SELECT .. FOR UPDATE,
+  raw text() statements and db.session.connection() without arguments.
+- Once a session has written, everything it runs afterwards uses the
+  primary, so a transaction always reads its own writes.
+- Requests other than GET/HEAD/OPTIONS use the primary throughout, as does
+  code inside `with use_primary():` (read-modify-write in a GET handler).
+
+Read-your-writes across requests: a request that commits a write sets the
+REPLICA_STICKY_COOKIE cookie, and that client's reads stay on the primary for
+the next REPLICA_STICKY_SECONDS, which should exceed the replication lag.
+
+Core reads that may use a replica call `read_connection()` instead of
+db.session.connection(); jobs that do not use the session take
+`read_engine(app)`.
+
+A replica that cannot be connected to, or drops a connection, is skipped for
+REPLICA_RETRY_SECONDS and its reads fall back to the next replica or the
+primary. A statement that fails after a replica connection was established
+is not retried; the next session picks another engine.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.instrumentation import HELP, metrics
+
+HELP['mentwel_db_read_routing_total'] = 'Sessions whose reads were routed to a replica or fell back to the primary'
+
+# session.info keys
+_PRIMARY = 'replica_use_primary'
+_REPLICA = 'replica_engine'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """Replica engines with round robin selection and a cool-off for failed ones"""
+
+    def __init__(self, engines, retry_seconds=30):
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self._down = {}
+        self._cycle = itertools.cycle(range(len(self.engines)))
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    def candidates(self):
+        """Replicas to try, healthy ones first from the next round robin position"""
+        with self._lock:
+            start = next(self._cycle)
+        now = time.monotonic()
+        ordered = self.engines[start:] + self.engines[:start]
+        return [engine for engine in ordered if self._down.get(engine, 0) <= now]
+
+    def mark_down(self, engine):
+        self._down[engine] = time.monotonic() + self.retry_seconds
+        current_app.logger.warning('Read replica %s unavailable for %ss', engine.url.render_as_string(),
+                                   self.retry_seconds)
+
+    def healthy(self, engine):
+        return self._down.get(engine, 0) <= time.monotonic()
+
+    def reader(self, session):
+        """The session's replica, connecting to one if needed; None when all are down"""
+        engine = session.info.get(_REPLICA)
+        if engine is not None and self.healthy(engine):
+            return engine
+        for engine in self.candidates():
+            try:
+                # Connect now, so a dead replica falls back here instead of failing the query
+                session.connection(bind_arguments={'bind': engine})
+            except DBAPIError:
+                self.mark_down(engine)
+                continue
+            session.info[_REPLICA] = engine
+            metrics.inc('mentwel_db_read_routing_total', (('target', 'replica'),))
+            return engine
+        metrics.inc('mentwel_db_read_routing_total', (('target', 'primary'),))
+        return None
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine is not None:
+            self._down[context.engine] = time.monotonic() + self.retry_seconds
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+class RoutingSession(FlaskSession):
+    """Flask-SQLAlchemy session that sends read-only statements to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, replica=False, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or self.info.get(_PRIMARY):
+            return engine
+        router = current_app.extensions.get('read_replicas')
+        if router is None or engine is not self._db.engine:
+            return engine
+        if replica or (isinstance(clause, Select) and clause._for_update_arg is None):
+            return router.reader(self) or engine
+        return engine
+
+
+def read_connection(session=None):
+    """A connection for read-only Core queries: a replica unless the session must use the primary"""
+    if session is None:
+        from app import db
+        session = db.session
+    return session.connection(bind_arguments={'replica': True})
+
+
+def read_engine(app):
+    """A healthy replica engine for jobs outside the ORM session, else the primary"""
+    from app import db
+    router = app.extensions.get('read_replicas')
+    engines = router.candidates() if router is not None else []
+    if engines:
+        return engines[0]
+    with app.app_context():
+        return db.engine
+
+
+@contextmanager
+def use_primary(session=None):
+    """Run the rest of the session, not just the block, against the primary"""
+    if session is None:
+        from app import db
+        session = db.session
+    session.info[_PRIMARY] = True
+    yield session
+
+
+def _mark_written(session, *args):
+    session.info[_PRIMARY] = True
+    session.info['replica_wrote'] = True
+
+
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_written(orm_execute_state.session)
+
+
+def _stick_after_commit(session):
+    if session.info.pop('replica_wrote', False) and has_request_context():
+        g._replica_sticky = True
+
+
+def _discard_written(session):
+    session.info.pop('replica_wrote', None)
+
+
+def _before_request():
+    from app import db
+    config = current_app.config
+    try:
+        sticky_until = float(request.cookies.get(config['REPLICA_STICKY_COOKIE']) or 0)
+    except ValueError:
+        sticky_until = 0
+    if request.method not in SAFE_METHODS or sticky_until > time.time():
+        db.session.info[_PRIMARY] = True
+
+
+def _after_request(response):
+    if g.pop('_replica_sticky', False):
+        config = current_app.config
+        seconds = config.get('REPLICA_STICKY_SECONDS', 5)
+        response.set_cookie(
+            config['REPLICA_STICKY_COOKIE'],
+            str(int(time.time() + seconds) + 1),
+            max_age=seconds + 1,
+            secure=config.get('SESSION_COOKIE_SECURE', False),
+            httponly=True,
+            samesite='Lax',
+        )
+    return response
+
+
+def router_from_config(app):
+    """Replica engines for SQLALCHEMY_REPLICA_URIS (None when no replicas are configured)"""
+    urls = [url.strip() for url in (app.config.get('SQLALCHEMY_REPLICA_URIS') or '').split(',') if url.strip()]
+    if not urls:
+        return None
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    engines = [create_engine(url, **({} if url.startswith('sqlite') else options)) for url in urls]
+    return ReplicaRouter(engines, retry_seconds=app.config.get('REPLICA_RETRY_SECONDS', 30))
+
+
+def init_app(app):
+    """Route db.session reads to the configured replicas"""
+    router = router_from_config(app)
+    if router is None:
+        return
+    from app import db
+
+    app.extensions['read_replicas'] = router
+    factory = db.session.session_factory
+    if not issubclass(factory.class_, RoutingSession):
+        factory.class_ = RoutingSession
+
+    if not event.contains(Session, 'after_flush', _mark_written):
+        event.listen(Session, 'after_flush', _mark_written)
+        event.listen(Session, 'do_orm_execute', _mark_dml)
+        event.listen(Session, 'after_commit', _stick_after_commit)
+        event.listen(Session, 'after_rollback', _discard_written)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,593 @@
+"""
+Real-time channel for therapy sessions
+
+Instead of polling, participants of a TherapySession hold one connection to
+the realtime hub and receive the session's events as they happen:
+
+    message    a written message was saved (published by the Flask route)
+    typing     a participant is typing (sent by clients over the WebSocket)
+    read       a participant has read up to a message
+    presence   a participant connected or disconnected
+
+The hub is a small asyncio server (`flask realtime`), run next to Gunicorn
+and proxied by Nginx under /realtime/. An idle connection costs a couple of
+coroutines and a few KB instead of a blocked Gunicorn worker. Clients connect
+with either transport:
+
+    GET /realtime/sessions/<id>/events?token=...   Server-Sent Events
+    GET /realtime/sessions/<id>/ws?token=...       WebSocket (also sends typing/read)
+
+Tokens come from GET /api/sessions/<id>/realtime, which checks that the
+signed-in user is the session's patient or therapist; they are short-lived
+and only needed to open the connection. WebSocket framing (masking, UTF-8,
+control frames, close handshake) is left to wsproto, and browser handshakes
+must come from an origin in REALTIME_ALLOWED_ORIGINS (default: the host the
+hub is reached on).
+
+Fan-out goes through a broker chosen by REALTIME_BROKER_URL:
+
+    memory://              in-process (tests, or Flask and hub in one process)
+    http://127.0.0.1:8765  Gunicorn workers post events to a single hub
+    redis://host:6379/0    Redis pub/sub; any number of hubs and workers
+
+Events are not stored by the hub: a client that reconnects reloads the
+session history over HTTP and then follows the stream.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import importlib.util
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from flask import Blueprint, abort, current_app, jsonify
+from flask_login import current_user, login_required
+
+TOKEN_SALT = 'mentwel-realtime'
+
+# Events clients may send over a WebSocket; messages themselves go through HTTP
+CLIENT_EVENTS = ('typing', 'read')
+
+_OVERFLOW = object()
+
+realtime_bp = Blueprint('realtime', __name__)
+
+
+def channel_name(session_id):
+    return f'session:{session_id}'
+
+
+def sign(secret, body):
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def make_token(secret, user_id, session_id, role):
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(secret, salt=TOKEN_SALT).dumps({'u': user_id, 's': session_id, 'r': role})
+
+
+def read_token(secret, token, max_age):
+    """Token payload, or None when it is forged or expired"""
+    from itsdangerous import BadSignature, URLSafeTimedSerializer
+    try:
+        return URLSafeTimedSerializer(secret, salt=TOKEN_SALT).loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+
+
+# -- brokers ---------------------------------------------------------------
+
+class MemoryBroker:
+    """In-process fan-out to every hub listening in this process"""
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            listeners = list(self._listeners)
+        for deliver in listeners:
+            deliver(channel, message)
+        return len(listeners)
+
+    def start(self, deliver):
+        with self._lock:
+            self._listeners.append(deliver)
+
+    def stop(self, deliver):
+        with self._lock:
+            if deliver in self._listeners:
+                self._listeners.remove(deliver)
+
+
+class RedisBroker:
+    """Redis pub/sub; each hub subscribes to every session channel"""
+
+    def __init__(self, client, prefix='mentwel:rt:'):
+        self.client = client
+        self.prefix = prefix
+        self._pubsub = None
+
+    def publish(self, channel, message):
+        return self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def start(self, deliver):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(self.prefix + '*')
+
+        def listen():
+            for item in self._pubsub.listen():
+                channel = item['channel']
+                if isinstance(channel, bytes):
+                    channel = channel.decode('utf-8')
+                deliver(channel[len(self.prefix):], json.loads(item['data']))
+
+        threading.Thread(target=listen, name='realtime-redis', daemon=True).start()
+
+    def stop(self, deliver):
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+class HubPublisher:
+    """Publish-only broker: POSTs events to a hub's /internal/publish endpoint"""
+
+    def __init__(self, url, secret, timeout=1.0):
+        self.url = url.rstrip('/') + '/internal/publish'
+        self.secret = secret
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        # One keep-alive connection per thread to the local hub
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def publish(self, channel, message):
+        body = json.dumps({'channel': channel, 'message': message}).encode('utf-8')
+        response = self._session().post(
+            self.url, data=body, timeout=self.timeout,
+            headers={'Content-Type': 'application/json', 'X-Realtime-Signature': sign(self.secret, body)},
+        )
+        response.raise_for_status()
+        return response.json().get('delivered', 0)
+
+    def start(self, deliver):
+        raise RuntimeError('An http:// REALTIME_BROKER_URL only publishes; the hub itself uses memory://')
+
+
+def broker_from_url(url, secret=None):
+    """Build a broker from a REALTIME_BROKER_URL"""
+    url = url or 'memory://'
+    if url.startswith('memory://'):
+        return MemoryBroker()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('REALTIME_BROKER_URL uses Redis; run `pip install redis`')
+        return RedisBroker(redis.Redis.from_url(url))
+    if url.startswith(('http://', 'https://')):
+        return HubPublisher(url, secret)
+    raise ValueError(f'Unsupported REALTIME_BROKER_URL: {url}')
+
+
+# -- hub -------------------------------------------------------------------
+
+class Connection:
+    """One subscriber: a bounded outgoing queue feeding an SSE or WebSocket writer"""
+
+    def __init__(self, user_id, session_id, role, queue_size):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.role = role
+        self.queue = asyncio.Queue(queue_size)
+
+    def push(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind is cut off; it reconnects and reloads history
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_OVERFLOW)
+
+
+class HttpError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def origin_allowed(origin, host, allowed=None):
+    """Whether a browser's Origin may open a WebSocket
+
+    Clients that send no Origin (not browsers) are left to the token check.
+    """
+    if not origin:
+        return True
+    origin = origin.rstrip('/').lower()
+    if allowed:
+        return origin in allowed
+    return bool(host) and urlsplit(origin).netloc == host.lower()
+
+
+class Hub:
+    """asyncio SSE/WebSocket server fanning broker events out to session participants"""
+
+    route = re.compile(r'^/sessions/(\d+)/(events|ws)$')
+
+    def __init__(self, broker, secret, token_ttl=60, heartbeat=25, queue_size=100,
+                 prefix='/realtime', max_frame=16384, allowed_origins=None, logger=None):
+        self.broker = broker
+        self.secret = secret
+        self.token_ttl = token_ttl
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.prefix = prefix.rstrip('/')
+        self.max_frame = max_frame
+        self.allowed_origins = {o.rstrip('/').lower() for o in allowed_origins or ()}
+        self.logger = logger
+        self.channels = {}
+        self.loop = None
+        self.server = None
+        self.delivered = 0
+
+    @property
+    def connections(self):
+        return sum(len(members) for members in self.channels.values())
+
+    # -- fan-out ---------------------------------------------------------
+
+    def deliver(self, channel, message):
+        """Broker callback; safe to call from any thread"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._fanout(channel, message)
+        else:
+            self.loop.call_soon_threadsafe(self._fanout, channel, message)
+
+    def _fanout(self, channel, message):
+        for connection in list(self.channels.get(channel, ())):
+            connection.push(message)
+            self.delivered += 1
+
+    def _join(self, connection):
+        channel = channel_name(connection.session_id)
+        self.channels.setdefault(channel, set()).add(connection)
+        self._presence(connection, True)
+
+    def _leave(self, connection):
+        channel = channel_name(connection.session_id)
+        members = self.channels.get(channel)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.channels[channel]
+        self._presence(connection, False)
+
+    def _presence(self, connection, online):
+        self._publish(connection.session_id, {
+            'type': 'presence', 'user_id': connection.user_id, 'role': connection.role, 'online': online,
+        })
+
+    def _publish(self, session_id, message):
+        message = dict(message, session_id=session_id, sent_at=time.time())
+        try:
+            self.broker.publish(channel_name(session_id), message)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('realtime publish failed: %s', e)
+
+    # -- HTTP ------------------------------------------------------------
+
+    async def _read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return head, method, target, headers
+
+    @staticmethod
+    def _respond(writer, status, reason, body=b'', content_type='application/json', extra=()):
+        lines = [f'HTTP/1.1 {status} {reason}', f'Content-Type: {content_type}',
+                 f'Content-Length: {len(body)}', 'Connection: close', *extra]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                head, method, target, headers = await self._read_request(reader)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                return
+            url = urlsplit(target)
+            path = url.path
+            if path.startswith(self.prefix):
+                path = path[len(self.prefix):]
+            try:
+                if path == '/internal/publish' and method == 'POST':
+                    await self._internal_publish(reader, writer, headers)
+                elif path == '/health' and method == 'GET':
+                    body = json.dumps({'connections': self.connections, 'channels': len(self.channels),
+                                       'delivered': self.delivered}).encode()
+                    self._respond(writer, 200, 'OK', body)
+                else:
+                    match = self.route.match(path)
+                    if match is None or method != 'GET':
+                        raise HttpError(404, 'Not Found')
+                    connection = self._authorize(int(match.group(1)), parse_qs(url.query).get('token', [''])[0])
+                    if match.group(2) == 'ws':
+                        await self._websocket(reader, writer, head, headers, connection)
+                    else:
+                        await self._event_stream(reader, writer, connection)
+            except HttpError as e:
+                self._respond(writer, e.status, e.reason, json.dumps({'error': e.reason}).encode())
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorize(self, session_id, token):
+        claims = read_token(self.secret, token, self.token_ttl) if token else None
+        if claims is None or claims.get('s') != session_id:
+            raise HttpError(403, 'Forbidden')
+        return Connection(claims['u'], session_id, claims.get('r'), self.queue_size)
+
+    async def _internal_publish(self, reader, writer, headers):
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, 'Bad Request')
+        if length > 65536:
+            raise HttpError(413, 'Payload Too Large')
+        body = await reader.readexactly(length)
+        if not hmac.compare_digest(sign(self.secret, body), headers.get('x-realtime-signature', '')):
+            raise HttpError(403, 'Forbidden')
+        try:
+            event = json.loads(body)
+            channel, message = event['channel'], event['message']
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, 'Bad Request')
+        if not isinstance(channel, str) or not isinstance(message, dict):
+            raise HttpError(400, 'Bad Request')
+        delivered = self.broker.publish(channel, message)
+        self._respond(writer, 202, 'Accepted', json.dumps({'delivered': delivered}).encode())
+
+    # -- transports ------------------------------------------------------
+
+    async def _event_stream(self, reader, writer, connection):
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+            b'X-Accel-Buffering: no\r\nConnection: keep-alive\r\n\r\nretry: 3000\n\n'
+        )
+        await writer.drain()
+
+        async def send():
+            while True:
+                try:
+                    message = await asyncio.wait_for(connection.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                else:
+                    if message is _OVERFLOW:
+                        return
+                    writer.write(f"event: {message.get('type', 'message')}\ndata: {json.dumps(message)}\n\n"
+                                 .encode('utf-8'))
+                await writer.drain()
+
+        async def closed():
+            # SSE clients never send; EOF means they went away
+            while await reader.read(1024):
+                pass
+
+        await self._run(connection, send(), closed())
+
+    async def _websocket(self, reader, writer, head, headers, connection):
+        from wsproto import ConnectionType, WSConnection
+        from wsproto.events import AcceptConnection, CloseConnection, Ping, Request, TextMessage
+        from wsproto.utilities import RemoteProtocolError
+
+        if not origin_allowed(headers.get('origin'), headers.get('host'), self.allowed_origins):
+            raise HttpError(403, 'Forbidden')
+        ws = WSConnection(ConnectionType.SERVER)
+        try:
+            ws.receive_data(head)
+            request = next(ws.events(), None)
+        except RemoteProtocolError:
+            request = None
+        if not isinstance(request, Request):
+            raise HttpError(400, 'Bad Request')
+        writer.write(ws.send(AcceptConnection()))
+        await writer.drain()
+
+        async def send():
+            while True:
+                try:
+                    message = await asyncio.wait_for(connection.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(ws.send(Ping()))
+                else:
+                    if message is _OVERFLOW:
+                        writer.write(ws.send(CloseConnection(code=1008, reason='too slow')))
+                        await writer.drain()
+                        return
+                    writer.write(ws.send(TextMessage(data=json.dumps(message))))
+                await writer.drain()
+
+        async def receive():
+            parts, size = [], 0
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    return
+                ws.receive_data(data)
+                for event in ws.events():
+                    if isinstance(event, CloseConnection):
+                        # Also how wsproto reports bad UTF-8, unmasked or oversized control frames
+                        writer.write(ws.send(event.response()))
+                        await writer.drain()
+                        return
+                    if isinstance(event, Ping):
+                        writer.write(ws.send(event.response()))
+                    elif isinstance(event, TextMessage):
+                        size += len(event.data)
+                        if size > self.max_frame:
+                            writer.write(ws.send(CloseConnection(code=1009)))
+                            await writer.drain()
+                            return
+                        parts.append(event.data)
+                        if event.message_finished:
+                            self._client_event(connection, ''.join(parts))
+                            parts, size = [], 0
+                await writer.drain()
+
+        await self._run(connection, send(), receive())
+
+    def _client_event(self, connection, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(event, dict) or event.get('type') not in CLIENT_EVENTS:
+            return
+        message = {'type': event['type'], 'user_id': connection.user_id, 'role': connection.role}
+        if event['type'] == 'read' and isinstance(event.get('message_id'), int):
+            message['message_id'] = event['message_id']
+        self._publish(connection.session_id, message)
+
+    async def _run(self, connection, *coroutines):
+        self._join(connection)
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._leave(connection)
+
+    # -- lifecycle -------------------------------------------------------
+
+    async def serve(self, host='127.0.0.1', port=8765, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.broker.start(self.deliver)
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        if ready is not None:
+            ready.set()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            # stop() closes the server, which cancels serve_forever()
+            pass
+        finally:
+            self.broker.stop(self.deliver)
+
+    def run(self, host='127.0.0.1', port=8765):
+        asyncio.run(self.serve(host, port))
+
+    def start_background(self, host='127.0.0.1', port=8765):
+        """Run the hub on a daemon thread (tests, single-process development)"""
+        ready = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self.serve(host, port, ready)),
+                         name='realtime-hub', daemon=True).start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+
+def hub_from_config(app):
+    """The hub for `flask realtime`; an http:// broker means this hub is the fan-out point"""
+    # Only probed here; the hub's connections import wsproto when they open
+    if importlib.util.find_spec('wsproto') is None:
+        raise RuntimeError('The realtime hub needs wsproto for WebSockets; run `pip install wsproto`')
+    secret = app.config.get('SECRET_KEY')
+    broker = app.extensions.get('realtime_broker')
+    if broker is None or isinstance(broker, HubPublisher):
+        broker = MemoryBroker()
+    return Hub(
+        broker,
+        secret,
+        token_ttl=app.config.get('REALTIME_TOKEN_TTL', 60),
+        heartbeat=app.config.get('REALTIME_HEARTBEAT', 25),
+        queue_size=app.config.get('REALTIME_QUEUE_SIZE', 100),
+        prefix=app.config.get('REALTIME_PATH', '/realtime'),
+        allowed_origins=[o.strip() for o in (app.config.get('REALTIME_ALLOWED_ORIGINS') or '').split(',')
+                         if o.strip()],
+        logger=app.logger,
+    )
+
+
+# -- Flask side ------------------------------------------------------------
+
+def publish_session_event(session_id, event_type, **data):
+    """Push an event to everyone connected to a therapy session; call after commit
+
+    Delivery is best effort: failures are logged and the caller's request
+    carries on, since clients reload history when they reconnect.
+    """
+    broker = current_app.extensions.get('realtime_broker')
+    if broker is None:
+        return False
+    message = dict(data, type=event_type, session_id=session_id, sent_at=time.time())
+    try:
+        broker.publish(channel_name(session_id), message)
+    except Exception as e:
+        current_app.logger.warning('realtime publish to session %s failed: %s', session_id, e)
+        return False
+    return True
+
+
+@realtime_bp.route('/api/sessions/<int:session_id>/realtime')
+@login_required
+def realtime_ticket(session_id):
+    """Short-lived token and URLs for the session's push channel"""
+    from app import db
+    from app.models import TherapySession
+    session = db.session.get(TherapySession, session_id)
+    if session is None:
+        abort(404)
+    if current_user.id == session.patient_id:
+        role = 'patient'
+    elif current_user.id == session.therapist_id:
+        role = 'therapist'
+    else:
+        abort(403)
+    token = make_token(current_app.config['SECRET_KEY'], current_user.id, session_id, role)
+    base = f"{current_app.config.get('REALTIME_PATH', '/realtime').rstrip('/')}/sessions/{session_id}"
+    return jsonify({
+        'token': token,
+        'expires_in': current_app.config.get('REALTIME_TOKEN_TTL', 60),
+        'events_url': f'{base}/events?token={token}',
+        'websocket_url': f'{base}/ws?token={token}',
+    })
+
+
+def init_app(app):
+    """Attach the realtime broker and the ticket endpoint"""
+    if not app.config.get('REALTIME_ENABLED', True):
+        return
+    app.extensions['realtime_broker'] = broker_from_url(
+        app.config.get('REALTIME_BROKER_URL'), app.config.get('SECRET_KEY')
+    )
+    app.register_blueprint(realtime_bp)
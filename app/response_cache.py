@@ -0,0 +1,450 @@
+"""
+Response and fragment cache for MentWel
+
+Pages that change only when an admin edits them (the session package
+catalog, therapist profiles, the landing page) are rendered once and served
+from the cache until a commit touches the rows they were built from:
+
+    @bp.route('/api/packages')
+    @cached(tags=('packages',))
+    def packages(): ...
+
+    @bp.route('/therapists/<int:therapist_id>')
+    @cached(tags=lambda therapist_id: (f'therapist:{therapist_id}',))
+    def therapist_profile(therapist_id): ...
+
+    @bp.route('/')
+    @cached(tags=('packages', 'therapists'), per_user=True, ttl=60)
+    def index(): ...
+
+    {% cache 'therapist_card', therapist.id, tags=['therapist:%d' % therapist.id] %}
+        ...expensive markup...
+    {% endcache %}
+
+Cached responses carry a strong ETag; a matching If-None-Match gets a 304
+without a body. per_user=True keys entries by the logged-in user (anonymous
+visitors share one entry) and marks them private; without it the view must
+not depend on who is asking.
+
+Invalidation is by tag. Every tag has a version, bumped after a commit that
+inserts, updates or deletes a row the tag covers (see TAG_RULES); an entry
+is served only while the versions it was built under are current. Core
+statements and bulk loads bypass the ORM events and should call
+invalidate(*tags) themselves.
+
+Backends (RESPONSE_CACHE_URL):
+    memory://            per-process LRU, bounded by entries and bytes (default)
+    sqlite:///path.db    WAL-mode SQLite file shared by the workers on one host
+    redis://host:6379/0  Redis, shared by every host
+
+Hits, misses and 304s are counted per cache name in the request metrics
+(mentwel_cache_requests_total), so /metrics and `flask cache-stats` report
+hit rates for all workers.
+"""
+
+import functools
+import hashlib
+import json
+import threading
+import time
+import weakref
+
+from flask import current_app, make_response, request
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.inference_cache import LRUCache
+from app.instrumentation import HELP, metrics
+from app.startup import SQLiteFile
+
+HELP['mentwel_cache_requests_total'] = 'Response and fragment cache lookups by cache name and result'
+
+# Response headers kept with a cached response; anything else is per request
+KEEP_HEADERS = ('Content-Type', 'Content-Language', 'Content-Disposition')
+
+# users columns shown on therapist profiles and listings
+THERAPIST_PROFILE = (
+    'is_therapist', 'therapist_verified', 'therapist_specialization', 'therapist_bio',
+    'therapist_rating', 'therapist_sessions_count', 'anonymous_id',
+)
+
+# Caches built in this process, invalidated after ORM commits
+_live = weakref.WeakSet()
+
+
+def _therapist_tags(obj, changed):
+    was_therapist = True in inspect(obj).attrs.is_therapist.history.deleted
+    if (obj.is_therapist or was_therapist) and changed(THERAPIST_PROFILE):
+        return ('therapists', f'therapist:{obj.id}')
+    return ()
+
+
+# table name -> rule(obj, changed) returning the tags a committed row invalidates;
+# changed(names) tells whether any of those attributes changed (always true for
+# inserted and deleted rows)
+TAG_RULES = {
+    'session_packages': lambda obj, changed: ('packages',),
+    'users': _therapist_tags,
+}
+
+
+# -- backends --------------------------------------------------------------
+
+def pack(meta, body):
+    return json.dumps(meta, separators=(',', ':')).encode('utf-8') + b'\n' + body
+
+
+def unpack(payload):
+    meta, body = payload.split(b'\n', 1)
+    return json.loads(meta), body
+
+
+class LocalBackend:
+    """Per-process LRU; tag versions live in a dict"""
+
+    def __init__(self, lru):
+        self.lru = lru
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.lru.get(key)
+
+    def set(self, key, meta, body, ttl):
+        # + rough size of the metadata, so tiny entries still count against max_bytes
+        self.lru.set(key, (meta, body), len(body) + 200, ttl=ttl)
+
+    def versions(self, tags):
+        return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        self.lru.clear()
+
+
+class SQLiteBackend(SQLiteFile):
+    """Shared layer in a WAL-mode SQLite file"""
+
+    PURGE_EVERY = 500  # sets between deleting expired entries
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS response_cache ('
+        'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS response_cache_tags ('
+        'tag TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID',
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._sets = 0
+
+    def get(self, key):
+        row = self.connect().execute(
+            'SELECT value FROM response_cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return unpack(row[0]) if row else None
+
+    def set(self, key, meta, body, ttl):
+        now = time.time()
+        conn = self.connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pack(meta, body), now + ttl),
+        )
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM response_cache WHERE expires < ?', (now,))
+
+    def versions(self, tags):
+        found = dict(self.connect().execute(
+            f'SELECT tag, version FROM response_cache_tags WHERE tag IN ({",".join("?" * len(tags))})',
+            list(tags),
+        ).fetchall()) if tags else {}
+        return {tag: found.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        self.connect().executemany(
+            'INSERT INTO response_cache_tags (tag, version) VALUES (?, 1) '
+            'ON CONFLICT(tag) DO UPDATE SET version = version + 1',
+            [(tag,) for tag in tags],
+        )
+
+    def clear(self):
+        self.connect().execute('DELETE FROM response_cache')
+
+
+class RedisBackend:
+    """Shared layer in Redis: entries expire by TTL, tag versions live in one hash"""
+
+    def __init__(self, client, prefix='mentwel:cache:'):
+        self.client = client
+        self.prefix = prefix
+        self.tags_key = prefix + 'tags'
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        return unpack(payload) if payload is not None else None
+
+    def set(self, key, meta, body, ttl):
+        self.client.set(self.prefix + key, pack(meta, body), ex=int(ttl))
+
+    def versions(self, tags):
+        values = self.client.hmget(self.tags_key, list(tags)) if tags else []
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def bump(self, tags):
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.hincrby(self.tags_key, tag, 1)
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*', count=1000):
+            if key != self.tags_key.encode('utf-8'):
+                self.client.delete(key)
+
+
+def backend_from_config(config):
+    url = config.get('RESPONSE_CACHE_URL') or 'memory://'
+    if url.startswith('memory://'):
+        return LocalBackend(LRUCache(
+            max_entries=config.get('RESPONSE_CACHE_MAX_ENTRIES', 5000),
+            max_bytes=config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+            ttl=config.get('RESPONSE_CACHE_TTL', 300),
+        ))
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RESPONSE_CACHE_URL uses Redis; run `pip install redis`')
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported RESPONSE_CACHE_URL: {url}')
+
+
+# -- cache -----------------------------------------------------------------
+
+def make_key(kind, name, parts):
+    digest = hashlib.sha1(repr(tuple(parts)).encode('utf-8')).hexdigest()
+    return f'{kind}:{name}:{digest}'
+
+
+class ResponseCache:
+    """Tag-versioned cache of rendered responses and template fragments"""
+
+    def __init__(self, backend, ttl=300, logger=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.logger = logger
+        self._lock = threading.Lock()
+        # name -> {'hit': n, 'miss': n, 'stale': n, 'not_modified': n}
+        self.counts = {}
+
+    def _count(self, name, result):
+        with self._lock:
+            counts = self.counts.setdefault(name, {})
+            counts[result] = counts.get(result, 0) + 1
+        metrics.inc('mentwel_cache_requests_total', (('cache', name), ('result', result)))
+
+    def lookup(self, name, key, tags):
+        """(meta, body) of a current entry, else (None, versions to store a fresh one under)
+
+        Versions are read before the caller renders, so a commit that lands
+        while it renders leaves the new entry already stale.
+        """
+        try:
+            entry = self.backend.get(key)
+            if entry is not None and self.backend.versions(list(entry[0]['v'])) == entry[0]['v']:
+                return entry, None
+            versions = self.backend.versions(list(tags))
+        except Exception as e:
+            self._report(e)
+            return None, None
+        self._count(name, 'stale' if entry is not None else 'miss')
+        return None, versions
+
+    def store(self, key, meta, body, ttl=None):
+        try:
+            self.backend.set(key, meta, body, ttl or self.ttl)
+        except Exception as e:
+            self._report(e)
+
+    def fragment(self, name, parts, render, tags=(), ttl=None):
+        """Cached result of render() (a string) for `name` and `parts`"""
+        key = make_key('fragment', name, parts)
+        entry, versions = self.lookup(name, key, tags)
+        if entry is not None:
+            self._count(name, 'hit')
+            return entry[1].decode('utf-8')
+        text = render()
+        if versions is not None:
+            self.store(key, {'v': versions}, str(text).encode('utf-8'), ttl)
+        return text
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except Exception as e:
+            self._report(e)
+
+    def invalidate(self, *tags):
+        if tags:
+            try:
+                self.backend.bump(sorted(set(tags)))
+            except Exception as e:
+                self._report(e)
+
+    def stats(self):
+        with self._lock:
+            counts = {name: dict(values) for name, values in self.counts.items()}
+        for values in counts.values():
+            lookups = sum(values.get(k, 0) for k in ('hit', 'miss', 'stale', 'not_modified'))
+            served = values.get('hit', 0) + values.get('not_modified', 0)
+            values['hit_rate'] = served / lookups if lookups else 0.0
+        return counts
+
+    def _report(self, error):
+        # A cache outage degrades to rendering every request, never to an error page
+        if self.logger is not None:
+            self.logger.warning('Response cache unavailable: %s', error)
+
+
+def _user_key():
+    from flask_login import current_user
+    return current_user.get_id() if current_user and current_user.is_authenticated else None
+
+
+def cached(name=None, tags=(), ttl=None, per_user=False):
+    """Cache a GET view's 200 responses until `tags` are invalidated or `ttl` passes
+
+    `tags` may be a callable, called with the view's arguments.
+    """
+    def decorator(view):
+        cache_name = name or view.__name__
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            user = _user_key() if per_user else None
+            key = make_key('response', cache_name, (user, request.path, sorted(request.args.items(multi=True))))
+            entry_tags = tags(**kwargs) if callable(tags) else tags
+            entry, versions = cache.lookup(cache_name, key, entry_tags)
+            if entry is not None:
+                meta, body = entry
+                response = current_app.response_class(body, status=meta['s'], headers=meta['h'])
+                response.set_etag(meta['e'])
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed or 'Set-Cookie' in response.headers:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                response.set_etag(etag)
+                if versions is not None:
+                    headers = [(k, v) for k, v in response.headers.items() if k in KEEP_HEADERS]
+                    cache.store(key, {'v': versions, 's': response.status_code, 'h': headers, 'e': etag},
+                                body, ttl)
+
+            response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+            if per_user:
+                response.vary.add('Cookie')
+            not_modified = request.if_none_match.contains(response.get_etag()[0])
+            if not_modified:
+                response = response.make_conditional(request)
+            if entry is not None:
+                cache._count(cache_name, 'not_modified' if not_modified else 'hit')
+            return response
+
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags):
+    """Bump `tags` for code that changes rows without the ORM (Core updates, bulk loads)"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.invalidate(*tags)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache name, key parts..., tags=[...], ttl=seconds %}...{% endcache %}"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        kwargs = []
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                keyword = next(parser.stream).value
+                next(parser.stream)
+                kwargs.append(nodes.Keyword(keyword, parser.parse_expression()))
+            else:
+                args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.List(args)], kwargs)
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller, tags=(), ttl=None):
+        cache = current_app.extensions.get('response_cache')
+        if cache is None:
+            return caller()
+        # The block was rendered (and escaped) by the template itself
+        return Markup(cache.fragment(parts[0], parts[1:], caller, tags=tags, ttl=ttl))
+
+
+# -- invalidation ----------------------------------------------------------
+
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('response_cache', set())
+    for obj in list(session.new) + list(session.deleted):
+        rule = TAG_RULES.get(getattr(obj, '__tablename__', None))
+        if rule is not None:
+            pending.update(rule(obj, lambda names: True))
+    for obj in session.dirty:
+        rule = TAG_RULES.get(getattr(obj, '__tablename__', None))
+        if rule is not None:
+            state = inspect(obj)
+            pending.update(rule(obj, lambda names: any(
+                name in state.attrs and state.attrs[name].history.has_changes() for name in names
+            )))
+
+
+def _apply_changes(session):
+    pending = session.info.pop('response_cache', None)
+    if not pending:
+        return
+    for cache in list(_live):
+        cache.invalidate(*pending)
+
+
+def _discard_changes(session):
+    session.info.pop('response_cache', None)
+
+
+def init_app(app):
+    """Attach the response cache, the {% cache %} tag and the commit hooks"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if not app.config.get('RESPONSE_CACHE_ENABLED', True):
+        return None
+    cache = ResponseCache(backend_from_config(app.config), ttl=app.config.get('RESPONSE_CACHE_TTL', 300),
+                          logger=app.logger)
+    app.extensions['response_cache'] = cache
+    _live.add(cache)
+
+    if not event.contains(Session, 'after_flush', _collect_changes):
+        event.listen(Session, 'after_flush', _collect_changes)
+        event.listen(Session, 'after_commit', _apply_changes)
+        event.listen(Session, 'after_rollback', _discard_changes)
+    return cache
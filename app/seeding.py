@@ -0,0 +1,367 @@
+"""
+Bulk, idempotent database seeding for MentWel
+
+Fixture files (JSON, or YAML with PyYAML installed) map table names to rows:
+
+    {
+      "session_packages": {
+        "match": ["package_name"],
+        "rows": [{"package_name": "Single Session", "session_count": 1, ...}]
+      },
+      "users": {"match": ["email"], "update": false, "rows": [...]}
+    }
+
+A table may also be given as a plain list of rows, matched on MATCH_COLUMNS.
+Rows are upserted in chunks: with a unique constraint on the match columns
+the dialect's native INSERT .. ON CONFLICT / ON DUPLICATE KEY UPDATE is used,
+otherwise existing keys are read in one query and only missing rows are
+inserted. A `password` field is replaced by a bcrypt `password_hash`.
+
+Rows of tables with an ORM model in MODELS (users) are built through the
+model first, so values its constructor generates (anonymous_id) and its
+validators apply to seeded rows too. Generated columns are only written on
+insert; re-seeding never replaces them.
+
+`generate(engine, tables, scale)` adds a synthetic load-test dataset: per
+scale unit one patient, three sessions, one payment and ten sentiment rows.
+Synthetic users are keyed by anonymous_id, so re-running with the same or a
+larger scale only adds what is missing.
+"""
+
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from importlib import import_module
+
+from sqlalchemy import bindparam, inspect, select, tuple_, update
+
+# Default match (natural key) columns for fixtures given as plain row lists
+MATCH_COLUMNS = {
+    'users': ['anonymous_id'],
+    'session_packages': ['package_name'],
+    'payments': ['paystack_reference'],
+}
+
+# Tables whose fixture rows are built through their ORM model
+MODELS = {
+    'users': 'app.models:User',
+}
+
+SYNTHETIC_PREFIX = 'LT'
+
+
+class SeedError(Exception):
+    """Raised for malformed fixtures"""
+
+
+class SeedReport:
+    """Rows written and time taken per table"""
+
+    def __init__(self):
+        self.tables = {}
+
+    def add(self, name, rows, seconds):
+        count, elapsed = self.tables.get(name, (0, 0.0))
+        self.tables[name] = (count + rows, elapsed + seconds)
+
+    @property
+    def rows(self):
+        return sum(count for count, _ in self.tables.values())
+
+    @property
+    def seconds(self):
+        return sum(elapsed for _, elapsed in self.tables.values())
+
+    def lines(self):
+        for name, (count, elapsed) in self.tables.items():
+            rate = count / elapsed if elapsed else 0.0
+            yield f'  {name:<20} {count:>9} rows  {elapsed:7.2f}s  {rate:>10,.0f} rows/sec'
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        yield f'  {"total":<20} {self.rows:>9} rows  {self.seconds:7.2f}s  {rate:>10,.0f} rows/sec'
+
+
+def read_fixture(path):
+    """Parse a .json, .yaml or .yml fixture file"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError('YAML fixtures need `pip install PyYAML` (or use JSON)')
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+def _has_unique(conn, table, columns):
+    """True when a primary key, unique constraint or unique index covers exactly `columns`"""
+    wanted = set(columns)
+    inspector = inspect(conn)
+    if set(inspector.get_pk_constraint(table.name).get('constrained_columns') or []) == wanted:
+        return True
+    for constraint in inspector.get_unique_constraints(table.name):
+        if set(constraint['column_names']) == wanted:
+            return True
+    return any(index.get('unique') and set(index['column_names']) == wanted
+               for index in inspector.get_indexes(table.name))
+
+
+def upsert_statement(table, dialect_name, match, update_columns):
+    """Native upsert for SQLite/PostgreSQL/MySQL, or None when unsupported"""
+    if dialect_name in ('sqlite', 'postgresql'):
+        stmt = import_module(f'sqlalchemy.dialects.{dialect_name}').insert(table)
+        if update_columns:
+            return stmt.on_conflict_do_update(
+                index_elements=match, set_={name: stmt.excluded[name] for name in update_columns}
+            )
+        return stmt.on_conflict_do_nothing(index_elements=match)
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        # A no-op assignment keeps existing rows without INSERT IGNORE swallowing other errors
+        columns = update_columns or match[:1]
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in columns})
+    return None
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _hash_passwords(rows):
+    from app.passwords import hash_password
+    hashed = []
+    for row in rows:
+        if 'password' in row:
+            row = dict(row)
+            password = row.pop('password')
+            row['password_hash'] = hash_password(password)
+        hashed.append(row)
+    return hashed
+
+
+def _resolve_model(name, table):
+    """The ORM model mapped to `table` from MODELS, or None"""
+    path = MODELS.get(name)
+    if not path:
+        return None
+    module, _, attr = path.partition(':')
+    try:
+        model = getattr(import_module(module), attr)
+    except ImportError:
+        return None
+    # Ad hoc tables of the same name (tests, scripts) are loaded as given
+    return model if model.__table__ is table else None
+
+
+def _model_rows(model, rows):
+    """Build each row through `model`; returns (rows, columns the model generated)"""
+    columns = {attr.key: attr.columns[0].name for attr in inspect(model).column_attrs}
+    built, generated = [], set()
+    for row in rows:
+        try:
+            instance = model(**row)
+        except (TypeError, ValueError) as e:
+            raise SeedError(f'{model.__tablename__}: {e}')
+        values = dict(row)
+        for key, name in columns.items():
+            value = instance.__dict__.get(key)
+            # Unset columns are left to their Core defaults at INSERT
+            if name not in row and value is not None:
+                values[name] = value
+                generated.add(name)
+        built.append(values)
+    return built, generated
+
+
+def upsert_rows(conn, table, rows, match, update=True, chunk_size=1000, insert_only=()):
+    """Insert or update `rows` keyed on `match` columns; returns rows written
+
+    Columns in `insert_only` are written for new rows and never updated.
+    """
+    if not rows:
+        return 0
+    for column in match:
+        if column not in table.c:
+            raise SeedError(f'{table.name} has no column {column!r} to match on')
+    unknown = {key for row in rows for key in row} - set(table.c.keys())
+    if unknown:
+        raise SeedError(f"{table.name} has no column(s) {', '.join(sorted(unknown))}")
+
+    # Last row wins for repeated keys (PostgreSQL rejects touching a row twice)
+    rows = list({tuple(row.get(name) for name in match): row for row in rows}.values())
+
+    # executemany needs the same keys in every row
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    native = _has_unique(conn, table, match)
+    for keys, group in groups.items():
+        update_columns = [k for k in keys if k not in match and k not in insert_only] if update else []
+        stmt = upsert_statement(table, conn.dialect.name, match, update_columns) if native else None
+        for chunk in _chunks(group, chunk_size):
+            if stmt is not None:
+                conn.execute(stmt, chunk)
+            else:
+                _upsert_by_lookup(conn, table, chunk, match, update_columns)
+    return len(rows)
+
+
+def _upsert_by_lookup(conn, table, rows, match, update_columns):
+    """Portable fallback: one lookup query, then bulk insert/update"""
+    key_columns = [table.c[name] for name in match]
+    keys = [tuple(row[name] for name in match) for row in rows]
+    if len(key_columns) == 1:
+        condition = key_columns[0].in_([k[0] for k in keys])
+    else:
+        condition = tuple_(*key_columns).in_(keys)
+    existing = {tuple(r) for r in conn.execute(select(*key_columns).where(condition))}
+
+    fresh = [row for key, row in zip(keys, rows) if key not in existing]
+    stale = [row for key, row in zip(keys, rows) if key in existing]
+    if fresh:
+        conn.execute(table.insert(), fresh)
+    if stale and update_columns:
+        stmt = (
+            update(table)
+            .where(*[table.c[name] == bindparam(f'm_{name}') for name in match])
+            .values({name: bindparam(f'u_{name}') for name in update_columns})
+        )
+        conn.execute(stmt, [
+            dict({f'm_{n}': row[n] for n in match}, **{f'u_{n}': row[n] for n in update_columns})
+            for row in stale
+        ])
+
+
+def load_fixture(engine, tables, fixture, report=None, chunk_size=1000):
+    """Upsert every table in `fixture` (a path or parsed dict)"""
+    data = read_fixture(fixture) if isinstance(fixture, str) else fixture
+    report = report or SeedReport()
+    for name, spec in data.items():
+        if name not in tables:
+            raise SeedError(f'Unknown table in fixture: {name}')
+        if isinstance(spec, list):
+            spec = {'rows': spec}
+        match = spec.get('match') or MATCH_COLUMNS.get(name)
+        if not match:
+            raise SeedError(f'No match columns for {name}; add "match" to the fixture')
+        rows = _hash_passwords(spec.get('rows') or [])
+        generated = ()
+        model = _resolve_model(name, tables[name])
+        if model is not None:
+            rows, generated = _model_rows(model, rows)
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            count = upsert_rows(conn, tables[name], rows, match, spec.get('update', True), chunk_size, generated)
+        report.add(name, count, time.perf_counter() - start)
+    return report
+
+
+def _only_columns(table, rows):
+    # Generated rows may carry columns a given schema does not have
+    names = set(table.c.keys())
+    return [{k: v for k, v in row.items() if k in names} for row in rows]
+
+
+def _insert(engine, table, rows, report, chunk_size):
+    if not rows:
+        return
+    rows = _only_columns(table, rows)
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for chunk in _chunks(rows, chunk_size):
+            conn.execute(table.insert(), chunk)
+    report.add(table.name, len(rows), time.perf_counter() - start)
+
+
+def generate(engine, tables, scale, report=None, chunk_size=5000, seed=7):
+    """Add a synthetic dataset of `scale` patients with sessions, payments and moods"""
+    import bcrypt
+
+    report = report or SeedReport()
+    users, sessions = tables['users'], tables['therapy_sessions']
+    payments, sentiment, packages = tables['payments'], tables['sentiment_analysis'], tables['session_packages']
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    therapist_count = max(1, scale // 50)
+    wanted = [f'{SYNTHETIC_PREFIX}T{i:07d}' for i in range(therapist_count)]
+    wanted += [f'{SYNTHETIC_PREFIX}P{i:07d}' for i in range(scale)]
+    with engine.connect() as conn:
+        existing = set(conn.execute(
+            select(users.c.anonymous_id).where(users.c.anonymous_id.like(f'{SYNTHETIC_PREFIX}%'))
+        ).scalars())
+        package_rows = conn.execute(select(packages.c.id, packages.c.package_price)).all()
+    missing = [anonymous_id for anonymous_id in wanted if anonymous_id not in existing]
+
+    # One hash for every synthetic account: bcrypt per row would dominate the run
+    password_hash = bcrypt.hashpw(b'loadtest123', bcrypt.gensalt(4)).decode('utf-8')
+    user_rows = []
+    for anonymous_id in missing:
+        therapist = anonymous_id[len(SYNTHETIC_PREFIX)] == 'T'
+        user_rows.append({
+            'anonymous_id': anonymous_id,
+            'password_hash': password_hash,
+            'is_anonymous': not therapist,
+            'is_therapist': therapist,
+            'therapist_verified': therapist,
+            'therapist_specialization': 'General Counseling' if therapist else None,
+            'therapist_rating': round(rng.uniform(3.5, 5.0), 1) if therapist else 0.0,
+            'therapist_sessions_count': 0,
+            'created_at': now - timedelta(days=rng.randint(0, 365)),
+        })
+    _insert(engine, users, user_rows, report, chunk_size)
+
+    with engine.connect() as conn:
+        ids = dict(conn.execute(
+            select(users.c.anonymous_id, users.c.id).where(users.c.anonymous_id.like(f'{SYNTHETIC_PREFIX}%'))
+        ).all())
+    therapist_ids = [ids[a] for a in wanted[:therapist_count]]
+    new_patients = [ids[a] for a in missing if a[len(SYNTHETIC_PREFIX)] == 'P']
+
+    session_rows, payment_rows, sentiment_rows = [], [], []
+    labels = ('positive', 'neutral', 'negative')
+    for patient_id in new_patients:
+        for _ in range(3):
+            scheduled = now - timedelta(days=rng.randint(0, 180), minutes=rng.randint(0, 1440))
+            session_rows.append({
+                'patient_id': patient_id,
+                'therapist_id': rng.choice(therapist_ids),
+                'session_type': rng.choice(('video', 'audio', 'chat')),
+                'status': 'completed',
+                'scheduled_at': scheduled,
+                'started_at': scheduled,
+                'ended_at': scheduled + timedelta(minutes=50),
+                'duration_minutes': 50,
+                'created_at': scheduled - timedelta(days=2),
+            })
+        if package_rows:
+            package_id, price = rng.choice(package_rows)
+            payment_rows.append({
+                'user_id': patient_id,
+                'package_id': package_id,
+                'amount': price,
+                'paystack_reference': f'{SYNTHETIC_PREFIX}-{patient_id}',
+                'status': 'success',
+                'paid_at': now - timedelta(days=rng.randint(0, 180)),
+                'created_at': now - timedelta(days=rng.randint(0, 180)),
+            })
+        for _ in range(10):
+            sentiment_rows.append({
+                'user_id': patient_id,
+                'sentiment_label': rng.choice(labels),
+                'sentiment_score': round(rng.uniform(0.5, 0.99), 3),
+                'created_at': now - timedelta(days=rng.randint(0, 180), minutes=rng.randint(0, 1440)),
+            })
+
+    _insert(engine, sessions, session_rows, report, chunk_size)
+    _insert(engine, payments, payment_rows, report, chunk_size)
+    _insert(engine, sentiment, sentiment_rows, report, chunk_size)
+    return report
+
+
+def default_fixture_path():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'base.json')
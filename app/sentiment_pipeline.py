@@ -0,0 +1,275 @@
+"""
+Background sentiment analysis pipeline for MentWel
+
+Message handlers call `queue_sentiment(text, user_id=..., session_id=...)`
+and return immediately. A worker thread collects queued messages into
+micro-batches (SENTIMENT_BATCH_SIZE items or SENTIMENT_BATCH_DELAY_MS,
+whichever comes first), runs one inference call per batch and bulk-inserts
+the resulting SentimentAnalysis rows.
+
+Backends (SENTIMENT_BACKEND):
+    huggingface  remote Inference API at HUGGINGFACE_API_URL
+    local        transformers pipeline on CPU (pip install transformers torch)
+    stub         deterministic word-list scorer for tests and offline benchmarks
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from flask import current_app
+
+from app.startup import LazyClient
+
+
+class HuggingFaceBackend:
+    """Batched calls to the Hugging Face Inference API"""
+
+    def __init__(self, api_url, api_key=None, timeout=10, http=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.model_id = api_url
+        # Shared pooled client (app.http_client) when running inside the app
+        self.http = http
+        self._session = LazyClient(self._make_session)
+
+    def _make_session(self):
+        import requests
+        session = requests.Session()
+        if self.api_key:
+            session.headers['Authorization'] = f'Bearer {self.api_key}'
+        return session
+
+    def analyze(self, texts):
+        payload = {'inputs': texts, 'options': {'wait_for_model': True}}
+        if self.http is not None:
+            # Classification is safe to repeat, so allow retries on this POST
+            response = self.http.request('huggingface', 'POST', self.api_url, json=payload, retry=True)
+        else:
+            response = self._session.post(self.api_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        results = []
+        for scores in response.json():
+            # One list of {label, score} per input; a single input may come back unwrapped
+            if isinstance(scores, dict):
+                scores = [scores]
+            best = max(scores, key=lambda s: s['score'])
+            results.append((best['label'].lower(), float(best['score'])))
+        return results
+
+
+class LocalModelBackend:
+    """transformers sentiment pipeline running on the local CPU"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model_id = model_name
+        self._pipeline = LazyClient(self._load)
+
+    def _load(self):
+        try:
+            from transformers import pipeline
+        except ImportError:
+            raise RuntimeError('SENTIMENT_BACKEND=local needs `pip install transformers torch`')
+        return pipeline('sentiment-analysis', model=self.model_name, device=-1)
+
+    def analyze(self, texts):
+        outputs = self._pipeline.get()(texts, truncation=True, batch_size=len(texts))
+        return [(out['label'].lower(), float(out['score'])) for out in outputs]
+
+
+class StubBackend:
+    """Deterministic scorer; optional latencies emulate a remote model"""
+
+    POSITIVE = {'good', 'great', 'happy', 'better', 'calm', 'thank', 'thanks', 'love', 'hopeful', 'grateful'}
+    NEGATIVE = {'bad', 'sad', 'anxious', 'worse', 'angry', 'tired', 'alone', 'hopeless', 'stressed', 'afraid'}
+
+    model_id = 'stub'
+
+    def __init__(self, call_latency=0.0, item_latency=0.0):
+        self.call_latency = call_latency
+        self.item_latency = item_latency
+        self.calls = 0
+
+    def analyze(self, texts):
+        self.calls += 1
+        if self.call_latency or self.item_latency:
+            time.sleep(self.call_latency + self.item_latency * len(texts))
+        results = []
+        for text in texts:
+            words = {w.strip('.,!?;:').lower() for w in text.split()}
+            balance = len(words & self.POSITIVE) - len(words & self.NEGATIVE)
+            # Stable tie-breaker so identical inputs always score identically
+            jitter = (zlib.crc32(text.encode('utf-8')) % 100) / 1000
+            if balance > 0:
+                results.append(('positive', min(0.99, 0.6 + 0.1 * balance + jitter)))
+            elif balance < 0:
+                results.append(('negative', min(0.99, 0.6 - 0.1 * balance + jitter)))
+            else:
+                results.append(('neutral', 0.5 + jitter))
+        return results
+
+
+def backend_from_config(config, http=None):
+    """Build the inference backend selected by SENTIMENT_BACKEND"""
+    name = (config.get('SENTIMENT_BACKEND') or 'huggingface').lower()
+    if name == 'stub':
+        return StubBackend()
+    if name == 'local':
+        return LocalModelBackend(config.get('SENTIMENT_LOCAL_MODEL'))
+    if name == 'huggingface':
+        return HuggingFaceBackend(config.get('HUGGINGFACE_API_URL'), config.get('HUGGINGFACE_API_KEY'), http=http)
+    raise ValueError(f'Unknown SENTIMENT_BACKEND: {name}')
+
+
+class SentimentPipeline:
+    """Queue messages and analyze them in micro-batches on a worker thread"""
+
+    def __init__(self, backend, sink, batch_size=32, max_delay=0.02, max_queue=10000, logger=None):
+        self.backend = backend
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.logger = logger
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def submit(self, text, **row):
+        """Queue `text`; extra keyword arguments are stored on the result row"""
+        self._ensure_thread()
+        row.setdefault('created_at', datetime.utcnow())
+        try:
+            self._queue.put_nowait((text, row))
+        except queue.Full:
+            # Analytics must never back-pressure the request path
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _ensure_thread(self):
+        # Threads do not survive a Gunicorn fork, so start one lazily per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._thread = threading.Thread(target=self._run, name='sentiment-pipeline', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._process(self._next_batch())
+
+    def _process(self, batch):
+        try:
+            scores = self.backend.analyze([text for text, _ in batch])
+            rows = [
+                dict(row, sentiment_label=label, sentiment_score=score)
+                for (_, row), (label, score) in zip(batch, scores)
+            ]
+            self.sink(rows)
+            self.processed += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            if self.logger:
+                self.logger.warning('Sentiment batch of %d failed: %s', len(batch), e)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """Block until every queued message has been processed (or timeout)"""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return not self._queue.unfinished_tasks
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'processed': self.processed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'queued': self._queue.qsize(),
+        }
+
+
+def sqlalchemy_sink(app):
+    """Bulk-insert result rows into SentimentAnalysis inside an app context"""
+    def write(rows):
+        from sqlalchemy import insert
+        from app import db
+        from app.models import SentimentAnalysis
+        with app.app_context():
+            db.session.execute(insert(SentimentAnalysis), rows)
+            if app.config.get('MOOD_ROLLUPS_ENABLED', True):
+                # Progress-chart aggregates land in the same transaction
+                from app.mood_rollups import record_rows
+                record_rows(db.session.connection(), rows)
+            db.session.commit()
+    return write
+
+
+def queue_sentiment(text, **row):
+    """Queue a message for analysis from request code; no-op when analysis is disabled"""
+    pipeline = current_app.extensions.get('sentiment_pipeline')
+    if pipeline is None or not text:
+        return False
+    return pipeline.submit(text, **row)
+
+
+def init_app(app):
+    """Attach the sentiment pipeline to the app"""
+    if not app.config.get('SENTIMENT_ANALYSIS_ENABLED'):
+        return None
+    backend = backend_from_config(app.config, http=app.extensions.get('http_client'))
+    cache = app.extensions.get('inference_cache')
+    if cache is not None:
+        # Repeated messages ("thank you") are answered from the cache
+        from app.inference_cache import CachedBackend
+        backend = CachedBackend(backend, cache, backend.model_id)
+
+    pipeline = SentimentPipeline(
+        backend,
+        sqlalchemy_sink(app),
+        batch_size=app.config.get('SENTIMENT_BATCH_SIZE', 32),
+        max_delay=app.config.get('SENTIMENT_BATCH_DELAY_MS', 20) / 1000,
+        max_queue=app.config.get('SENTIMENT_QUEUE_SIZE', 10000),
+        logger=app.logger,
+    )
+    app.extensions['sentiment_pipeline'] = pipeline
+    # Give queued messages a chance to land when a worker shuts down cleanly
+    atexit.register(pipeline.flush, 5.0)
+    return pipeline
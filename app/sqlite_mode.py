@@ -0,0 +1,343 @@
+"""
+SQLite production mode for MentWel
+
+Applies SQLITE_PRAGMAS (WAL, synchronous, mmap/cache sizes, busy timeout) to
+every new connection of the application's engine and serializes writers so
+concurrent commits queue on a lock instead of spinning in SQLite's busy
+handler:
+
+- ORM sessions take the writer lock around each flush, bulk DML statement
+  and commit, so `db.session.commit()` needs no changes. Nothing holds it
+  while a request does other work between writes.
+- WriteQueue runs submitted units of work on one writer thread and commits
+  them in batches (group commit) for high-volume, fire-and-forget writes.
+
+The writer lock is a thread lock within a process plus flock() on a
+`<database>.writelock` file across Gunicorn workers (thread lock only where
+fcntl is unavailable, e.g. Windows development machines). A writer that
+cannot get it within SQLITE_WRITE_LOCK_TIMEOUT seconds fails with
+OperationalError, as SQLite itself does when busy_timeout runs out.
+
+Only engines created with `engine_options(...)` (the app engine, via
+SQLALCHEMY_ENGINE_OPTIONS) are affected; other SQLite engines in the
+process keep SQLite's defaults.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from sqlalchemy import event
+from sqlalchemy.dialects import plugins
+from sqlalchemy.engine import CreateEnginePlugin
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_HELD = 'sqlite_writer_lock'
+_COMMITTING = 'sqlite_committing'
+
+
+class WriterLock:
+    """Re-entrant per thread, exclusive across threads and worker processes"""
+
+    def __init__(self, path=None, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._fd = None
+        self._pid = None
+
+    def _file(self):
+        # Re-open after a Gunicorn fork so each worker has its own open file
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _flock(self, deadline):
+        delay = 0.0005
+        while True:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+
+    def acquire(self, timeout=None):
+        """Wait at most `timeout` seconds (default self.timeout); returns False if the wait ran out"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if not self._lock.acquire(timeout=max(timeout, 0)):
+            return False
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0 and self.path and fcntl is not None:
+            try:
+                locked = self._flock(deadline)
+            except Exception:
+                self._lock.release()
+                raise
+            if not locked:
+                self._lock.release()
+                return False
+        self._local.depth = depth + 1
+        return True
+
+    def release(self):
+        self._local.depth -= 1
+        if self._local.depth == 0 and self.path and fcntl is not None:
+            fcntl.flock(self._file(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        if not self.acquire():
+            raise lock_timeout_error(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def lock_timeout_error(lock):
+    """The OperationalError raised when a writer gives up waiting for `lock`"""
+    return OperationalError(
+        'acquire SQLite writer lock', None,
+        sqlite3.OperationalError(f'database is locked (writer lock not acquired within {lock.timeout}s)'),
+    )
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def writer_lock(database):
+    """Shared WriterLock for a SQLite database path (None or ':memory:' for in-memory)"""
+    key = None if database in (None, '', ':memory:') else os.path.abspath(database)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = WriterLock(key + '.writelock' if key else None)
+        return _locks[key]
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+# Engines running in SQLite mode, with their writer locks (or None when writes are not serialized)
+_engines = weakref.WeakKeyDictionary()
+
+
+def _session_lock(session):
+    try:
+        bind = session.get_bind()
+    except Exception:
+        return None
+    return _engines.get(bind)
+
+
+def _lock_session(session):
+    """Take the writer lock for `session` unless it holds it already; False if it has none"""
+    if session.info.get(_HELD) is not None:
+        return True
+    lock = _session_lock(session)
+    if lock is None:
+        return False
+    if not lock.acquire():
+        raise lock_timeout_error(lock)
+    session.info[_HELD] = lock
+    return True
+
+
+def _unlock_session(session, *args):
+    session.info.pop(_COMMITTING, None)
+    lock = session.info.pop(_HELD, None)
+    if lock is not None:
+        lock.release()
+
+
+def _before_flush(session, flush_context, instances):
+    _lock_session(session)
+
+
+def _after_flush(session, flush_context):
+    # A flush inside commit keeps the lock until the commit is done
+    if not session.info.get(_COMMITTING):
+        _unlock_session(session)
+
+
+def _before_commit(session):
+    if session.in_nested_transaction():
+        return
+    if _lock_session(session):
+        session.info[_COMMITTING] = True
+
+
+def _lock_dml(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE through session.execute() bypasses flush
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    session = state.session
+    if session.info.get(_HELD) is not None or not _lock_session(session):
+        return None
+    try:
+        return state.invoke_statement()
+    finally:
+        _unlock_session(session)
+
+
+def _end_transaction(session, transaction):
+    # Safety net: whatever ended the outermost transaction, the lock goes with it
+    if transaction.parent is None:
+        _unlock_session(session)
+
+
+class WriteQueue:
+    """Single writer thread that commits queued units of work in batches"""
+
+    def __init__(self, engine, max_batch=200, max_delay=0.005):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.lock = writer_lock(engine.url.database)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(connection, *args, **kwargs); returns a Future with its result"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so start one lazily in each worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        results = []
+        try:
+            with self.lock, self.engine.begin() as conn:
+                for future, fn, args, kwargs in batch:
+                    results.append(fn(conn, *args, **kwargs))
+        except Exception as e:
+            # One bad unit of work must not fail its neighbours: retry singly
+            if len(batch) > 1:
+                for item in batch:
+                    self._commit([item])
+            else:
+                batch[0][0].set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (future, _, _, _), result in zip(batch, results):
+            future.set_result(result)
+
+
+def install(engine, pragmas, serialize_writes=True, lock_timeout=30.0):
+    """Apply `pragmas` to every new connection of `engine` and serialize its ORM writers"""
+    if engine in _engines:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, pragmas)
+
+    lock = None
+    if serialize_writes:
+        lock = writer_lock(engine.url.database)
+        lock.timeout = lock_timeout
+    _engines[engine] = lock
+    if lock is not None and not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush_postexec', _after_flush)
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_commit', _unlock_session)
+        event.listen(Session, 'after_rollback', _unlock_session)
+        event.listen(Session, 'after_transaction_end', _end_transaction)
+        event.listen(Session, 'do_orm_execute', _lock_dml)
+
+
+class SQLiteModePlugin(CreateEnginePlugin):
+    """Installs SQLite mode on the engine created with `engine_options(...)`, and only that one"""
+
+    def __init__(self, url, kwargs):
+        super().__init__(url, kwargs)
+        self.pragmas = kwargs.pop('sqlite_pragmas', None) or {}
+        self.serialize_writes = kwargs.pop('sqlite_serialize_writes', True)
+        self.lock_timeout = kwargs.pop('sqlite_lock_timeout', 30.0)
+
+    def update_url(self, url):
+        return url
+
+    def engine_created(self, engine):
+        if engine.dialect.name == 'sqlite':
+            install(engine, self.pragmas, self.serialize_writes, self.lock_timeout)
+
+
+plugins.register('mentwel_sqlite_mode', __name__, 'SQLiteModePlugin')
+
+
+def engine_options(pragmas, serialize_writes=True, lock_timeout=30.0, options=None):
+    """create_engine() keyword arguments that put the new engine in SQLite mode"""
+    options = dict(options or {})
+    options['plugins'] = list(options.get('plugins') or []) + ['mentwel_sqlite_mode']
+    options.update(sqlite_pragmas=pragmas, sqlite_serialize_writes=serialize_writes,
+                   sqlite_lock_timeout=lock_timeout)
+    return options
+
+
+def init_app(app):
+    """Enable SQLite production mode for the app engine when the app runs on SQLite"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+            app.config.get('SQLITE_PRAGMAS') or {},
+            serialize_writes=app.config.get('SQLITE_SERIALIZE_WRITES', True),
+            lock_timeout=app.config.get('SQLITE_WRITE_LOCK_TIMEOUT', 30),
+            options=app.config.get('SQLALCHEMY_ENGINE_OPTIONS'),
+        )
@@ -0,0 +1,140 @@
+"""
+Startup-time helpers for MentWel
+
+Heavy subsystems are imported on first use rather than when a worker boots:
+
+    from app.startup import LazyClient, lazy_module
+
+    Image = lazy_module('PIL.Image')            # uploads: Pillow loads on first Image.open()
+    paystack = LazyClient(make_paystack_client) # payments: built on first request
+
+Extensions that need the database build their client inside an app context
+with `lazy_app_client(app, build)`, and `register_tables(metadata)` lets
+`db.create_all()` create a module's own tables.  `SQLiteFile` holds the
+per-thread connections of the host-local SQLite layers (rate limits, caches).
+
+`profile_imports` runs a cold import in a fresh interpreter with
+`-X importtime` and is what `flask import-profile` reports.
+"""
+
+import importlib.util
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+
+def lazy_module(name):
+    """Return module `name`, deferring its execution until an attribute is used"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f'No module named {name!r}')
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class LazyClient:
+    """Build a client with `factory` on first use and reuse it afterwards"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def lazy_app_client(app, factory):
+    """LazyClient whose `factory` runs inside `app`'s application context"""
+    def build():
+        with app.app_context():
+            return factory()
+
+    return LazyClient(build)
+
+
+def register_tables(metadata):
+    """Let db.create_all() (init-db, test suites) create the tables in `metadata` too"""
+    from app import db
+    for table in metadata.tables.values():
+        if table.name not in db.metadata.tables:
+            table.to_metadata(db.metadata)
+
+
+class SQLiteFile:
+    """A WAL-mode SQLite file shared by all workers on a host
+
+    `SCHEMA` holds the CREATE statements run on every new connection.
+    """
+
+    SCHEMA = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def connect(self):
+        # Connections must not cross threads or survive a Gunicorn fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Counters and caches are disposable; skip fsync on every update
+            conn.execute('PRAGMA synchronous=OFF')
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+def parse_importtime(output):
+    """Parse `-X importtime` output into (module, depth, self_ms, cumulative_ms) tuples"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+        except ValueError:
+            continue
+    return entries
+
+
+def profile_imports(module='wsgi', cwd=None):
+    """Import `module` in a fresh interpreter; returns (entries, total_ms, error)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        cwd=cwd or os.getcwd(),
+    )
+    entries = parse_importtime(result.stderr)
+    # Cumulative times of the top-level imports add up to the whole startup
+    total_ms = sum(cumulative for _, depth, _, cumulative in entries if depth == 0)
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed'
+    return entries, total_ms, error
@@ -0,0 +1,436 @@
+"""
+Therapist directory for MentWel: matching and availability without scanning `users`
+
+Verified therapists are loaded once into an in-memory snapshot, ranked by
+rating overall and per specialization, so a booking page is a dictionary
+lookup and a bisect instead of a filtered, sorted query over every user:
+
+    directory = current_app.extensions['therapist_directory'].get()
+    directory.match(specialization='Anxiety', min_rating=4.0, limit=10)
+    directory.free_slots(therapist_id, days=7)
+    directory.next_available(specialization='Anxiety')
+
+Availability is precomputed for THERAPIST_BOOKING_DAYS ahead as one bitmask
+per therapist and day (bit n = the n-th THERAPIST_SLOT_MINUTES slot of the
+working day is booked), built from the same load with one indexed range query
+on therapy_sessions.
+
+Invalidation: commits that touch a therapist's profile rebuild the snapshot,
+commits that add, move or cancel a session reload only that therapist's
+bookings. Other workers pick changes up after THERAPIST_DIRECTORY_TTL
+seconds at most, as do bulk Core updates that bypass the ORM.
+
+The composite indexes below back both loads and are created by
+`db.create_all()` (flask init-db); `flask therapist-indexes` adds them to an
+existing database.
+"""
+
+import threading
+import time
+import weakref
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import login_required
+from sqlalchemy import Index, event, inspect, select
+from sqlalchemy.orm import Session
+
+# name -> (table, columns)
+INDEXES = {
+    'ix_users_therapist_directory': (
+        'users', ['is_therapist', 'therapist_verified', 'therapist_specialization', 'therapist_rating'],
+    ),
+    'ix_sessions_therapist_schedule': ('therapy_sessions', ['therapist_id', 'scheduled_at']),
+}
+
+# users columns -> keys in directory entries
+PROFILE_COLUMNS = {
+    'id': 'id',
+    'anonymous_id': 'anonymous_id',
+    'therapist_specialization': 'specialization',
+    'therapist_bio': 'bio',
+    'therapist_rating': 'rating',
+    'therapist_sessions_count': 'sessions_count',
+}
+
+# Sessions in these states do not hold a slot
+FREE_STATUSES = ('cancelled', 'canceled', 'rejected')
+
+therapist_directory_bp = Blueprint('therapist_directory', __name__)
+
+# Directories built in this process, invalidated after ORM commits
+_live = weakref.WeakSet()
+
+
+def directory_indexes(tables):
+    """Index objects for the tables present in `tables` (attached on first call)"""
+    indexes = []
+    for name, (table_name, columns) in INDEXES.items():
+        table = tables.get(table_name)
+        if table is None or any(column not in table.c for column in columns):
+            continue
+        existing = {index.name: index for index in table.indexes}
+        indexes.append(existing.get(name) or Index(name, *[table.c[column] for column in columns]))
+    return indexes
+
+
+def create_indexes(bind, tables):
+    """Create missing directory indexes; returns their names"""
+    indexes = directory_indexes(tables)
+    for index in indexes:
+        index.create(bind, checkfirst=True)
+    return [index.name for index in indexes]
+
+
+def specialization_key(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def parse_range(value, default):
+    """'8-16' -> (8, 16)"""
+    try:
+        start, end = (int(part) for part in str(value).split('-', 1))
+    except (TypeError, ValueError):
+        return default
+    return (start, end) if start < end else default
+
+
+class Snapshot:
+    """Immutable view of verified therapists and their bookings"""
+
+    def __init__(self, therapists, booked, first_day, last_day, built_at):
+        self.therapists = therapists
+        self.booked = booked
+        self.first_day = first_day
+        self.last_day = last_day
+        self.built_at = built_at
+        self.ranked = {}
+        ordered = sorted(therapists.values(), key=lambda t: (-(t['rating'] or 0.0), t['id']))
+        self.ranked[None] = ordered
+        for therapist in ordered:
+            self.ranked.setdefault(specialization_key(therapist['specialization']), []).append(therapist)
+        # Negated ratings, ascending, for bisecting on a minimum rating
+        self.keys = {key: [-(t['rating'] or 0.0) for t in rows] for key, rows in self.ranked.items()}
+
+
+class TherapistDirectory:
+    """Cached therapist ranking plus per-day slot bitmasks"""
+
+    def __init__(self, engine, users, sessions, ttl=60, slot_minutes=60, hours=(8, 16),
+                 work_days=(0, 4), horizon_days=14):
+        self.engine = engine
+        self.users = users
+        self.sessions = sessions
+        self.ttl = ttl
+        self.slot_minutes = slot_minutes
+        self.day_start = hours[0] * 60
+        self.slots_per_day = (hours[1] - hours[0]) * 60 // slot_minutes
+        self.work_days = set(range(work_days[0], work_days[1] + 1))
+        self.horizon_days = horizon_days
+        self._snapshot = None
+        self._stale = set()
+        self._lock = threading.Lock()
+        self.loads = 0
+        _live.add(self)
+
+    # -- loading ---------------------------------------------------------
+
+    def _profile_query(self):
+        users = self.users
+        columns = [users.c[name].label(key) for name, key in PROFILE_COLUMNS.items() if name in users.c]
+        # Served by ix_users_therapist_directory
+        return (
+            select(*columns)
+            .where(users.c.is_therapist.is_(True), users.c.therapist_verified.is_(True))
+            .order_by(users.c.therapist_rating.desc())
+        )
+
+    def _booked_masks(self, conn, therapist_ids, first_day, last_day):
+        """{therapist_id: {day: bitmask of booked slots}} for [first_day, last_day)"""
+        sessions = self.sessions
+        query = (
+            select(sessions.c.therapist_id, sessions.c.scheduled_at, sessions.c.duration_minutes)
+            .where(
+                sessions.c.scheduled_at >= datetime.combine(first_day, datetime.min.time()),
+                sessions.c.scheduled_at < datetime.combine(last_day, datetime.min.time()),
+                sessions.c.status.notin_(FREE_STATUSES) | sessions.c.status.is_(None),
+            )
+        )
+        if therapist_ids is not None:
+            query = query.where(sessions.c.therapist_id.in_(list(therapist_ids)))
+        booked = {}
+        for therapist_id, scheduled_at, duration in conn.execute(query):
+            mask = self._slot_mask(scheduled_at, duration)
+            if mask:
+                days = booked.setdefault(therapist_id, {})
+                day = scheduled_at.date()
+                days[day] = days.get(day, 0) | mask
+        return booked
+
+    def _slot_mask(self, scheduled_at, duration):
+        """Bits for every working-day slot that [scheduled_at, +duration) overlaps"""
+        start = scheduled_at.hour * 60 + scheduled_at.minute - self.day_start
+        end = start + (duration or self.slot_minutes)
+        first = max(start // self.slot_minutes, 0)
+        last = min(-(-end // self.slot_minutes), self.slots_per_day)
+        if first >= last:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def _load(self):
+        first_day = datetime.utcnow().date()
+        last_day = first_day + timedelta(days=self.horizon_days)
+        with self.engine.connect() as conn:
+            therapists = {row.id: dict(row._mapping) for row in conn.execute(self._profile_query())}
+            booked = self._booked_masks(conn, None, first_day, last_day)
+        self.loads += 1
+        return Snapshot(therapists, booked, first_day, last_day, time.monotonic())
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at > self.ttl \
+                or snapshot.first_day != datetime.utcnow().date():
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._stale.clear()
+                    self._snapshot = self._load()
+                snapshot = self._snapshot
+        if self._stale:
+            snapshot = self._refresh_bookings(snapshot)
+        return snapshot
+
+    def _refresh_bookings(self, snapshot):
+        with self._lock:
+            stale, self._stale = self._stale, set()
+            if not stale or self._snapshot is not snapshot:
+                return self._snapshot
+            with self.engine.connect() as conn:
+                fresh = self._booked_masks(conn, stale, snapshot.first_day, snapshot.last_day)
+            booked = {tid: days for tid, days in snapshot.booked.items() if tid not in stale}
+            booked.update(fresh)
+            # Profiles and ranking are unchanged; keep the build time so the TTL still applies
+            self._snapshot = Snapshot(snapshot.therapists, booked, snapshot.first_day,
+                                      snapshot.last_day, snapshot.built_at)
+            return self._snapshot
+
+    def invalidate(self, therapist_ids=None):
+        """Drop everything, or only the bookings of `therapist_ids`"""
+        if therapist_ids is None:
+            self._snapshot = None
+        else:
+            self._stale.update(therapist_ids)
+
+    # -- matching --------------------------------------------------------
+
+    def get(self, therapist_id):
+        return self.snapshot().therapists.get(therapist_id)
+
+    def specializations(self):
+        """[(specialization, therapist count)] for filters on the booking page"""
+        names = {}
+        for therapist in self.snapshot().ranked[None]:
+            name = therapist['specialization']
+            if name:
+                names.setdefault(specialization_key(name), [' '.join(name.split()), 0])[1] += 1
+        return sorted((name, count) for name, count in names.values())
+
+    def match(self, specialization=None, min_rating=None, limit=20, offset=0):
+        """Verified therapists, best rated first; returns (page, total)"""
+        snapshot = self.snapshot()
+        key = specialization_key(specialization) if specialization else None
+        rows = snapshot.ranked.get(key, [])
+        end = len(rows)
+        if min_rating is not None:
+            end = bisect_right(snapshot.keys[key], -min_rating) if rows else 0
+        return rows[offset:min(offset + limit, end)], end
+
+    # -- availability ----------------------------------------------------
+
+    def _day_masks(self, snapshot, therapist_id, first_day, last_day):
+        if snapshot.first_day <= first_day and last_day <= snapshot.last_day:
+            return snapshot.booked.get(therapist_id, {})
+        # Outside the precomputed window: ask the database for this therapist only
+        with self.engine.connect() as conn:
+            return self._booked_masks(conn, [therapist_id], first_day, last_day).get(therapist_id, {})
+
+    def free_slots(self, therapist_id, start=None, days=7, limit=None):
+        """Start times of open slots from `start` (default now) for `days` days"""
+        snapshot = self.snapshot()
+        if therapist_id not in snapshot.therapists:
+            return []
+        now = datetime.utcnow()
+        start = max(start or now, now)
+        first_day = start.date()
+        last_day = first_day + timedelta(days=days)
+        masks = self._day_masks(snapshot, therapist_id, first_day, last_day)
+        slots = []
+        day = first_day
+        while day < last_day:
+            if day.weekday() in self.work_days:
+                booked = masks.get(day, 0)
+                opening = datetime.combine(day, datetime.min.time()) + timedelta(minutes=self.day_start)
+                for n in range(self.slots_per_day):
+                    if booked >> n & 1:
+                        continue
+                    slot = opening + timedelta(minutes=n * self.slot_minutes)
+                    if slot < start:
+                        continue
+                    slots.append(slot)
+                    if limit and len(slots) >= limit:
+                        return slots
+            day += timedelta(days=1)
+        return slots
+
+    def is_free(self, therapist_id, when):
+        """True when `when` is the start of an open slot (check before booking)"""
+        offset = when.hour * 60 + when.minute - self.day_start
+        if when.second or when.microsecond or offset < 0 or offset % self.slot_minutes:
+            return False
+        slot = offset // self.slot_minutes
+        if slot >= self.slots_per_day or when.weekday() not in self.work_days or when < datetime.utcnow():
+            return False
+        snapshot = self.snapshot()
+        if therapist_id not in snapshot.therapists:
+            return False
+        day = when.date()
+        masks = self._day_masks(snapshot, therapist_id, day, day + timedelta(days=1))
+        return not masks.get(day, 0) >> slot & 1
+
+    def next_available(self, specialization=None, min_rating=None, limit=5, days=None):
+        """[(therapist, first open slot)] among the best rated matches"""
+        days = days or self.horizon_days
+        matches, _ = self.match(specialization, min_rating, limit=len(self.snapshot().therapists))
+        found = []
+        for therapist in matches:
+            slots = self.free_slots(therapist['id'], days=days, limit=1)
+            if slots:
+                found.append((therapist, slots[0]))
+                if len(found) >= limit:
+                    break
+        return found
+
+
+def directory_from_config(app, engine, users, sessions):
+    return TherapistDirectory(
+        engine,
+        users,
+        sessions,
+        ttl=app.config.get('THERAPIST_DIRECTORY_TTL', 60),
+        slot_minutes=app.config.get('THERAPIST_SLOT_MINUTES', 60),
+        hours=parse_range(app.config.get('THERAPIST_HOURS'), (8, 16)),
+        work_days=parse_range(app.config.get('THERAPIST_WORK_DAYS'), (0, 4)),
+        horizon_days=app.config.get('THERAPIST_BOOKING_DAYS', 14),
+    )
+
+
+# -- invalidation ----------------------------------------------------------
+
+_PROFILE_ATTRIBUTES = ('is_therapist', 'therapist_verified') + tuple(PROFILE_COLUMNS)
+
+
+def _changed(obj, names):
+    state = inspect(obj)
+    return any(name in state.attrs and state.attrs[name].history.has_changes() for name in names)
+
+
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('therapist_directory', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table == 'users':
+            if getattr(obj, 'is_therapist', False) or _changed(obj, ('is_therapist',)):
+                if obj in session.new or obj in session.deleted or _changed(obj, _PROFILE_ATTRIBUTES):
+                    pending.add(None)
+        elif table == 'therapy_sessions':
+            pending.add(obj.therapist_id)
+            history = inspect(obj).attrs.therapist_id.history
+            pending.update(value for value in history.deleted if value is not None)
+
+
+def _apply_changes(session):
+    pending = session.info.pop('therapist_directory', None)
+    if not pending:
+        return
+    for directory in list(_live):
+        if None in pending:
+            directory.invalidate()
+        else:
+            directory.invalidate(pending)
+
+
+def _discard_changes(session):
+    session.info.pop('therapist_directory', None)
+
+
+def _create_directory_indexes(target, connection, **kw):
+    create_indexes(connection, target.tables)
+
+
+# -- endpoints -------------------------------------------------------------
+
+@therapist_directory_bp.route('/api/therapists')
+@login_required
+def list_therapists():
+    """Verified therapists for the booking page"""
+    directory = current_app.extensions['therapist_directory'].get()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    therapists, total = directory.match(
+        request.args.get('specialization') or None,
+        request.args.get('min_rating', type=float),
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify({'therapists': [dict(t) for t in therapists], 'total': total})
+
+
+@therapist_directory_bp.route('/api/therapists/available')
+@login_required
+def available_therapists():
+    """Best rated matches with their first open slot"""
+    directory = current_app.extensions['therapist_directory'].get()
+    found = directory.next_available(
+        request.args.get('specialization') or None,
+        request.args.get('min_rating', type=float),
+        limit=max(1, min(request.args.get('limit', 5, type=int), 50)),
+    )
+    return jsonify({'therapists': [dict(t, next_slot=slot.isoformat()) for t, slot in found]})
+
+
+@therapist_directory_bp.route('/api/therapists/<int:therapist_id>/slots')
+@login_required
+def therapist_slots(therapist_id):
+    """Open slots for one therapist"""
+    directory = current_app.extensions['therapist_directory'].get()
+    if directory.get(therapist_id) is None:
+        abort(404)
+    days = max(1, min(request.args.get('days', 7, type=int), 60))
+    slots = directory.free_slots(therapist_id, days=days)
+    return jsonify({
+        'therapist_id': therapist_id,
+        'slot_minutes': directory.slot_minutes,
+        'slots': [slot.isoformat() for slot in slots],
+    })
+
+
+def init_app(app):
+    """Register the directory endpoints, indexes and commit hooks; the cache is built on first use"""
+    from app import db
+    from app.startup import lazy_app_client
+
+    def build():
+        from app.models import TherapySession, User
+        return directory_from_config(app, db.engine, User.__table__, TherapySession.__table__)
+
+    app.extensions['therapist_directory'] = lazy_app_client(app, build)
+
+    # db.create_all() (init-db) also creates the composite indexes
+    if not event.contains(db.metadata, 'after_create', _create_directory_indexes):
+        event.listen(db.metadata, 'after_create', _create_directory_indexes)
+
+    if not event.contains(Session, 'after_flush', _collect_changes):
+        event.listen(Session, 'after_flush', _collect_changes)
+        event.listen(Session, 'after_commit', _apply_changes)
+        event.listen(Session, 'after_rollback', _discard_changes)
+    app.register_blueprint(therapist_directory_bp)
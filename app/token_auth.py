@@ -0,0 +1,465 @@
+"""
+Stateless access tokens for the MentWel API
+
+Flask-Login sessions load the `users` row on every request. API clients can
+instead send `Authorization: Bearer <access token>`: a short-lived HS256 JWT
+that carries what most endpoints need (user id, anonymous_id, is_therapist),
+so the request is authenticated without touching the database:
+
+    POST /api/auth/token     {"anonymous_id", "password"} -> access + refresh token
+    POST /api/auth/refresh   {"refresh_token"}           -> new pair (old refresh token revoked)
+    POST /api/auth/revoke    {"all": true} revokes every token of the caller
+
+A valid token makes `current_user` a TokenUser, so existing @login_required
+views work unchanged; reading an attribute the token does not carry (e.g.
+current_user.email) loads the row once for that request.
+
+Verification is in memory: the HMAC key is prepared once per key id
+(JWT_SECRET_KEY, plus JWT_PREVIOUS_SECRET_KEYS during a rotation), and
+recently verified tokens skip signature checking and JSON parsing.
+
+Revocation: revoked token ids (and "every token of user N issued before T")
+are stored in `revoked_tokens`. Each worker keeps a Bloom filter of them,
+refreshed from the table every JWT_REVOCATION_SYNC_SECONDS, so almost every
+request is cleared by a few bit lookups; only a filter hit (a revoked token,
+or a false positive at JWT_REVOCATION_ERROR_RATE) reads the table. A token
+revoked in another worker is accepted there for at most one sync interval.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import math
+import threading
+import time
+import uuid
+
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import Column, Float, Index, MetaData, String, Table, delete, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.startup import lazy_module
+
+# PyJWT pulls in cryptography; load it when the first token is issued or checked
+jwt = lazy_module('jwt')
+
+ACCESS, REFRESH = 'access', 'refresh'
+
+metadata = MetaData()
+
+revoked_tokens = Table(
+    'revoked_tokens', metadata,
+    # A token's jti, or 'user:<id>' to revoke every token of that user issued before revoked_at
+    Column('key', String(64), primary_key=True),
+    # Epoch seconds, comparable with the iat/exp claims
+    Column('revoked_at', Float, nullable=False),
+    Column('expires_at', Float, nullable=False),
+    Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+)
+
+token_auth_bp = Blueprint('token_auth', __name__)
+
+
+class TokenError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def key_id(secret):
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:8]
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class KeyRing:
+    """HMAC-SHA256 state keyed once per secret; verifying copies it instead of re-keying"""
+
+    def __init__(self, secret, previous=()):
+        self.secret = secret
+        self.kid = key_id(secret)
+        self._macs = {
+            key_id(s): hmac.new(s.encode('utf-8'), digestmod=hashlib.sha256) for s in (secret, *previous) if s
+        }
+
+    def verify(self, kid, signing_input, signature):
+        mac = self._macs.get(kid)
+        if mac is None:
+            return False
+        mac = mac.copy()
+        mac.update(signing_input)
+        return hmac.compare_digest(mac.digest(), signature)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one BLAKE2b digest)"""
+
+    def __init__(self, capacity=100000, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _hashes(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, key):
+        h1, h2 = self._hashes(key)
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        h1, h2 = self._hashes(key)
+        bits, size = self.bits, self.size
+        # Most keys are absent and fail on the first or second probe
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class TokenUser:
+    """current_user for a token-authenticated request
+
+    Carries the token's claims; any other attribute loads the User row once.
+    """
+
+    is_authenticated = True
+    is_active = True
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.id = int(claims['sub'])
+        self.anonymous_id = claims.get('aid')
+        self.is_therapist = bool(claims.get('thr'))
+        # Mirrors users.is_anonymous (an anonymous MentWel account), not Flask-Login's guest flag
+        self.is_anonymous = bool(claims.get('ano'))
+
+    def get_id(self):
+        return str(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        user = self.__dict__.get('_user')
+        if user is None:
+            from app import db
+            from app.models import User
+            user = self.__dict__['_user'] = db.session.get(User, self.id)
+            if user is None:
+                raise AttributeError(name)
+        return getattr(user, name)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class TokenAuth:
+    """Issue, verify and revoke JWTs with in-memory verification"""
+
+    def __init__(self, engine, keys, access_ttl=3600, refresh_ttl=2592000, leeway=30,
+                 sync_interval=10, rebuild_interval=3600, capacity=100000, error_rate=0.01,
+                 cache_size=10000, clock=time.time, logger=None):
+        self.engine = engine
+        self.keys = keys
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.leeway = leeway
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cache_size = cache_size
+        self.clock = clock
+        self.logger = logger
+        # token -> [claims, filter generation it was last cleared against] for
+        # tokens whose signature already checked out
+        self._verified = {}
+        self._cache_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.bloom = BloomFilter(capacity, error_rate)
+        # Bumped whenever the filter gains keys, so cleared tokens are checked again
+        self.generation = 0
+        self._synced_at = None
+        self._rebuilt_at = None
+        self.lookups = 0  # revocation table reads after a filter hit
+
+    # -- issuing -----------------------------------------------------------
+
+    def _encode(self, claims):
+        return jwt.encode(claims, self.keys.secret, algorithm='HS256', headers={'kid': self.keys.kid})
+
+    def issue(self, user):
+        """Access and refresh token for `user` (a User or TokenUser)"""
+        now = round(self.clock(), 3)
+        claims = {
+            'sub': str(user.id),
+            'aid': user.anonymous_id,
+            'thr': bool(user.is_therapist),
+            'ano': bool(user.is_anonymous),
+            'iat': now,
+        }
+        access = self._encode(dict(claims, typ=ACCESS, jti=uuid.uuid4().hex, exp=int(now + self.access_ttl)))
+        refresh = self._encode({'sub': claims['sub'], 'iat': now, 'typ': REFRESH, 'jti': uuid.uuid4().hex,
+                                'exp': int(now + self.refresh_ttl)})
+        return {'access_token': access, 'refresh_token': refresh, 'token_type': 'Bearer',
+                'expires_in': self.access_ttl}
+
+    # -- verifying ---------------------------------------------------------
+
+    def decode(self, token):
+        """Claims of a correctly signed token (no expiry or revocation check)"""
+        return self._entry(token)[0]
+
+    def _entry(self, token):
+        entry = self._verified.get(token)
+        if entry is not None:
+            return entry
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            signing_input = f'{header_segment}.{payload_segment}'.encode('ascii')
+            header = json.loads(_b64decode(header_segment))
+            signature = _b64decode(signature_segment)
+        except ValueError:
+            raise TokenError('Malformed token')
+        if not isinstance(header, dict) or header.get('alg') != 'HS256':
+            raise TokenError('Unsupported token algorithm')
+        if not self.keys.verify(header.get('kid', self.keys.kid), signing_input, signature):
+            raise TokenError('Invalid token signature')
+        try:
+            claims = json.loads(_b64decode(payload_segment))
+        except ValueError:
+            raise TokenError('Malformed token')
+        if not isinstance(claims, dict) or 'sub' not in claims or 'exp' not in claims:
+            raise TokenError('Malformed token')
+
+        entry = [claims, None]
+        with self._cache_lock:
+            if len(self._verified) >= self.cache_size:
+                # Oldest first; expired tokens would be rejected again anyway
+                for key in list(self._verified)[:self.cache_size // 10 or 1]:
+                    del self._verified[key]
+            self._verified[token] = entry
+        return entry
+
+    def verify(self, token, token_type=ACCESS):
+        """Claims of a valid, unexpired, unrevoked token, or TokenError"""
+        entry = self._entry(token)
+        claims = entry[0]
+        now = self.clock()
+        if claims['exp'] + self.leeway < now:
+            raise TokenError('Token expired')
+        if claims.get('typ') != token_type:
+            raise TokenError(f'Wrong token type (expected {token_type})')
+        self.maybe_sync(now)
+        generation = self.generation
+        if entry[1] != generation:
+            if self.is_revoked(claims):
+                raise TokenError('Token revoked')
+            entry[1] = generation
+        return claims
+
+    # -- revocation --------------------------------------------------------
+
+    def is_revoked(self, claims):
+        keys = [key for key in (claims.get('jti'), f"user:{claims['sub']}") if key and key in self.bloom]
+        if not keys:
+            return False
+        self.lookups += 1
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(revoked_tokens.c.key, revoked_tokens.c.revoked_at).where(revoked_tokens.c.key.in_(keys))
+            ).all()
+        for key, revoked_at in rows:
+            if not key.startswith('user:') or claims.get('iat', 0) <= revoked_at:
+                return True
+        return False
+
+    def _store(self, key, revoked_at, expires_at):
+        with self.engine.begin() as conn:
+            conn.execute(delete(revoked_tokens).where(revoked_tokens.c.key == key))
+            conn.execute(insert(revoked_tokens).values(key=key, revoked_at=revoked_at, expires_at=expires_at))
+        self.bloom.add(key)
+        self.generation += 1
+
+    def revoke(self, claims):
+        """Revoke one token (by jti) until it would have expired anyway"""
+        self._store(claims['jti'], self.clock(), claims['exp'] + self.leeway)
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to a user so far (logout everywhere, password change)"""
+        now = self.clock()
+        self._store(f'user:{user_id}', now, now + self.refresh_ttl + self.leeway)
+
+    def maybe_sync(self, now=None):
+        now = self.clock() if now is None else now
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        # One request per worker pays for the sync; the others keep the current filter
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.sync(now)
+        except SQLAlchemyError as e:
+            # Keep the current filter; the next request after sync_interval retries
+            self._synced_at = now
+            if self.logger is not None:
+                self.logger.warning('Token revocation sync failed: %s', e)
+        finally:
+            self._sync_lock.release()
+
+    def sync(self, now=None):
+        """Add revocations from other workers to the filter; rebuild it hourly to drop expired ones"""
+        now = self.clock() if now is None else now
+        rebuild = self._rebuilt_at is None or now - self._rebuilt_at >= self.rebuild_interval
+        query = select(revoked_tokens.c.key).where(revoked_tokens.c.expires_at >= now)
+        if not rebuild:
+            # Overlap by one interval: rows are stamped before their transaction commits
+            query = query.where(revoked_tokens.c.revoked_at >= self._synced_at - self.sync_interval)
+        with self.engine.begin() as conn:
+            if rebuild:
+                conn.execute(delete(revoked_tokens).where(revoked_tokens.c.expires_at < now))
+            keys = conn.execute(query).scalars().all()
+        if rebuild:
+            bloom = BloomFilter(max(self.capacity, len(keys) * 2), self.error_rate)
+            for key in keys:
+                bloom.add(key)
+            self.bloom = bloom
+            self._rebuilt_at = now
+        else:
+            for key in keys:
+                self.bloom.add(key)
+        if keys or rebuild:
+            self.generation += 1
+        self._synced_at = now
+
+    # -- Flask hook --------------------------------------------------------
+
+    def before_request(self):
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return None
+        try:
+            claims = self.verify(header[7:].strip())
+        except TokenError as e:
+            response = jsonify({'error': e.message})
+            response.status_code = e.status
+            response.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+            return response
+        # Where Flask-Login keeps the request's user; current_user resolves
+        # to it without calling the session-based user loader
+        g._login_user = TokenUser(claims)
+        return None
+
+
+def auth_from_config(app, engine):
+    config = app.config
+    previous = [s.strip() for s in (config.get('JWT_PREVIOUS_SECRET_KEYS') or '').split(',') if s.strip()]
+    return TokenAuth(
+        engine,
+        KeyRing(config['JWT_SECRET_KEY'], previous),
+        access_ttl=config.get('JWT_ACCESS_TOKEN_EXPIRES', 3600),
+        refresh_ttl=config.get('JWT_REFRESH_TOKEN_EXPIRES', 2592000),
+        leeway=config.get('JWT_LEEWAY', 30),
+        sync_interval=config.get('JWT_REVOCATION_SYNC_SECONDS', 10),
+        capacity=config.get('JWT_REVOCATION_CAPACITY', 100000),
+        error_rate=config.get('JWT_REVOCATION_ERROR_RATE', 0.01),
+        logger=app.logger,
+    )
+
+
+# -- endpoints -------------------------------------------------------------
+
+def _error(message, status):
+    return jsonify({'error': message}), status
+
+
+@token_auth_bp.route('/api/auth/token', methods=['POST'])
+def create_token():
+    """Exchange anonymous_id and password for an access and a refresh token"""
+    from app import db
+    from app.models import User
+    from app.passwords import check_user_password
+
+    data = request.get_json(silent=True) or {}
+    anonymous_id, password = data.get('anonymous_id'), data.get('password')
+    if not anonymous_id or not password:
+        return _error('anonymous_id and password are required', 400)
+    user = User.query.filter_by(anonymous_id=anonymous_id).first()
+    if user is None or not user.password_hash or not check_user_password(user, password):
+        return _error('Invalid credentials', 401)
+    db.session.commit()  # a rehashed password, if BCRYPT_ROUNDS was raised
+    return jsonify(current_app.extensions['token_auth'].issue(user))
+
+
+@token_auth_bp.route('/api/auth/refresh', methods=['POST'])
+def refresh_token():
+    """Rotate a refresh token: the old one is revoked, a new pair is issued"""
+    from app import db
+    from app.models import User
+
+    auth = current_app.extensions['token_auth']
+    data = request.get_json(silent=True) or {}
+    try:
+        claims = auth.verify(data.get('refresh_token') or '', REFRESH)
+    except TokenError as e:
+        return _error(e.message, e.status)
+    # Claims may have changed since the last refresh (e.g. therapist verification)
+    user = db.session.get(User, int(claims['sub']))
+    if user is None:
+        return _error('Unknown user', 401)
+    auth.revoke(claims)
+    return jsonify(auth.issue(user))
+
+
+@token_auth_bp.route('/api/auth/revoke', methods=['POST'])
+def revoke_token():
+    """Revoke the presented access token (and refresh token), or every token with {"all": true}"""
+    user = g.get('_login_user')
+    if not isinstance(user, TokenUser):
+        return _error('Bearer token required', 401)
+    auth = current_app.extensions['token_auth']
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        auth.revoke_user(user.id)
+        return jsonify({'revoked': 'all'})
+    auth.revoke(user.claims)
+    if data.get('refresh_token'):
+        try:
+            claims = auth.verify(data['refresh_token'], REFRESH)
+        except TokenError:
+            claims = None
+        if claims is not None and claims['sub'] == user.claims['sub']:
+            auth.revoke(claims)
+    return jsonify({'revoked': user.claims['jti']})
+
+
+def init_app(app):
+    """Accept Bearer access tokens on every request and register the token endpoints"""
+    from app import db
+    from app.startup import lazy_app_client, register_tables
+
+    auth = lazy_app_client(app, lambda: auth_from_config(app, db.engine))
+    app.extensions['token_auth'] = auth
+    register_tables(metadata)
+
+    def authenticate_bearer():
+        if 'Authorization' in request.headers:
+            return auth.before_request()
+        return None
+
+    app.before_request(authenticate_bearer)
+    app.register_blueprint(token_auth_bp)
+    return auth
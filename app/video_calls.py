@@ -0,0 +1,685 @@
+"""
+Video call rooms for therapy sessions
+
+One room per TherapySession tracks who is in the call, the WebRTC signaling
+exchange (offer, answer, ICE candidates) and the call's timing without
+touching the database on every request:
+
+    join      the first join loads the session's patient/therapist ids once;
+              later joins are checked against them and MAX_VIDEO_CALL_PARTICIPANTS
+    signal    offer/answer/candidate messages go to the other participants'
+              mailboxes, and reach them once, through their next poll
+    poll      returns the room and drains the caller's mailbox; doubles as
+              the heartbeat
+    leave     the room ends when its last participant leaves
+
+Expiry is driven by a sweeper thread rather than per-request time checks:
+participants that stop polling for VIDEO_CALL_IDLE_TIMEOUT seconds are
+dropped, and a room closes VIDEO_CALL_TIMEOUT seconds after it was opened.
+In memory the deadlines sit on a hashed timer wheel, so scheduling,
+rescheduling on every heartbeat and cancelling are O(1) and a sweep only
+looks at the slots that have come due.
+
+Calls that connected (both participants present at once) are written back
+to therapy_sessions (started_at, ended_at, duration_minutes, status) in
+batched UPDATEs by the sweeper.
+
+VIDEO_ROOMS_URL chooses where rooms live:
+
+    memory://                 this process only (one worker, development)
+    redis://localhost:6379/0  shared by all workers; deadlines in a sorted set
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import bindparam, update
+
+SIGNALS = ('offer', 'answer', 'candidate')
+MAX_SIGNAL_BYTES = 16384
+
+CallRecord = namedtuple('CallRecord', 'session_id started_at ended_at reason')
+
+video_calls_bp = Blueprint('video_calls', __name__)
+
+
+class RoomError(Exception):
+    """Rejected room operation, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class TimerWheel:
+    """Hashed timing wheel: O(1) schedule/cancel, sweeps visit only due slots
+
+    Deadlines are rounded up to `tick` seconds, so expiry fires up to one
+    tick late. Deadlines more than `slots` ticks away wait in their slot
+    for the wheel to come round again.
+    """
+
+    def __init__(self, tick=1.0, slots=4096, now=None):
+        self.tick = tick
+        self.slots = slots
+        self._buckets = [{} for _ in range(slots)]
+        self._where = {}
+        self._current = int((time.time() if now is None else now) // tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, deadline):
+        """Add or move a timer"""
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._buckets[index][key]
+        index = max(int(deadline // self.tick), self._current + 1) % self.slots
+        self._buckets[index][key] = deadline
+        self._where[key] = index
+
+    def cancel(self, key):
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._buckets[index][key]
+
+    def advance(self, now):
+        """Remove and return the keys whose deadline has passed"""
+        # Only whole ticks before `now` are complete
+        target = int(now // self.tick) - 1
+        if target <= self._current:
+            return []
+        if target - self._current >= self.slots:
+            indexes = range(self.slots)
+        else:
+            indexes = (t % self.slots for t in range(self._current + 1, target + 1))
+        expired = []
+        for index in indexes:
+            bucket = self._buckets[index]
+            due = [key for key, deadline in bucket.items() if deadline <= now]
+            for key in due:
+                del bucket[key]
+                del self._where[key]
+            expired.extend(due)
+        self._current = target
+        return expired
+
+
+class Participant:
+    __slots__ = ('user_id', 'role', 'joined_at', 'inbox')
+
+    def __init__(self, user_id, role, joined_at, mailbox_size):
+        self.user_id = user_id
+        self.role = role
+        self.joined_at = joined_at
+        self.inbox = deque(maxlen=mailbox_size)
+
+
+class Room:
+    __slots__ = ('session_id', 'members', 'participants', 'created_at', 'started_at', 'answered')
+
+    def __init__(self, session_id, members, created_at):
+        self.session_id = session_id
+        self.members = members
+        self.participants = {}
+        self.created_at = created_at
+        self.started_at = None
+        self.answered = False
+
+
+def room_state(count, max_participants, answered):
+    if count < max_participants:
+        return 'waiting'
+    return 'connected' if answered else 'connecting'
+
+
+class RoomRegistry:
+    """Rooms in this process; every operation is O(1)"""
+
+    def __init__(self, call_timeout=3600, idle_timeout=45, max_participants=2, tick=1.0,
+                 mailbox_size=50, now=None):
+        self.call_timeout = call_timeout
+        self.idle_timeout = idle_timeout
+        self.max_participants = max_participants
+        self.mailbox_size = mailbox_size
+        self.rooms = {}
+        self.timers = TimerWheel(tick, max(64, int(call_timeout // tick) + 1), now)
+        self.ended = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def join(self, session_id, user_id, load_members, now=None):
+        """Enter the call; load_members() -> {user_id: role} runs only for a new room"""
+        now = time.time() if now is None else now
+        with self._lock:
+            room = self.rooms.get(session_id)
+        if room is None:
+            members = load_members()
+            if user_id not in members:
+                raise RoomError('Not a participant of this session', 403)
+            with self._lock:
+                room = self.rooms.get(session_id)
+                if room is None:
+                    room = self.rooms[session_id] = Room(session_id, members, now)
+                    self.timers.schedule(('room', session_id), now + self.call_timeout)
+        with self._lock:
+            role = room.members.get(user_id)
+            if role is None:
+                raise RoomError('Not a participant of this session', 403)
+            if self.rooms.get(session_id) is not room:
+                raise RoomError('Call has ended', 410)
+            if user_id not in room.participants:
+                if len(room.participants) >= self.max_participants:
+                    raise RoomError('Call is full', 409)
+                room.participants[user_id] = Participant(user_id, role, now, self.mailbox_size)
+                room.answered = False
+                if room.started_at is None and len(room.participants) >= self.max_participants:
+                    room.started_at = now
+            self.timers.schedule(('peer', session_id, user_id), now + self.idle_timeout)
+            return self._describe(room)
+
+    def signal(self, session_id, user_id, kind, payload, now=None):
+        """Queue a signaling message for the other participants"""
+        now = time.time() if now is None else now
+        with self._lock:
+            room, _ = self._participant(session_id, user_id, now)
+            if kind == 'offer':
+                room.answered = False
+            elif kind == 'answer':
+                room.answered = True
+            message = {'kind': kind, 'from': user_id, 'payload': payload, 'at': now}
+            for other in room.participants.values():
+                if other.user_id != user_id:
+                    other.inbox.append(message)
+            return self._describe(room)
+
+    def poll(self, session_id, user_id, now=None):
+        """Room state and the caller's pending signals; also a heartbeat"""
+        now = time.time() if now is None else now
+        with self._lock:
+            room, participant = self._participant(session_id, user_id, now)
+            messages = list(participant.inbox)
+            participant.inbox.clear()
+            return self._describe(room), messages
+
+    def leave(self, session_id, user_id, now=None, reason='left'):
+        now = time.time() if now is None else now
+        with self._lock:
+            room = self.rooms.get(session_id)
+            if room is None or room.participants.pop(user_id, None) is None:
+                return None
+            self.timers.cancel(('peer', session_id, user_id))
+            room.answered = False
+            if not room.participants:
+                self._end(room, now, reason)
+            return self._describe(room)
+
+    def get(self, session_id):
+        with self._lock:
+            room = self.rooms.get(session_id)
+            return None if room is None else self._describe(room)
+
+    def sweep(self, now=None):
+        """Expire idle participants and overdue rooms; returns how many timers fired"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = self.timers.advance(now)
+            for key in expired:
+                room = self.rooms.get(key[1])
+                if room is None:
+                    continue
+                if key[0] == 'room':
+                    self._end(room, now, 'timeout')
+                elif room.participants.pop(key[2], None) is not None:
+                    room.answered = False
+                    if not room.participants:
+                        self._end(room, now, 'idle')
+        return len(expired)
+
+    def drain_ended(self, limit=1000):
+        """Finished calls waiting to be written back"""
+        records = []
+        with self._lock:
+            while self.ended and len(records) < limit:
+                records.append(self.ended.popleft())
+        return records
+
+    def _participant(self, session_id, user_id, now):
+        room = self.rooms.get(session_id)
+        participant = room.participants.get(user_id) if room is not None else None
+        if participant is None:
+            raise RoomError('Not in this call', 404)
+        self.timers.schedule(('peer', session_id, user_id), now + self.idle_timeout)
+        return room, participant
+
+    def _end(self, room, now, reason):
+        del self.rooms[room.session_id]
+        self.timers.cancel(('room', room.session_id))
+        for user_id in room.participants:
+            self.timers.cancel(('peer', room.session_id, user_id))
+        room.participants.clear()
+        if room.started_at is not None:
+            self.ended.append(CallRecord(room.session_id, room.started_at, now, reason))
+
+    def _describe(self, room):
+        return {
+            'session_id': room.session_id,
+            'state': 'ended' if self.rooms.get(room.session_id) is not room
+            else room_state(len(room.participants), self.max_participants, room.answered),
+            'participants': [
+                {'user_id': p.user_id, 'role': p.role, 'joined_at': p.joined_at}
+                for p in room.participants.values()
+            ],
+            'started_at': room.started_at,
+            'expires_at': room.created_at + self.call_timeout,
+        }
+
+
+# Atomic capacity check and room creation (KEYS: room, peers, deadlines)
+_JOIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('HSET', KEYS[1], 'created_at', ARGV[3], 'members', ARGV[7], 'answered', '0')
+  redis.call('ZADD', KEYS[3], ARGV[4], 'room:' .. ARGV[1])
+end
+local members = cjson.decode(redis.call('HGET', KEYS[1], 'members'))
+local role = members[ARGV[2]]
+if not role then return redis.error_reply('forbidden') end
+if redis.call('HEXISTS', KEYS[2], ARGV[2]) == 0 then
+  if redis.call('HLEN', KEYS[2]) >= tonumber(ARGV[6]) then return redis.error_reply('full') end
+  redis.call('HSET', KEYS[2], ARGV[2], cjson.encode({role, tonumber(ARGV[3])}))
+  redis.call('HSET', KEYS[1], 'answered', '0')
+  if redis.call('HLEN', KEYS[2]) >= tonumber(ARGV[6]) and redis.call('HEXISTS', KEYS[1], 'started_at') == 0 then
+    redis.call('HSET', KEYS[1], 'started_at', ARGV[3])
+  end
+end
+redis.call('ZADD', KEYS[3], ARGV[5], 'peer:' .. ARGV[1] .. ':' .. ARGV[2])
+return 1
+"""
+
+# Remove one participant, or everyone when ARGV[2] is '*', ending an empty room
+# (KEYS: room, peers, deadlines, ended)
+_LEAVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local users = {ARGV[2]}
+if ARGV[2] == '*' then users = redis.call('HKEYS', KEYS[2]) end
+for _, user in ipairs(users) do
+  redis.call('HDEL', KEYS[2], user)
+  redis.call('ZREM', KEYS[3], 'peer:' .. ARGV[1] .. ':' .. user)
+end
+redis.call('HSET', KEYS[1], 'answered', '0')
+if redis.call('HLEN', KEYS[2]) > 0 then return 1 end
+local started = redis.call('HGET', KEYS[1], 'started_at')
+if started then
+  redis.call('RPUSH', KEYS[4], cjson.encode({tonumber(ARGV[1]), tonumber(started), tonumber(ARGV[3]), ARGV[4]}))
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('ZREM', KEYS[3], 'room:' .. ARGV[1])
+return 2
+"""
+
+
+class RedisRoomRegistry:
+    """Rooms shared by every worker; deadlines in a sorted set swept by any worker"""
+
+    def __init__(self, client, call_timeout=3600, idle_timeout=45, max_participants=2,
+                 mailbox_size=50, prefix='mentwel:vc:'):
+        self.client = client
+        self.call_timeout = call_timeout
+        self.idle_timeout = idle_timeout
+        self.max_participants = max_participants
+        self.mailbox_size = mailbox_size
+        self.prefix = prefix
+        self.deadlines = prefix + 'deadlines'
+        self.ended_key = prefix + 'ended'
+        self._join = client.register_script(_JOIN_SCRIPT)
+        self._leave = client.register_script(_LEAVE_SCRIPT)
+
+    def _keys(self, session_id):
+        return f'{self.prefix}room:{session_id}', f'{self.prefix}peers:{session_id}'
+
+    def _inbox(self, session_id, user_id):
+        return f'{self.prefix}inbox:{session_id}:{user_id}'
+
+    def join(self, session_id, user_id, load_members, now=None):
+        import redis
+        now = time.time() if now is None else now
+        room_key, peers_key = self._keys(session_id)
+        members = '{}'
+        if not self.client.exists(room_key):
+            loaded = load_members()
+            if user_id not in loaded:
+                raise RoomError('Not a participant of this session', 403)
+            members = json.dumps({str(k): v for k, v in loaded.items()})
+        try:
+            self._join(keys=[room_key, peers_key, self.deadlines], args=[
+                session_id, user_id, now, now + self.call_timeout, now + self.idle_timeout,
+                self.max_participants, members,
+            ])
+        except redis.ResponseError as e:
+            if 'full' in str(e):
+                raise RoomError('Call is full', 409)
+            raise RoomError('Not a participant of this session', 403)
+        return self.get(session_id)
+
+    def signal(self, session_id, user_id, kind, payload, now=None):
+        now = time.time() if now is None else now
+        room_key, peers_key = self._keys(session_id)
+        peers = self._heartbeat(session_id, user_id, now)
+        message = json.dumps({'kind': kind, 'from': user_id, 'payload': payload, 'at': now})
+        pipe = self.client.pipeline()
+        if kind in ('offer', 'answer'):
+            pipe.hset(room_key, 'answered', '1' if kind == 'answer' else '0')
+        for other in peers:
+            if int(other) != user_id:
+                inbox = self._inbox(session_id, int(other))
+                pipe.rpush(inbox, message)
+                pipe.ltrim(inbox, -self.mailbox_size, -1)
+                pipe.expire(inbox, self.call_timeout)
+        pipe.execute()
+        return self.get(session_id)
+
+    def poll(self, session_id, user_id, now=None):
+        now = time.time() if now is None else now
+        self._heartbeat(session_id, user_id, now)
+        inbox = self._inbox(session_id, user_id)
+        pipe = self.client.pipeline()
+        pipe.lrange(inbox, 0, -1)
+        pipe.delete(inbox)
+        messages, _ = pipe.execute()
+        return self.get(session_id), [json.loads(m) for m in messages]
+
+    def leave(self, session_id, user_id, now=None, reason='left'):
+        now = time.time() if now is None else now
+        room_key, peers_key = self._keys(session_id)
+        self.client.delete(self._inbox(session_id, user_id))
+        if not self._leave(keys=[room_key, peers_key, self.deadlines, self.ended_key],
+                           args=[session_id, user_id, now, reason]):
+            return None
+        return self.get(session_id) or {'session_id': session_id, 'state': 'ended', 'participants': []}
+
+    def get(self, session_id):
+        room_key, peers_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.hgetall(room_key)
+        pipe.hgetall(peers_key)
+        room, peers = pipe.execute()
+        if not room:
+            return None
+        participants = []
+        for user_id, value in peers.items():
+            role, joined_at = json.loads(value)
+            participants.append({'user_id': int(user_id), 'role': role, 'joined_at': joined_at})
+        started_at = room.get(b'started_at')
+        return {
+            'session_id': session_id,
+            'state': room_state(len(participants), self.max_participants, room.get(b'answered') == b'1'),
+            'participants': participants,
+            'started_at': float(started_at) if started_at else None,
+            'expires_at': float(room[b'created_at']) + self.call_timeout,
+        }
+
+    def sweep(self, now=None, limit=1000):
+        """Expire due deadlines; ZREM decides which worker handles each one"""
+        now = time.time() if now is None else now
+        fired = 0
+        for member in self.client.zrangebyscore(self.deadlines, '-inf', now, start=0, num=limit):
+            if not self.client.zrem(self.deadlines, member):
+                continue
+            fired += 1
+            parts = member.decode('utf-8').split(':')
+            session_id = int(parts[1])
+            room_key, peers_key = self._keys(session_id)
+            if parts[0] == 'room':
+                self._leave(keys=[room_key, peers_key, self.deadlines, self.ended_key],
+                            args=[session_id, '*', now, 'timeout'])
+            else:
+                self._leave(keys=[room_key, peers_key, self.deadlines, self.ended_key],
+                            args=[session_id, parts[2], now, 'idle'])
+        return fired
+
+    def drain_ended(self, limit=1000):
+        records = self.client.lpop(self.ended_key, limit) or []
+        return [CallRecord(*json.loads(record)) for record in records]
+
+    def _heartbeat(self, session_id, user_id, now):
+        _, peers_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.hkeys(peers_key)
+        pipe.zadd(self.deadlines, {f'peer:{session_id}:{user_id}': now + self.idle_timeout}, xx=True)
+        peers, _ = pipe.execute()
+        if str(user_id).encode() not in peers:
+            raise RoomError('Not in this call', 404)
+        return peers
+
+
+# -- write-back --------------------------------------------------------------
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def write_durations(engine, sessions, records):
+    """Write finished calls to therapy_sessions in one batched UPDATE; returns rows written"""
+    merged = {}
+    for record in records:
+        # A dropped and re-joined call counts once, spanning both rooms
+        started, ended, seconds = merged.get(record.session_id, (record.started_at, record.ended_at, 0.0))
+        merged[record.session_id] = (
+            min(started, record.started_at),
+            max(ended, record.ended_at),
+            seconds + record.ended_at - record.started_at,
+        )
+    if not merged:
+        return 0
+    query = (
+        update(sessions)
+        .where(sessions.c.id == bindparam('call_session_id'))
+        .values(
+            status='completed',
+            started_at=bindparam('call_started_at'),
+            ended_at=bindparam('call_ended_at'),
+            duration_minutes=bindparam('call_minutes'),
+        )
+    )
+    with engine.begin() as conn:
+        conn.execute(query, [
+            {'call_session_id': session_id, 'call_started_at': _utc(started), 'call_ended_at': _utc(ended),
+             'call_minutes': max(1, int(round(seconds / 60)))}
+            for session_id, (started, ended, seconds) in merged.items()
+        ])
+    return len(merged)
+
+
+class CallSweeper:
+    """Fires room timers once per tick and writes finished calls back in batches"""
+
+    def __init__(self, registry, engine, sessions, tick=1.0, flush_size=200, flush_interval=5.0, logger=None):
+        self.registry = registry
+        self.engine = engine
+        self.sessions = sessions
+        self.tick = tick
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self.pending = []
+        self.written = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def run_once(self, now=None):
+        """One sweep; flushes when a batch is full or flush_interval has passed"""
+        self.registry.sweep(now)
+        ended = self.registry.drain_ended()
+        with self._lock:
+            self.pending.extend(ended)
+            due = len(self.pending) >= self.flush_size or (
+                self.pending and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self.pending = self.pending, []
+            self._last_flush = time.monotonic()
+        for i in range(0, len(records), self.flush_size):
+            batch = records[i:i + self.flush_size]
+            try:
+                self.written += write_durations(self.engine, self.sessions, batch)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning('Writing %d call durations failed, will retry: %s', len(batch), e)
+                with self._lock:
+                    self.pending.extend(records[i:])
+                return
+
+    def ensure_running(self):
+        # Threads do not survive a Gunicorn fork, so start one lazily per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='video-call-sweeper', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                self.run_once()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning('Video call sweep failed: %s', e)
+
+
+def registry_from_config(config):
+    """Room registry for VIDEO_ROOMS_URL"""
+    url = config.get('VIDEO_ROOMS_URL') or 'memory://'
+    options = {
+        'call_timeout': config.get('VIDEO_CALL_TIMEOUT', 3600),
+        'idle_timeout': config.get('VIDEO_CALL_IDLE_TIMEOUT', 45),
+        'max_participants': config.get('MAX_VIDEO_CALL_PARTICIPANTS', 2),
+    }
+    if url.startswith('memory://'):
+        return RoomRegistry(**options)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('VIDEO_ROOMS_URL uses Redis; run `pip install redis`')
+        return RedisRoomRegistry(redis.Redis.from_url(url), **options)
+    raise ValueError(f'Unsupported VIDEO_ROOMS_URL: {url}')
+
+
+# -- endpoints -------------------------------------------------------------
+
+def _members(session_id):
+    """{user_id: role} for a session, loaded once when its room opens"""
+    from app import db
+    from app.models import TherapySession
+    session = db.session.get(TherapySession, session_id)
+    if session is None:
+        raise RoomError('Session not found', 404)
+    members = {}
+    if session.patient_id is not None:
+        members[session.patient_id] = 'patient'
+    if session.therapist_id is not None:
+        members[session.therapist_id] = 'therapist'
+    return members
+
+
+def _calls():
+    calls = current_app.extensions['video_calls'].get()
+    calls.ensure_running()
+    return calls.registry
+
+
+def _announce(session_id, event_type, **data):
+    from app.realtime import publish_session_event
+    publish_session_event(session_id, event_type, **data)
+
+
+@video_calls_bp.errorhandler(RoomError)
+def room_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+@video_calls_bp.route('/api/sessions/<int:session_id>/call/join', methods=['POST'])
+@login_required
+def join_call(session_id):
+    """Enter the session's video call"""
+    room = _calls().join(session_id, current_user.id, lambda: _members(session_id))
+    _announce(session_id, 'call', room=room)
+    return jsonify(room)
+
+
+@video_calls_bp.route('/api/sessions/<int:session_id>/call/signal', methods=['POST'])
+@login_required
+def signal_call(session_id):
+    """Relay an offer, answer or ICE candidate to the other participant"""
+    if (request.content_length or 0) > MAX_SIGNAL_BYTES:
+        abort(413)
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    if kind not in SIGNALS:
+        return jsonify({'error': f"kind must be one of {', '.join(SIGNALS)}"}), 400
+    # Delivered only through the peer's mailbox; publishing it on the realtime
+    # channel as well handed every signal to clients twice
+    room = _calls().signal(session_id, current_user.id, kind, data.get('payload'))
+    return jsonify(room)
+
+
+@video_calls_bp.route('/api/sessions/<int:session_id>/call')
+@login_required
+def poll_call(session_id):
+    """Room state and pending signals; clients poll this as their heartbeat"""
+    room, signals = _calls().poll(session_id, current_user.id)
+    return jsonify({'room': room, 'signals': signals})
+
+
+@video_calls_bp.route('/api/sessions/<int:session_id>/call/leave', methods=['POST'])
+@login_required
+def leave_call(session_id):
+    """Hang up; the call ends when the last participant leaves"""
+    room = _calls().leave(session_id, current_user.id)
+    if room is None:
+        return jsonify({'error': 'Not in this call'}), 404
+    _announce(session_id, 'call', room=room)
+    return jsonify(room)
+
+
+def init_app(app):
+    """Register the call endpoints; the registry and its sweeper are built on first use"""
+    from app.startup import lazy_app_client
+
+    def build():
+        from app import db
+        from app.models import TherapySession
+        return CallSweeper(
+            registry_from_config(app.config),
+            db.engine,
+            TherapySession.__table__,
+            flush_size=app.config.get('VIDEO_CALL_FLUSH_SIZE', 200),
+            flush_interval=app.config.get('VIDEO_CALL_FLUSH_INTERVAL', 5),
+            logger=app.logger,
+        )
+
+    app.extensions['video_calls'] = lazy_app_client(app, build)
+    app.register_blueprint(video_calls_bp)
@@ -0,0 +1,353 @@
+"""
+Durable inbox for Paystack webhooks
+
+The webhook endpoint (PAYSTACK_WEBHOOK_PATH) only verifies the HMAC-SHA512
+signature and inserts the raw event into `paystack_webhook_events`, keyed on
+"<event>:<reference>" with ON CONFLICT DO NOTHING, then acks with 200.
+Duplicate deliveries are absorbed by the unique key and never re-applied.
+
+A drainer thread in each worker (or `flask webhook-replay`) claims pending
+events in batches and applies them in one transaction per batch:
+
+    charge.success  marks the Payment successful and adds a `session_credits`
+                    row with the package's session count and expiry
+    anything else   recorded as ignored
+
+Events that cannot be applied (unknown reference, amount mismatch) are marked
+failed with the reason and can be replayed once the cause is fixed.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify, request
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, Text, bindparam, select, update,
+)
+
+from app.startup import lazy_app_client, register_tables
+
+MAX_ATTEMPTS = 5
+
+metadata = MetaData()
+
+webhook_events = Table(
+    'paystack_webhook_events', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('event_key', String(200), nullable=False, unique=True),
+    Column('event_type', String(50), nullable=False),
+    Column('reference', String(100), index=True),
+    Column('payload', Text, nullable=False),
+    Column('status', String(20), nullable=False, default='pending'),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('error', String(255)),
+    Column('received_at', DateTime, nullable=False, default=datetime.utcnow),
+    Column('processed_at', DateTime),
+    Index('ix_paystack_webhook_events_status_id', 'status', 'id'),
+)
+
+session_credits = Table(
+    'session_credits', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, nullable=False, index=True),
+    Column('package_id', Integer),
+    Column('payment_id', Integer, nullable=False, unique=True),
+    Column('sessions_total', Integer, nullable=False),
+    Column('sessions_remaining', Integer, nullable=False),
+    Column('expires_at', DateTime),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def insert_ignore(table, dialect_name):
+    """INSERT that silently skips rows violating a unique constraint"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect_name in ('mysql', 'mariadb'):
+        return table.insert().prefix_with('IGNORE')
+    raise ValueError(f'insert_ignore is not supported on {dialect_name}')
+
+
+def verify_signature(secret, body, signature):
+    """Check Paystack's x-paystack-signature (HMAC-SHA512 of the raw body)"""
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def event_key(event):
+    """Deduplication key: Paystack redelivers the same event for one reference"""
+    data = event.get('data') or {}
+    return f"{event.get('event')}:{data.get('reference') or data.get('id')}"
+
+
+class WebhookInbox:
+    """Accepts webhook events with a single insert and applies them in batches"""
+
+    def __init__(self, engine, payments, packages, batch_size=200, max_delay=0.05, logger=None):
+        self.engine = engine
+        self.payments = payments
+        self.packages = packages
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.logger = logger
+        self._insert = insert_ignore(webhook_events, engine.dialect.name)
+        self._credit_insert = insert_ignore(session_credits, engine.dialect.name)
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.accepted = 0
+        self.duplicates = 0
+
+    def create_tables(self):
+        metadata.create_all(self.engine, checkfirst=True)
+
+    def accept(self, event, body):
+        """Store one verified event; returns False for a duplicate delivery"""
+        data = event.get('data') or {}
+        with self.engine.begin() as conn:
+            result = conn.execute(self._insert, {
+                'event_key': event_key(event),
+                'event_type': event.get('event') or 'unknown',
+                'reference': data.get('reference'),
+                'payload': body.decode('utf-8') if isinstance(body, bytes) else body,
+                'status': 'pending',
+                'attempts': 0,
+                'received_at': datetime.utcnow(),
+            })
+        if result.rowcount:
+            self.accepted += 1
+            return True
+        self.duplicates += 1
+        return False
+
+    def drain_once(self, limit=None):
+        """Apply one batch of pending events; returns how many were claimed"""
+        limit = limit or self.batch_size
+        query = (
+            select(webhook_events.c.id, webhook_events.c.event_type, webhook_events.c.payload,
+                   webhook_events.c.attempts)
+            .where(webhook_events.c.status == 'pending')
+            .order_by(webhook_events.c.id)
+            .limit(limit)
+        )
+        if self.engine.dialect.name == 'postgresql':
+            # Workers draining concurrently claim disjoint batches
+            query = query.with_for_update(skip_locked=True)
+
+        try:
+            with self.engine.begin() as conn:
+                events = conn.execute(query).all()
+                if events:
+                    self._mark(conn, self._apply(conn, events))
+            return len(events)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('Webhook inbox batch failed, retrying singly: %s', e)
+
+        # Apply one event per transaction so a single bad event cannot block the rest
+        with self.engine.connect() as conn:
+            events = conn.execute(query).all()
+        for row in events:
+            try:
+                with self.engine.begin() as conn:
+                    self._mark(conn, self._apply(conn, [row]))
+            except Exception as e:
+                status = 'failed' if row.attempts + 1 >= MAX_ATTEMPTS else 'pending'
+                with self.engine.begin() as conn:
+                    self._mark(conn, {row.id: (status, str(e)[:255])})
+        return len(events)
+
+    def drain(self, limit=None):
+        """Apply pending events until the inbox is empty; returns the total"""
+        total = 0
+        while True:
+            count = self.drain_once(limit)
+            total += count
+            if count < (limit or self.batch_size):
+                return total
+
+    def _apply(self, conn, events):
+        """Return {event_id: (status, error)} after applying the batch"""
+        outcomes = {}
+        charges = {}
+        for row in events:
+            if row.event_type != 'charge.success':
+                outcomes[row.id] = ('ignored', None)
+                continue
+            data = json.loads(row.payload).get('data') or {}
+            charges[row.id] = data
+
+        references = {data.get('reference') for data in charges.values()}
+        payments, packages = self.payments, self.packages
+        found = {}
+        if references:
+            rows = conn.execute(
+                select(payments.c.id, payments.c.user_id, payments.c.package_id, payments.c.amount,
+                       payments.c.status, payments.c.paystack_reference,
+                       packages.c.session_count, packages.c.package_duration_days)
+                .select_from(payments.outerjoin(packages, payments.c.package_id == packages.c.id))
+                .where(payments.c.paystack_reference.in_(references))
+            ).all()
+            found = {row.paystack_reference: row for row in rows}
+
+        now = datetime.utcnow()
+        paid_ids = []
+        credits = []
+        for event_id, data in charges.items():
+            payment = found.get(data.get('reference'))
+            if payment is None:
+                outcomes[event_id] = ('failed', 'unknown payment reference')
+                continue
+            # Paystack amounts are in kobo
+            if payment.amount is not None and int(round(float(payment.amount) * 100)) != data.get('amount'):
+                outcomes[event_id] = ('failed', 'amount mismatch')
+                continue
+            outcomes[event_id] = ('processed', None)
+            if payment.status == 'success' or payment.id in paid_ids:
+                continue
+            paid_ids.append(payment.id)
+            if payment.session_count:
+                credits.append({
+                    'user_id': payment.user_id,
+                    'package_id': payment.package_id,
+                    'payment_id': payment.id,
+                    'sessions_total': payment.session_count,
+                    'sessions_remaining': payment.session_count,
+                    'expires_at': now + timedelta(days=payment.package_duration_days)
+                    if payment.package_duration_days else None,
+                    'created_at': now,
+                })
+
+        if paid_ids:
+            conn.execute(
+                update(payments)
+                .where(payments.c.id.in_(paid_ids), payments.c.status != 'success')
+                .values(status='success', paid_at=now)
+            )
+        if credits:
+            conn.execute(self._credit_insert, credits)
+        return outcomes
+
+    def _mark(self, conn, outcomes):
+        if not outcomes:
+            return
+        conn.execute(
+            update(webhook_events)
+            .where(webhook_events.c.id == bindparam('event_id'))
+            .values(
+                status=bindparam('new_status'),
+                error=bindparam('new_error'),
+                attempts=webhook_events.c.attempts + 1,
+                processed_at=bindparam('done_at'),
+            ),
+            [
+                {'event_id': event_id, 'new_status': status, 'new_error': error,
+                 'done_at': None if status == 'pending' else datetime.utcnow()}
+                for event_id, (status, error) in outcomes.items()
+            ],
+        )
+
+    def replay(self, status='failed', reference=None, since=None):
+        """Reset matching events to pending; returns how many were reset"""
+        query = update(webhook_events).values(status='pending', error=None, attempts=0, processed_at=None)
+        if status:
+            query = query.where(webhook_events.c.status == status)
+        if reference:
+            query = query.where(webhook_events.c.reference == reference)
+        if since:
+            query = query.where(webhook_events.c.received_at >= since)
+        with self.engine.begin() as conn:
+            return conn.execute(query).rowcount
+
+    def counts(self):
+        from sqlalchemy import func
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(webhook_events.c.status, func.count()).group_by(webhook_events.c.status)
+            ).all()
+        return dict(rows)
+
+    def notify(self):
+        """Wake the drainer thread after an insert"""
+        self._ensure_thread()
+        self._wake.set()
+
+    def _ensure_thread(self):
+        # Threads do not survive a Gunicorn fork, so start one lazily per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._wake = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='webhook-inbox', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            # Also poll now and then so events left by a crashed worker get applied
+            self._wake.wait(timeout=30)
+            self._wake.clear()
+            # Let a burst accumulate into one batch
+            time.sleep(self.max_delay)
+            try:
+                self.drain()
+            except Exception:
+                time.sleep(1)
+
+
+def paystack_webhook():
+    """Verify, store and ack a Paystack webhook"""
+    body = request.get_data()
+    secret = current_app.config.get('PAYSTACK_SECRET_KEY')
+    if not verify_signature(secret, body, request.headers.get('x-paystack-signature')):
+        return jsonify({'error': 'Invalid signature'}), 401
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return jsonify({'error': 'Invalid payload'}), 400
+
+    inbox = current_app.extensions['webhook_inbox'].get()
+    if inbox.accept(event, body) and current_app.config.get('PAYSTACK_INBOX_WORKER', True):
+        inbox.notify()
+    return jsonify({'status': 'ok'}), 200
+
+
+def init_app(app):
+    """Register the webhook endpoint; the inbox is built on first use"""
+    def build():
+        from app import db
+        from app.models import Payment, SessionPackage
+        inbox = WebhookInbox(
+            db.engine,
+            Payment.__table__,
+            SessionPackage.__table__,
+            batch_size=app.config.get('PAYSTACK_INBOX_BATCH_SIZE', 200),
+            max_delay=app.config.get('PAYSTACK_INBOX_DELAY_MS', 50) / 1000,
+            logger=app.logger,
+        )
+        inbox.create_tables()
+        return inbox
+
+    app.extensions['webhook_inbox'] = lazy_app_client(app, build)
+    register_tables(metadata)
+    app.add_url_rule(
+        app.config.get('PAYSTACK_WEBHOOK_PATH', '/api/webhooks/paystack'),
+        'paystack_webhook', paystack_webhook, methods=['POST'],
+    )
+    # Paystack retries on 429, so bursts must not be rate limited
+    limiter = app.extensions.get('mentwel_ratelimit')
+    if limiter is not None:
+        limiter.exempt.add('paystack_webhook')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark the analytics export: throughput and peak memory vs. table size
+
+Each size runs in a fresh process against a temporary SQLite database of
+sentiment rows spread over a year, so peak RSS can be compared: with
+chunked reads it should stay roughly flat as the table grows.
+
+Usage: python benchmarks/bench_analytics_export.py [sizes...]   (default: 100000 1000000)
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_one(size):
+    from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, insert
+    from app.analytics_export import export_all
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{tmp}/bench.db')
+        metadata = MetaData()
+        table = Table(
+            'sentiment_analysis', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', Integer),
+            Column('session_id', Integer),
+            Column('sentiment_label', String(20)),
+            Column('sentiment_score', Float),
+            Column('created_at', DateTime),
+        )
+        metadata.create_all(engine)
+        rng = random.Random(7)
+        now = datetime.utcnow()
+        labels = ('positive', 'neutral', 'negative')
+        with engine.begin() as conn:
+            for start in range(0, size, 50000):
+                conn.execute(insert(table), [
+                    {'user_id': rng.randint(1, 5000), 'session_id': rng.randint(1, 20000),
+                     'sentiment_label': rng.choice(labels), 'sentiment_score': rng.random(),
+                     'created_at': now - timedelta(seconds=rng.randint(0, 365 * 86400))}
+                    for _ in range(min(50000, size - start))
+                ])
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        out = os.path.join(tmp, 'export')
+        start = time.perf_counter()
+        report = export_all(engine, {'sentiment_analysis': table}, out, 'bench-key',
+                            datasets=['sentiment_analysis'], chunk_size=50000)
+        elapsed = time.perf_counter() - start
+        rows, _, files = report['sentiment_analysis']
+        size_mb = sum(os.path.getsize(f) for f in files) / 1024 / 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'{size:>9} rows  {rows / elapsed:>9,.0f} rows/s  {len(files):>4} files  {size_mb:6.1f} MiB  '
+              f'peak RSS {peak / 1024:6.1f} MiB (+{(peak - baseline) / 1024:5.1f} MiB during export)')
+
+        # An incremental run with nothing new is a no-op
+        report = export_all(engine, {'sentiment_analysis': table}, out, 'bench-key', datasets=['sentiment_analysis'])
+        assert report['sentiment_analysis'][0] == 0
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--one':
+        run_one(int(sys.argv[2]))
+        return
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 1000000]
+    print('📦 Analytics export (Parquet, zstd, 50k-row chunks)')
+    print('=' * 78)
+    for size in sizes:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--one', str(size)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark connection reuse in the shared outbound HTTP client
+
+Compares a fresh connection per call (plain requests.post) with the pooled
+OutboundClient against a local TLS mock server, then shows the circuit
+breaker failing fast against a degraded upstream.
+
+Usage: python benchmarks/bench_http_client.py [requests]
+"""
+
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from app.http_client import CircuitBreaker, CircuitOpenError, Integration, OutboundClient
+from benchmarks.mock_server import MockServer
+
+
+def timed(fn, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return sum(latencies) / 1000, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print(f'🌐 Outbound HTTP: {count} POSTs to a local TLS mock server')
+    print('=' * 60)
+
+    with MockServer(tls=True) as server:
+        url = server.url + '/transaction/initialize'
+        elapsed, p50, p99 = timed(
+            lambda: requests.post(url, json={'amount': 5000}, verify=server.cert_path, timeout=5), count
+        )
+        fresh_connections = server.connections
+        print(f'{"fresh":<8} {count / elapsed:7.0f} req/s  p50 {p50:6.2f}ms  p99 {p99:6.2f}ms  '
+              f'connections {fresh_connections}')
+
+        client = OutboundClient([Integration('paystack', server.url)], verify=server.cert_path)
+        elapsed, p50, p99 = timed(
+            lambda: client.request('paystack', 'POST', '/transaction/initialize', json={'amount': 5000}),
+            count,
+        )
+        print(f'{"pooled":<8} {count / elapsed:7.0f} req/s  p50 {p50:6.2f}ms  p99 {p99:6.2f}ms  '
+              f'connections {server.connections - fresh_connections}')
+        print(f"Per-host latency: {client.stats()['hosts']}")
+
+    with MockServer(latency=0.05, fail_rate=1.0) as server:
+        integration = Integration('huggingface', server.url, retries=0,
+                                  breaker=CircuitBreaker(threshold=5, reset_timeout=60))
+        client = OutboundClient([integration])
+        fast_failures = 0
+        start = time.perf_counter()
+        for _ in range(50):
+            try:
+                client.request('huggingface', 'POST', '/models/x', json={'inputs': 'hi'})
+            except CircuitOpenError:
+                fast_failures += 1
+        elapsed = time.perf_counter() - start
+        print(f'Degraded upstream: 50 calls in {elapsed * 1000:.0f}ms, {fast_failures} failed fast, '
+              f'{server.requests} reached the server')
+
+
+if __name__ == '__main__':
+    main()
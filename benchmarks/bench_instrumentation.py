@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark the overhead of app.instrumentation on a request
+
+A Flask app on a file-backed SQLite database serves an endpoint that runs a
+handful of queries (like a dashboard page). The same request is driven
+through the WSGI test client with instrumentation off, on with the default
+sample rate and on with every request profiled. One app is switched between
+the modes (hooks and SQL listeners removed for "off") in short interleaved
+runs. End-to-end differences of 1% are within machine noise, so the time spent
+in the hooks and SQL listeners is also measured directly and reported as a
+share of the uninstrumented request.
+
+It then requests an N+1 endpoint and a slow endpoint to show what gets
+logged, and prints an excerpt of the Prometheus output.
+
+Usage: python benchmarks/bench_instrumentation.py [requests_per_run] [queries_per_request]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select
+
+ROUNDS = 41
+
+
+def build_app(engine, users, queries):
+    from app import instrumentation
+
+    app = Flask(__name__)
+    app.config.update(INSTRUMENT_SLOW_REQUEST_MS=200, INSTRUMENT_METRICS_PATH='/metrics')
+    instrumentation.init_app(app)
+
+    @app.route('/dashboard')
+    def dashboard():
+        with engine.connect() as conn:
+            rows = [conn.execute(select(users).where(users.c.id == i + 1)).first() for i in range(queries)]
+        return jsonify({'rows': len(rows)})
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        with engine.connect() as conn:
+            ids = [row.id for row in conn.execute(select(users.c.id).limit(25))]
+            names = [conn.execute(select(users.c.name).where(users.c.id == i)).scalar() for i in ids]
+        return jsonify({'names': len(names)})
+
+    @app.route('/slow')
+    def slow():
+        with engine.connect() as conn:
+            conn.execute(select(users).limit(5)).all()
+        time.sleep(0.25)
+        return jsonify({})
+
+    return app
+
+
+def set_mode(app, mode):
+    """Switch one app between no hooks and a given sample rate, so every mode
+    runs the same code objects and memory layout"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from app.instrumentation import _after_cursor_execute, _before_cursor_execute
+
+    instrumentation = app.extensions['instrumentation']
+    hooks = ((app.before_request_funcs, instrumentation.before_request),
+             (app.after_request_funcs, instrumentation.after_request),
+             (app.teardown_request_funcs, instrumentation.teardown_request))
+    listening = event.contains(Engine, 'before_cursor_execute', _before_cursor_execute)
+    for funcs, hook in hooks:
+        registered = funcs.setdefault(None, [])
+        if mode == 'off' and hook in registered:
+            registered.remove(hook)
+        elif mode != 'off' and hook not in registered:
+            registered.insert(0, hook)
+    if mode == 'off' and listening:
+        event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+    elif mode != 'off' and not listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if mode != 'off':
+        instrumentation.sample_rate = mode
+
+
+def hook_cost(app, queries, iterations=20000):
+    """Seconds per request spent in the hooks and the SQL listeners"""
+    from app.instrumentation import _after_cursor_execute, _before_cursor_execute
+
+    class Connection:
+        info = {}
+
+    instrumentation = app.extensions['instrumentation']
+    statements = [f'SELECT users.id, users.name FROM users WHERE users.id = ? -- {i}' for i in range(queries)]
+    with app.test_request_context('/dashboard'):
+        from flask import request
+        request.url_rule = app.url_map.bind('localhost').match('/dashboard', return_rule=True)[0]
+        start = time.perf_counter()
+        for _ in range(iterations):
+            instrumentation.before_request()
+            for statement in statements:
+                _before_cursor_execute(Connection, None, statement, None, None, False)
+                _after_cursor_execute(Connection, None, statement, None, None, False)
+            instrumentation.teardown_request()
+        return (time.perf_counter() - start) / iterations
+
+
+def drive(client, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get('/dashboard')
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    from app.instrumentation import metrics
+
+    print(f'📈 Instrumentation overhead: runs of {count} requests x {queries} queries (SQLite), best of {ROUNDS} interleaved runs')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+        metadata = MetaData()
+        users = Table('users', metadata, Column('id', Integer, primary_key=True), Column('name', String(50)))
+        metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(users), [{'id': i, 'name': f'user{i}'} for i in range(1, 101)])
+
+        modes = ['off', 0.1, 1.0]
+        app = build_app(engine, users, queries)
+        client = app.test_client()
+        drive(client, 500)
+        runs = {mode: [] for mode in modes}
+        for _ in range(ROUNDS):
+            for mode in modes:
+                set_mode(app, mode)
+                runs[mode].append(drive(client, count))
+        request_s = min(runs['off'])
+
+        # End to end differences sit inside machine noise, so also time the
+        # instrumentation itself and compare it with the request
+        print(f'{"mode":<18} {"end to end":>12} {"hook cost":>10} {"overhead":>9}')
+        for mode in modes:
+            best = min(runs[mode])
+            if mode == 'off':
+                print(f'{"off":<18} {best * 1e6:10.1f}µs')
+                continue
+            set_mode(app, mode)
+            cost = hook_cost(app, queries)
+            print(f'{f"sample rate {mode:g}":<18} {best * 1e6:10.1f}µs {cost * 1e6:8.1f}µs '
+                  f'{cost / request_s * 100:8.2f}%')
+
+        print()
+        metrics.reset()
+        set_mode(app, 1.0)
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('  log: %(message)s'))
+        app.logger.addHandler(handler)
+        client = app.test_client()
+        client.get('/n-plus-one')
+        client.get('/slow')
+        for _ in range(20):
+            client.get('/dashboard')
+        text = client.get('/metrics').get_data(as_text=True)
+        print()
+        for line in text.splitlines():
+            if line.startswith(('mentwel_n_plus_one_total', 'mentwel_slow_requests_total',
+                                'mentwel_db_queries_per_request_sum')) or \
+                    ('le="0.01"' in line and 'dashboard' in line):
+                print(f'  {line}')
+
+
+if __name__ == '__main__':
+    main()
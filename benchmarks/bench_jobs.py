@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark email delivery: in the request vs. the background job queue
+
+A local SMTPSink stands in for the mail provider, with CONNECT_DELAY seconds
+per connection (TCP + TLS + AUTH against a remote server) and MESSAGE_DELAY
+per message. Reported:
+
+    - request latency: sending synchronously on a new connection (what a
+      per-request SMTP send costs) vs. app.jobs enqueue (one INSERT into the
+      jobs table, SQLite)
+    - throughput in emails/sec: one connection per email, the pooled
+      connections from app.mailer on one thread, and `flask worker`
+      (app.jobs.Worker) draining the queue with THREADS threads
+
+Usage: python benchmarks/bench_jobs.py [emails] [connect_delay_ms]
+"""
+
+import os
+import smtplib
+import sys
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+from app.jobs import JobQueue, Worker
+from app.mailer import SMTPPool, SMTPSink, build_message
+from app.sqlite_mode import engine_options
+from app.startup import LazyClient
+
+THREADS = 4
+MESSAGE_DELAY = 0.002
+SENDER = 'noreply@mentwel.test'
+
+
+def message(i):
+    return build_message(SENDER, f'patient{i}@example.com', 'Reset your MentWel password',
+                         f'Use this link to choose a new password: https://mentwel.test/reset/{i:08d}')
+
+
+def send_unpooled(sink, i):
+    with smtplib.SMTP(sink.host, sink.port, timeout=10) as smtp:
+        smtp.send_message(message(i))
+
+
+def rate(count, seconds):
+    return f'{count / seconds:8.1f} emails/sec'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    connect_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    print(f'📧 Email jobs: {count} emails, SMTP handshake {connect_delay * 1000:.0f}ms, '
+          f'{MESSAGE_DELAY * 1000:.0f}ms per message (local sink)')
+    print('=' * 70)
+    sink = SMTPSink(connect_delay=connect_delay, message_delay=MESSAGE_DELAY, keep=False).start()
+
+    # SQLite production mode, as config.py sets it up
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'jobs.db')}",
+                               **engine_options({'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000}))
+        queue = JobQueue(engine, backoff_base=0)
+        queue.create_tables()
+
+        # Request latency
+        samples = min(count, 50)
+        start = time.perf_counter()
+        for i in range(samples):
+            send_unpooled(sink, i)
+        sync_ms = (time.perf_counter() - start) / samples * 1000
+        start = time.perf_counter()
+        for i in range(count):
+            queue.enqueue('email', {'to': f'patient{i}@example.com', 'subject': 'Reset your MentWel password',
+                                    'body': f'https://mentwel.test/reset/{i:08d}'})
+        enqueue_ms = (time.perf_counter() - start) / count * 1000
+        print(f'Request latency: send in request {sync_ms:7.2f}ms, enqueue {enqueue_ms:6.3f}ms '
+              f'({sync_ms / enqueue_ms:.0f}x)\n')
+
+        # Throughput
+        start = time.perf_counter()
+        for i in range(samples):
+            send_unpooled(sink, i)
+        print(f'{"new connection per email":<28} {rate(samples, time.perf_counter() - start)}')
+
+        pool = SMTPPool(sink.host, sink.port, size=THREADS)
+        start = time.perf_counter()
+        for i in range(count):
+            pool.send(message(i))
+        print(f'{"pooled, 1 thread":<28} {rate(count, time.perf_counter() - start)}  '
+              f'({pool.connects} connections)')
+        pool.close()
+
+        app = Flask(__name__)
+        app.config['MAIL_DEFAULT_SENDER'] = SENDER
+        pool = SMTPPool(sink.host, sink.port, size=THREADS)
+        app.extensions['mailer'] = LazyClient(lambda: pool)
+        worker = Worker(queue, app, threads=THREADS, poll_interval=0.05)
+        received = sink.count
+        start = time.perf_counter()
+        processed = worker.run(burst=True)
+        seconds = time.perf_counter() - start
+        assert processed == count and sink.count - received == count, (processed, sink.count - received)
+        print(f'{f"worker, {THREADS} threads":<28} {rate(count, seconds)}  ({pool.connects} connections, '
+              f'includes claiming and marking jobs done)')
+        pool.close()
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
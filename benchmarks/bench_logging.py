@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark request latency with logging off, synchronous and queued
+
+A Flask app serves an endpoint that logs a few lines per request (like a
+booking flow) and is driven at a fixed request rate from several threads
+through the WSGI test client. Log output goes to a pipe drained by a throttled reader process,
+which is what a busy stderr collector or a slow disk looks like to a worker:
+once the pipe buffer is full, every synchronous write waits.
+
+Modes:
+    - off:   logging disabled
+    - sync:  JSON formatter on a plain StreamHandler (what production used)
+    - queue: app.log_pipeline (bounded queue, background writer, drops on overflow)
+
+Reports p50/p99 request latency per mode and, for the queue, how many
+records were written, suppressed by the rate limit or dropped.
+
+Usage: python benchmarks/bench_logging.py [requests_per_sec] [threads] [reader_kib_per_sec]
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+LINES_PER_REQUEST = 4
+SECONDS = 10
+
+# Prints bytes and lines read, and the drop and rate limit counts reported in those lines
+READER = '''
+import json, os, sys, time
+chunk, pause = int(sys.argv[1]), float(sys.argv[2])
+total, pending = 0, b''
+lines = dropped = suppressed = 0
+while True:
+    data = os.read(0, chunk)
+    if not data:
+        break
+    total += len(data)
+    *complete, pending = (pending + data).split(b'\\n')
+    for line in complete:
+        lines += 1
+        entry = json.loads(line)
+        dropped += entry.get('dropped', 0)
+        suppressed += entry.get('suppressed', 0)
+    time.sleep(pause)
+print(total, lines, dropped, suppressed)
+'''
+
+
+def start_reader(kib_per_sec):
+    """Subprocess draining stdin at roughly `kib_per_sec`"""
+    chunk = 4096
+    pause = chunk / (kib_per_sec * 1024)
+    return subprocess.Popen([sys.executable, '-c', READER, str(chunk), str(pause)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+def build_app(mode, stream):
+    from app import log_pipeline
+
+    app = Flask(__name__)
+    app.config.update(LOG_ACCESS_SAMPLE_RATE=0.1, LOG_RATE_LIMIT=1000, LOG_RATE_WINDOW=1)
+    # Every mode's app shares one logger (named after this module)
+    logger = app.logger
+    logger.handlers.clear()
+    logger.disabled = mode == 'off'
+    if mode == 'sync':
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(log_pipeline.JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    elif mode == 'queue':
+        original = log_pipeline.build_pipeline
+        log_pipeline.build_pipeline = lambda config: original(config, stream=stream)
+        try:
+            log_pipeline.init_app(app)
+        finally:
+            log_pipeline.build_pipeline = original
+
+    @app.route('/sessions/<int:session_id>/book', methods=['POST'])
+    def book(session_id):
+        logger.info('booking session %s', session_id, extra={'email': 'patient@example.com'})
+        logger.info('therapist %s has capacity', session_id % 40)
+        logger.info('payment intent created for session %s', session_id)
+        logger.info('notified patient %s via 08031234567', session_id)
+        return jsonify({'id': session_id, 'status': 'scheduled'})
+
+    return app
+
+
+def drive(app, per_thread, threads, rate=None):
+    """Latencies of `threads` x `per_thread` requests, paced to `rate` req/s in total"""
+    latencies = []
+    lock = threading.Lock()
+    interval = threads / rate if rate else 0
+
+    def worker(offset):
+        client = app.test_client()
+        mine = []
+        due = time.perf_counter()
+        for i in range(per_thread):
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            due += interval
+            start = time.perf_counter()
+            client.post(f'/sessions/{offset + i}/book')
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sorted(latencies), time.perf_counter() - start
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    kib_per_sec = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+    per_thread = rate * SECONDS // threads
+
+    print(f'🪵 Logging pipeline: {rate} req/s for {SECONDS}s from {threads} threads, '
+          f'{LINES_PER_REQUEST} log lines each, reader draining {kib_per_sec} KiB/s')
+    print('=' * 70)
+    print(f'{"mode":<8} {"p50":>9} {"p99":>9} {"max":>9} {"req/s":>9}  log output')
+    for mode in ('off', 'sync', 'queue'):
+        reader = start_reader(kib_per_sec)
+        stream = open(reader.stdin.fileno(), 'w', closefd=False)
+        app = build_app(mode, stream)
+        drive(app, 50, 1)  # warm up
+        latencies, wall = drive(app, per_thread, threads, rate)
+
+        note = ''
+        pipeline = app.extensions.get('log_pipeline')
+        if pipeline is not None:
+            backlog = pipeline.queue.qsize()
+            # Let the writer catch up, then log once more so it reports drops still pending
+            while pipeline.queue.qsize() > 100:
+                time.sleep(0.05)
+            app.logger.warning('benchmark done')
+            pipeline.stop()
+            note = f'; {backlog:,} still queued when the load stopped'
+        stream.close()
+        reader.stdin.close()
+        written, lines, dropped, suppressed = (int(n) for n in reader.stdout.read().split())
+        reader.wait()
+        if mode != 'off':
+            note = f'{lines:,} lines ({written / 1024:,.0f} KiB) written, {dropped:,} dropped, ' \
+                   f'{suppressed:,} rate limited' + note
+
+        print(f'{mode:<8} {percentile(latencies, 0.5) * 1e6:7.0f}µs {percentile(latencies, 0.99) * 1e6:7.0f}µs '
+              f'{latencies[-1] * 1e3:7.1f}ms {len(latencies) / wall:9.0f}  {note}')
+
+
+if __name__ == '__main__':
+    main()
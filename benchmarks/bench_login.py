@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput with bcrypt at several concurrency levels
+
+Each level sends a burst of logins from N client threads to a threaded
+Flask app (as with Gunicorn's gthread worker) while a probe thread keeps
+hitting a cheap endpoint, so both login throughput and the latency that
+other requests see during the burst are reported. Stored hashes use a
+lower cost than configured, so the first login of each user also pays for
+the rehash-on-login upgrade.
+
+Usage: python benchmarks/bench_login.py [logins_per_level] [rounds]
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from flask import Flask, jsonify, request
+
+from app.passwords import PasswordHasher, check_user_password, init_app
+
+PASSWORD = 'correct horse battery staple'
+
+
+class User:
+    def __init__(self, password_hash):
+        self.password_hash = password_hash
+
+
+def make_app(rounds, users):
+    app = Flask(__name__)
+    app.config.update(BCRYPT_ROUNDS=rounds)
+    init_app(app)
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        user = users[int(request.form['user'])]
+        ok = check_user_password(user, request.form['password'])
+        return jsonify({'ok': ok}), 200 if ok else 401
+
+    @app.route('/health')
+    def health():
+        return jsonify({'status': 'ok'})
+
+    return app
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run_level(app, users, concurrency, count):
+    login_ms, probe_ms = [], []
+    done = threading.Event()
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/health')
+            probe_ms.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.002)
+
+    def login(i):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/login', data={'user': i % len(users), 'password': PASSWORD})
+        login_ms.append((time.perf_counter() - start) * 1000)
+        return response.status_code
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        statuses = list(pool.map(login, range(count)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+    failures = sum(1 for s in statuses if s != 200)
+    return count / elapsed, percentile(login_ms, 0.5), percentile(login_ms, 0.99), percentile(probe_ms, 0.99), failures
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+    print(f'🔐 Login burst: {count} logins per level, bcrypt cost {rounds}')
+    print('=' * 78)
+    for concurrency in (1, 2, 4, 8, 16):
+        # Fresh users per level, hashed at a lower cost so each level includes upgrades
+        old_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(max(4, rounds - 2))).decode()
+        users = [User(old_hash) for _ in range(max(1, count // 4))]
+        app = make_app(rounds, users)
+        rate, p50, p99, probe_p99, failures = run_level(app, users, concurrency, count)
+        upgraded = sum(1 for u in users if not PasswordHasher(rounds).needs_rehash(u.password_hash))
+        print(f'concurrency {concurrency:>2}  {rate:7.1f} logins/s  p50 {p50:7.1f}ms  p99 {p99:7.1f}ms  '
+              f'other requests p99 {probe_p99:6.1f}ms  upgraded {upgraded}/{len(users)}  failed {failures}')
+
+
+if __name__ == '__main__':
+    main()
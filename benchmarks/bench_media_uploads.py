@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark peak worker memory for concurrent voice-note uploads
+
+Starts a threaded Flask server in a fresh process for each mode and sends
+N concurrent multipart uploads of a WAV voice note (8MB by default):
+
+    buffered    request.files['file'].read() into memory, then written out,
+                with the normalization step (simulated) still in the request
+    streaming   app.media: chunks streamed to a content-addressed file,
+                normalization queued for the background pool
+
+The server resets its RSS high-water mark after a warm-up upload and
+reports the peak (VmHWM) minus its RSS at that point; the per-upload figure
+is that delta divided by N. Linux only.
+
+Usage: python benchmarks/bench_media_uploads.py [concurrency] [size_mb]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROCESSING_DELAY = 0.3  # stand-in for in-request Pillow/ffmpeg work
+
+
+def memory_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def serve(mode, port, folder):
+    from flask import Flask, jsonify, request
+    from werkzeug.serving import make_server
+
+    from app.media import MediaStore, UploadError, request_chunks
+
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+    store = MediaStore(folder, {'wav', 'mp3', 'm4a', 'png', 'jpg'}, {None: 64 * 1024 * 1024})
+    state = {}
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        if mode == 'buffered':
+            f = request.files['file']
+            data = f.read()
+            with open(os.path.join(folder, f'{time.monotonic_ns()}.wav'), 'wb') as out:
+                out.write(data)
+            time.sleep(PROCESSING_DELAY)
+            return jsonify({'size': len(data)})
+        try:
+            stored = store.save_stream(request_chunks(request))
+        except UploadError as e:
+            return jsonify({'error': e.message}), e.status
+        return jsonify({'size': stored.size})
+
+    @app.route('/baseline', methods=['POST'])
+    def baseline():
+        # Reset VmHWM so the peak covers only the measured uploads
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        state['baseline'] = memory_kb('VmRSS')
+        return jsonify(state)
+
+    @app.route('/rss')
+    def rss():
+        return jsonify({'baseline': state['baseline'], 'peak': memory_kb('VmHWM')})
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    server.RequestHandlerClass.log_request = lambda *args, **kwargs: None
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+def wav_bytes(size):
+    header = b'RIFF' + (size - 8).to_bytes(4, 'little') + b'WAVEfmt '
+    return header + os.urandom(size - len(header))
+
+
+def run_mode(mode, concurrency, payload, port):
+    import requests
+
+    with tempfile.TemporaryDirectory() as folder:
+        server = subprocess.Popen(
+            [sys.executable, __file__, '--serve', mode, str(port), folder],
+            stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            server.stdout.readline()
+            base = f'http://127.0.0.1:{port}'
+            # Warm up imports and the multipart parser before taking the baseline
+            requests.post(f'{base}/upload', files={'file': ('warm.wav', wav_bytes(64 * 1024))}).raise_for_status()
+            requests.post(f'{base}/baseline').raise_for_status()
+
+            bodies = [wav_bytes(len(payload)) for _ in range(concurrency)]
+            errors = []
+
+            def send(body):
+                try:
+                    requests.post(f'{base}/upload', files={'file': ('note.wav', body)}).raise_for_status()
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=send, args=(body,)) for body in bodies]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            if errors:
+                raise errors[0]
+            stats = requests.get(f'{base}/rss').json()
+        finally:
+            server.terminate()
+            server.wait()
+    delta_mb = (stats['peak'] - stats['baseline']) / 1024
+    return delta_mb, elapsed
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    size_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    payload = wav_bytes(int(size_mb * 1024 * 1024))
+
+    print(f'🎙️  {concurrency} concurrent uploads of a {size_mb:g}MB voice note')
+    print('=' * 70)
+    for port, mode in ((18731, 'buffered'), (18732, 'streaming')):
+        delta_mb, elapsed = run_mode(mode, concurrency, payload, port)
+        print(f'{mode:<10} peak RSS +{delta_mb:7.1f} MiB  ({delta_mb / concurrency:6.2f} MiB per upload)  '
+              f'{elapsed:5.2f}s')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark progress-chart queries: raw sentiment scans vs. mood rollups
+
+Builds a temporary SQLite database with one heavy user (100k messages over a
+year by default) plus background users, then times the chart read three
+ways: loading the user's rows and aggregating in Python, GROUP BY over the
+raw rows, and reading the precomputed daily/weekly rollups. Also reports
+the backfill time and the incremental cost per pipeline batch.
+
+Usage: python benchmarks/bench_mood_rollups.py [messages] [other_users]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import (
+    Column, DateTime, Float, Index, Integer, MetaData, String, Table, create_engine, func, insert, select,
+)
+
+from app.mood_rollups import aggregate, backfill, mood_chart, record_rows
+
+HEAVY_USER = 1
+
+
+def make_table(engine):
+    metadata = MetaData()
+    table = Table(
+        'sentiment_analysis', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer),
+        Column('session_id', Integer),
+        Column('sentiment_label', String(20)),
+        Column('sentiment_score', Float),
+        Column('created_at', DateTime),
+        Index('ix_sentiment_analysis_user_id', 'user_id'),
+    )
+    metadata.create_all(engine)
+    return table
+
+
+def synthetic_rows(user_id, count, rng, now):
+    labels = ('positive', 'neutral', 'negative')
+    for _ in range(count):
+        yield {
+            'user_id': user_id,
+            'sentiment_label': rng.choice(labels),
+            'sentiment_score': round(rng.uniform(0.5, 0.99), 3),
+            'created_at': now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+        }
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    other_users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(7)
+    now = datetime.utcnow()
+
+    print(f'📈 Mood charts: user with {messages} messages, {other_users} other users x 100 messages')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{tmp}/bench.db')
+        table = make_table(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(table), list(synthetic_rows(HEAVY_USER, messages, rng, now)))
+            for user_id in range(2, other_users + 2):
+                conn.execute(insert(table), list(synthetic_rows(user_id, 100, rng, now)))
+
+        def python_scan():
+            with engine.connect() as conn:
+                rows = conn.execute(select(table).where(table.c.user_id == HEAVY_USER)).mappings().all()
+            return aggregate(rows)[0]
+
+        def sql_group_by():
+            with engine.connect() as conn:
+                return conn.execute(
+                    select(func.date(table.c.created_at), func.count(), func.avg(table.c.sentiment_score))
+                    .where(table.c.user_id == HEAVY_USER)
+                    .group_by(func.date(table.c.created_at))
+                ).all()
+
+        start = time.perf_counter()
+        daily_rows, weekly_rows = backfill(engine, table)
+        backfill_s = time.perf_counter() - start
+
+        def rollup(period):
+            with engine.connect() as conn:
+                return mood_chart(conn, HEAVY_USER, period)
+
+        scan_ms, scanned = timed(python_scan, repeat=2)
+        group_ms, _ = timed(sql_group_by)
+        daily_ms, daily = timed(lambda: rollup('daily'))
+        weekly_ms, weekly = timed(lambda: rollup('weekly'))
+
+        assert sum(point['messages'] for point in daily) == messages
+        assert len(daily) == len(scanned)
+
+        print(f'{"load rows + aggregate":<24} {scan_ms:9.2f}ms  ({messages} rows read)')
+        print(f'{"SQL GROUP BY raw rows":<24} {group_ms:9.2f}ms')
+        print(f'{"daily rollup":<24} {daily_ms:9.2f}ms  ({len(daily)} points)')
+        print(f'{"weekly rollup":<24} {weekly_ms:9.2f}ms  ({len(weekly)} points)')
+        print(f'Backfill: {daily_rows} daily + {weekly_rows} weekly rows in {backfill_s:.2f}s')
+
+        batch = list(synthetic_rows(HEAVY_USER, 32, rng, now))
+        costs = []
+        for _ in range(50):
+            start = time.perf_counter()
+            with engine.begin() as conn:
+                record_rows(conn, batch)
+            costs.append((time.perf_counter() - start) * 1000)
+        costs.sort()
+        print(f'Incremental update per 32-message batch: p50 {costs[len(costs) // 2]:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
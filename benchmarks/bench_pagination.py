@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark keyset pagination (app.pagination) against LIMIT/OFFSET
+
+A file-backed SQLite database gets a synthetic sentiment_analysis table of
+ROWS rows spread over OWNERS users, with the listing's covering index on
+(user_id, created_at, id, ...). One user's history is read newest first,
+PAGE_SIZE rows per page, at increasing page depths:
+
+    - OFFSET:  ORDER BY created_at DESC, id DESC LIMIT n OFFSET depth * n
+    - keyset:  app.pagination.keyset_page from the previous page's cursor
+
+and once more for the keyset page with columns outside the index
+(?fields=...), which needs a table lookup per row returned.
+
+Usage: python benchmarks/bench_pagination.py [rows] [owners]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import (Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, insert, select,
+                        text)
+
+from app.pagination import LISTINGS, create_indexes, keyset_page
+
+PAGE_SIZE = 20
+CHUNK = 50000
+REPEAT = 20
+LABELS = ['positive', 'neutral', 'negative']
+
+
+def build(folder, rows, owners):
+    engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+    metadata = MetaData()
+    table = Table(
+        'sentiment_analysis', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer),
+        Column('session_id', Integer),
+        Column('sentiment_label', String(20)),
+        Column('sentiment_score', Float),
+        Column('note', String(200)),  # not in the index
+        Column('created_at', DateTime),
+    )
+    metadata.create_all(engine)
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for first in range(1, rows + 1, CHUNK):
+            conn.execute(insert(table), [{
+                'id': i,
+                'user_id': rng.randrange(owners),
+                'session_id': rng.randrange(1, 50000),
+                'sentiment_label': rng.choice(LABELS),
+                'sentiment_score': rng.random(),
+                'note': 'x' * 80,
+                # Messages arrive in pairs, so pages have to break ties on created_at by id
+                'created_at': start + timedelta(seconds=30 * (i // 2)),
+            } for i in range(first, min(first + CHUNK, rows + 1))])
+        create_indexes(conn, metadata.tables)
+        conn.execute(text('ANALYZE'))
+    return engine, table
+
+
+def offset_page(conn, table, owner_id, columns, offset, limit):
+    return conn.execute(
+        select(*[table.c[name] for name in columns])
+        .where(table.c.user_id == owner_id, table.c.created_at.is_not(None))
+        .order_by(table.c.created_at.desc(), table.c.id.desc())
+        .offset(offset)
+        .limit(limit)
+    ).all()
+
+
+def timed(fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = fn()
+    return (time.perf_counter() - start) / REPEAT, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    owners = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    print(f'📜 Pagination: {rows} sentiment rows over {owners} users (SQLite), {PAGE_SIZE} per page')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        engine, table = build(folder, rows, owners)
+        print(f'Built in {time.perf_counter() - start:.1f}s')
+
+        listing = LISTINGS['messages']
+        covered = listing.columns()
+        uncovered = ['id', 'created_at', 'sentiment_label', 'note']
+        with engine.connect() as conn:
+            owner_rows = conn.execute(select(table.c.id).where(table.c.user_id == 0)).all()
+            pages = len(owner_rows) // PAGE_SIZE
+            print(f'User 0 has {len(owner_rows)} rows ({pages} pages)\n')
+            print(f'{"page":>8} {"OFFSET":>10} {"keyset":>10} {"speedup":>8} {"keyset, uncovered":>18}')
+
+            depths = sorted({d for d in (1, 10, 100, 1000, pages // 2, pages - 1) if 0 < d < pages})
+            for depth in depths:
+                # Cursor of the previous page, as a client would hold it
+                last = conn.execute(
+                    select(table.c.created_at, table.c.id).where(table.c.user_id == 0)
+                    .order_by(table.c.created_at.desc(), table.c.id.desc())
+                    .offset(depth * PAGE_SIZE - 1).limit(1)
+                ).one()
+                after = (last.created_at, last.id)
+
+                by_offset, expected = timed(lambda: offset_page(conn, table, 0, covered, depth * PAGE_SIZE,
+                                                                PAGE_SIZE))
+                by_keyset, (found, _) = timed(lambda: keyset_page(conn, table, 'user_id', 0, covered, after,
+                                                                  PAGE_SIZE))
+                assert [tuple(row) for row in found] == [tuple(row) for row in expected], depth
+                wide, _ = timed(lambda: keyset_page(conn, table, 'user_id', 0, uncovered, after, PAGE_SIZE))
+                print(f'{depth + 1:>8} {by_offset * 1e3:8.2f}ms {by_keyset * 1e3:8.3f}ms '
+                      f'{by_offset / by_keyset:7.1f}x {wide * 1e3:16.3f}ms')
+
+            plan = conn.execute(text('EXPLAIN QUERY PLAN ' + str(
+                select(*[table.c[name] for name in covered]).where(table.c.user_id == 0)
+                .where(table.c.created_at <= '2024-06-01').order_by(table.c.created_at.desc(), table.c.id.desc())
+                .limit(PAGE_SIZE + 1).compile(compile_kwargs={'literal_binds': True})))).all()
+            print('\nKeyset plan: ' + '; '.join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    main()
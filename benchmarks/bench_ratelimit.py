@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request overhead of the rate limit storage backends
+
+Usage: python benchmarks/bench_ratelimit.py [requests]
+Set REDIS_URL to include a real Redis server in the comparison.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ratelimit import TokenBucketLimiter, backend_from_url, parse_limits
+
+
+def run(name, url, requests):
+    """Time `requests` limit checks spread over 100 client keys"""
+    limiter = TokenBucketLimiter(backend_from_url(url), parse_limits('200 per day;50 per hour'))
+    keys = [f'10.0.0.{i}' for i in range(100)]
+    limiter.hit(keys[0])
+
+    start = time.perf_counter()
+    for i in range(requests):
+        limiter.hit(keys[i % len(keys)])
+    elapsed = time.perf_counter() - start
+    print(f'{name:<12} {elapsed / requests * 1e6:8.1f} us/request  {requests / elapsed:10.0f} req/s')
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print('⏱️  Rate limit backend overhead')
+    print('=' * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run('memory', 'memory://', requests)
+        try:
+            run('fakeredis', 'fakeredis://', requests)
+        except RuntimeError as e:
+            print(f'fakeredis    skipped ({e})')
+        run('sqlite', f'sqlite:///{tmp}/ratelimit.db', requests)
+        if os.environ.get('REDIS_URL'):
+            run('redis', os.environ['REDIS_URL'], requests)
+        else:
+            print('redis        skipped (set REDIS_URL to include it)')
+
+
+if __name__ == '__main__':
+    main()
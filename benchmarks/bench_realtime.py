@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Load test the realtime hub: thousands of idle session connections
+
+Starts the hub (app.realtime.Hub with the in-process broker) in a separate
+process, opens N connections from one asyncio client (half Server-Sent
+Events, half WebSocket, two participants per therapy session), then:
+
+    - reports hub memory per idle connection (VmRSS before/after)
+    - publishes messages to random sessions through /internal/publish,
+      as Gunicorn workers do, and reports delivery latency
+    - publishes one message to every session and times the full fan-out
+
+For comparison it prints the request rate the same clients would generate
+by polling every 3 seconds. Linux only (reads /proc).
+
+Usage: python benchmarks/bench_realtime.py [connections] [messages]
+"""
+
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.realtime import Hub, MemoryBroker, make_token, sign
+
+SECRET = 'bench-secret'
+PORT = 18765
+POLL_INTERVAL = 3
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+async def http_request(method, path, body=b'', headers=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    lines = [f'{method} {path} HTTP/1.1', 'Host: localhost', f'Content-Length: {len(body)}']
+    lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b'\r\n\r\n', 1)[1] or b'{}')
+
+
+async def publish(session_id, message):
+    body = json.dumps({'channel': f'session:{session_id}', 'message': message}).encode()
+    return await http_request('POST', '/realtime/internal/publish', body, {'X-Realtime-Signature': sign(SECRET, body)})
+
+
+class Client:
+    def __init__(self, session_id, user_id, transport, received):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.transport = transport
+        self.received = received
+
+    async def connect(self):
+        token = make_token(SECRET, self.user_id, self.session_id, 'patient')
+        path = f'/realtime/sessions/{self.session_id}/{self.transport}?token={token}'
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', PORT)
+        headers = ['Host: localhost']
+        if self.transport == 'ws':
+            key = base64.b64encode(os.urandom(16)).decode()
+            headers += ['Upgrade: websocket', 'Connection: Upgrade', f'Sec-WebSocket-Key: {key}',
+                        'Sec-WebSocket-Version: 13']
+        self.writer.write((f'GET {path} HTTP/1.1\r\n' + '\r\n'.join(headers) + '\r\n\r\n').encode())
+        await self.writer.drain()
+        status = await self.reader.readuntil(b'\r\n\r\n')
+        assert status.split(b' ')[1] in (b'101', b'200'), status
+        self.task = asyncio.ensure_future(self.listen())
+
+    async def listen(self):
+        try:
+            if self.transport == 'ws':
+                while True:
+                    first, second = await self.reader.readexactly(2)
+                    length = second & 0x7F
+                    if length == 126:
+                        length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+                    elif length == 127:
+                        length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+                    payload = await self.reader.readexactly(length)
+                    if first & 0x0F == 0x1:
+                        self.on_message(json.loads(payload))
+            else:
+                while True:
+                    block = await self.reader.readuntil(b'\n\n')
+                    for line in block.decode().splitlines():
+                        if line.startswith('data: '):
+                            self.on_message(json.loads(line[6:]))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+
+    def on_message(self, message):
+        if message.get('type') == 'message':
+            self.received.append((message['id'], time.time() - message['sent']))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+async def run(connections, messages, hub_pid):
+    received = []
+    sessions = connections // 2
+    clients = [
+        Client(session_id, session_id * 2 + member, 'ws' if member else 'events', received)
+        for session_id in range(1, sessions + 1)
+        for member in (0, 1)
+    ]
+    await asyncio.sleep(0.5)
+    before = rss_kb(hub_pid)
+
+    start = time.perf_counter()
+    for i in range(0, len(clients), 200):
+        await asyncio.gather(*(client.connect() for client in clients[i:i + 200]))
+    connect_s = time.perf_counter() - start
+    await asyncio.sleep(1)
+    health = await http_request('GET', '/realtime/health')
+    after = rss_kb(hub_pid)
+
+    print(f'Connected {health["connections"]} clients ({sessions} sessions) in {connect_s:.2f}s')
+    print(f'Hub RSS {before / 1024:.1f} -> {after / 1024:.1f} MiB '
+          f'({(after - before) / max(1, health["connections"]):.1f} KiB per idle connection)')
+
+    rng = random.Random(7)
+    for n in range(messages):
+        await publish(rng.randint(1, sessions), {'type': 'message', 'id': n, 'sent': time.time(), 'text': 'hi'})
+    await asyncio.sleep(0.5)
+    latencies = [latency for _, latency in received]
+    print(f'{messages} targeted messages, {len(received)} deliveries: '
+          f'p50 {percentile(latencies, 0.5):.2f}ms  p99 {percentile(latencies, 0.99):.2f}ms')
+
+    received.clear()
+    start = time.perf_counter()
+    sent = time.time()
+    await asyncio.gather(*(
+        publish(session_id, {'type': 'message', 'id': -session_id, 'sent': sent, 'text': 'broadcast'})
+        for session_id in range(1, sessions + 1)
+    ))
+    while len(received) < len(clients) and time.perf_counter() - start < 30:
+        await asyncio.sleep(0.01)
+    fanout_s = time.perf_counter() - start
+    print(f'Fan-out to every session: {len(received)}/{len(clients)} delivered in {fanout_s:.2f}s '
+          f'(p99 {percentile([l for _, l in received], 0.99):.1f}ms)')
+    print(f'Polling every {POLL_INTERVAL}s would cost {len(clients) / POLL_INTERVAL:,.0f} requests/sec '
+          f'against RATELIMIT_DEFAULT; idle push connections cost none')
+
+    for client in clients:
+        client.task.cancel()
+        client.writer.close()
+
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    print(f'📡 Realtime hub: {connections} idle connections, {messages} messages')
+    print('=' * 70)
+    hub = subprocess.Popen([sys.executable, __file__, '--serve'], stdout=subprocess.PIPE, text=True)
+    try:
+        hub.stdout.readline()
+        asyncio.run(run(connections, messages, hub.pid))
+    finally:
+        hub.terminate()
+        hub.wait()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        hub = Hub(MemoryBroker(), SECRET)
+
+        async def serve():
+            ready = asyncio.Event()
+            task = asyncio.ensure_future(hub.serve('127.0.0.1', PORT, ready))
+            await ready.wait()
+            print('ready', flush=True)
+            await task
+
+        asyncio.run(serve())
+    else:
+        main()
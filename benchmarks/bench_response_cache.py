@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark app.response_cache on a catalog-style page
+
+A Flask app on a file-backed SQLite database renders a page from the
+session package catalog and the verified therapists (two queries and a
+template, like the landing page). It is requested through the WSGI test
+client:
+
+    - uncached
+    - cached, memory:// backend (hits)
+    - cached, sqlite:/// backend (hits, shared between workers)
+    - conditional requests answered with 304 from the cache
+
+then a mixed run where an admin edit is committed every EDIT_EVERY requests
+shows the hit rate with commit-driven invalidation.
+
+Usage: python benchmarks/bench_response_cache.py [requests] [therapists]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import Boolean, Column, Integer, Numeric, String, Text, create_engine, select
+from sqlalchemy.orm import Session, declarative_base
+
+EDIT_EVERY = 200
+
+Base = declarative_base()
+
+
+class SessionPackage(Base):
+    __tablename__ = 'session_packages'
+    id = Column(Integer, primary_key=True)
+    package_name = Column(String(100))
+    package_description = Column(Text)
+    package_price = Column(Numeric(10, 2))
+    is_active = Column(Boolean, default=True)
+
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    anonymous_id = Column(String(20))
+    is_therapist = Column(Boolean, default=False)
+    therapist_verified = Column(Boolean, default=False)
+    therapist_specialization = Column(String(100))
+    therapist_bio = Column(Text)
+
+
+PAGE = '''<h1>MentWel</h1>
+<ul>{% for p in packages %}<li>{{ p.package_name }}: {{ p.package_description }} (NGN {{ p.package_price }})</li>{% endfor %}</ul>
+<ul>{% for t in therapists %}<li>{{ t.anonymous_id }}, {{ t.therapist_specialization }}: {{ t.therapist_bio }}</li>{% endfor %}</ul>'''
+
+
+def build_app(engine, url):
+    from app import response_cache
+
+    app = Flask(__name__)
+    app.config.update(RESPONSE_CACHE_URL=url, RESPONSE_CACHE_ENABLED=url is not None)
+    response_cache.init_app(app)
+    page = app.jinja_env.from_string(PAGE)
+
+    @app.route('/')
+    @response_cache.cached(name='landing', tags=('packages', 'therapists'))
+    def landing():
+        with Session(engine) as session:
+            packages = session.scalars(select(SessionPackage).where(SessionPackage.is_active.is_(True))
+                                       .order_by(SessionPackage.package_price)).all()
+            therapists = session.scalars(select(User).where(User.is_therapist.is_(True),
+                                                            User.therapist_verified.is_(True))).all()
+            return page.render(packages=packages, therapists=therapists)
+
+    return app
+
+
+def drive(client, count, headers=None):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get('/', headers=headers)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    therapists = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print(f'🗄️  Response cache: landing page with 6 packages and {therapists} therapists (SQLite), '
+          f'{count} requests per run')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add_all(SessionPackage(package_name=f'Package {i}', package_description='Weekly sessions ' * 8,
+                                           package_price=5000 * i) for i in range(1, 7))
+            session.add_all(User(anonymous_id=f'T{i:04d}', is_therapist=True, therapist_verified=True,
+                                 therapist_specialization='Anxiety', therapist_bio='Licensed counsellor ' * 10)
+                            for i in range(therapists))
+            session.commit()
+
+        runs = [('uncached', None), ('memory://', 'memory://'),
+                ('sqlite:///', f"sqlite:///{os.path.join(folder, 'cache.db')}")]
+        baseline = None
+        for label, url in runs:
+            client = build_app(engine, url).test_client()
+            drive(client, 50)
+            seconds = drive(client, count)
+            baseline = baseline or seconds
+            print(f'{label:<12} {seconds * 1e6:8.0f}µs per request  {baseline / seconds:5.1f}x')
+
+        app = build_app(engine, 'memory://')
+        client = app.test_client()
+        etag = client.get('/').headers['ETag']
+        seconds = drive(client, count, headers={'If-None-Match': etag})
+        print(f'{"304":<12} {seconds * 1e6:8.0f}µs per request  {baseline / seconds:5.1f}x')
+
+        # Admin edits committed through the ORM invalidate the page
+        cache = app.extensions['response_cache']
+        cache.counts.clear()
+        start = time.perf_counter()
+        for i in range(count):
+            if i and i % EDIT_EVERY == 0:
+                with Session(engine) as session:
+                    package = session.get(SessionPackage, 1 + i // EDIT_EVERY % 6)
+                    package.package_price += 100
+                    session.commit()
+            client.get('/')
+        seconds = (time.perf_counter() - start) / count
+        stats = cache.stats()['landing']
+        print(f'Edit every {EDIT_EVERY} requests: {seconds * 1e6:.0f}µs per request, hit rate '
+              f"{stats['hit_rate']:.1%} ({stats.get('hit', 0)} hits, {stats.get('stale', 0)} rebuilt after commits)")
+
+
+if __name__ == '__main__':
+    main()
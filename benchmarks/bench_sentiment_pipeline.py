@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark inline vs. micro-batched sentiment analysis
+
+Uses the deterministic stub backend with a simulated per-call latency, so it
+runs offline. Rows are bulk-inserted into a temporary SQLite table.
+
+Usage: python benchmarks/bench_sentiment_pipeline.py [messages] [call_latency_ms]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, insert
+
+from app.sentiment_pipeline import SentimentPipeline, StubBackend
+
+MESSAGES = [
+    'I feel anxious about work today',
+    'thank you, that really helped',
+    'I have been sad and tired all week',
+    'feeling calm and hopeful after our session',
+    'not sure how I feel',
+]
+
+
+def make_table(engine):
+    metadata = MetaData()
+    table = Table(
+        'sentiment_analysis', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer),
+        Column('sentiment_label', String(20)),
+        Column('sentiment_score', Float),
+        Column('created_at', DateTime),
+    )
+    metadata.create_all(engine)
+    return table
+
+
+def make_sink(engine, table):
+    def write(rows):
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows)
+    return write
+
+
+def run_inline(count, backend, sink):
+    """One inference call and one insert inside each request"""
+    start = time.perf_counter()
+    for i in range(count):
+        text = MESSAGES[i % len(MESSAGES)]
+        label, score = backend.analyze([text])[0]
+        sink([{'user_id': i % 50, 'sentiment_label': label, 'sentiment_score': score}])
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed / count
+
+
+def run_pipeline(count, backend, sink, batch_size):
+    """Requests only enqueue; the worker thread batches inference and inserts"""
+    pipeline = SentimentPipeline(backend, sink, batch_size=batch_size, max_delay=0.01)
+    start = time.perf_counter()
+    request_time = 0.0
+    for i in range(count):
+        t = time.perf_counter()
+        pipeline.submit(MESSAGES[i % len(MESSAGES)], user_id=i % 50)
+        request_time += time.perf_counter() - t
+    pipeline.flush(timeout=600)
+    elapsed = time.perf_counter() - start
+    return elapsed, request_time / count, pipeline.stats()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    call_latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 30) / 1000
+
+    print(f'🧠 Sentiment analysis: {count} messages, {call_latency * 1000:.0f}ms per inference call')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{tmp}/bench.db')
+        table = make_table(engine)
+        sink = make_sink(engine, table)
+
+        elapsed, per_request = run_inline(count, StubBackend(call_latency, 0.0005), sink)
+        print(f'{"inline":<14} {count / elapsed:8.0f} msg/s  request path {per_request * 1000:8.3f}ms')
+
+        for batch_size in (8, 32, 128):
+            backend = StubBackend(call_latency, 0.0005)
+            elapsed, per_request, stats = run_pipeline(count, backend, sink, batch_size)
+            print(f'{"batch " + str(batch_size):<14} {count / elapsed:8.0f} msg/s  request path '
+                  f'{per_request * 1000:8.3f}ms  calls {backend.calls}  failed {stats["failed"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQLite commits per second with N concurrent writer processes
+
+Compares SQLite defaults (rollback journal, synchronous=FULL) against SQLite
+production mode (WAL + pragmas + serialized writers) and the batched
+WriteQueue. Each writer process stands in for a Gunicorn worker.
+
+Usage: python benchmarks/bench_sqlite_writes.py [writers] [commits_per_writer]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Float, Integer, String, create_engine, insert
+from sqlalchemy.orm import Session, declarative_base
+
+from app import sqlite_mode
+from config import Config
+
+Base = declarative_base()
+
+
+class Message(Base):
+    __tablename__ = 'bench_messages'
+    id = Column(Integer, primary_key=True)
+    writer = Column(Integer)
+    body = Column(String(200))
+    created_at = Column(Float)
+
+
+def orm_writer(url, writer, commits, results, options):
+    """One db.session.commit() per row, like a request handler"""
+    engine = create_engine(url, **options)
+    latencies, errors = [], 0
+    for i in range(commits):
+        start = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.add(Message(writer=writer, body=f'message {i}', created_at=time.time()))
+                session.commit()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.put((latencies, errors))
+
+
+def queued_writer(url, writer, commits, results, options, threads=4):
+    """Request threads hand rows to the per-process WriteQueue and wait for them"""
+    engine = create_engine(url, **options)
+    write_queue = sqlite_mode.WriteQueue(engine)
+    table = Message.__table__
+    latencies, errors = [], [0]
+
+    def run(count):
+        for i in range(count):
+            start = time.perf_counter()
+            try:
+                write_queue.submit(
+                    lambda conn, n: conn.execute(insert(table).values(
+                        writer=writer, body=f'message {n}', created_at=time.time())),
+                    i,
+                ).result()
+            except Exception:
+                errors[0] += 1
+            latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=run, args=(commits // threads,)) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    results.put((latencies, errors[0]))
+
+
+def run_mode(name, target, url, writers, commits, options=None):
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=target, args=(url, w, commits, results, options or {}))
+             for w in range(writers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for lats, _ in collected for l in lats)
+    errors = sum(e for _, e in collected)
+    done = len(latencies) - errors
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f'{name:<22} {done / elapsed:9.0f} commits/s  p99 {p99:8.1f}ms  errors {errors}')
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    multiprocessing.set_start_method('fork')
+
+    print(f'💾 SQLite writes: {writers} writers x {commits} commits')
+    print('=' * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        run_mode('defaults', orm_writer, f'sqlite:///{tmp}/before.db', writers, commits)
+
+        options = sqlite_mode.engine_options(Config.SQLITE_PRAGMAS, serialize_writes=True)
+        run_mode('production mode', orm_writer, f'sqlite:///{tmp}/after.db', writers, commits, options)
+        run_mode('production + queue', queued_writer, f'sqlite:///{tmp}/queued.db', writers, commits, options)
+
+
+if __name__ == '__main__':
+    main()
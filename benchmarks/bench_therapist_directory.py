@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark therapist matching: full scans vs. composite index vs. cached directory
+
+Builds a temporary SQLite database with many users (200k by default, 1% of
+them verified therapists) and two weeks of bookings, then times the booking
+page lookups three ways: the filtered, sorted query without the directory
+indexes, the same query with them, and the in-memory directory. Also times
+free-slot lookups and a cache rebuild.
+
+Usage: python benchmarks/bench_therapist_directory.py [users] [therapist_percent]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, Integer, MetaData, String, Table, Text, create_engine, insert, select,
+)
+
+from app.therapist_directory import TherapistDirectory, create_indexes
+
+SPECIALIZATIONS = ('Anxiety', 'Depression', 'Trauma', 'Relationships', 'Addiction', 'General Counseling')
+
+
+def make_tables(engine):
+    metadata = MetaData()
+    users = Table(
+        'users', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('anonymous_id', String(20), unique=True),
+        Column('is_therapist', Boolean),
+        Column('therapist_verified', Boolean),
+        Column('therapist_specialization', String(100)),
+        Column('therapist_bio', Text),
+        Column('therapist_rating', Float),
+        Column('therapist_sessions_count', Integer),
+    )
+    sessions = Table(
+        'therapy_sessions', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('patient_id', Integer),
+        Column('therapist_id', Integer),
+        Column('status', String(20)),
+        Column('scheduled_at', DateTime),
+        Column('duration_minutes', Integer),
+    )
+    metadata.create_all(engine)
+    return users, sessions
+
+
+def populate(engine, users, sessions, count, percent, rng):
+    rows, therapist_ids = [], []
+    for i in range(1, count + 1):
+        therapist = rng.random() < percent / 100
+        rows.append({
+            'id': i,
+            'anonymous_id': f'U{i:09d}',
+            'is_therapist': therapist,
+            'therapist_verified': therapist and rng.random() < 0.8,
+            'therapist_specialization': rng.choice(SPECIALIZATIONS) if therapist else None,
+            'therapist_bio': 'Licensed counselor' if therapist else None,
+            'therapist_rating': round(rng.uniform(3.0, 5.0), 2) if therapist else 0.0,
+            'therapist_sessions_count': rng.randint(0, 500) if therapist else 0,
+        })
+        if therapist:
+            therapist_ids.append(i)
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    bookings = [
+        {
+            'patient_id': rng.randint(1, count),
+            'therapist_id': therapist_id,
+            'status': rng.choice(('scheduled', 'scheduled', 'scheduled', 'cancelled')),
+            'scheduled_at': today + timedelta(days=rng.randint(0, 13), hours=rng.randint(8, 15)),
+            'duration_minutes': 50,
+        }
+        for therapist_id in therapist_ids
+        for _ in range(20)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(users), rows)
+        conn.execute(insert(sessions), bookings)
+    return therapist_ids
+
+
+def timed(fn, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    percent = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    rng = random.Random(7)
+
+    print(f'🩺 Therapist directory: {count} users, ~{percent:g}% therapists')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{tmp}/bench.db')
+        users, sessions = make_tables(engine)
+        populate(engine, users, sessions, count, percent, rng)
+
+        query = (
+            select(users)
+            .where(
+                users.c.is_therapist.is_(True),
+                users.c.therapist_verified.is_(True),
+                users.c.therapist_specialization == 'Anxiety',
+                users.c.therapist_rating >= 4.0,
+            )
+            .order_by(users.c.therapist_rating.desc(), users.c.id)
+            .limit(20)
+        )
+
+        def sql_match():
+            with engine.connect() as conn:
+                return conn.execute(query).all()
+
+        scan_ms, scanned = timed(sql_match)
+        with engine.begin() as conn:
+            create_indexes(conn, {'users': users, 'therapy_sessions': sessions})
+            conn.exec_driver_sql('ANALYZE')
+        indexed_ms, indexed = timed(sql_match)
+
+        directory = TherapistDirectory(engine, users, sessions, ttl=3600)
+        start = time.perf_counter()
+        directory.snapshot()
+        load_ms = (time.perf_counter() - start) * 1000
+        cached_ms, (cached, total) = timed(lambda: directory.match('Anxiety', 4.0, limit=20), repeat=200)
+        assert [row.id for row in indexed] == [row.id for row in scanned]
+        assert {t['id'] for t in cached} == {row.id for row in indexed}
+
+        therapist_id = next(iter(directory.snapshot().therapists))
+
+        def sql_slots():
+            # What a booking page does without the directory: read the bookings, then diff
+            with engine.connect() as conn:
+                return conn.execute(
+                    select(sessions.c.scheduled_at)
+                    .where(sessions.c.therapist_id == therapist_id, sessions.c.status != 'cancelled')
+                ).all()
+
+        slots_sql_ms, _ = timed(sql_slots)
+        slots_ms, slots = timed(lambda: directory.free_slots(therapist_id, days=7), repeat=200)
+        next_ms, found = timed(lambda: directory.next_available('Anxiety', limit=5), repeat=50)
+
+        print(f'{"match: full scan":<28} {scan_ms:9.3f}ms')
+        print(f'{"match: composite index":<28} {indexed_ms:9.3f}ms')
+        print(f'{"match: cached directory":<28} {cached_ms:9.3f}ms  ({total} matches)')
+        print(f'{"bookings query (1 therapist)":<28} {slots_sql_ms:9.3f}ms')
+        print(f'{"free slots from bitmasks":<28} {slots_ms:9.3f}ms  ({len(slots)} open in 7 days)')
+        print(f'{"next available x5":<28} {next_ms:9.3f}ms  ({len(found)} found)')
+        print(f'Directory load: {len(directory.snapshot().therapists)} therapists in {load_ms:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark authenticated API requests: Flask-Login session vs Bearer token
+
+A Flask app on a file-backed SQLite database (USERS users) serves a
+@login_required endpoint that reads current_user.id, anonymous_id and
+is_therapist. The same request is made through the WSGI test client:
+
+    - session cookie: Flask-Login's user loader reads the users row per request
+    - Bearer token:   app.token_auth verifies the JWT in memory
+
+with REVOKED tokens already in the revocation table (so the Bloom filter is
+populated). Also reports the per-token cost of PyJWT's decode against the
+cached-key verifier, cold and warm, and the Bloom filter's measured false
+positive rate.
+
+Usage: python benchmarks/bench_token_auth.py [requests] [revoked]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from flask import Flask, jsonify
+from flask_login import LoginManager, UserMixin, current_user, login_required, login_user
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, create_engine, insert, select
+
+from app.token_auth import KeyRing, TokenAuth, revoked_tokens
+from app.token_auth import metadata as token_metadata
+
+USERS = 10000
+SECRET = 'bench-secret'
+
+
+class SessionUser(UserMixin):
+    def __init__(self, row):
+        self.id = row.id
+        self.anonymous_id = row.anonymous_id
+        self.is_therapist = row.is_therapist
+
+
+def build(folder, revoked):
+    engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+    metadata = MetaData()
+    users = Table('users', metadata, Column('id', Integer, primary_key=True), Column('anonymous_id', String(20)),
+                  Column('is_therapist', Boolean), Column('email', String(120)))
+    metadata.create_all(engine)
+    token_metadata.create_all(engine)
+    now = time.time()
+    with engine.begin() as conn:
+        conn.execute(insert(users), [{'id': i, 'anonymous_id': f'P{i:05d}', 'is_therapist': i % 20 == 0,
+                                      'email': f'user{i}@example.com'} for i in range(1, USERS + 1)])
+        if revoked:
+            conn.execute(insert(revoked_tokens), [{'key': uuid.uuid4().hex, 'revoked_at': now,
+                                                   'expires_at': now + 3600} for _ in range(revoked)])
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET
+    login_manager = LoginManager(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        with engine.connect() as conn:
+            row = conn.execute(select(users).where(users.c.id == int(user_id))).first()
+        return SessionUser(row) if row else None
+
+    auth = TokenAuth(engine, KeyRing(SECRET), capacity=max(100000, revoked * 2))
+    app.extensions['token_auth'] = auth
+    app.before_request(auth.before_request)
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        login_user(load_user(user_id))
+        return 'ok'
+
+    @app.route('/api/me')
+    @login_required
+    def me():
+        return jsonify({'id': current_user.id, 'anonymous_id': current_user.anonymous_id,
+                        'is_therapist': current_user.is_therapist})
+
+    return app, auth, engine, users
+
+
+def drive(client, count, headers=None):
+    start = time.perf_counter()
+    for _ in range(count):
+        response = client.get('/api/me', headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return count / (time.perf_counter() - start)
+
+
+def per_call(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    revoked = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+
+    print(f'🔑 Token auth: {count} authenticated requests, {USERS} users, {revoked} revoked tokens (SQLite)')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as folder:
+        app, auth, engine, users = build(folder, revoked)
+        with engine.connect() as conn:
+            user = SessionUser(conn.execute(select(users).where(users.c.id == 42)).first())
+        tokens = auth.issue(user)
+
+        session_client = app.test_client()
+        session_client.get('/login/42')
+        token_client = app.test_client()
+        bearer = {'Authorization': f"Bearer {tokens['access_token']}"}
+        drive(session_client, 200)
+        drive(token_client, 200, bearer)
+
+        session_rps = drive(session_client, count)
+        token_rps = drive(token_client, count, bearer)
+        print(f'{"session cookie":<16} {session_rps:8.0f} req/s  {1e6 / session_rps:6.0f}µs per request')
+        print(f'{"bearer token":<16} {token_rps:8.0f} req/s  {1e6 / token_rps:6.0f}µs per request  '
+              f'({token_rps / session_rps:.2f}x, {auth.lookups} revocation lookups)')
+
+        # Distinct tokens, so the cold numbers include signature and JSON work
+        fresh = [auth.issue(user)['access_token'] for _ in range(2000)]
+        pyjwt = per_call(lambda t: jwt.decode(t, SECRET, algorithms=['HS256']), fresh)
+        cold = per_call(auth.verify, fresh)
+        warm = per_call(auth.verify, fresh)
+        print(f'Per token: PyJWT decode {pyjwt * 1e6:.1f}µs, verify cold {cold * 1e6:.1f}µs, '
+              f'warm {warm * 1e6:.1f}µs')
+
+        probes = [uuid.uuid4().hex for _ in range(20000)]
+        positives = sum(1 for key in probes if key in auth.bloom)
+        check = per_call(lambda key: key in auth.bloom, probes)
+        print(f'Bloom filter: {auth.bloom.size / 8 / 1024:.0f} KiB, {auth.bloom.hashes} hashes, '
+              f'{check * 1e6:.2f}µs per check, false positives {positives / len(probes):.2%} '
+              f'(target {auth.error_rate:.0%})')
+
+
+if __name__ == '__main__':
+    main()
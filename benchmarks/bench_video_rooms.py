@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Simulate 10k concurrent video call rooms against app.video_calls
+
+Runs a virtual clock (one sweep per simulated second) over N rooms:
+both participants join within the first minute, exchange an offer, an
+answer and ICE candidates, then poll every POLL_EVERY seconds. Some
+participants vanish without leaving (dropped by the idle timeout), some
+rooms hang up early and the rest run into the call timeout.
+
+Reports:
+    - registry throughput (join/signal/poll/leave per second, wall clock)
+    - sweep cost per tick: timer wheel vs. scanning every deadline
+    - per-request cost: registry poll vs. re-reading the session row (SQLite)
+    - write-back of finished calls: one UPDATE per call vs. batched
+
+Usage: python benchmarks/bench_video_rooms.py [rooms] [call_timeout_s]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, insert, select
+
+from app.video_calls import RoomRegistry, write_durations
+
+POLL_EVERY = 10
+IDLE_TIMEOUT = 45
+DROP_RATE = 0.05
+HANGUP_RATE = 0.6
+CANDIDATES = 6
+SNAPSHOT_AT = 90  # every room open, nothing expired yet
+
+
+def build_schedule(rooms, call_timeout, rng):
+    """{second: [(op, session_id, user_id)]} for the whole simulation"""
+    events = defaultdict(list)
+    for session_id in range(1, rooms + 1):
+        patient, therapist = session_id * 2, session_id * 2 + 1
+        opened = rng.randrange(60)
+        hangup = opened + rng.randrange(120, call_timeout) if rng.random() < HANGUP_RATE else None
+        for user_id, joined in ((patient, opened), (therapist, opened + rng.randrange(30))):
+            events[joined].append(('join', session_id, user_id))
+            stop = hangup if hangup is not None else opened + call_timeout + POLL_EVERY
+            if rng.random() < DROP_RATE:
+                stop = rng.randrange(joined + 1, stop)
+            elif hangup is not None:
+                events[hangup].append(('leave', session_id, user_id))
+            for t in range(joined + rng.randrange(1, POLL_EVERY), stop, POLL_EVERY):
+                events[t].append(('poll', session_id, user_id))
+        connected = opened + 30
+        events[connected].append(('offer', session_id, patient))
+        events[connected + 1].append(('answer', session_id, therapist))
+        for i in range(CANDIDATES):
+            events[connected + 1 + i % 3].append(('candidate', session_id, patient if i % 2 else therapist))
+    return events
+
+
+def simulate(rooms, call_timeout, events):
+    registry = RoomRegistry(call_timeout=call_timeout, idle_timeout=IDLE_TIMEOUT, now=0)
+    members = {}
+    ops = 0
+    op_seconds = 0.0
+    sweep_times = []
+    peak_rooms = 0
+    peak_deadlines = {}
+    horizon = max(events) + IDLE_TIMEOUT + 2
+
+    for now in range(horizon):
+        start = time.perf_counter()
+        for op, session_id, user_id in events.get(now, ()):
+            try:
+                if op == 'join':
+                    registry.join(session_id, user_id,
+                                  lambda: members.setdefault(session_id, {session_id * 2: 'patient',
+                                                                          session_id * 2 + 1: 'therapist'}),
+                                  now=now)
+                elif op == 'poll':
+                    registry.poll(session_id, user_id, now=now)
+                elif op == 'leave':
+                    registry.leave(session_id, user_id, now=now)
+                else:
+                    registry.signal(session_id, user_id, op, {'sdp': 'v=0'}, now=now)
+            except Exception:
+                pass  # e.g. polling a room that already ended
+            ops += 1
+        op_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        registry.sweep(now)
+        sweep_times.append(time.perf_counter() - start)
+
+        peak_rooms = max(peak_rooms, len(registry))
+        if now == SNAPSHOT_AT:
+            # What a sweeper without the wheel would have to scan every tick
+            peak_deadlines = {
+                key: deadline for bucket in registry.timers._buckets for key, deadline in bucket.items()
+            }
+    return registry, ops, op_seconds, sweep_times, peak_rooms, peak_deadlines
+
+
+def scan_cost(deadlines, now, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        [key for key, deadline in deadlines.items() if deadline <= now]
+    return (time.perf_counter() - start) / repeat
+
+
+def database(path, rooms):
+    engine = create_engine(f'sqlite:///{path}')
+    metadata = MetaData()
+    sessions = Table(
+        'therapy_sessions', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('patient_id', Integer),
+        Column('therapist_id', Integer),
+        Column('status', String(20)),
+        Column('started_at', DateTime),
+        Column('ended_at', DateTime),
+        Column('duration_minutes', Integer),
+    )
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(sessions), [
+            {'id': i, 'patient_id': i * 2, 'therapist_id': i * 2 + 1, 'status': 'scheduled'}
+            for i in range(1, rooms + 1)
+        ])
+    return engine, sessions
+
+
+def main():
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    call_timeout = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    rng = random.Random(18)
+
+    print(f'📹 Video call rooms: {rooms} rooms, {call_timeout}s call timeout, one sweep per simulated second')
+    print('=' * 70)
+    events = build_schedule(rooms, call_timeout, rng)
+    registry, ops, op_seconds, sweep_times, peak_rooms, peak_deadlines = simulate(rooms, call_timeout, events)
+    ended = registry.drain_ended(limit=rooms * 2)
+    reasons = defaultdict(int)
+    for record in ended:
+        reasons[record.reason] += 1
+
+    print(f'Peak concurrent rooms: {peak_rooms}; rooms left open: {len(registry)}; timers left: {len(registry.timers)}')
+    print(f'Calls ended: {len(ended)} ({", ".join(f"{k} {v}" for k, v in sorted(reasons.items()))})')
+    print(f'Registry ops: {ops:,} in {op_seconds:.2f}s  ({ops / op_seconds:,.0f} ops/sec, '
+          f'{op_seconds / ops * 1e6:.1f}µs each)')
+
+    sweep_ms = [s * 1000 for s in sweep_times]
+    scan_ms = scan_cost(peak_deadlines, SNAPSHOT_AT) * 1000
+    print(f'Sweep per tick, timer wheel:  mean {sum(sweep_ms) / len(sweep_ms):.3f}ms  max {max(sweep_ms):.3f}ms')
+    print(f'Sweep per tick, full scan:    {scan_ms:.3f}ms over {len(peak_deadlines):,} deadlines')
+
+    with tempfile.TemporaryDirectory() as folder:
+        engine, sessions = database(os.path.join(folder, 'sessions.db'), rooms)
+
+        sample = min(rooms, 20000)
+        query = select(sessions.c.patient_id, sessions.c.therapist_id, sessions.c.status, sessions.c.started_at)
+        start = time.perf_counter()
+        for i in range(sample):
+            with engine.connect() as conn:
+                conn.execute(query.where(sessions.c.id == i % rooms + 1)).first()
+        per_query = (time.perf_counter() - start) / sample
+        print(f'Per-request check: session row query {per_query * 1e6:.1f}µs vs registry '
+              f'{op_seconds / ops * 1e6:.1f}µs')
+
+        half = len(ended) // 2
+        start = time.perf_counter()
+        for record in ended[:half]:
+            write_durations(engine, sessions, [record])
+        single = (time.perf_counter() - start) / max(1, half)
+        start = time.perf_counter()
+        rest = ended[half:]
+        for i in range(0, len(rest), 200):
+            write_durations(engine, sessions, rest[i:i + 200])
+        batched = (time.perf_counter() - start) / max(1, len(rest))
+        with engine.connect() as conn:
+            completed = conn.execute(select(sessions.c.id).where(sessions.c.status == 'completed')).all()
+        print(f'Write-back per call: one UPDATE each {single * 1e6:.1f}µs, batches of 200 '
+              f'{batched * 1e6:.1f}µs ({single / batched:.0f}x); {len(completed)} sessions completed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark a burst of Paystack webhooks: inline processing vs. the inbox
+
+Inline handlers verify the signature and update Payment and credits inside
+the request, one transaction per delivery. Inbox handlers verify, insert the
+raw event (duplicates dropped by the unique key) and ack; the drainer then
+applies everything in batches. A share of deliveries are duplicates, as in
+Paystack's retry behaviour.
+
+Usage: python benchmarks/bench_webhook_inbox.py [events] [threads] [duplicate_pct]
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, current_app, jsonify, request
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, Numeric, String, Table, create_engine, event, func, insert, select,
+    update,
+)
+
+from app.startup import LazyClient
+from app.webhook_inbox import WebhookInbox, paystack_webhook, session_credits, verify_signature
+
+SECRET = 'sk_test_benchmark'
+
+
+def make_tables(engine):
+    metadata = MetaData()
+    packages = Table(
+        'session_packages', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('session_count', Integer),
+        Column('package_duration_days', Integer),
+    )
+    payments = Table(
+        'payments', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer),
+        Column('package_id', Integer),
+        Column('amount', Numeric(10, 2)),
+        Column('paystack_reference', String(100), unique=True),
+        Column('status', String(20)),
+        Column('paid_at', DateTime),
+    )
+    metadata.create_all(engine)
+    return payments, packages
+
+
+def make_engine(path):
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 30})
+
+    @event.listens_for(engine, 'connect')
+    def pragmas(dbapi_connection, record):
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+        dbapi_connection.execute('PRAGMA synchronous=NORMAL')
+
+    return engine
+
+
+def seed(engine, payments, packages, count):
+    with engine.begin() as conn:
+        conn.execute(insert(packages), [{'id': 1, 'session_count': 3, 'package_duration_days': 90}])
+        conn.execute(insert(payments), [
+            {'user_id': i % 500, 'package_id': 1, 'amount': 13500, 'paystack_reference': f'ref-{i}',
+             'status': 'pending'}
+            for i in range(count)
+        ])
+
+
+def deliveries(count, duplicate_pct):
+    bodies = []
+    for i in range(count):
+        body = json.dumps({'event': 'charge.success',
+                           'data': {'reference': f'ref-{i}', 'amount': 1350000, 'status': 'success'}}).encode()
+        bodies.append(body)
+    bodies += random.sample(bodies, int(count * duplicate_pct / 100))
+    random.shuffle(bodies)
+    return [(body, hmac.new(SECRET.encode(), body, hashlib.sha512).hexdigest()) for body in bodies]
+
+
+def inline_webhook():
+    """Baseline: verify and apply inside the request"""
+    body = request.get_data()
+    if not verify_signature(SECRET, body, request.headers.get('x-paystack-signature')):
+        return jsonify({'error': 'Invalid signature'}), 401
+    data = json.loads(body)['data']
+    engine, payments, packages = current_app.extensions['bench']
+    with engine.begin() as conn:
+        payment = conn.execute(
+            select(payments, packages.c.session_count, packages.c.package_duration_days)
+            .join(packages, payments.c.package_id == packages.c.id)
+            .where(payments.c.paystack_reference == data['reference'])
+        ).first()
+        now = datetime.utcnow()
+        conn.execute(update(payments).where(payments.c.id == payment.id).values(status='success', paid_at=now))
+        # Duplicate deliveries are applied again; only the unique key stops a second credit row
+        conn.execute(insert(session_credits).prefix_with('OR IGNORE'), {
+            'user_id': payment.user_id, 'package_id': payment.package_id, 'payment_id': payment.id,
+            'sessions_total': payment.session_count, 'sessions_remaining': payment.session_count,
+            'expires_at': now + timedelta(days=payment.package_duration_days), 'created_at': now,
+        })
+    return jsonify({'status': 'ok'}), 200
+
+
+def burst(app, items, threads):
+    latencies = []
+
+    def send(item):
+        body, signature = item
+        start = time.perf_counter()
+        response = app.test_client().post(
+            '/webhook', data=body, content_type='application/json',
+            headers={'x-paystack-signature': signature},
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        statuses = list(pool.map(send, items))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1], statuses
+
+
+def run(mode, count, threads, duplicate_pct, tmp):
+    engine = make_engine(os.path.join(tmp, f'{mode}.db'))
+    payments, packages = make_tables(engine)
+    seed(engine, payments, packages, count)
+    inbox = WebhookInbox(engine, payments, packages, batch_size=500, max_delay=0.02)
+    inbox.create_tables()
+
+    app = Flask(__name__)
+    app.config.update(PAYSTACK_SECRET_KEY=SECRET, PAYSTACK_INBOX_WORKER=(mode == 'inbox'))
+    if mode == 'inbox':
+        app.extensions['webhook_inbox'] = LazyClient(lambda: inbox)
+        app.add_url_rule('/webhook', 'webhook', paystack_webhook, methods=['POST'])
+    else:
+        app.extensions['bench'] = (engine, payments, packages)
+        app.add_url_rule('/webhook', 'webhook', inline_webhook, methods=['POST'])
+
+    items = deliveries(count, duplicate_pct)
+    start = time.perf_counter()
+    elapsed, p50, p99, statuses = burst(app, items, threads)
+    if mode == 'inbox':
+        # Wait for the background drainer to apply everything
+        while inbox.counts().get('pending') or inbox._wake.is_set():
+            time.sleep(0.01)
+    applied = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        paid = conn.execute(select(func.count()).where(payments.c.status == 'success')).scalar()
+        credits = conn.execute(select(func.count()).select_from(session_credits)).scalar()
+    errors = sum(1 for s in statuses if s != 200)
+    print(f'{mode:<8} ack {len(items) / elapsed:7.0f} req/s  p50 {p50:7.2f}ms  p99 {p99:7.2f}ms  '
+          f'all applied {applied:6.2f}s  paid {paid}  credits {credits}  errors {errors}')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    duplicate_pct = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    random.seed(7)
+    print(f'💳 Paystack webhook burst: {count} events + {duplicate_pct:.0f}% duplicates, {threads} threads')
+    print('=' * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('inline', 'inbox'):
+            run(mode, count, threads, duplicate_pct, tmp)
+
+
+if __name__ == '__main__':
+    main()
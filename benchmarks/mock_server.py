@@ -0,0 +1,125 @@
+"""
+Local mock HTTP(S) server for outbound-client benchmarks
+
+Speaks HTTP/1.1 with keep-alive, optionally over TLS with a throwaway
+self-signed certificate, and counts the TCP connections it accepts so
+connection reuse can be measured without touching the network.
+
+    with MockServer(tls=True, latency=0.005) as server:
+        requests.get(server.url + '/ping', verify=server.cert_path)
+        server.connections  # number of TCP connections accepted
+"""
+
+import datetime
+import json
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _self_signed_cert(directory):
+    """Write a localhost certificate and key; returns (cert_path, key_path)"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+    import ipaddress
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName('localhost'), x509.IPAddress(ipaddress.ip_address('127.0.0.1'))
+        ]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+    return cert_path, key_path
+
+
+class MockServer:
+    """Threaded keep-alive server with optional latency and failure injection"""
+
+    def __init__(self, tls=False, latency=0.0, fail_rate=0.0):
+        self.tls = tls
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.connections = 0
+        self.requests = 0
+        self.cert_path = None
+        self._tmp = None
+        self._server = None
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                mock.connections += 1
+                super().setup()
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                mock.requests += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                status = 503 if mock.fail_rate and random.random() < mock.fail_rate else 200
+                body = json.dumps({'status': status == 200, 'path': self.path}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        if self.tls:
+            self._tmp = tempfile.TemporaryDirectory()
+            self.cert_path, key_path = _self_signed_cert(self._tmp.name)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_path, key_path)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"{'https' if self.tls else 'http'}://localhost:{port}"
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._tmp is not None:
+            self._tmp.cleanup()
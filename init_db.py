@@ -16,7 +16,7 @@ def init_database():
         
         # Import app and database
         from app import create_app, db
-        from app.models import User, TherapySession, Payment, SentimentAnalysis, SessionPackage
+        import app.models  # noqa: F401  (registers the tables)
         
         # Create app context
         app = create_app('development')
@@ -28,67 +28,13 @@ def init_database():
             db.create_all()
             print("✅ Database tables created")
             
-            # Create initial session packages
-            packages = [
-                SessionPackage(
-                    package_name='Single Session',
-                    package_description='One therapy session',
-                    session_count=1,
-                    package_duration_days=30,
-                    package_price=5000.00
-                ),
-                SessionPackage(
-                    package_name='Starter Pack',
-                    package_description='3 therapy sessions',
-                    session_count=3,
-                    package_duration_days=90,
-                    package_price=13500.00
-                ),
-                SessionPackage(
-                    package_name='Monthly Plan',
-                    package_description='8 therapy sessions per month',
-                    session_count=8,
-                    package_duration_days=30,
-                    package_price=32000.00
-                ),
-                SessionPackage(
-                    package_name='Quarterly Plan',
-                    package_description='24 therapy sessions over 3 months',
-                    session_count=24,
-                    package_duration_days=90,
-                    package_price=90000.00
-                )
-            ]
-            
-            for package in packages:
-                db.session.add(package)
-            
-            db.session.commit()
-            print("✅ Session packages created")
-
-            # Seed a default verified therapist if none exists
-            from app.models import User
-            existing_therapist = User.query.filter_by(is_therapist=True).first()
-            if not existing_therapist:
-                import bcrypt
-                print("👩‍⚕️  Creating a default verified therapist for development...")
-                pwd = 'therapist123'
-                password_hash = bcrypt.hashpw(pwd.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                therapist = User(
-                    is_anonymous=False,
-                    is_therapist=True,
-                    therapist_verified=True,
-                    therapist_specialization='General Counseling',
-                    therapist_bio='Experienced licensed therapist available for sessions.',
-                    therapist_rating=4.8,
-                    therapist_sessions_count=0,
-                    email='therapist@mentwel.ng',
-                    phone_number=None,
-                    password_hash=password_hash
-                )
-                db.session.add(therapist)
-                db.session.commit()
-                print("✅ Default therapist created: therapist@mentwel.ng / therapist123")
+            # Default packages and a verified development therapist; safe to re-run
+            from app.seeding import default_fixture_path, load_fixture
+            report = load_fixture(db.engine, db.metadata.tables, default_fixture_path())
+            print("✅ Session packages and default therapist seeded")
+            for line in report.lines():
+                print(line)
+            print("   Default therapist: therapist@mentwel.ng / therapist123")
             
             print("\n🎉 Database initialization completed successfully!")
             print("📊 Created tables:")
@@ -121,7 +67,7 @@ def create_admin_user():
         
         from app import create_app, db
         from app.models import User
-        import bcrypt
+        from app.passwords import hash_password
         
         app = create_app('development')
         
@@ -134,11 +80,11 @@ def create_admin_user():
             
             # Create admin user
             password = 'admin123'
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            password_hash = hash_password(password)
             
             admin_user = User(
                 anonymous_id='ADMIN001',
-                password_hash=password_hash.decode('utf-8'),
+                password_hash=password_hash,
                 email='admin@mentwel.ng',
                 is_anonymous=False,
                 is_therapist=False
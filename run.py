@@ -5,8 +5,8 @@ Main application entry point
 """
 
 import os
+import click
 from app import create_app, db
-from app.models import User, TherapySession, Payment, SentimentAnalysis, SessionPackage
 
 # Create Flask application instance
 app = create_app(os.getenv('FLASK_ENV') or 'development')
@@ -14,6 +14,7 @@ app = create_app(os.getenv('FLASK_ENV') or 'development')
 @app.shell_context_processor
 def make_shell_context():
     """Make database models available in Flask shell"""
+    from app.models import User, TherapySession, Payment, SentimentAnalysis, SessionPackage
     return {
         'db': db,
         'User': User,
@@ -30,57 +31,326 @@ def init_db():
     print('Database tables created successfully!')
 
 @app.cli.command()
-def seed_data():
-    """Seed the database with initial data"""
+@click.option('--probe', default=0, help='Run this many checkouts first to exercise the pool')
+@click.option('--threads', default=4, help='Concurrent threads used by --probe')
+def pool_stats(probe, threads):
+    """Report connection pool checkouts, waits, overflow and latency"""
+    import threading
+    from app.db_pool import LATENCY_BUCKETS_MS, load_snapshots, merge_snapshots, pool_stats as stats
+
+    engine = db.engine
+    if probe:
+        def worker(count):
+            for _ in range(count):
+                with engine.connect() as conn:
+                    conn.execute(db.text('SELECT 1'))
+        per_thread = max(1, probe // threads)
+        workers = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+    snapshots = [stats.snapshot()]
+    if app.config.get('DB_POOL_STATS_DIR'):
+        snapshots += [s for s in load_snapshots(app.config['DB_POOL_STATS_DIR'])
+                      if s.get('pid') != os.getpid()]
+    report = merge_snapshots(snapshots)
+
+    pool = engine.pool
+    print(f'Pool: {pool.__class__.__name__} {pool.status()}')
+    print(f"Processes reporting: {report['workers']}")
+    for key in ('checkouts', 'waits', 'timeouts', 'overflow_checkouts', 'peak_overflow',
+                'connects', 'invalidations', 'disconnect_errors'):
+        print(f"  {key:<20} {report[key]}")
+    if report['checkouts']:
+        mean = report['latency_total_ms'] / report['checkouts']
+        print(f"  checkout latency     mean {mean:.3f}ms  max {report['latency_max_ms']:.3f}ms")
+        bounds = [f'<={b}ms' for b in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        for label, count in zip(bounds, report['histogram']):
+            if count:
+                print(f'    {label:>10} {count}')
+
+@app.cli.command()
+@click.option('--top', default=20, help='Number of endpoints to list')
+def perf_report(top):
+    """Report per-endpoint latency, SQL and outbound time, N+1 and slow requests"""
+    from app.instrumentation import collect, endpoint_report
+
+    merged = collect(app.config.get('INSTRUMENT_STATS_DIR'))
+    rows = endpoint_report(merged)
+    print(f"Processes reporting: {merged['workers']}  (sample rate {app.config.get('INSTRUMENT_SAMPLE_RATE')})")
+    if not rows:
+        print('No requests recorded yet (set INSTRUMENT_STATS_DIR to read running workers)')
+        return
+    print(f'{"endpoint":<36} {"reqs":>7} {"mean":>8} {"p95":>8} {"p99":>8} {"queries":>8} {"sql":>8} '
+          f'{"outbound":>9} {"n+1":>5} {"slow":>5}')
+    for row in rows[:top]:
+        print(f"{row['endpoint'][:36]:<36} {row['requests']:>7} {row['mean_ms']:>6.1f}ms {row['p95_ms']:>6.0f}ms "
+              f"{row['p99_ms']:>6.0f}ms {row['queries_per_request']:>8.1f} {row['sql_ms_per_request']:>6.1f}ms "
+              f"{row['outbound_ms_per_request']:>7.1f}ms {row['n_plus_one']:>5} {row['slow']:>5}")
+
+@app.cli.command()
+@click.option('--module', default='wsgi', help='Module whose cold import is profiled')
+@click.option('--top', default=20, help='Number of slowest modules to list')
+@click.option('--budget', type=float, default=None, help='Startup budget in ms (default: STARTUP_IMPORT_BUDGET_MS)')
+def import_profile(module, top, budget):
+    """Report per-module import time for a cold start"""
+    from app.startup import profile_imports
+
+    budget = budget if budget is not None else app.config.get('STARTUP_IMPORT_BUDGET_MS')
+    entries, total_ms, error = profile_imports(module, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if error:
+        print(f'Error importing {module}: {error}')
+
+    print(f'{"cumulative":>12} {"self":>10}  module')
+    for name, depth, self_ms, cumulative_ms in sorted(entries, key=lambda e: e[3], reverse=True)[:top]:
+        print(f'{cumulative_ms:10.1f}ms {self_ms:8.1f}ms  {name}')
+    print(f'Total import time for {module}: {total_ms:.1f}ms')
+
+    if budget and total_ms > budget:
+        print(f'WARNING: startup import time {total_ms:.1f}ms exceeds budget of {budget:.0f}ms')
+
+@app.cli.command()
+def inference_cache_stats():
+    """Report inference cache hits, misses and size"""
+    cache = app.extensions.get('inference_cache')
+    if cache is None:
+        print('Inference cache is disabled (INFERENCE_CACHE_ENABLED=false)')
+        return
+    if cache.shared is None:
+        # The LRU counters of this CLI process say nothing about the Gunicorn workers
+        print('No shared layer configured (INFERENCE_CACHE_URL); hit counts are kept inside each worker')
+        return
+
+    counts, entries, size = cache.shared.totals()
+    hits = counts.get('local_hits', 0) + counts.get('shared_hits', 0)
+    lookups = hits + counts.get('misses', 0)
+    print(f'Shared cache: {entries} entries, {size / 1024:.1f} KiB')
+    for key in ('local_hits', 'shared_hits', 'misses', 'sets'):
+        print(f'  {key:<16} {counts.get(key, 0)}')
+    print(f'  {"hit_rate":<16} {hits / lookups if lookups else 0.0:.1%}')
+
+@app.cli.command()
+def cache_stats():
+    """Report response and fragment cache hit rates per cache name"""
+    from app.instrumentation import collect
+
+    merged = collect(app.config.get('INSTRUMENT_STATS_DIR'))
+    counts = {}
+    for (name, labels), value in merged['counters'].items():
+        if name == 'mentwel_cache_requests_total':
+            labels = dict(labels)
+            counts.setdefault(labels['cache'], {})[labels['result']] = value
+    print(f"Processes reporting: {merged['workers']}  (backend {app.config.get('RESPONSE_CACHE_URL')})")
+    if not counts:
+        print('No cache lookups recorded yet (set INSTRUMENT_STATS_DIR to read running workers)')
+        return
+    print(f'{"cache":<32} {"hits":>8} {"304s":>8} {"misses":>8} {"stale":>8} {"hit rate":>9}')
+    for name, values in sorted(counts.items()):
+        served = values.get('hit', 0) + values.get('not_modified', 0)
+        lookups = served + values.get('miss', 0) + values.get('stale', 0)
+        print(f"{name[:32]:<32} {values.get('hit', 0):>8} {values.get('not_modified', 0):>8} "
+              f"{values.get('miss', 0):>8} {values.get('stale', 0):>8} {served / lookups if lookups else 0:>9.1%}")
+
+@app.cli.command()
+def replica_status():
+    """Check the primary and read replicas and show where read-only queries go"""
+    import time
+    from app.instrumentation import collect
+
+    router = app.extensions.get('read_replicas')
+    if router is None:
+        print('No read replicas configured (set DATABASE_REPLICA_URLS)')
+        return
+    for label, engine in [('primary', db.engine)] + [('replica', e) for e in router.engines]:
+        url = engine.url.render_as_string()
+        try:
+            start = time.perf_counter()
+            with engine.connect() as conn:
+                conn.execute(db.text('SELECT 1'))
+                elapsed = (time.perf_counter() - start) * 1000
+                # Row counts make replication lag visible on SQLite copies
+                users = conn.execute(db.text('SELECT COUNT(*) FROM users')).scalar()
+            print(f'{label:<8} {url}  ok {elapsed:.1f}ms  users {users}')
+        except Exception as e:
+            print(f'{label:<8} {url}  FAILED {e.__class__.__name__}: {str(e).splitlines()[0]}')
+
+    target = db.session.get_bind(clause=db.select(db.literal(1)))
+    print(f'Read-only queries now go to: {target.url.render_as_string()}')
+    merged = collect(app.config.get('INSTRUMENT_STATS_DIR'))
+    for (name, labels), value in sorted(merged['counters'].items()):
+        if name == 'mentwel_db_read_routing_total':
+            print(f"  sessions routed to {dict(labels)['target']}: {value}")
+
+@app.cli.command()
+def cache_clear():
+    """Drop every cached response and fragment (run after deploying template changes)"""
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        print('Response cache is disabled (RESPONSE_CACHE_ENABLED=false)')
+        return
+    cache.clear()
+    print(f"Response cache cleared ({app.config.get('RESPONSE_CACHE_URL')})")
+
+@app.cli.command()
+@click.option('--status', default='failed', help='Replay events in this state (failed, processed, ignored)')
+@click.option('--reference', default=None, help='Only replay events for this Paystack reference')
+@click.option('--since', type=click.DateTime(), default=None, help='Only replay events received after this date')
+@click.option('--all', 'replay_all', is_flag=True, help='Replay every stored event regardless of state')
+def webhook_replay(status, reference, since, replay_all):
+    """Re-apply stored Paystack webhook events and drain the inbox"""
+    inbox = app.extensions['webhook_inbox'].get()
+    reset = inbox.replay(status=None if replay_all else status, reference=reference, since=since)
+    print(f'Reset {reset} event(s) to pending')
+    applied = inbox.drain()
+    print(f'Applied {applied} event(s)')
+    for key, value in sorted(inbox.counts().items()):
+        print(f'  {key:<10} {value}')
+
+@app.cli.command()
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user')
+@click.option('--since', type=click.DateTime(), default=None, help='Only rebuild from this date (whole weeks)')
+def mood_rollups_backfill(user_id, since):
+    """Rebuild daily and weekly mood aggregates from sentiment history"""
+    import time
+    from app.models import SentimentAnalysis
+    from app.mood_rollups import backfill
+
+    start = time.perf_counter()
+    daily, weekly = backfill(db.engine, SentimentAnalysis.__table__, user_id=user_id, since=since)
+    print(f'Rebuilt {daily} daily and {weekly} weekly mood rows in {time.perf_counter() - start:.2f}s')
+
+@app.cli.command()
+@click.option('--dataset', 'datasets', multiple=True,
+              type=click.Choice(['therapy_sessions', 'payments', 'sentiment_analysis']),
+              help='Export only this dataset (repeatable)')
+def analytics_export(datasets):
+    """Append new rows to the pseudonymized columnar analytics export"""
+    from app.analytics_export import export_from_config
+
+    report = export_from_config(app, datasets=list(datasets) or None)
+    print(f"Exported to {app.config.get('ANALYTICS_EXPORT_DIR')}")
+    for name, (rows, seconds, files) in report.items():
+        rate = rows / seconds if seconds else 0.0
+        print(f'  {name:<20} {rows:>9} rows  {len(files):>4} files  {seconds:7.2f}s  {rate:>10,.0f} rows/sec')
+
+@app.cli.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', default=8765, help='Port to listen on')
+def realtime(host, port):
+    """Run the SSE/WebSocket hub for therapy session events"""
+    from app.realtime import hub_from_config
+
+    hub = hub_from_config(app)
+    print(f'Realtime hub on http://{host}:{port}{hub.prefix} ({type(hub.broker).__name__})')
+    hub.run(host, port)
+
+@app.cli.command()
+@click.option('--threads', default=0, help='Jobs run at once (default: JOB_WORKER_THREADS)')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more')
+def worker(threads, burst):
+    """Run queued background jobs (emails, notifications, deferred work)"""
+    from app.jobs import worker_from_config
+
+    job_worker = worker_from_config(app, threads or None)
+    job_worker.install_signal_handlers()
+    limits = ', '.join(f'{name}={limit}' for name, limit in sorted(job_worker.limits.items()))
+    print(f'Job worker {job_worker.name}: {job_worker.threads} threads ({limits})')
+    processed = job_worker.run(burst=burst)
+    app.extensions['mailer'].get().close()
+    print(f'Stopped after {processed} jobs')
+
+@app.cli.command()
+def jobs_status():
+    """Count background jobs by type and status"""
+    counts = app.extensions['jobs'].get().counts()
+    if not counts:
+        print('No jobs')
+        return
+    statuses = ['queued', 'running', 'done', 'failed']
+    print(f'{"job type":<20}' + ''.join(f'{status:>10}' for status in statuses))
+    for kind in sorted({kind for kind, _ in counts}):
+        print(f'{kind:<20}' + ''.join(f'{counts.get((kind, status), 0):>10}' for status in statuses))
+
+@app.cli.command()
+@click.option('--kind', default=None, help='Only jobs of this type')
+def jobs_retry(kind):
+    """Queue failed background jobs again"""
+    count = app.extensions['jobs'].get().retry_failed(kind)
+    print(f'Queued {count} failed jobs again')
+
+@app.cli.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', default=1025, help='Port to listen on')
+def smtp_sink(host, port):
+    """Accept and print emails locally instead of sending them (MAIL_PORT=1025, MAIL_USE_TLS=false)"""
+    from email import message_from_bytes
+    from app.mailer import SMTPSink
+
+    def show(sender, recipients, data):
+        message = message_from_bytes(data)
+        print(f"{sender} -> {', '.join(recipients)}: {message.get('Subject')}")
+
+    sink = SMTPSink(host, port, keep=False, on_message=show)
+    print(f'SMTP sink on {sink.host}:{sink.port}')
     try:
-        # Create default session packages if they don't exist
-        packages = [
-            {
-                'name': 'Single Session',
-                'description': 'One therapy session',
-                'session_count': 1,
-                'duration_days': 30,
-                'price': 5000.00
-            },
-            {
-                'name': 'Starter Pack',
-                'description': '3 therapy sessions',
-                'session_count': 3,
-                'duration_days': 90,
-                'price': 13500.00
-            },
-            {
-                'name': 'Monthly Plan',
-                'description': '8 therapy sessions per month',
-                'session_count': 8,
-                'duration_days': 30,
-                'price': 32000.00
-            },
-            {
-                'name': 'Quarterly Plan',
-                'description': '24 therapy sessions over 3 months',
-                'session_count': 24,
-                'duration_days': 90,
-                'price': 90000.00
-            }
-        ]
-        
-        for package_data in packages:
-            existing = SessionPackage.query.filter_by(package_name=package_data['name']).first()
-            if not existing:
-                package = SessionPackage(**package_data)
-                db.session.add(package)
-        
-        db.session.commit()
-        print('Default packages seeded successfully!')
-        
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command()
+def therapist_indexes():
+    """Add the therapist directory indexes to an existing database"""
+    import app.models  # noqa: F401  (registers the tables)
+    from app.therapist_directory import create_indexes
+
+    with db.engine.begin() as conn:
+        for name in create_indexes(conn, db.metadata.tables):
+            print(f'  {name}')
+    print('Therapist directory indexes are in place')
+
+@app.cli.command()
+def pagination_indexes():
+    """Add the covering indexes behind the paged history endpoints"""
+    import app.models  # noqa: F401  (registers the tables)
+    from app.pagination import create_indexes
+
+    with db.engine.begin() as conn:
+        for name in create_indexes(conn, db.metadata.tables):
+            print(f'  {name}')
+    print('Pagination indexes are in place')
+
+@app.cli.command()
+@click.argument('fixtures', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--scale', default=0, help='Also generate N synthetic patients with sessions, payments and moods')
+@click.option('--chunk-size', default=5000, help='Rows per INSERT batch')
+def seed_data(fixtures, scale, chunk_size):
+    """Upsert fixture files (default: fixtures/base.json) and optional load-test data"""
+    from app.seeding import SeedReport, default_fixture_path, generate, load_fixture
+
+    tables = db.metadata.tables
+    report = SeedReport()
+    try:
+        for path in fixtures or [default_fixture_path()]:
+            load_fixture(db.engine, tables, path, report=report, chunk_size=chunk_size)
+            print(f'Loaded {path}')
+        if scale:
+            generate(db.engine, tables, scale, report=report, chunk_size=chunk_size)
+            print(f'Generated synthetic data for {scale} patients')
     except Exception as e:
-        db.session.rollback()
         print(f'Error seeding data: {str(e)}')
+        return
+    # Core inserts bypass the commit hooks that invalidate cached pages
+    from app.response_cache import invalidate
+    invalidate('packages', 'therapists')
+    for line in report.lines():
+        print(line)
 
 @app.cli.command()
 def create_admin():
     """Create an admin user for testing"""
+    from app.models import User
     try:
         # Check if admin user already exists
         admin = User.query.filter_by(anonymous_id='ADMIN001').first()
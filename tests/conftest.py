@@ -0,0 +1,63 @@
+"""
+Shared fixtures for the MentWel test suite
+
+Unit tests build the objects they need directly. Tests that need the whole
+application use the `app` fixture: create_app('testing') with every table
+created in in-memory SQLite.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app():
+    try:
+        from app import create_app, db
+    except ImportError as e:
+        pytest.skip(f'application factory not importable: {e}')
+
+    application = create_app('testing')
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create and return a User; keyword arguments override the defaults"""
+    from app import db
+    from app.models import User
+
+    def make(**fields):
+        user = User(anonymous_id=f'anon{User.query.count() + 1:04d}', **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """Sign `user` in on the test client (Flask-Login session keys)"""
+    def sign_in(user):
+        from flask import g
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        # Requests share the fixture's app context, so drop the user Flask-Login cached in g
+        g.pop('_login_user', None)
+        return user
+    return sign_in
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine
+
+from app.analytics_export import Pseudonymizer, export_all
+
+tables = MetaData()
+sentiment = Table(
+    'sentiment_analysis', tables,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer),
+    Column('session_id', Integer),
+    Column('message_text', String(1000)),
+    Column('sentiment_label', String(20)),
+    Column('sentiment_score', Float),
+    Column('created_at', DateTime),
+)
+
+
+def test_pseudonyms_are_keyed_and_stable():
+    pseudonymize = Pseudonymizer('key')
+    assert pseudonymize('user', 42) == pseudonymize('user', 42)
+    assert pseudonymize('user', 42) != pseudonymize('session', 42)
+    assert pseudonymize('user', 42) != Pseudonymizer('other key')('user', 42)
+    assert pseudonymize('user', None) is None
+    with pytest.raises(ValueError):
+        Pseudonymizer('')
+
+
+def test_export_is_pseudonymized_partitioned_and_incremental(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    tables.create_all(engine)
+    rows = [
+        {'user_id': 7, 'session_id': 1, 'message_text': 'I feel alone', 'sentiment_label': 'negative',
+         'sentiment_score': 0.9, 'created_at': datetime(2026, 1, 15)},
+        {'user_id': 7, 'session_id': 2, 'message_text': 'Better today', 'sentiment_label': 'positive',
+         'sentiment_score': 0.8, 'created_at': datetime(2026, 2, 3)},
+    ]
+    with engine.begin() as conn:
+        conn.execute(sentiment.insert(), rows)
+
+    root = str(tmp_path / 'export')
+    report = export_all(engine, tables.tables, root, 'key', datasets=['sentiment_analysis'])
+    assert report['sentiment_analysis'][0] == 2
+    assert sorted(p.name for p in (tmp_path / 'export' / 'sentiment_analysis').iterdir()) == [
+        'month=2026-01', 'month=2026-02',
+    ]
+
+    table = pq.read_table(str(tmp_path / 'export' / 'sentiment_analysis'))
+    assert 'message_text' not in table.column_names
+    assert set(table.column('user_id').to_pylist()) == {Pseudonymizer('key')('user', 7)}
+
+    # Nothing new: the watermark keeps the next run empty
+    assert export_all(engine, tables.tables, root, 'key', datasets=['sentiment_analysis'])[
+        'sentiment_analysis'][0] == 0
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+
+from app.chat_stream import LocalStandInBackend, stream_tokens
+
+
+class SlowBackend:
+    """Records how many tokens it produced and whether it was closed"""
+
+    def __init__(self, first_token_delay=0.0):
+        self.first_token_delay = first_token_delay
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def generate(self, prompt):
+        try:
+            time.sleep(self.first_token_delay)
+            for i in range(1000):
+                self.produced += 1
+                yield f' token{i}'
+                time.sleep(0.005)
+        finally:
+            self.closed.set()
+
+
+def test_tokens_then_done():
+    events = list(stream_tokens(LocalStandInBackend(), 'hello', ttft_budget=1))
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == 'done'
+    assert set(kinds[:-1]) == {'token'}
+    assert ''.join(value for kind, value in events if kind == 'token') == LocalStandInBackend.REPLY
+    assert events[-1][1]['tokens'] == len(events) - 1
+
+
+def test_first_token_timeout_cancels_the_backend():
+    backend = SlowBackend(first_token_delay=0.2)
+    events = list(stream_tokens(backend, 'hello', ttft_budget=0.05))
+
+    assert events == [('error', 'The assistant is taking too long to respond. Please try again.')]
+    assert backend.closed.wait(2)
+    assert backend.produced < 1000
+
+
+def test_client_disconnect_cancels_the_backend():
+    backend = SlowBackend()
+    stream = stream_tokens(backend, 'hello', ttft_budget=1)
+    for _ in range(3):
+        assert next(stream)[0] == 'token'
+    # What the WSGI server does when the client goes away
+    stream.close()
+
+    assert backend.closed.wait(2)
+    assert backend.produced < 1000
+
+
+def test_endpoint_streams_server_sent_events(client, make_user, login):
+    login(make_user())
+    response = client.post('/api/chat/stream', json={'message': 'I had a hard week'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    events = [block.split('\n') for block in body.strip().split('\n\n')]
+    assert events[-1][0] == 'event: done'
+    text = ''.join(json.loads(lines[1][len('data: '):])['text'] for lines in events if lines[0] == 'event: token')
+    assert text == LocalStandInBackend.REPLY
+
+
+def test_endpoint_requires_a_message(client, make_user, login):
+    login(make_user())
+    assert client.post('/api/chat/stream', json={}).status_code == 400
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import db_pool
+from app.db_pool import InstrumentedQueuePool, PoolStats, merge_snapshots, pool_stats
+from config import ENGINE_PROFILES, engine_options
+
+POSTGRES = 'postgresql://mentwel@db/mentwel'
+ENV = ('GUNICORN_WORKER_CLASS', 'GUNICORN_THREADS', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT')
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in ENV:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.fixture
+def stats():
+    pool_stats.reset()
+    yield pool_stats
+    pool_stats.reset()
+
+
+def test_sqlite_gets_no_pool_sizing(env):
+    assert engine_options('sqlite:///instance/mentwel.db') == {}
+    assert engine_options(None) == {}
+
+
+def test_postgres_profile_follows_the_worker_class(env):
+    options = engine_options(POSTGRES)
+    assert (options['pool_size'], options['max_overflow']) == (2, 2)
+    assert options['pool_use_lifo'] and not options['pool_pre_ping']
+
+    env.setenv('GUNICORN_WORKER_CLASS', 'gevent')
+    assert engine_options(POSTGRES)['pool_size'] == ENGINE_PROFILES['gevent']['pool_size']
+
+    # gthread sizes the pool to the thread count
+    env.setenv('GUNICORN_WORKER_CLASS', 'gthread')
+    env.setenv('GUNICORN_THREADS', '8')
+    assert (engine_options(POSTGRES)['pool_size'], engine_options(POSTGRES)['max_overflow']) == (8, 4)
+
+    env.setenv('DB_POOL_SIZE', '3')
+    env.setenv('GUNICORN_WORKER_CLASS', 'unknown')
+    assert engine_options(POSTGRES)['pool_size'] == 3
+
+
+def test_snapshot_and_merge():
+    stats = PoolStats()
+    stats.record_checkout(0.0002, False, False, 0)
+    stats.record_checkout(0.02, True, True, 2)
+    stats.incr('timeouts')
+    snap = stats.snapshot()
+    assert (snap['checkouts'], snap['waits'], snap['overflow_checkouts'], snap['timeouts']) == (2, 1, 1, 1)
+    assert snap['peak_overflow'] == 2 and snap['latency_max_ms'] == pytest.approx(20)
+    # 0.2ms lands in the 0.5ms bucket, 20ms in the 50ms bucket
+    assert snap['histogram'][1] == 1 and snap['histogram'][5] == 1
+
+    total = merge_snapshots([snap, dict(snap, peak_overflow=1)])
+    assert (total['workers'], total['checkouts'], total['peak_overflow']) == (2, 4, 2)
+
+
+def test_checkouts_count_overflow_and_waits(stats, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=1, pool_timeout=5)
+    first = engine.connect()
+    second = engine.connect()
+    snap = stats.snapshot()
+    assert (snap['checkouts'], snap['overflow_checkouts'], snap['peak_overflow'], snap['waits']) == (2, 1, 1, 0)
+
+    # Both connections are out, so a third checkout blocks until one returns
+    got = threading.Event()
+
+    def third():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            got.set()
+
+    thread = threading.Thread(target=third)
+    thread.start()
+    assert not got.wait(0.1)
+    first.close()
+    thread.join()
+    second.close()
+    snap = stats.snapshot()
+    assert (snap['checkouts'], snap['waits'], snap['overflow_checkouts']) == (3, 1, 1)
+    assert snap['connects'] == 2 and snap['timeouts'] == 0
+    engine.dispose()
+
+
+def test_exhausted_pool_counts_timeouts(stats, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert stats.snapshot()['timeouts'] == 1
+    engine.dispose()
+
+
+def test_init_app_installs_the_pool_for_sized_profiles(env):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(POSTGRES)
+    db_pool.init_app(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'] is InstrumentedQueuePool
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('sqlite://')
+    db_pool.init_app(app)
+    assert 'poolclass' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
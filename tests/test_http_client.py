@@ -0,0 +1,95 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.http_client import CircuitBreaker, CircuitOpenError, Integration, OutboundClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.requests.append(self.command)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.connections = 0
+    httpd.requests = []
+    httpd.statuses = []
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def client_for(server, **options):
+    options.setdefault('backoff_base', 0)
+    return OutboundClient([Integration('service', server.url, timeout=(1, 2), **options)])
+
+
+def test_connections_are_reused(server):
+    client = client_for(server)
+    for _ in range(5):
+        assert client.request('service', 'GET', '/ping').status_code == 200
+    assert server.connections == 1
+    assert client.stats()['hosts'][server.url[len('http://'):]]['count'] == 5
+
+
+def test_idempotent_requests_are_retried(server):
+    server.statuses = [503, 502]
+    response = client_for(server, retries=2).request('service', 'GET', '/ping')
+    assert response.status_code == 200
+    assert server.requests == ['GET', 'GET', 'GET']
+
+
+def test_post_is_not_retried_unless_asked(server):
+    server.statuses = [503, 503]
+    client = client_for(server, retries=2)
+    assert client.request('service', 'POST', '/charge', json={}).status_code == 503
+    assert server.requests == ['POST']
+    assert client.request('service', 'POST', '/classify', json={}, retry=True).status_code == 200
+
+
+def test_breaker_opens_after_consecutive_failures(server):
+    server.statuses = [500] * 3
+    client = client_for(server, retries=0, breaker=CircuitBreaker(threshold=3, reset_timeout=60))
+    for _ in range(3):
+        assert client.request('service', 'GET', '/ping').status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.request('service', 'GET', '/ping')
+    assert len(server.requests) == 3
+    assert client.stats()['breakers']['service']['state'] == 'open'
+
+
+def test_breaker_lets_one_trial_through_after_reset():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
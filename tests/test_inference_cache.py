@@ -0,0 +1,56 @@
+import hashlib
+
+import pytest
+
+from app.inference_cache import CachedBackend, InferenceCache, LRUCache, SQLiteStore, cache_key, normalize
+from app.sentiment_pipeline import StubBackend
+
+MODEL = 'https://models.example/sentiment'
+
+
+def test_keys_are_keyed_hashes_of_normalized_text():
+    key = cache_key(b'secret', MODEL, '  Thank you!! ')
+    assert key == cache_key(b'secret', MODEL, 'thank you')
+    assert key != cache_key(b'other secret', MODEL, 'thank you')
+    # A plain hash of the input must not reveal the key
+    assert key != hashlib.sha256(f'{MODEL}\0{normalize("thank you")}'.encode('utf-8')).hexdigest()
+
+
+def test_cache_requires_a_secret():
+    with pytest.raises(ValueError):
+        InferenceCache(LRUCache(), None)
+
+
+def test_shared_layer_stores_no_plaintext(tmp_path):
+    shared = SQLiteStore(str(tmp_path / 'cache.db'))
+    cache = InferenceCache(LRUCache(), 'secret', shared)
+    cache.set(MODEL, 'I feel alone tonight', ['negative', 0.9])
+
+    conn = shared.connect()
+    assert 'alone' not in ' '.join(row[0] for row in conn.execute('SELECT key FROM inference_cache'))
+    # A second worker with the same key reads the shared entry
+    other = InferenceCache(LRUCache(), 'secret', shared)
+    assert other.get(MODEL, 'i feel alone tonight') == ['negative', 0.9]
+    assert other.stats()['shared_hits'] == 1
+
+
+def test_lru_evicts_and_expires():
+    lru = LRUCache(max_entries=2, ttl=10)
+    lru.set('a', 1, 1, now=0)
+    lru.set('b', 2, 1, now=0)
+    lru.get('a', now=1)
+    lru.set('c', 3, 1, now=1)
+    assert lru.get('b', now=1) is None
+    assert lru.get('a', now=1) == 1
+    assert lru.get('a', now=20) is None
+
+
+def test_cached_backend_only_sends_misses_to_the_model():
+    backend = StubBackend()
+    cached = CachedBackend(backend, InferenceCache(LRUCache(), 'secret'), MODEL)
+
+    first = cached.analyze(['thank you', 'Thank you!', 'so tired'])
+    assert first[0] == first[1]
+    assert backend.calls == 1
+    assert cached.analyze(['thank you', 'so tired']) == [first[0], first[2]]
+    assert backend.calls == 1
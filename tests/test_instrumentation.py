@@ -0,0 +1,45 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import instrumentation
+from app.instrumentation import RequestProfile, RequestState, _state, merge_snapshots, metrics, render_prometheus
+
+
+def test_failed_statements_leave_no_start_time_behind():
+    # init_app listens on every Engine, once per process
+    instrumentation.init_app(Flask(__name__))
+    engine = create_engine('sqlite://')
+    profile = RequestProfile()
+    token = _state.set(RequestState(0, None, profile))
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM missing'))
+            conn.execute(text('SELECT 1'))
+            assert not any(key.startswith('mentwel') for key in conn.info)
+    finally:
+        _state.reset(token)
+    assert profile.queries == 1 and list(profile.statements) == ['SELECT 1']
+
+
+def test_requests_are_timed_and_repeated_statements_flagged():
+    engine = create_engine('sqlite://')
+    app = Flask(__name__)
+    app.config['INSTRUMENT_N_PLUS_ONE_THRESHOLD'] = 5
+
+    @app.route('/loop')
+    def loop():
+        with engine.connect() as conn:
+            for i in range(6):
+                conn.execute(text('SELECT :i'), {'i': i})
+        return 'ok'
+
+    metrics.reset()
+    instrumentation.init_app(app)
+    assert app.test_client().get('/loop').status_code == 200
+
+    merged = merge_snapshots([metrics.snapshot()])
+    assert merged['counters'][('mentwel_n_plus_one_total', (('endpoint', 'loop'),))] == 1
+    assert 'mentwel_db_queries_per_request_sum{endpoint="loop"} 6' in render_prometheus(merged)
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, update
+
+from app.jobs import JOB_TYPES, JobQueue, PermanentJobError, job, jobs, parse_concurrency
+
+calls = []
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(create_engine(f"sqlite:///{tmp_path / 'jobs.db'}"), max_attempts=3, backoff_base=0,
+                     backoff_max=0)
+    queue.create_tables()
+    calls.clear()
+    yield queue
+    for name in ('test_record', 'test_flaky', 'test_refused'):
+        JOB_TYPES.pop(name, None)
+
+
+@pytest.fixture
+def flask_app():
+    return Flask(__name__)
+
+
+def register():
+    @job('test_record')
+    def record(payload):
+        calls.append(payload)
+
+    @job('test_flaky')
+    def flaky(payload):
+        calls.append(payload)
+        raise ConnectionError('try again')
+
+    @job('test_refused')
+    def refused(payload):
+        raise PermanentJobError('mailbox does not exist')
+
+
+def test_jobs_run_once_when_due(queue, flask_app):
+    register()
+    queue.enqueue('test_record', {'n': 1})
+    queue.enqueue('test_record', {'n': 2}, delay=3600)
+
+    assert queue.run_pending(flask_app) == 1
+    assert calls == [{'n': 1}]
+    assert queue.run_pending(flask_app) == 0
+    assert queue.counts() == {('test_record', 'done'): 1, ('test_record', 'queued'): 1}
+    with pytest.raises(ValueError):
+        queue.enqueue('no_such_job')
+
+
+def test_failures_retry_until_attempts_run_out(queue, flask_app):
+    register()
+    queue.enqueue('test_flaky', {'n': 1})
+    queue.enqueue('test_refused')
+
+    # backoff_max=0 makes every retry due at once
+    assert queue.run_pending(flask_app) == 4
+    assert calls == [{'n': 1}] * 3
+    assert queue.counts() == {('test_flaky', 'failed'): 1, ('test_refused', 'failed'): 1}
+
+    assert queue.retry_failed('test_refused') == 1
+    assert queue.counts()[('test_refused', 'queued')] == 1
+
+
+def test_claims_respect_per_type_capacity(queue):
+    register()
+    for n in range(3):
+        queue.enqueue('test_record', {'n': n})
+    queue.enqueue('test_flaky')
+
+    claimed = queue.claim('worker-a:1', {'test_record': 2, 'test_flaky': 0}, 10)
+    assert [row.kind for row in claimed] == ['test_record', 'test_record']
+    # Already-claimed rows are never handed to a second worker
+    assert len(queue.claim('worker-b:1', {'test_record': 5}, 10)) == 1
+
+
+def test_expired_leases_are_requeued(queue):
+    register()
+    queue.enqueue('test_record')
+    [row] = queue.claim('worker-a:1', {'test_record': 1}, 1)
+    assert queue.requeue_expired() == 0
+
+    with queue.engine.begin() as conn:
+        conn.execute(update(jobs).values(locked_at=datetime.utcnow() - timedelta(hours=1)))
+    assert queue.requeue_expired() == 1
+    assert queue.claim('worker-b:1', {'test_record': 1}, 1)[0].id == row.id
+
+
+def test_backoff_and_concurrency_settings():
+    queue = JobQueue(create_engine('sqlite://'), backoff_base=30, backoff_max=3600)
+    assert 15 <= queue.backoff(1) <= 30
+    assert 1800 <= queue.backoff(20) <= 3600
+    assert parse_concurrency('email=4, session_event = 8') == {'email': 4, 'session_event': 8}
+    assert parse_concurrency(None) == {}
+
+
+def test_queued_email_reaches_the_outbox(app):
+    from app.jobs import send_email
+
+    send_email('patient@example.com', 'Your session', 'See you at 9')
+    assert app.extensions['jobs'].run_pending(app) == 1
+    [message] = app.extensions['mailer'].outbox
+    assert (message['To'], message['Subject']) == ('patient@example.com', 'Your session')
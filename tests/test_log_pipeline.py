@@ -0,0 +1,81 @@
+import io
+import json
+import logging
+import queue
+
+from flask import Flask
+
+from app.log_pipeline import (
+    AccessLog, DroppingQueueHandler, JsonFormatter, RateLimitFilter, build_pipeline, redact, redact_text,
+)
+
+
+def record(msg, *args, level=logging.INFO, **extra):
+    item = logging.LogRecord('mentwel', level, __file__, 1, msg, args, None)
+    item.__dict__.update(extra)
+    return item
+
+
+def test_pii_is_masked_in_text_and_fields():
+    assert redact_text('mail ada@example.com or call 08031234567 / +447911123456') == \
+        'mail [email] or call [phone] / [phone]'
+    assert redact({'Email': 'x', 'profile': {'token': 't', 'notes': ['ada@example.com']}, 'count': 3}) == \
+        {'Email': '[redacted]', 'profile': {'token': '[redacted]', 'notes': ['[email]']}, 'count': 3}
+
+    line = json.loads(JsonFormatter().format(record('signup %s', 'ada@example.com', password='pw', user_id=7)))
+    assert (line['msg'], line['password'], line['user_id'], line['level']) == ('signup [email]', '[redacted]', 7, 'INFO')
+
+
+def test_repeated_templates_are_rate_limited():
+    limiter = RateLimitFilter(limit=2, window=60)
+    passed = [limiter.filter(record('retrying %s', i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limiter.filter(record('retrying %s', 9, level=logging.ERROR))
+    assert limiter.filter(record('another template'))
+
+
+def test_full_queue_drops_and_reports_on_the_next_record():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(record('first'))
+    handler.handle(record('lost'))
+    handler.handle(record('lost'))
+    assert handler.dropped == 2
+    handler.queue.get_nowait()
+    handler.handle(record('next'))
+    assert handler.queue.get_nowait().dropped == 2 and handler.dropped == 0
+
+
+def test_requests_get_an_id_and_an_access_line():
+    stream = io.StringIO()
+    pipeline = build_pipeline({'LOG_LEVEL': 'INFO'}, stream).start()
+    logger = logging.getLogger('mentwel.test_access')
+    logger.addHandler(pipeline.handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    app = Flask(__name__)
+    access = AccessLog(logger)
+    app.before_request(access.before_request)
+    app.after_request(access.after_request)
+    app.teardown_request(access.teardown_request)
+
+    @app.route('/hello')
+    def hello():
+        logger.info('greeting %s', 'ada@example.com')
+        return 'hi'
+
+    try:
+        client = app.test_client()
+        assert client.get('/hello', headers={'X-Request-ID': 'abc-123'}).headers['X-Request-ID'] == 'abc-123'
+        generated = client.get('/hello', headers={'X-Request-ID': 'bad id!'}).headers['X-Request-ID']
+        assert generated != 'bad id!'
+    finally:
+        pipeline.stop()
+        logger.removeHandler(pipeline.handler)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(l['msg'], l['request_id']) for l in lines] == [
+        ('greeting [email]', 'abc-123'), ('request', 'abc-123'),
+        ('greeting [email]', generated), ('request', generated),
+    ]
+    assert lines[1]['status'] == 200 and lines[1]['endpoint'] == 'hello' and 'duration_ms' in lines[1]
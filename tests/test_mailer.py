@@ -0,0 +1,64 @@
+import smtplib
+
+import pytest
+from flask import Flask
+
+from app.mailer import OutboxMailer, SMTPPool, SMTPSink, build_message, mailer_from_config
+
+
+@pytest.fixture
+def sink():
+    sink = SMTPSink().start()
+    yield sink
+    sink.stop()
+
+
+def message(to='patient@example.com', subject='Reminder'):
+    return build_message('care@mentwel.example', to, subject, 'Your session starts at 9',
+                         html='<p>Your session starts at 9</p>')
+
+
+def test_messages_carry_text_and_html():
+    built = build_message('a@example.com', ['b@example.com', 'c@example.com'], 'Hi', 'text',
+                          html='<b>text</b>', reply_to='d@example.com')
+    assert built['To'] == 'b@example.com, c@example.com' and built['Reply-To'] == 'd@example.com'
+    assert [part.get_content_type() for part in built.iter_parts()] == ['text/plain', 'text/html']
+
+
+def test_pool_reuses_and_recycles_connections(sink):
+    pool = SMTPPool(sink.host, sink.port, size=2, max_messages=3)
+    for n in range(5):
+        pool.send(message(subject=f'Reminder {n}'))
+    pool.close()
+
+    assert (sink.count, pool.sent) == (5, 5)
+    # The first connection is retired after three messages
+    assert pool.connects == sink.connections == 2
+    assert b'Subject: Reminder 4' in sink.messages[-1][2]
+
+
+def test_refused_recipients_keep_the_connection(sink):
+    pool = SMTPPool(sink.host, sink.port, size=1)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send(message(to='nobody@invalid'))
+    pool.send(message())
+    pool.close()
+    assert pool.connects == 1 and sink.count == 1
+
+
+def test_idle_connections_are_replaced(sink):
+    pool = SMTPPool(sink.host, sink.port, idle_timeout=0)
+    pool.send(message())
+    pool.send(message())
+    pool.close()
+    assert pool.connects == 2 and sink.count == 2
+
+
+def test_sending_is_suppressed_under_testing():
+    app = Flask(__name__)
+    app.config.update(TESTING=True)
+    assert isinstance(mailer_from_config(app), OutboxMailer)
+
+    app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_SERVER='mail.example', MAIL_POOL_SIZE=2)
+    pool = mailer_from_config(app)
+    assert isinstance(pool, SMTPPool) and (pool.host, pool.size) == ('mail.example', 2)
@@ -0,0 +1,153 @@
+import io
+import os
+
+import pytest
+
+from app.media import AUDIO, IMAGE, MediaStore, UploadError, sniff
+
+WAV = b'RIFF\x24\x00\x00\x00WAVEfmt ' + b'\x00' * 64
+
+
+def png_bytes(size=(40, 30), color=(200, 30, 30)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def chunks(data, size=7):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path), {'png', 'jpeg', 'wav'}, {AUDIO: 100, None: 1024 * 1024})
+
+
+def test_type_comes_from_magic_bytes():
+    assert sniff(png_bytes()[:16]) == ('png', IMAGE)
+    assert sniff(WAV[:16]) == ('wav', AUDIO)
+    assert sniff(b'GIF89a' + b'\x00' * 10, allowed={'png'}) == (None, None)
+    assert sniff(b'#!/bin/sh\nrm -rf /') == (None, None)
+
+
+def test_identical_content_is_stored_once(store, tmp_path):
+    data = png_bytes()
+    first = store.save_stream(chunks(data))
+    second = store.save_stream(chunks(data))
+
+    assert first.digest == second.digest and (first.duplicate, second.duplicate) == (False, True)
+    assert first.path.endswith(f'{first.digest}.png')
+    with open(first.path, 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(tmp_path / 'incoming') == []
+
+
+def test_rejected_uploads_leave_nothing_behind(store, tmp_path):
+    with pytest.raises(UploadError) as error:
+        store.save_stream(chunks(b'plain text is not media'))
+    assert error.value.status == 415
+    with pytest.raises(UploadError) as error:
+        store.save_stream(chunks(WAV + b'\x00' * 100))
+    assert error.value.status == 413
+    with pytest.raises(UploadError):
+        store.save_stream([])
+    assert os.listdir(tmp_path / 'incoming') == []
+
+
+def test_images_are_normalized(store):
+    stored = store.save_stream([png_bytes(size=(2000, 1000))])
+    assert store.normalize_async(stored).result(timeout=10)
+    assert store.status(stored.digest) == 'ready'
+
+    from PIL import Image
+    with Image.open(os.path.join(store.derived_dir(stored.digest), 'display.jpg')) as image:
+        assert image.size == (1600, 800)
+
+
+@pytest.fixture
+def media_app(app, tmp_path):
+    app.config['MEDIA_ROOT'] = str(tmp_path / 'media')
+    return app
+
+
+def test_upload_endpoint(media_app, client, make_user, login):
+    login(make_user())
+    data = png_bytes()
+
+    response = client.post('/api/media', data=data, content_type='application/octet-stream')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['kind'], body['type'], body['size']) == ('image', 'png', len(data))
+    # Existence of identical content uploaded by anyone else is never revealed
+    assert 'duplicate' not in body
+
+    again = client.post('/api/media', data={'file': (io.BytesIO(data), 'photo.png')},
+                        content_type='multipart/form-data')
+    assert again.status_code == 201
+    assert again.get_json()['id'] == body['id'] and 'duplicate' not in again.get_json()
+
+    rejected = client.post('/api/media', data={'file': (io.BytesIO(b'<?php echo 1;'), 'x.png')},
+                           content_type='multipart/form-data')
+    assert rejected.status_code == 415
+
+
+def upload(client, data, **query):
+    return client.post('/api/media', query_string=query, data=data, content_type='application/octet-stream')
+
+
+def test_default_store_is_outside_static(app):
+    from app.media import store_from_config
+    root = store_from_config(app).root
+    assert root == os.path.join(app.instance_path, 'media')
+    assert not root.startswith(app.static_folder)
+
+
+def test_only_owners_can_read_uploads(media_app, client, make_user, login):
+    owner, stranger = make_user(), make_user()
+    login(owner)
+    digest = upload(client, png_bytes()).get_json()['id']
+    assert client.get(f'/api/media/{digest}').status_code == 200
+    assert client.get(f'/media/{digest}').status_code == 200
+
+    login(stranger)
+    assert client.get(f'/api/media/{digest}').status_code == 404
+    assert client.get(f'/media/{digest}').status_code == 404
+    media_app.config['MEDIA_ACCEL_REDIRECT'] = '/_media/'
+    assert 'X-Accel-Redirect' not in client.get(f'/media/{digest}').headers
+
+    # Uploading the same bytes makes the stranger an owner of their own copy
+    upload(client, png_bytes())
+    assert client.get(f'/media/{digest}').headers['X-Accel-Redirect'].startswith('/_media/originals/')
+
+
+def test_session_uploads_are_shared_with_participants(media_app, client, make_user, login):
+    from app import db
+    from app.models import TherapySession
+
+    patient, therapist, stranger = make_user(), make_user(is_therapist=True), make_user()
+    session = TherapySession(patient_id=patient.id, therapist_id=therapist.id, status='scheduled')
+    db.session.add(session)
+    db.session.commit()
+
+    login(stranger)
+    assert upload(client, png_bytes(), session_id=session.id).status_code == 403
+    assert upload(client, png_bytes(), session_id=9999).status_code == 404
+
+    login(patient)
+    digest = upload(client, png_bytes(), session_id=session.id).get_json()['id']
+    login(therapist)
+    assert client.get(f'/api/media/{digest}').status_code == 200
+    login(stranger)
+    assert client.get(f'/api/media/{digest}').status_code == 404
+
+
+def test_serving_honours_range_and_etag(media_app, client, make_user, login):
+    login(make_user())
+    data = png_bytes()
+    digest = upload(client, data).get_json()['id']
+
+    partial = client.get(f'/media/{digest}', headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206 and partial.data == data[:10]
+    assert partial.headers['Content-Range'] == f'bytes 0-9/{len(data)}'
+    assert client.get(f'/media/{digest}', headers={'If-None-Match': f'"{digest}"'}).status_code == 304
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine
+
+from app.mood_rollups import aggregate, backfill, metadata, mood_chart, record_rows
+
+tables = MetaData()
+sentiment = Table(
+    'sentiment_analysis', tables,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer),
+    Column('sentiment_label', String(20)),
+    Column('sentiment_score', Float),
+    Column('created_at', DateTime),
+)
+
+MONDAY = datetime(2026, 3, 2, 9, 0)
+ROWS = [
+    {'user_id': 1, 'sentiment_label': 'positive', 'sentiment_score': 0.8, 'created_at': MONDAY},
+    {'user_id': 1, 'sentiment_label': 'negative', 'sentiment_score': 0.6, 'created_at': MONDAY},
+    {'user_id': 1, 'sentiment_label': 'neutral', 'sentiment_score': 0.5, 'created_at': MONDAY + timedelta(days=2)},
+    {'user_id': 2, 'sentiment_label': 'positive', 'sentiment_score': 0.9, 'created_at': MONDAY},
+    {'user_id': None, 'sentiment_label': 'positive', 'sentiment_score': 0.9, 'created_at': MONDAY},
+]
+
+
+def test_rows_fold_into_daily_and_weekly_buckets():
+    daily, weekly = aggregate(ROWS)
+    assert daily[(1, MONDAY.date())]['messages'] == 2
+    assert round(daily[(1, MONDAY.date())]['mood_sum'], 4) == 0.2
+    assert weekly[(1, MONDAY.date())]['messages'] == 3
+    assert (None, MONDAY.date()) not in daily
+
+
+def test_incremental_rollups_match_a_backfill(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'moods.db'}")
+    tables.create_all(engine)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sentiment.insert(), ROWS)
+        # Two batches, as the pipeline would write them
+        record_rows(conn, ROWS[:2])
+        record_rows(conn, ROWS[2:])
+        incremental = mood_chart(conn, 1, 'daily'), mood_chart(conn, 1, 'weekly')
+
+    assert backfill(engine, sentiment) == (3, 2)
+    with engine.connect() as conn:
+        assert (mood_chart(conn, 1, 'daily'), mood_chart(conn, 1, 'weekly')) == incremental
+
+    daily, weekly = incremental
+    assert [point['date'] for point in daily] == ['2026-03-02', '2026-03-04']
+    assert daily[0]['average_mood'] == 0.1
+    assert weekly == [{'date': '2026-03-02', 'messages': 3, 'average_mood': 0.0667,
+                       'positive': 1, 'neutral': 1, 'negative': 1}]
+
+
+def test_endpoint_serves_the_signed_in_users_chart(app, client, make_user, login):
+    from app import db
+    from app.models import SentimentAnalysis
+
+    user = login(make_user())
+    other = make_user()
+    now = datetime.utcnow()
+    db.session.add_all([
+        SentimentAnalysis(user_id=user.id, sentiment_label='positive', sentiment_score=0.9, created_at=now),
+        SentimentAnalysis(user_id=other.id, sentiment_label='negative', sentiment_score=0.9, created_at=now),
+    ])
+    db.session.commit()
+
+    response = client.get('/api/progress/mood?period=weekly')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['period'] == 'weekly'
+    assert [(p['messages'], p['positive']) for p in data['points']] == [(1, 1)]
+    assert date.fromisoformat(data['points'][0]['date']).weekday() == 0
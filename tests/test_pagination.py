@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, Numeric, String, Table, create_engine, inspect
+
+from app.pagination import (
+    LISTINGS, CursorError, create_indexes, cursor_serializer, decode_cursor, encode_cursor, keyset_page,
+)
+
+tables = MetaData()
+payments = Table(
+    'payments', tables,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer),
+    Column('package_id', Integer),
+    Column('amount', Numeric(10, 2)),
+    Column('status', String(20)),
+    Column('created_at', DateTime),
+)
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pages.db'}")
+    tables.create_all(engine)
+    with engine.begin() as conn:
+        # Pairs of rows share a timestamp, so ties are broken by id
+        conn.execute(payments.insert(), [
+            {'id': i, 'user_id': 1, 'amount': i, 'status': 'success', 'created_at': START + timedelta(hours=i // 2)}
+            for i in range(1, 8)
+        ] + [{'id': 50, 'user_id': 2, 'amount': 1, 'status': 'success', 'created_at': START}])
+    with engine.connect() as conn:
+        yield conn
+
+
+def test_pages_walk_every_row_once_newest_first(conn):
+    seen, after = [], None
+    while True:
+        rows, more = keyset_page(conn, payments, 'user_id', 1, ['id', 'created_at'], after, limit=3)
+        seen += [row.id for row in rows]
+        if not more:
+            break
+        after = (rows[-1].created_at, rows[-1].id)
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_cursors_are_signed_per_listing():
+    payments_cursor = encode_cursor(cursor_serializer('key', 'payments'), START, 4)
+    assert decode_cursor(cursor_serializer('key', 'payments'), payments_cursor) == (START, 4)
+    for serializer, cursor in [(cursor_serializer('key', 'sessions'), payments_cursor),
+                               (cursor_serializer('key', 'payments'), payments_cursor[:-3] + 'abc')]:
+        with pytest.raises(CursorError):
+            decode_cursor(serializer, cursor)
+
+
+def test_fields_are_whitelisted():
+    listing = LISTINGS['payments']
+    assert listing.columns('status,amount,status') == ['id', 'created_at', 'status', 'amount']
+    with pytest.raises(ValueError):
+        listing.columns('amount,password_hash')
+
+
+def test_covering_index_is_created(conn):
+    assert create_indexes(conn, tables.tables) == ['ix_payments_user_id_page']
+    [index] = inspect(conn).get_indexes('payments')
+    assert index['column_names'] == LISTINGS['payments'].index_columns
+
+
+def test_payments_endpoint_pages_with_cursors(app, client, make_user, login):
+    from app import db
+    from app.models import Payment
+
+    user = login(make_user())
+    db.session.add_all([Payment(user_id=user.id, amount=10 + i, status='success', created_at=START + timedelta(days=i))
+                        for i in range(5)])
+    db.session.commit()
+
+    first = client.get('/api/payments?limit=2&fields=amount').get_json()
+    assert [p['amount'] for p in first['payments']] == [14.0, 13.0]
+    assert set(first['payments'][0]) == {'id', 'created_at', 'amount'}
+    second = client.get(f"/api/payments?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [p['amount'] for p in second['payments']] == [12.0, 11.0]
+
+    assert client.get('/api/payments?cursor=forged').status_code == 400
+    assert client.get('/api/payments?fields=paystack_secret').status_code == 400
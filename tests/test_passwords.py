@@ -0,0 +1,37 @@
+import bcrypt
+
+from app.passwords import PasswordHasher, check_user_password
+
+
+class Account:
+    def __init__(self, password_hash):
+        self.password_hash = password_hash
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(rounds=4)
+    password_hash = hasher.hash('correct horse')
+    assert password_hash.startswith('$2b$04$')
+    assert hasher.verify('correct horse', password_hash)
+    assert not hasher.verify('wrong', password_hash)
+    assert not hasher.verify('correct horse', '')
+    assert not hasher.verify('correct horse', 'not-a-bcrypt-hash')
+
+
+def test_outdated_cost_is_upgraded_on_login():
+    old = bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode('utf-8')
+    hasher = PasswordHasher(rounds=5)
+    assert hasher.needs_rehash(old)
+
+    matches, new_hash = hasher.verify_and_update('secret', old)
+    assert matches and new_hash.startswith('$2b$05$')
+    assert hasher.verify_and_update('secret', new_hash) == (True, None)
+    assert hasher.verify_and_update('wrong', old) == (False, None)
+
+
+def test_user_hash_upgraded_with_app_rounds(app):
+    app.extensions['password_hasher'].rounds = 5
+    user = Account(bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode('utf-8'))
+    assert check_user_password(user, 'secret')
+    assert user.password_hash.startswith('$2b$05$')
+    assert not check_user_password(user, 'wrong')
@@ -0,0 +1,112 @@
+import pytest
+from flask import Flask
+
+from app import ratelimit
+from app.ratelimit import FakeRedis, MemoryBackend, RedisBackend, SQLiteBackend, TokenBucketLimiter, parse_limits
+
+
+def test_limits_are_parsed():
+    assert parse_limits('200 per day;50 per hour') == [(200, 86400), (50, 3600)]
+    assert parse_limits(['10/minute', '5 per 2 seconds']) == [(10, 60), (5, 2)]
+    assert parse_limits(None) == []
+    with pytest.raises(ValueError):
+        parse_limits('10 per fortnight')
+
+
+# Two buckets: a burst of 3 refilled at one token per second, and 5 per minute
+BUCKETS = [('client:3/3', 3, 1.0), ('client:5/60', 5, 5 / 60)]
+
+
+def check_burst_and_refill(consume):
+    assert [consume(0)[0] for _ in range(3)] == [True, True, True]
+    allowed, remaining, retry_after = consume(0)
+    assert (allowed, remaining) == (False, 0) and retry_after == pytest.approx(1.0)
+
+    # One second refills one token of the burst bucket
+    assert consume(1.0)[:2] == (True, 0)
+    # The minute bucket has one token left; the burst bucket refuses, so neither is charged
+    assert consume(1.0)[0] is False
+    assert consume(3.0)[:2] == (True, 0)
+    assert consume(3.0)[0] is False
+
+
+def test_memory_backend():
+    backend = MemoryBackend()
+    check_burst_and_refill(lambda offset: backend.consume(BUCKETS, now=1000 + offset))
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'ratelimit.db')
+    workers = [SQLiteBackend(path), SQLiteBackend(path)]
+    calls = iter(range(100))
+    check_burst_and_refill(lambda offset: workers[next(calls) % 2].consume(BUCKETS, now=1000 + offset))
+
+    workers[0].reset()
+    assert workers[1].consume(BUCKETS, now=2000)[:2] == (True, 2)
+
+
+@pytest.fixture
+def clock():
+    pytest.importorskip('lupa')
+    return [1000.0]
+
+
+def test_redis_backend_runs_the_lua_script(clock):
+    client = FakeRedis(clock=lambda: clock[0])
+    backend = RedisBackend(client)
+
+    def consume(offset):
+        clock[0] = 1000 + offset
+        return backend.consume(BUCKETS)
+
+    check_burst_and_refill(consume)
+    state = client._hashes['mentwel:rl:client:3/3']
+    assert set(state) == {'tokens', 'stamp'} and float(state['stamp']) == 1003
+
+
+def test_redis_keys_expire_once_full_again(clock):
+    client = FakeRedis(clock=lambda: clock[0])
+    backend = RedisBackend(client)
+    backend.consume([('idle:2/10', 2, 0.2)])
+    assert client.scan_iter('mentwel:rl:*') == ['mentwel:rl:idle:2/10']
+
+    # One token refills in 5s; EXPIRE adds a second of slack
+    clock[0] += 7
+    assert client.scan_iter('mentwel:rl:*') == []
+    assert backend.consume([('idle:2/10', 2, 0.2)])[:2] == (True, 1)
+    backend.reset()
+    assert client.scan_iter('mentwel:rl:*') == []
+
+
+def test_fake_redis_needs_lupa(monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+
+    def no_lupa(name, *args, **kwargs):
+        if name == 'lupa':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', no_lupa)
+    with pytest.raises(RuntimeError, match='lupa'):
+        ratelimit.backend_from_url('fakeredis://')
+
+
+def test_requests_over_the_limit_get_429():
+    app = Flask(__name__)
+    app.config.update(RATELIMIT_DEFAULT='2 per minute', RATELIMIT_STORAGE_URL='memory://')
+    limiter = ratelimit.init_app(app)
+    assert isinstance(limiter, TokenBucketLimiter) and app.config['RATELIMIT_DEFAULT'] == []
+
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    app.add_url_rule('/webhook', 'webhook', lambda: 'ok')
+    limiter.exempt.add('webhook')
+    client = app.test_client()
+
+    assert [client.get('/ping').status_code for _ in range(2)] == [200, 200]
+    refused = client.get('/ping')
+    assert refused.status_code == 429
+    assert refused.headers['Retry-After'] == '30' and refused.headers['X-RateLimit-Remaining'] == '0'
+    assert client.get('/webhook').status_code == 200
+    # Another client address has its own buckets
+    assert client.get('/ping', environ_base={'REMOTE_ADDR': '10.0.0.9'}).status_code == 200
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """The testing app with one SQLite replica that starts out holding different rows"""
+    try:
+        from app import create_app, db
+    except ImportError as e:
+        pytest.skip(f'application factory not importable: {e}')
+    from config import TestingConfig
+
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_REPLICA_URIS', replica_url, raising=False)
+    application = create_app('testing')
+
+    @application.route('/_test/users', methods=['GET', 'POST'])
+    def user_names():
+        from app.models import User
+        return {'users': db.session.execute(select(User.anonymous_id).order_by(User.id)).scalars().all()}
+
+    @application.route('/_test/users/new', methods=['POST'])
+    def add_user():
+        from app.models import User
+        db.session.add(User(anonymous_id='written'))
+        db.session.commit()
+        return {'ok': True}
+
+    with application.app_context():
+        db.create_all()
+        replica = create_engine(replica_url)
+        db.metadata.create_all(replica)
+        users = db.metadata.tables['users']
+        with replica.begin() as conn:
+            conn.execute(insert(users).values(anonymous_id='on-replica'))
+        with db.engine.begin() as conn:
+            conn.execute(insert(users).values(anonymous_id='on-primary'))
+        yield application
+        db.session.remove()
+        db.drop_all()
+        application.extensions['read_replicas'].dispose()
+        replica.dispose()
+
+
+def test_reads_go_to_the_replica_and_writes_stick_to_the_primary(replica_app):
+    client = replica_app.test_client()
+    assert client.get('/_test/users').get_json()['users'] == ['on-replica']
+    # Unsafe methods read from the primary throughout
+    assert client.post('/_test/users').get_json()['users'] == ['on-primary']
+
+    response = client.post('/_test/users/new')
+    assert replica_app.config['REPLICA_STICKY_COOKIE'] in response.headers['Set-Cookie']
+    # The client's next reads see its own write
+    assert client.get('/_test/users').get_json()['users'] == ['on-primary', 'written']
+
+
+def test_unreachable_replicas_fall_back_to_the_primary(tmp_path):
+    from flask import Flask
+    from sqlalchemy.orm import Session
+
+    from app.read_replicas import ReplicaRouter
+
+    primary = create_engine('sqlite://')
+    down = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router = ReplicaRouter([down], retry_seconds=60)
+    with Flask(__name__).app_context(), Session(primary) as session:
+        assert router.reader(session) is None
+        assert not router.healthy(down) and router.candidates() == []
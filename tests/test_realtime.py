@@ -0,0 +1,131 @@
+import json
+import os
+import socket
+import struct
+
+import pytest
+from flask import Flask
+
+from app import realtime
+from app.realtime import Hub, MemoryBroker, make_token, origin_allowed, sign
+
+SECRET = 'realtime-test-secret'
+
+
+def test_origin_check():
+    assert origin_allowed(None, 'mentwel.org')
+    assert origin_allowed('https://mentwel.org', 'mentwel.org')
+    assert not origin_allowed('https://evil.example', 'mentwel.org')
+    assert origin_allowed('https://app.mentwel.org/', 'api', {'https://app.mentwel.org'})
+    assert not origin_allowed('https://mentwel.org', 'mentwel.org', {'https://app.mentwel.org'})
+
+
+@pytest.fixture
+def hub():
+    hub = Hub(MemoryBroker(), SECRET, heartbeat=5).start_background('127.0.0.1', 0)
+    hub.port = hub.server.sockets[0].getsockname()[1]
+    yield hub
+    hub.stop()
+
+
+def request(hub, head, body=b''):
+    with socket.create_connection(('127.0.0.1', hub.port), timeout=5) as sock:
+        sock.sendall(head.encode('latin-1') + body)
+        return sock.recv(65536)
+
+
+def publish(hub, body):
+    head = (f'POST /realtime/internal/publish HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+            f'X-Realtime-Signature: {sign(SECRET, body)}\r\n\r\n')
+    return request(hub, head, body).split(b' ')[1]
+
+
+def test_hub_needs_wsproto(monkeypatch):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET
+    assert isinstance(realtime.hub_from_config(app), Hub)
+
+    find_spec = realtime.importlib.util.find_spec
+    monkeypatch.setattr(realtime.importlib.util, 'find_spec',
+                        lambda name, *args: None if name == 'wsproto' else find_spec(name, *args))
+    with pytest.raises(RuntimeError, match='wsproto'):
+        realtime.hub_from_config(app)
+
+
+def test_internal_publish_rejects_malformed_events(hub):
+    assert publish(hub, b'not json') == b'400'
+    assert publish(hub, b'{"channel": "session:1"}') == b'400'
+    assert publish(hub, b'[1, 2]') == b'400'
+    assert publish(hub, json.dumps({'channel': 'session:1', 'message': {'type': 'message'}}).encode()) == b'202'
+
+
+def open_websocket(hub, session_id=1, origin=None):
+    from wsproto import ConnectionType, WSConnection
+    from wsproto.events import AcceptConnection, Request
+
+    token = make_token(SECRET, 7, session_id, 'patient')
+    ws = WSConnection(ConnectionType.CLIENT)
+    sock = socket.create_connection(('127.0.0.1', hub.port), timeout=5)
+    extra = [('Origin', origin)] if origin else []
+    sock.sendall(ws.send(Request(host='localhost', target=f'/realtime/sessions/{session_id}/ws?token={token}',
+                                 extra_headers=extra)))
+    response = sock.recv(65536)
+    ws.receive_data(response)
+    accepted = isinstance(next(ws.events(), None), AcceptConnection)
+    return sock, ws, accepted, response
+
+
+def events_until(sock, ws, kind):
+    """Next event of `kind`, reading from the socket only once buffered events run out"""
+    while True:
+        for event in ws.events():
+            if isinstance(event, kind):
+                return event
+        data = sock.recv(65536)
+        if not data:
+            return None
+        ws.receive_data(data)
+
+
+def test_websocket_checks_origin(hub):
+    sock, _, accepted, response = open_websocket(hub, origin='https://evil.example')
+    sock.close()
+    assert not accepted and response.split(b' ')[1] == b'403'
+    sock, _, accepted, _ = open_websocket(hub, origin='http://localhost')
+    sock.close()
+    assert accepted
+
+
+def test_websocket_relays_events_and_rejects_bad_utf8(hub):
+    from wsproto.events import CloseConnection, TextMessage
+
+    sock, ws, accepted, _ = open_websocket(hub)
+    assert accepted
+    with sock:
+        assert json.loads(events_until(sock, ws, TextMessage).data)['type'] == 'presence'
+        sock.sendall(ws.send(TextMessage(data=json.dumps({'type': 'typing'}))))
+        assert json.loads(events_until(sock, ws, TextMessage).data)['type'] == 'typing'
+
+        # A masked text frame that is not valid UTF-8
+        payload, mask = b'\xff\xfe', os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        sock.sendall(struct.pack('!BB', 0x81, 0x80 | len(payload)) + mask + masked)
+        assert events_until(sock, ws, CloseConnection).code == 1007
+
+
+def test_ticket_is_only_issued_to_participants(app, client, make_user, login):
+    from app import db
+    from app.models import TherapySession
+    from app.realtime import read_token
+
+    patient, stranger = make_user(), make_user()
+    session = TherapySession(patient_id=patient.id, status='scheduled')
+    db.session.add(session)
+    db.session.commit()
+
+    login(stranger)
+    assert client.get(f'/api/sessions/{session.id}/realtime').status_code == 403
+    login(patient)
+    data = client.get(f'/api/sessions/{session.id}/realtime').get_json()
+    assert read_token(app.config['SECRET_KEY'], data['token'], 60) == {'u': patient.id, 's': session.id, 'r': 'patient'}
+    assert data['websocket_url'].endswith(f'/sessions/{session.id}/ws?token={data["token"]}')
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from app.response_cache import ResponseCache, SQLiteBackend, backend_from_config
+
+
+def test_production_shares_the_cache_between_workers():
+    if os.environ.get('RESPONSE_CACHE_URL'):
+        pytest.skip('RESPONSE_CACHE_URL is set in the environment')
+    from config import ProductionConfig
+    assert isinstance(backend_from_config({'RESPONSE_CACHE_URL': ProductionConfig.RESPONSE_CACHE_URL}),
+                      SQLiteBackend)
+
+
+def test_invalidation_in_one_worker_reaches_the_others(tmp_path):
+    path = str(tmp_path / 'response_cache.db')
+    first, second = ResponseCache(SQLiteBackend(path)), ResponseCache(SQLiteBackend(path))
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f'render {len(renders)}'
+
+    assert first.fragment('card', [7], render, tags=['therapist:7']) == 'render 1'
+    assert second.fragment('card', [7], render, tags=['therapist:7']) == 'render 1'
+    second.invalidate('therapist:7')
+    assert first.fragment('card', [7], render, tags=['therapist:7']) == 'render 2'
+    assert first.stats()['card'] == {'miss': 1, 'stale': 1, 'hit_rate': 0.0}
+
+
+def test_catalog_is_cached_and_refreshed_after_a_commit(app, client):
+    from app import db
+    from app.models import SessionPackage
+
+    package = SessionPackage(package_name='Starter Pack', session_count=3, package_price=45)
+    db.session.add(package)
+    db.session.commit()
+
+    response = client.get('/api/packages')
+    assert [p['name'] for p in response.get_json()['packages']] == ['Starter Pack']
+    assert client.get('/api/packages', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    package.package_name = 'Starter Bundle'
+    db.session.commit()
+    assert [p['name'] for p in client.get('/api/packages').get_json()['packages']] == ['Starter Bundle']
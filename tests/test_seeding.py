@@ -0,0 +1,120 @@
+import itertools
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, func, select
+from sqlalchemy.orm import declarative_base
+
+from app import seeding
+from app.passwords import check_password
+from app.seeding import SeedError, default_fixture_path, generate, load_fixture, read_fixture
+
+tables = MetaData()
+keyed = Table(
+    'session_packages', tables,
+    Column('id', Integer, primary_key=True),
+    Column('package_name', String(100), unique=True),
+    Column('session_count', Integer),
+)
+unkeyed = Table(
+    'users', tables,
+    Column('id', Integer, primary_key=True),
+    Column('anonymous_id', String(20)),
+    Column('password_hash', String(128)),
+)
+
+Base = declarative_base(metadata=tables)
+member_ids = itertools.count(1)
+
+
+class Member(Base):
+    """Like app.models.User: the constructor generates anonymous_id"""
+    __tablename__ = 'members'
+    id = Column(Integer, primary_key=True)
+    anonymous_id = Column(String(20), nullable=False)
+    email = Column(String(120))
+    password_hash = Column(String(128))
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('anonymous_id', f'ANON{next(member_ids):04d}')
+        super().__init__(**kwargs)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    tables.create_all(engine)
+    return engine
+
+
+def rows(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(select(table).order_by(table.c.id)).all()
+
+
+def test_fixtures_are_upserted_idempotently(engine):
+    fixture = {
+        'session_packages': {'match': ['package_name'], 'rows': [
+            {'package_name': 'Single Session', 'session_count': 1},
+            {'package_name': 'Starter Pack', 'session_count': 3},
+        ]},
+        # No unique constraint on anonymous_id: existing keys are looked up instead
+        'users': [{'anonymous_id': 'ANON0001', 'password': 'pw-123'}],
+    }
+    load_fixture(engine, tables.tables, fixture)
+    fixture['session_packages']['rows'][1]['session_count'] = 4
+    load_fixture(engine, tables.tables, fixture)
+
+    assert [(r.package_name, r.session_count) for r in rows(engine, keyed)] == [
+        ('Single Session', 1), ('Starter Pack', 4),
+    ]
+    users = rows(engine, unkeyed)
+    assert len(users) == 1
+    assert check_password('pw-123', users[0].password_hash)
+
+
+def test_model_rows_get_generated_columns_once(engine, monkeypatch):
+    monkeypatch.setitem(seeding.MODELS, 'members', f'{__name__}:Member')
+    fixture = {'members': {'match': ['email'], 'rows': [{'email': 'therapist@mentwel.ng', 'password': 'pw'}]}}
+    load_fixture(engine, tables.tables, fixture)
+    [first] = rows(engine, Member.__table__)
+    assert first.anonymous_id.startswith('ANON') and check_password('pw', first.password_hash)
+
+    # Re-seeding updates the given columns but keeps the generated anonymous_id
+    fixture['members']['rows'][0]['password'] = 'new-pw'
+    load_fixture(engine, tables.tables, fixture)
+    [again] = rows(engine, Member.__table__)
+    assert again.anonymous_id == first.anonymous_id and check_password('new-pw', again.password_hash)
+
+    with pytest.raises(SeedError):
+        load_fixture(engine, tables.tables, {'members': {'match': ['email'], 'rows': [{'email': 'x', 'age': 3}]}})
+
+
+def test_malformed_fixtures_are_rejected(engine):
+    with pytest.raises(SeedError):
+        load_fixture(engine, tables.tables, {'therapists': []})
+    with pytest.raises(SeedError):
+        load_fixture(engine, tables.tables, {'session_packages': [{'package_name': 'X', 'price': 1}]})
+
+
+def test_base_fixture_parses():
+    assert 'session_packages' in read_fixture(default_fixture_path())
+
+
+def test_synthetic_data_is_only_added_once(app):
+    from app import db
+
+    load_fixture(db.engine, db.metadata.tables, default_fixture_path())
+    names = ('users', 'therapy_sessions', 'payments', 'sentiment_analysis')
+
+    def counts():
+        with db.engine.connect() as conn:
+            return [conn.execute(select(func.count()).select_from(db.metadata.tables[name])).scalar()
+                    for name in names]
+
+    before = counts()
+    generate(db.engine, db.metadata.tables, 5)
+    after = counts()
+    # Five patients and one therapist; three sessions, one payment and ten moods per patient
+    assert [b - a for a, b in zip(before, after)] == [6, 15, 5, 50]
+    generate(db.engine, db.metadata.tables, 5)
+    assert counts() == after
@@ -0,0 +1,53 @@
+from app.sentiment_pipeline import SentimentPipeline, StubBackend
+
+
+class FailingBackend:
+    model_id = 'failing'
+
+    def analyze(self, texts):
+        raise RuntimeError('model unavailable')
+
+
+def test_messages_are_analyzed_in_batches():
+    rows = []
+    backend = StubBackend()
+    pipeline = SentimentPipeline(backend, rows.extend, batch_size=4, max_delay=0.05)
+
+    for i in range(10):
+        assert pipeline.submit('I feel great today' if i % 2 else 'so tired and anxious', user_id=i)
+    assert pipeline.flush(timeout=5)
+
+    assert sorted(row['user_id'] for row in rows) == list(range(10))
+    assert {row['sentiment_label'] for row in rows if row['user_id'] % 2} == {'positive'}
+    assert {row['sentiment_label'] for row in rows if not row['user_id'] % 2} == {'negative'}
+    assert all('created_at' in row for row in rows)
+    # Ten messages in batches of at most four
+    assert 3 <= backend.calls < 10
+    assert pipeline.stats()['processed'] == 10
+
+
+def test_failed_batch_is_counted_not_raised():
+    pipeline = SentimentPipeline(FailingBackend(), lambda rows: None, batch_size=8, max_delay=0.01)
+    pipeline.submit('hello', user_id=1)
+    assert pipeline.flush(timeout=5)
+    assert pipeline.stats()['failed'] == 1
+    assert pipeline.stats()['processed'] == 0
+
+
+def test_full_queue_drops_instead_of_blocking():
+    pipeline = SentimentPipeline(StubBackend(call_latency=0.2), lambda rows: None, batch_size=1, max_queue=1)
+    results = [pipeline.submit(f'message {i}') for i in range(5)]
+    assert not all(results)
+    assert pipeline.stats()['dropped'] >= 1
+
+
+def test_queued_messages_are_stored(app):
+    from app import db
+    from app.models import SentimentAnalysis
+    from app.sentiment_pipeline import queue_sentiment
+
+    with app.test_request_context():
+        assert queue_sentiment('thank you, I feel better', user_id=None)
+    assert app.extensions['sentiment_pipeline'].flush(timeout=5)
+    db.session.remove()
+    assert SentimentAnalysis.query.one().sentiment_label == 'positive'
@@ -0,0 +1,161 @@
+import threading
+
+import pytest
+from flask import Flask
+from sqlalchemy import Column, Integer, String, create_engine, event, insert, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, declarative_base
+
+from app import sqlite_mode
+from app.sqlite_mode import WriteQueue, engine_options, writer_lock
+
+Base = declarative_base()
+
+
+class Note(Base):
+    __tablename__ = 'notes'
+    id = Column(Integer, primary_key=True)
+    body = Column(String(50), nullable=False)
+
+
+PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1000, 'cache_size': -2048}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'mode.db'}", **engine_options(PRAGMAS, lock_timeout=0.2))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def held_elsewhere(lock):
+    """True if another thread cannot take `lock` right now"""
+    result = []
+
+    def probe():
+        result.append(lock.acquire(timeout=0.05))
+        if result[0]:
+            lock.release()
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join()
+    return not result[0]
+
+
+def test_pragmas_apply_to_this_engine_only(engine, tmp_path):
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert conn.execute(text('PRAGMA cache_size')).scalar() == -2048
+
+    other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    with other.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+    with Session(other) as session:
+        session.execute(text('CREATE TABLE t (x)'))
+        session.execute(text('INSERT INTO t VALUES (1)'))
+        session.flush()
+        assert session.info.get('sqlite_writer_lock') is None
+        session.commit()
+
+
+def test_lock_is_held_only_around_flush_and_commit(engine):
+    lock = writer_lock(engine.url.database)
+    seen = []
+
+    @event.listens_for(Session, 'after_flush')
+    def during_flush(session, flush_context):
+        seen.append(held_elsewhere(lock))
+
+    try:
+        with Session(engine) as session:
+            session.add(Note(body='first'))
+            session.flush()
+            assert not held_elsewhere(lock)
+            session.execute(insert(Note).values(body='bulk'))
+            assert not held_elsewhere(lock)
+            session.add(Note(body='second'))
+            session.commit()
+        assert seen == [True, True] and not held_elsewhere(lock)
+    finally:
+        event.remove(Session, 'after_flush', during_flush)
+
+    with Session(engine) as session:
+        assert session.scalars(select(Note.body).order_by(Note.id)).all() == ['first', 'bulk', 'second']
+
+
+def test_lock_is_released_on_rollback_and_errors(engine):
+    lock = writer_lock(engine.url.database)
+    with Session(engine) as session:
+        session.add(Note(body='kept'))
+        session.commit()
+
+        session.add(Note(id=1, body='duplicate'))
+        with pytest.raises(IntegrityError):
+            session.commit()
+        # The failed flush rolled back; nobody called session.rollback() yet
+        assert not held_elsewhere(lock)
+        session.rollback()
+
+        session.add(Note(body=None))
+        with pytest.raises(IntegrityError):
+            session.flush()
+        assert not held_elsewhere(lock)
+
+
+def test_waiting_writers_give_up_with_operational_error(engine):
+    lock = writer_lock(engine.url.database)
+    taken, done = threading.Event(), threading.Event()
+
+    def hold():
+        with lock:
+            taken.set()
+            done.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    taken.wait(5)
+    try:
+        with Session(engine) as session:
+            session.add(Note(body='late'))
+            with pytest.raises(OperationalError, match='writer lock'):
+                session.commit()
+    finally:
+        done.set()
+        holder.join()
+
+
+def test_write_queue_commits_in_batches(engine):
+    write_queue = WriteQueue(engine, max_batch=50, max_delay=0.05)
+    table = Note.__table__
+
+    def add(conn, body):
+        return conn.execute(insert(table).values(body=body)).inserted_primary_key[0]
+
+    futures = [write_queue.submit(add, f'n{n}') for n in range(20)]
+    assert [future.result(timeout=5) for future in futures] == list(range(1, 21))
+    assert write_queue.items == 20 and write_queue.batches < 20
+
+    # A failing unit of work is retried alone and does not fail its neighbours
+    futures = [write_queue.submit(add, body) for body in ('before', None, 'after')]
+    with pytest.raises(IntegrityError):
+        futures[1].result(timeout=5)
+    assert futures[0].result(timeout=5) and futures[2].result(timeout=5)
+    with engine.connect() as conn:
+        assert len(conn.execute(select(table.c.id)).all()) == 22
+
+
+def test_init_app_sets_engine_options_for_sqlite_only():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///x.db', SQLITE_PRAGMAS=PRAGMAS,
+                      SQLALCHEMY_ENGINE_OPTIONS={'echo': False})
+    sqlite_mode.init_app(app)
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['plugins'] == ['mentwel_sqlite_mode'] and options['echo'] is False
+    assert options['sqlite_pragmas'] == PRAGMAS
+
+    app.config.update(SQLALCHEMY_DATABASE_URI='postgresql://db/mentwel', SQLALCHEMY_ENGINE_OPTIONS={})
+    sqlite_mode.init_app(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {}
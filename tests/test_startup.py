@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import threading
+
+from flask import Flask, current_app
+from sqlalchemy import Column, Integer, MetaData, Table, inspect
+
+from app.startup import LazyClient, SQLiteFile, lazy_app_client, parse_importtime, register_tables
+from config import Config
+
+
+class Counters(SQLiteFile):
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER NOT NULL)',)
+
+
+def test_lazy_client_builds_once():
+    built = []
+    client = LazyClient(lambda: built.append(1) or {'ready': True})
+    assert built == []
+    assert client.get() is client.get() and client.get()['ready']
+    assert built == [1]
+    client.reset()
+    client.get()
+    assert built == [1, 1]
+
+
+def test_app_clients_are_built_inside_the_app_context():
+    app = Flask(__name__)
+    app.config['NAME'] = 'mentwel'
+    client = lazy_app_client(app, lambda: {'name': current_app.config['NAME']})
+    assert client.get() == {'name': 'mentwel'}
+
+
+def test_sqlite_file_connections_are_per_thread(tmp_path):
+    store = Counters(str(tmp_path / 'nested' / 'counters.db'))
+    conn = store.connect()
+    assert store.connect() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.execute("INSERT INTO counters VALUES ('a', 1)")
+
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(store.connect()))
+    thread.start()
+    thread.join()
+    assert seen[0] is not conn
+    assert Counters(store.path).connect().execute('SELECT n FROM counters').fetchone() == (1,)
+
+
+def test_importtime_output_is_parsed():
+    output = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |   encodings\n'
+        'import time:      2500 |       3000 | flask\n'
+        'unrelated line\n'
+    )
+    assert parse_importtime(output) == [('encodings', 1, 0.12, 0.12), ('flask', 0, 2.5, 3.0)]
+
+
+def test_subsystems_import_within_budget():
+    # A fresh interpreter, as a Gunicorn worker would boot
+    code = 'import config, importlib\nfor module, _ in config.Config.SUBSYSTEMS: importlib.import_module(module)'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode == 0, result.stderr[-2000:]
+    entries = parse_importtime(result.stderr)
+    loaded = {name for name, _, _, _ in entries}
+    # Heavy clients load on first use, never while the worker boots
+    for heavy in ('jwt', 'cryptography', 'requests', 'PIL.Image', 'bcrypt', 'smtplib', 'lupa', 'redis'):
+        assert heavy not in loaded
+    total_ms = sum(cumulative for _, depth, _, cumulative in entries if depth == 0)
+    assert total_ms < Config.STARTUP_IMPORT_BUDGET_MS
+
+
+def test_module_tables_are_created_with_the_app(app):
+    from app import db
+
+    tables = MetaData()
+    Table('startup_probe', tables, Column('id', Integer, primary_key=True))
+    register_tables(tables)
+    register_tables(tables)
+    db.create_all()
+    assert 'startup_probe' in inspect(db.engine).get_table_names()
+    db.metadata.remove(db.metadata.tables['startup_probe'])
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from app.therapist_directory import parse_range, specialization_key
+
+
+def next_workday_at(hour, days_ahead=2):
+    day = datetime.utcnow().date() + timedelta(days=days_ahead)
+    while day.weekday() > 4:
+        day += timedelta(days=1)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+def test_settings_parsing():
+    assert parse_range('9-17', (8, 16)) == (9, 17)
+    assert parse_range(None, (8, 16)) == (8, 16)
+    assert specialization_key('  Anxiety   Disorders ') == specialization_key('anxiety disorders')
+
+
+def make_therapist(make_user, **fields):
+    fields = dict({
+        'is_therapist': True, 'therapist_verified': True, 'therapist_rating': 4.5,
+        'therapist_specialization': 'Anxiety',
+    }, **fields)
+    return make_user(**fields)
+
+
+def test_slots_endpoint_reflects_new_bookings(app, client, make_user, login):
+    from app import db
+    from app.models import TherapySession
+
+    patient = login(make_user())
+    therapist = make_therapist(make_user)
+    booked = next_workday_at(9)
+
+    response = client.get(f'/api/therapists/{therapist.id}/slots?days=14')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['therapist_id'] == therapist.id
+    assert booked.isoformat() in data['slots']
+
+    db.session.add(TherapySession(patient_id=patient.id, therapist_id=therapist.id, status='scheduled',
+                                  scheduled_at=booked, duration_minutes=50))
+    db.session.commit()
+
+    slots = client.get(f'/api/therapists/{therapist.id}/slots?days=14').get_json()['slots']
+    assert booked.isoformat() not in slots
+    assert (booked + timedelta(hours=1)).isoformat() in slots
+
+
+def test_slots_for_unknown_therapist_is_404(app, client, make_user, login):
+    login(make_user())
+    assert client.get('/api/therapists/9999/slots').status_code == 404
+
+
+def test_listing_is_ranked_and_filtered(app, client, make_user, login):
+    login(make_user())
+    make_therapist(make_user, therapist_rating=4.9)
+    make_therapist(make_user, therapist_rating=3.0)
+    make_therapist(make_user, therapist_rating=4.0, therapist_specialization='Grief')
+    make_therapist(make_user, therapist_verified=False)
+
+    data = client.get('/api/therapists?specialization=anxiety').get_json()
+    assert [t['rating'] for t in data['therapists']] == [4.9, 3.0]
+    assert client.get('/api/therapists?min_rating=3.5').get_json()['total'] == 2
+
+    available = client.get('/api/therapists/available?limit=1').get_json()['therapists']
+    assert len(available) == 1 and available[0]['rating'] == 4.9
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.token_auth import ACCESS, REFRESH, BloomFilter, KeyRing, TokenAuth, TokenError, metadata
+
+USER = SimpleNamespace(id=7, anonymous_id='anon0007', is_therapist=True, is_anonymous=False)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tokens.db'}")
+    metadata.create_all(engine)
+    return engine
+
+
+def make_auth(engine, clock, secret='current', previous=()):
+    return TokenAuth(engine, KeyRing(secret, previous), access_ttl=60, sync_interval=10, clock=clock)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(500):
+        bloom.add(f'jti-{i}')
+    assert all(f'jti-{i}' in bloom for i in range(500))
+    assert sum(f'other-{i}' in bloom for i in range(1000)) < 50
+
+
+def test_tokens_verify_until_they_expire(engine):
+    clock = Clock()
+    auth = make_auth(engine, clock)
+    pair = auth.issue(USER)
+
+    claims = auth.verify(pair['access_token'])
+    assert (claims['sub'], claims['aid'], claims['thr']) == ('7', 'anon0007', True)
+    with pytest.raises(TokenError):
+        auth.verify(pair['refresh_token'], ACCESS)
+    with pytest.raises(TokenError):
+        auth.verify(pair['access_token'][:-2] + 'xx')
+    with pytest.raises(TokenError):
+        make_auth(engine, clock, secret='forged').verify(pair['access_token'])
+
+    clock.now += 60 + 31
+    with pytest.raises(TokenError, match='expired'):
+        auth.verify(pair['access_token'])
+    assert auth.verify(pair['refresh_token'], REFRESH)['sub'] == '7'
+
+
+def test_rotated_keys_still_verify(engine):
+    clock = Clock()
+    token = make_auth(engine, clock, secret='old').issue(USER)['access_token']
+    assert make_auth(engine, clock, secret='new', previous=['old']).verify(token)['sub'] == '7'
+
+
+def test_revocations_reach_other_workers_after_a_sync(engine):
+    clock = Clock()
+    first, second = make_auth(engine, clock), make_auth(engine, clock)
+    token = first.issue(USER)['access_token']
+    assert second.verify(token)
+
+    first.revoke(first.verify(token))
+    with pytest.raises(TokenError, match='revoked'):
+        first.verify(token)
+    # Accepted by the other worker for at most one sync interval
+    assert second.verify(token)
+    clock.now += 11
+    with pytest.raises(TokenError, match='revoked'):
+        second.verify(token)
+
+    clock.now += 1
+    later = first.issue(USER)['access_token']
+    first.revoke_user(USER.id)
+    with pytest.raises(TokenError):
+        first.verify(later)
+    clock.now += 1
+    assert first.verify(first.issue(USER)['access_token'])
+
+
+def test_token_endpoints(app, client, make_user):
+    from app.passwords import hash_password
+
+    make_user(password_hash=hash_password('s3cret-pass'))
+    assert client.post('/api/auth/token', json={'anonymous_id': 'anon0001', 'password': 'wrong'}).status_code == 401
+    pair = client.post('/api/auth/token', json={'anonymous_id': 'anon0001', 'password': 's3cret-pass'}).get_json()
+
+    bearer = {'Authorization': f"Bearer {pair['access_token']}"}
+    assert client.get('/api/progress/mood', headers=bearer).status_code == 200
+    assert client.get('/api/progress/mood', headers={'Authorization': 'Bearer nope'}).status_code == 401
+
+    rotated = client.post('/api/auth/refresh', json={'refresh_token': pair['refresh_token']}).get_json()
+    assert 'access_token' in rotated
+    assert client.post('/api/auth/refresh', json={'refresh_token': pair['refresh_token']}).status_code == 401
+
+    assert client.post('/api/auth/revoke', headers=bearer, json={}).status_code == 200
+    assert client.get('/api/progress/mood', headers=bearer).status_code == 401
@@ -0,0 +1,90 @@
+import pytest
+from flask import Flask
+
+from app.video_calls import RoomError, RoomRegistry, TimerWheel
+from config import ProductionConfig
+
+MEMBERS = {1: 'patient', 2: 'therapist'}
+
+
+def test_timer_wheel_fires_due_keys_once():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule('a', 3)
+    wheel.schedule('b', 20)
+    wheel.schedule('a', 5)
+    assert wheel.advance(4.5) == []
+    assert wheel.advance(6.5) == ['a']
+    assert wheel.advance(30) == ['b'] and len(wheel) == 0
+
+
+def test_signals_reach_the_peer_once():
+    rooms = RoomRegistry(now=0)
+    rooms.join(10, 1, lambda: MEMBERS, now=0)
+    assert rooms.join(10, 2, lambda: pytest.fail('members are loaded once'), now=1)['state'] == 'connecting'
+
+    rooms.signal(10, 1, 'offer', {'sdp': 'o'}, now=2)
+    room, signals = rooms.poll(10, 2, now=3)
+    assert [(s['kind'], s['from']) for s in signals] == [('offer', 1)]
+    assert rooms.poll(10, 2, now=4)[1] == []
+    assert rooms.poll(10, 1, now=4)[1] == []
+
+    assert rooms.signal(10, 2, 'answer', {'sdp': 'a'}, now=5)['state'] == 'connected'
+
+
+def test_rooms_are_limited_to_members_and_capacity():
+    rooms = RoomRegistry(max_participants=1, now=0)
+    with pytest.raises(RoomError) as error:
+        rooms.join(10, 3, lambda: MEMBERS, now=0)
+    assert error.value.status == 403
+    rooms.join(10, 1, lambda: MEMBERS, now=0)
+    with pytest.raises(RoomError) as error:
+        rooms.join(10, 2, lambda: MEMBERS, now=0)
+    assert error.value.status == 409
+
+
+def test_idle_participants_are_dropped_and_calls_recorded():
+    rooms = RoomRegistry(idle_timeout=10, now=0)
+    rooms.join(10, 1, lambda: MEMBERS, now=0)
+    rooms.join(10, 2, lambda: MEMBERS, now=0)
+    rooms.poll(10, 1, now=8)
+    rooms.sweep(now=12)
+    assert [p['user_id'] for p in rooms.get(10)['participants']] == [1]
+    rooms.sweep(now=20)
+    assert rooms.get(10) is None
+    assert [(r.session_id, r.started_at, r.reason) for r in rooms.drain_ended()] == [(10, 0, 'idle')]
+
+
+def test_signal_endpoint_does_not_also_publish_the_signal(app, client, make_user, login):
+    from app import db
+    from app.models import TherapySession
+
+    patient, therapist = make_user(), make_user(is_therapist=True)
+    session = TherapySession(patient_id=patient.id, therapist_id=therapist.id, status='scheduled')
+    db.session.add(session)
+    db.session.commit()
+    published = []
+    app.extensions['realtime_broker'].start(lambda channel, message: published.append(message['type']))
+
+    login(therapist)
+    assert client.post(f'/api/sessions/{session.id}/call/join').status_code == 200
+    login(patient)
+    client.post(f'/api/sessions/{session.id}/call/join')
+    assert client.post(f'/api/sessions/{session.id}/call/signal',
+                       json={'kind': 'offer', 'payload': {'sdp': 'o'}}).get_json()['state'] == 'connecting'
+    assert client.post(f'/api/sessions/{session.id}/call/signal', json={'kind': 'hello'}).status_code == 400
+
+    login(therapist)
+    signals = client.get(f'/api/sessions/{session.id}/call').get_json()['signals']
+    assert [s['kind'] for s in signals] == ['offer']
+    assert 'signal' not in published and published.count('call') == 2
+
+
+def test_production_boots_with_memory_rooms_and_several_workers(monkeypatch, tmp_path):
+    app = Flask(__name__)
+    log_file = tmp_path / 'app.log'
+    app.config.update(SUBSYSTEMS=(), SECRET_KEY='s', JWT_SECRET_KEY='j', VIDEO_ROOMS_URL='memory://',
+                      LOG_FILE=str(log_file))
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    ProductionConfig.init_app(app)
+    app.extensions['log_pipeline'].stop()
+    assert 'memory:// with 3 workers' in log_file.read_text()
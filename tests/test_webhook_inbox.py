@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, Numeric, String, Table, create_engine, select
+
+from app.webhook_inbox import WebhookInbox, session_credits, verify_signature
+
+SECRET = 'sk_test_secret'
+
+tables = MetaData()
+packages = Table(
+    'session_packages', tables,
+    Column('id', Integer, primary_key=True),
+    Column('session_count', Integer),
+    Column('package_duration_days', Integer),
+)
+payments = Table(
+    'payments', tables,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer),
+    Column('package_id', Integer),
+    Column('amount', Numeric(10, 2)),
+    Column('status', String(20)),
+    Column('paystack_reference', String(100)),
+    Column('paid_at', DateTime),
+)
+
+
+def charge(reference, amount):
+    event = {'event': 'charge.success', 'data': {'reference': reference, 'amount': amount}}
+    return event, json.dumps(event).encode('utf-8')
+
+
+@pytest.fixture
+def inbox(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'inbox.db'}")
+    tables.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(packages.insert(), [{'id': 1, 'session_count': 4, 'package_duration_days': 30}])
+        conn.execute(payments.insert(), [
+            {'id': 1, 'user_id': 7, 'package_id': 1, 'amount': 15000, 'status': 'pending',
+             'paystack_reference': 'T100'},
+        ])
+    inbox = WebhookInbox(engine, payments, packages)
+    inbox.create_tables()
+    return inbox
+
+
+def test_signature_is_hmac_sha512_of_the_body():
+    body = b'{"event": "charge.success"}'
+    signature = hmac.new(SECRET.encode('utf-8'), body, hashlib.sha512).hexdigest()
+    assert verify_signature(SECRET, body, signature)
+    assert not verify_signature(SECRET, body + b' ', signature)
+    assert not verify_signature(None, body, signature)
+
+
+def test_redeliveries_are_stored_and_credited_once(inbox):
+    event, body = charge('T100', 1500000)
+    assert inbox.accept(event, body)
+    assert not inbox.accept(event, body)
+    assert inbox.drain() == 1
+    # A replay of processed events must not credit the payment again
+    inbox.replay(status='processed')
+    inbox.drain()
+
+    with inbox.engine.connect() as conn:
+        assert conn.execute(select(payments.c.status)).scalar() == 'success'
+        credits = conn.execute(select(session_credits)).all()
+    assert [(c.user_id, c.sessions_total) for c in credits] == [(7, 4)]
+    assert inbox.counts() == {'processed': 1}
+
+
+def test_unapplicable_events_fail_with_a_reason(inbox):
+    inbox.accept(*charge('T999', 100))
+    inbox.accept(*charge('T100', 1))
+    inbox.accept({'event': 'transfer.success', 'data': {'reference': 'X1'}}, b'{}')
+    inbox.drain()
+
+    with inbox.engine.connect() as conn:
+        rows = conn.execute(select(payments.c.status)).all()
+    assert rows[0].status == 'pending'
+    assert inbox.counts() == {'failed': 2, 'ignored': 1}
+
+
+def test_endpoint_rejects_bad_signatures_and_stores_good_ones(app, client):
+    app.config['PAYSTACK_SECRET_KEY'] = SECRET
+    event, body = charge('T100', 1500000)
+    path = app.config['PAYSTACK_WEBHOOK_PATH']
+
+    assert client.post(path, data=body, headers={'x-paystack-signature': 'bad'}).status_code == 401
+    signature = hmac.new(SECRET.encode('utf-8'), body, hashlib.sha512).hexdigest()
+    for _ in range(2):
+        response = client.post(path, data=body, headers={'x-paystack-signature': signature})
+        assert response.status_code == 200
+    inbox = app.extensions['webhook_inbox'].get()
+    assert (inbox.accepted, inbox.duplicates) == (1, 1)
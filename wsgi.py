@@ -1,5 +1,12 @@
 """
 WSGI entrypoint for Gunicorn/Render
 Exports the Flask app instance as `app`.
+
+Builds the app directly rather than importing run.py, so web workers skip
+the CLI commands and shell helpers defined there.
 """
-from run import app
+import os
+
+from app import create_app
+
+app = create_app(os.getenv('FLASK_ENV') or 'development')